@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'idempotency_key', 'status', 'attempts', 'run_after', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('idempotency_key',)
+    readonly_fields = ('created_at', 'finished_at', 'locked_at', 'locked_by')
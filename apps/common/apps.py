@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.utils.translation import gettext_lazy as _
+
+
+class CommonConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.common'
+    verbose_name = _('Infrastruttura comune (cache, job, metriche)')
+
+    def ready(self):
+        from .metrics import instrument_serializers
+        instrument_serializers()
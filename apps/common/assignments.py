@@ -0,0 +1,80 @@
+"""
+Assegnazione in blocco di contenuti (quiz, percorsi, lezioni) agli studenti.
+
+`bulk_assign` lavora per insiemi, in un'unica transazione: una query per gli studenti ammessi
+(attivi e del docente proprietario del contenuto), una per le assegnazioni già esistenti e un
+`bulk_create(ignore_conflicts=True)` per le nuove. Assegnare un quiz a 200 studenti costa
+quindi poche query invece di due per studente.
+
+`bulk_create` non invia i segnali post_save: gli scope 'student:<id>' della cache condivisa
+vengono invalidati qui, come farebbero i segnali dei modelli di assegnazione.
+"""
+import logging
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .cache import bump_version
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AssignmentResult:
+    """ Esito di un'assegnazione in blocco (ID studenti). """
+    created: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)  # Già assegnati
+    invalid: list = field(default_factory=list)  # Inesistenti, non attivi o di un altro docente
+
+    def as_dict(self) -> dict:
+        return {'created': self.created, 'skipped': self.skipped, 'invalid': self.invalid}
+
+
+def bulk_assign(model, target_field: str, target, teacher, assigned_by, student_ids=None,
+                cache_namespace: str | None = None, all_or_nothing: bool = False, **extra) -> AssignmentResult:
+    """
+    Assegna `target` (es. un Quiz, campo `target_field`='quiz' di `model`) agli studenti indicati,
+    oppure a tutti gli studenti attivi di `teacher` se `student_ids` è None.
+    Con `all_or_nothing` non viene creato nulla se qualche ID non è valido.
+    I campi aggiuntivi (es. due_date) vengono passati a ogni nuova assegnazione.
+    """
+    from apps.users.models import Student
+
+    students = Student.objects.filter(teacher=teacher, is_active=True)
+    if student_ids is not None:
+        requested = list(dict.fromkeys(student_ids)) # Senza duplicati, nell'ordine ricevuto
+        students = students.filter(pk__in=requested)
+
+    with transaction.atomic():
+        eligible = set(students.values_list('pk', flat=True))
+        if student_ids is None:
+            requested = sorted(eligible)
+        existing = set(
+            model.objects.filter(**{target_field: target}, student_id__in=eligible).values_list('student_id', flat=True)
+        )
+        result = AssignmentResult(
+            created=[pk for pk in requested if pk in eligible and pk not in existing],
+            skipped=[pk for pk in requested if pk in existing],
+            invalid=[pk for pk in requested if pk not in eligible],
+        )
+        if all_or_nothing and result.invalid:
+            result.created = []
+        if result.created:
+            # ignore_conflicts: un'assegnazione creata in parallelo non fa fallire il blocco
+            model.objects.bulk_create(
+                [model(**{target_field: target}, student_id=pk, assigned_by=assigned_by, **extra) for pk in result.created],
+                ignore_conflicts=True,
+            )
+
+            if cache_namespace:
+                def _bump(created=tuple(result.created)):
+                    for pk in created:
+                        bump_version(cache_namespace, f"student:{pk}")
+                _bump()
+                transaction.on_commit(_bump)
+
+    logger.info(
+        f"Assegnazione in blocco di {model._meta.model_name} {target.pk}: "
+        f"{len(result.created)} create, {len(result.skipped)} già presenti, {len(result.invalid)} non valide."
+    )
+    return result
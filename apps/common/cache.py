@@ -0,0 +1,154 @@
+"""
+Livello di cache condiviso per le app del progetto.
+
+- Chiavi con namespace (education, rewards, users, lezioni, quiz_bundles) e "scope" opzionale
+  (es. un docente o uno studente): `make_key('rewards', 'catalogue', scope='teacher:5')`.
+- Invalidazione per versione: ogni namespace/scope ha un contatore di versione incluso
+  nelle chiavi; incrementarlo (`bump_version`) rende obsolete tutte le chiavi precedenti
+  senza doverle cercare e cancellare. I segnali dei modelli incrementano le versioni
+  tramite `invalidate_on_change`.
+- Protezione dallo stampede: `get_or_set` usa un lock per chiave (`cache.add`) così che
+  un solo worker ricalcoli un valore scaduto mentre gli altri attendono il risultato.
+
+Funziona con qualunque backend Django (Redis in produzione, LocMem nei test).
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Valore sentinella per distinguere "chiave assente" da un valore None salvato in cache
+_MISSING = object()
+# Le versioni non devono scadere insieme ai dati: durata lunga (30 giorni)
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+# Intervallo di attesa tra due controlli mentre un altro worker ricalcola la chiave
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _check_namespace(namespace: str) -> None:
+    if namespace not in settings.CACHE_NAMESPACES:
+        raise ValueError(f"Namespace di cache sconosciuto: '{namespace}'.")
+
+
+def _version_key(namespace: str, scope: str | None) -> str:
+    return f"cachever:{namespace}:{scope}" if scope else f"cachever:{namespace}"
+
+
+def get_version(namespace: str, scope: str | None = None) -> int:
+    """ Restituisce la versione corrente del namespace (o dello scope all'interno del namespace). """
+    _check_namespace(namespace)
+    key = _version_key(namespace, scope)
+    version = cache.get(key)
+    if version is None:
+        # Versione assente (mai letta o rimossa dalla cache): come in bump_version riparte dal
+        # timestamp, così non torna a un valore già usato da chiavi ancora presenti in cache.
+        # add() non sovrascrive una versione impostata nel frattempo da un altro worker
+        seed = int(time.time())
+        cache.add(key, seed, VERSION_TIMEOUT)
+        version = cache.get(key, seed)
+    return version
+
+
+def bump_version(namespace: str, scope: str | None = None) -> None:
+    """ Invalida tutte le chiavi del namespace (o dello scope) incrementandone la versione. """
+    _check_namespace(namespace)
+    key = _version_key(namespace, scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Chiave assente (mai letta o rimossa dalla cache): riparte da una versione nuova
+        cache.set(key, int(time.time()), VERSION_TIMEOUT)
+    logger.debug(f"Cache: versione incrementata per {key}.")
+
+
+def make_key(namespace: str, *parts, scope: str | None = None) -> str:
+    """
+    Costruisce una chiave versionata, es. 'rewards:v3:teacher:5:v1:catalogue'.
+    La chiave include sia la versione del namespace sia quella dello scope, se presente.
+    """
+    _check_namespace(namespace)
+    version_keys = [_version_key(namespace, None)] + ([_version_key(namespace, scope)] if scope else [])
+    # Una sola lettura per le versioni di namespace e scope; le mancanti vengono inizializzate
+    found = cache.get_many(version_keys)
+    versions = [found[key] if found.get(key) is not None else get_version(namespace, key_scope)
+                for key, key_scope in zip(version_keys, (None, scope))]
+    key = f"{namespace}:v{versions[0]}"
+    if scope:
+        key += f":{scope}:v{versions[1]}"
+    return ":".join([key, *(str(part) for part in parts)])
+
+
+def get_or_set(namespace: str, *parts, compute, scope: str | None = None, timeout=DEFAULT_TIMEOUT):
+    """
+    Restituisce il valore in cache per la chiave, calcolandolo con `compute()` se assente.
+    Senza `timeout` vale la durata predefinita del backend (CACHES['default']['TIMEOUT']);
+    `timeout=None` salva il valore senza scadenza.
+    Un solo chiamante alla volta esegue `compute()` per la stessa chiave: gli altri attendono
+    (fino a CACHE_STAMPEDE_LOCK_TIMEOUT secondi) che il valore venga pubblicato, poi in caso
+    di timeout lo calcolano comunque.
+    """
+    key = make_key(namespace, *parts, scope=scope)
+    value = cache.get(key, _MISSING)
+    record_cache(hit=value is not _MISSING)
+    if value is not _MISSING:
+        return value
+
+    lock_timeout = settings.CACHE_STAMPEDE_LOCK_TIMEOUT
+    lock_key = f"lock:{key}"
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    # Un altro worker sta già calcolando il valore: attendi che venga pubblicato
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+    logger.warning(f"Cache: timeout in attesa del lock per {key}, ricalcolo locale.")
+    return compute()
+
+
+def invalidate_on_change(namespace: str, *models, scope_func=None, ignore_fields=()) -> None:
+    """
+    Collega post_save/post_delete dei modelli indicati all'invalidazione del namespace.
+    Se `scope_func(instance)` è fornita e restituisce uno scope (o una lista di scope),
+    vengono invalidati solo quegli scope invece dell'intero namespace.
+    I salvataggi con `update_fields` contenuti in `ignore_fields` (es. last_login) non invalidano.
+    """
+    _check_namespace(namespace)
+    ignore_fields = frozenset(ignore_fields)
+
+    def _invalidate(sender, instance, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields and ignore_fields and set(update_fields) <= ignore_fields:
+            return
+        scopes = scope_func(instance) if scope_func else None
+        scopes = [None] if not scopes else ([scopes] if isinstance(scopes, str) else list(scopes))
+
+        def _bump():
+            for scope in scopes:
+                bump_version(namespace, scope)
+
+        # Subito, per le letture nella stessa transazione, e di nuovo al commit: un altro worker
+        # potrebbe aver ricalcolato la chiave con i dati non ancora committati nel frattempo
+        _bump()
+        transaction.on_commit(_bump)
+
+    for model in models:
+        uid = f"cache-invalidate:{namespace}:{model._meta.label}"
+        post_save.connect(_invalidate, sender=model, weak=False, dispatch_uid=uid)
+        post_delete.connect(_invalidate, sender=model, weak=False, dispatch_uid=uid)
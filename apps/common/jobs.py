@@ -0,0 +1,170 @@
+"""
+Coda di job persistente su database.
+
+- Le app registrano gli handler con `@register_job('<app>.<nome>')` (modulo importato in `ready()`).
+  Il lavoro lento senza scritture (es. lettura di un file) va in `prepare`, eseguito fuori dalla
+  transazione del job: l'handler riceve il risultato e fa solo le scritture.
+- `enqueue()` accoda un job con una chiave di idempotenza: accodare di nuovo la stessa chiave
+  restituisce il job esistente senza duplicarlo.
+- Il comando `python manage.py run_jobs` preleva i job pronti (select_for_update con
+  skip_locked dove supportato), li esegue e ritenta quelli falliti con backoff.
+- Con `JOBS_RUN_INLINE = True` i job vengono eseguiti subito (al commit) nel processo corrente:
+  comodo in sviluppo e nei test, senza worker separato.
+"""
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_HANDLERS = {}
+_PREPARERS = {}
+
+
+def register_job(kind: str, prepare=None):
+    """
+    Decoratore che registra un handler `handler(payload) -> dict | None` per il tipo di job.
+    Con `prepare(payload)` l'handler diventa `handler(payload, prepared)`: `prepare` è eseguito
+    prima della transazione e del lock sulla riga del job, e non deve scrivere sul database.
+    """
+    def decorator(func):
+        _HANDLERS[kind] = func
+        if prepare is not None:
+            _PREPARERS[kind] = prepare
+        return func
+    return decorator
+
+
+def get_handler(kind: str):
+    return _HANDLERS.get(kind)
+
+
+def get_preparer(kind: str):
+    return _PREPARERS.get(kind)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(kind: str, payload: dict, idempotency_key: str, run_inline: bool | None = None) -> Job:
+    """
+    Accoda un job (una sola volta per `idempotency_key`).
+    Se `run_inline` (default: settings.JOBS_RUN_INLINE) il job viene eseguito al commit della transazione corrente.
+    """
+    if kind not in _HANDLERS:
+        raise ValueError(f"Nessun handler registrato per il job '{kind}'.")
+    job, created = Job.objects.get_or_create(
+        idempotency_key=idempotency_key,
+        defaults={'kind': kind, 'payload': payload},
+    )
+    if created:
+        logger.info(f"Job {job.id} ({kind}) accodato con chiave {idempotency_key}.")
+    else:
+        logger.info(f"Job con chiave {idempotency_key} già presente (id {job.id}, stato {job.status}), non duplicato.")
+
+    if run_inline is None:
+        run_inline = getattr(settings, 'JOBS_RUN_INLINE', False)
+    if created and run_inline:
+        transaction.on_commit(lambda: run_job(job.pk, worker_id='inline'))
+    return job
+
+
+def claim_jobs(batch_size: int = 10, worker_id: str | None = None, kinds=None) -> list[int]:
+    """
+    Riserva fino a `batch_size` job pronti (PENDING con run_after scaduto, o RUNNING con lock
+    scaduto perché il worker è terminato) e restituisce i loro id.
+    """
+    worker_id = worker_id or default_worker_id()
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    with transaction.atomic():
+        queryset = Job.objects.filter(
+            Q(status=Job.JobStatus.PENDING, run_after__lte=now)
+            | Q(status=Job.JobStatus.RUNNING, locked_at__lt=stale_before)
+        )
+        if kinds:
+            queryset = queryset.filter(kind__in=kinds)
+        job_ids = list(
+            queryset.order_by('run_after', 'id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if job_ids:
+            Job.objects.filter(id__in=job_ids).update(
+                status=Job.JobStatus.RUNNING, locked_at=now, locked_by=worker_id
+            )
+    return job_ids
+
+
+def run_job(job_id: int, worker_id: str | None = None) -> Job:
+    """
+    Esegue un job: successo -> DONE, errore -> nuovo tentativo con backoff o FAILED.
+    Effetti dell'handler e stato DONE sono salvati nella stessa transazione, con la riga del job
+    bloccata: un job riprelevato (worker terminato, lock scaduto) non ripete effetti già confermati.
+    L'eventuale `prepare` dell'handler è eseguito prima, senza transazione né lock.
+    """
+    worker_id = worker_id or default_worker_id()
+    try:
+        job = Job.objects.get(pk=job_id)
+        if job.status == Job.JobStatus.DONE:
+            return job # Idempotenza: un job concluso non viene rieseguito
+        handler, prepare = get_handler(job.kind), get_preparer(job.kind)
+        if handler is None:
+            raise LookupError(f"Nessun handler registrato per il job '{job.kind}'.")
+        prepared = prepare(job.payload) if prepare else None
+
+        with transaction.atomic(): # Effetti dell'handler e stato DONE: tutto o niente
+            job = Job.objects.select_for_update().get(pk=job_id)
+            if job.status == Job.JobStatus.DONE:
+                return job # Concluso da un altro worker durante la preparazione
+            job.result = handler(job.payload, prepared) if prepare else handler(job.payload)
+            job.attempts += 1
+            job.locked_by = worker_id
+            job.locked_at = None
+            job.status = Job.JobStatus.DONE
+            job.finished_at = timezone.now()
+            job.last_error = ''
+            job.save()
+        logger.info(f"Job {job.id} ({job.kind}) completato al tentativo {job.attempts}.")
+        return job
+    except Job.DoesNotExist:
+        raise
+    except Exception as e:
+        error, message = traceback.format_exc(), str(e)
+
+    # Errore: la transazione dell'handler è stata annullata, si registra solo il tentativo
+    job = Job.objects.get(pk=job_id)
+    job.attempts += 1
+    job.locked_by = worker_id
+    job.locked_at = None
+    job.last_error = error
+    if job.attempts >= job.max_attempts:
+        job.status = Job.JobStatus.FAILED
+        job.finished_at = timezone.now()
+        logger.error(f"Job {job.id} ({job.kind}) fallito definitivamente dopo {job.attempts} tentativi: {message}")
+    else:
+        # Backoff esponenziale: 2, 4, 8... secondi (massimo 5 minuti)
+        delay = min(2 ** job.attempts, 300)
+        job.status = Job.JobStatus.PENDING
+        job.run_after = timezone.now() + timedelta(seconds=delay)
+        logger.warning(f"Job {job.id} ({job.kind}) fallito al tentativo {job.attempts}, nuovo tentativo tra {delay}s: {message}")
+    job.save()
+    return job
+
+
+def run_pending(batch_size: int = 10, worker_id: str | None = None, kinds=None) -> int:
+    """ Preleva ed esegue un lotto di job pronti. Restituisce il numero di job eseguiti. """
+    job_ids = claim_jobs(batch_size=batch_size, worker_id=worker_id, kinds=kinds)
+    for job_id in job_ids:
+        run_job(job_id, worker_id=worker_id)
+    return len(job_ids)
@@ -0,0 +1,38 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from apps.common.jobs import default_worker_id, run_pending
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Esegue i job della coda persistente (es. ricompense post-completamento dei quiz).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Esegue i job pronti una sola volta ed esce.')
+        parser.add_argument('--batch-size', type=int, default=20, help='Numero massimo di job prelevati per ciclo.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Attesa (secondi) quando la coda è vuota.')
+        parser.add_argument('--kind', action='append', dest='kinds', help='Limita ai tipi di job indicati (ripetibile).')
+
+    def handle(self, *args, **options):
+        worker_id = default_worker_id()
+        self._stop = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        self.stdout.write(f"Worker {worker_id} avviato.")
+
+        total = 0
+        while not self._stop:
+            processed = run_pending(batch_size=options['batch_size'], worker_id=worker_id, kinds=options['kinds'])
+            total += processed
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker_id} terminato. Job eseguiti: {total}."))
+
+    def _request_stop(self, signum, frame):
+        logger.info(f"Segnale {signum} ricevuto, arresto del worker al termine del lotto corrente.")
+        self._stop = True
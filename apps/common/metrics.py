@@ -0,0 +1,287 @@
+"""
+Metriche di performance per richiesta, aggregate nel processo.
+
+- `PerformanceMetricsMiddleware` misura per ogni richiesta il tempo totale e, per le richieste
+  campionate (PERF_METRICS_SAMPLE_RATE), numero e durata delle query SQL, hit/miss della cache
+  condivisa (apps.common.cache) e tempo speso nei serializer DRF.
+- I valori sono aggregati per vista risolta (es. 'AttemptViewSet.complete_attempt') ed esposti
+  in formato testo Prometheus da `render_prometheus()` (vista `MetricsView`, solo Admin).
+- Con PERF_SLOW_REQUEST_MS le richieste campionate più lente della soglia vengono loggate con
+  le istruzioni SQL più costose (raggruppate per testo).
+
+Le richieste non campionate costano solo una misura del tempo: le query non vengono intercettate.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Limiti superiori (secondi) dei bucket dell'istogramma delle durate
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = 'eduapp'
+
+# Statistiche della richiesta in corso (None se la richiesta non è campionata)
+_current = contextvars.ContextVar('perf_request_stats', default=None)
+
+
+class RequestStats:
+    """ Contatori di una singola richiesta campionata. """
+    __slots__ = ('queries', 'db_time', 'cache_hits', 'cache_misses', 'serializer_time',
+                 'serializer_depth', 'statements')
+
+    def __init__(self, collect_statements: bool = False):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        # {sql: [conteggio, durata]} solo se serve il log delle richieste lente
+        self.statements = {} if collect_statements else None
+
+    def __call__(self, execute, sql, params, many, context):
+        """ execute_wrapper di Django: misura ogni query eseguita sulla connessione. """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if self.statements is not None:
+                entry = self.statements.setdefault(sql, [0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def top_statements(self, limit: int):
+        """ Le `limit` istruzioni SQL con il tempo totale maggiore: [(sql, conteggio, secondi)]. """
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [(sql, count, seconds) for sql, (count, seconds) in ranked[:limit]]
+
+
+class _ViewMetrics:
+    __slots__ = ('requests', 'duration_sum', 'buckets', 'statuses', 'sampled', 'queries',
+                 'db_time', 'cache_hits', 'cache_misses', 'serializer_time', 'slow')
+
+    def __init__(self):
+        self.requests = 0
+        self.duration_sum = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.statuses = {}
+        self.sampled = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serializer_time = 0.0
+        self.slow = 0
+
+
+class MetricsRegistry:
+    """ Aggregati per vista, condivisi dai thread del processo. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view: str, duration: float, status_code: int, stats: RequestStats | None, slow: bool = False):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = _ViewMetrics()
+            metrics.requests += 1
+            metrics.duration_sum += duration
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    metrics.buckets[index] += 1
+                    break
+            status_class = f"{status_code // 100}xx"
+            metrics.statuses[status_class] = metrics.statuses.get(status_class, 0) + 1
+            if stats is not None:
+                metrics.sampled += 1
+                metrics.queries += stats.queries
+                metrics.db_time += stats.db_time
+                metrics.cache_hits += stats.cache_hits
+                metrics.cache_misses += stats.cache_misses
+                metrics.serializer_time += stats.serializer_time
+                metrics.slow += slow
+
+    def snapshot(self) -> dict:
+        """ Copia degli aggregati: {vista: {campo: valore}}. """
+        with self._lock:
+            return {view: self._as_dict(metrics) for view, metrics in self._views.items()}
+
+    @staticmethod
+    def _as_dict(metrics: _ViewMetrics) -> dict:
+        values = {name: getattr(metrics, name) for name in _ViewMetrics.__slots__}
+        values['buckets'] = list(metrics.buckets)
+        values['statuses'] = dict(metrics.statuses)
+        return values
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry()
+
+
+def record_cache(hit: bool) -> None:
+    """ Registra un hit/miss della cache condivisa nella richiesta corrente (se campionata). """
+    stats = _current.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def instrument_serializers() -> None:
+    """
+    Misura il tempo di `Serializer.data` (serializzazione dell'output) nelle richieste campionate.
+    Solo la chiamata più esterna viene contata (ListSerializer.data richiama BaseSerializer.data).
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data
+    if getattr(original.fget, '_perf_instrumented', False):
+        return
+
+    def data(self):
+        stats = _current.get()
+        if stats is None:
+            return original.fget(self)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            stats.serializer_depth -= 1
+            if not stats.serializer_depth:
+                stats.serializer_time += time.perf_counter() - started
+
+    data._perf_instrumented = True
+    BaseSerializer.data = property(data)
+
+
+def resolve_view_name(view_func, method: str) -> str:
+    """ Nome della vista per le metriche: 'ViewSet.azione', 'APIView.metodo' o 'modulo.funzione'. """
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if cls is None:
+        return f"{view_func.__module__}.{getattr(view_func, '__name__', type(view_func).__name__)}"
+    actions = getattr(view_func, 'actions', None) # ViewSet: {'get': 'list', ...}
+    handler = actions.get(method, method) if actions else method
+    return f"{cls.__name__}.{handler}"
+
+
+class PerformanceMetricsMiddleware:
+    """ Raccoglie le metriche di ogni richiesta (vedi docstring del modulo). """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.PERF_METRICS_ENABLED:
+            return self.get_response(request)
+
+        sample_rate = settings.PERF_METRICS_SAMPLE_RATE
+        stats = None
+        if sample_rate >= 1 or (sample_rate > 0 and random.random() < sample_rate):
+            stats = RequestStats(collect_statements=bool(settings.PERF_SLOW_REQUEST_MS))
+
+        started = time.perf_counter()
+        if stats is None:
+            response = self.get_response(request)
+        else:
+            token = _current.set(stats)
+            try:
+                with ExitStack() as stack:
+                    for conn in connections.all():
+                        stack.enter_context(conn.execute_wrapper(stats))
+                    response = self.get_response(request)
+            finally:
+                _current.reset(token)
+        duration = time.perf_counter() - started
+
+        view_name = getattr(request, '_perf_view_name', 'unresolved') # Impostato da process_view
+        slow = False
+        if stats is not None and settings.PERF_SLOW_REQUEST_MS and duration * 1000 >= settings.PERF_SLOW_REQUEST_MS:
+            slow = True
+            self._log_slow_request(request, view_name, duration, stats)
+        registry.record(view_name, duration, response.status_code, stats, slow)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._perf_view_name = resolve_view_name(view_func, request.method.lower())
+
+    def _log_slow_request(self, request, view_name, duration, stats):
+        lines = [
+            f"Richiesta lenta: {request.method} {request.path} ({view_name}) "
+            f"{duration * 1000:.0f} ms, {stats.queries} query in {stats.db_time * 1000:.0f} ms, "
+            f"serializer {stats.serializer_time * 1000:.0f} ms, cache {stats.cache_hits} hit / {stats.cache_misses} miss."
+        ]
+        for sql, count, seconds in stats.top_statements(settings.PERF_SLOW_REQUEST_TOP_SQL):
+            lines.append(f"  {seconds * 1000:.1f} ms x{count}: {sql}")
+        logger.warning("\n".join(lines))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshot: dict | None = None) -> str:
+    """ Aggregati in formato testo Prometheus (exposition format 0.0.4). """
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    p = METRIC_PREFIX
+    lines = [f"# HELP {p}_metrics_sample_rate Frazione di richieste con metriche SQL/cache/serializer.",
+             f"# TYPE {p}_metrics_sample_rate gauge",
+             f"{p}_metrics_sample_rate {settings.PERF_METRICS_SAMPLE_RATE}"]
+
+    def family(name, kind, help_text, samples):
+        lines.append(f"# HELP {p}_{name} {help_text}")
+        lines.append(f"# TYPE {p}_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+            lines.append(f"{p}_{name}{{{label_text}}} {value}")
+
+    views = sorted(snapshot.items())
+    histogram = []
+    for view, m in views:
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS, m['buckets']):
+            cumulative += count
+            histogram.append(({'view': view, 'le': bound}, cumulative))
+        histogram.append(({'view': view, 'le': '+Inf'}, m['requests']))
+    lines.append(f"# HELP {p}_request_duration_seconds Durata delle richieste per vista.")
+    lines.append(f"# TYPE {p}_request_duration_seconds histogram")
+    for labels, value in histogram:
+        label_text = f'view="{_escape(labels["view"])}",le="{labels["le"]}"'
+        lines.append(f"{p}_request_duration_seconds_bucket{{{label_text}}} {value}")
+    for view, m in views:
+        lines.append(f'{p}_request_duration_seconds_sum{{view="{_escape(view)}"}} {m["duration_sum"]:.6f}')
+        lines.append(f'{p}_request_duration_seconds_count{{view="{_escape(view)}"}} {m["requests"]}')
+
+    family('requests_total', 'counter', 'Richieste per vista e classe di stato HTTP.',
+           [({'view': view, 'status': status}, count) for view, m in views for status, count in sorted(m['statuses'].items())])
+    family('sampled_requests_total', 'counter', 'Richieste campionate per vista.',
+           [({'view': view}, m['sampled']) for view, m in views])
+    family('db_queries_total', 'counter', 'Query SQL eseguite (richieste campionate).',
+           [({'view': view}, m['queries']) for view, m in views])
+    family('db_seconds_total', 'counter', 'Tempo speso nelle query SQL (richieste campionate).',
+           [({'view': view}, f"{m['db_time']:.6f}") for view, m in views])
+    family('cache_hits_total', 'counter', 'Hit della cache condivisa (richieste campionate).',
+           [({'view': view}, m['cache_hits']) for view, m in views])
+    family('cache_misses_total', 'counter', 'Miss della cache condivisa (richieste campionate).',
+           [({'view': view}, m['cache_misses']) for view, m in views])
+    family('serializer_seconds_total', 'counter', 'Tempo speso nei serializer DRF (richieste campionate).',
+           [({'view': view}, f"{m['serializer_time']:.6f}") for view, m in views])
+    family('slow_requests_total', 'counter', 'Richieste campionate oltre PERF_SLOW_REQUEST_MS.',
+           [({'view': view}, m['slow']) for view, m in views])
+    return "\n".join(lines) + "\n"
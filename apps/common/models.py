@@ -0,0 +1,40 @@
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class Job(models.Model):
+    """
+    Job in coda persistente su database, eseguito dal comando `run_jobs`.
+    La `idempotency_key` univoca impedisce di accodare (ed eseguire) due volte lo stesso lavoro.
+    """
+    class JobStatus(models.TextChoices):
+        PENDING = 'PENDING', _('Pending')
+        RUNNING = 'RUNNING', _('Running')
+        DONE = 'DONE', _('Done')
+        FAILED = 'FAILED', _('Failed')
+
+    kind = models.CharField(_('Kind'), max_length=100, help_text=_('Nome dell\'handler registrato, es. "education.attempt_rewards".'))
+    payload = models.JSONField(_('Payload'), default=dict, blank=True)
+    idempotency_key = models.CharField(_('Idempotency Key'), max_length=255, unique=True)
+    status = models.CharField(_('Status'), max_length=10, choices=JobStatus.choices, default=JobStatus.PENDING)
+    attempts = models.PositiveIntegerField(_('Attempts'), default=0)
+    max_attempts = models.PositiveIntegerField(_('Max Attempts'), default=5)
+    run_after = models.DateTimeField(_('Run After'), default=timezone.now)
+    locked_at = models.DateTimeField(_('Locked At'), null=True, blank=True)
+    locked_by = models.CharField(_('Locked By'), max_length=100, blank=True)
+    result = models.JSONField(_('Result'), null=True, blank=True)
+    last_error = models.TextField(_('Last Error'), blank=True)
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+    finished_at = models.DateTimeField(_('Finished At'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Job')
+        verbose_name_plural = _('Jobs')
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='common_job_status_run_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} [{self.idempotency_key}] ({self.status})"
@@ -0,0 +1,56 @@
+"""
+Paginazione a cursore (keyset) per gli endpoint con elenchi che crescono nel tempo
+(transazioni, correzioni, assegnazioni, studenti, template).
+
+- L'ordinamento è quello già usato dal queryset della vista (order_by esplicito o Meta.ordering
+  del modello, es. '-timestamp', '-assigned_at', 'completed_at'), con la chiave primaria come
+  spareggio: le pagine successive filtrano sul valore del primo campo (WHERE ... > cursore)
+  invece di usare OFFSET, quindi il costo di una pagina non dipende da quante ne precedono.
+- Paginazione su richiesta: senza `?cursor=` né `?page_size=` la risposta resta l'elenco completo
+  (contratto usato dai frontend); con uno dei due parametri diventa `{next, previous, results}`,
+  senza COUNT. `?page_size=` arriva fino a API_MAX_PAGE_SIZE.
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """ Pagina solo se il client lo chiede (?cursor= o ?page_size=), altrimenti None: elenco completo. """
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        """ Ordinamento del queryset, con la chiave primaria come spareggio. """
+        ordering = keyset_ordering(queryset)
+        tiebreak = '-pk' if ordering[0].startswith('-') else 'pk'
+        if ordering[-1].lstrip('-') not in ('pk', queryset.model._meta.pk.name):
+            ordering += (tiebreak,)
+        return ordering
+
+
+def keyset_ordering(queryset) -> tuple:
+    """
+    Campi di ordinamento del queryset utilizzabili come cursore: il primo deve essere un campo
+    semplice del modello (né espressione, né lookup con '__', né relazione), altrimenti si ordina per '-pk'.
+    """
+    ordering = tuple(queryset.query.order_by or queryset.model._meta.ordering or ())
+    if not ordering or not all(isinstance(field, str) for field in ordering):
+        return ('-pk',)
+    name = ordering[0].lstrip('-')
+    if name == 'pk':
+        return ordering
+    try:
+        field = queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return ('-pk',)
+    if field.is_relation or any('__' in field_name for field_name in ordering):
+        return ('-pk',)
+    return ordering
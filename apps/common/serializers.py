@@ -0,0 +1,34 @@
+"""
+Serializer condivisi tra le app.
+"""
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+class SparseFieldsetMixin:
+    """
+    Restituisce solo i campi richiesti con `?fields=id,name,...` (letture GET): i client mobili
+    scaricano soltanto le colonne che mostrano. Vale per il serializer principale della risposta
+    (anche con many=True), non per quelli annidati; i nomi sconosciuti vengono ignorati.
+    """
+    fields_query_param = 'fields'
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self._requested_fields()
+        if requested is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in requested}
+
+    def _requested_fields(self):
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS or not self._is_response_root():
+            return None
+        value = request.query_params.get(self.fields_query_param)
+        if not value:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    def _is_response_root(self) -> bool:
+        root = self.root
+        return root is self or (isinstance(root, serializers.ListSerializer) and root.child is self)
@@ -0,0 +1,265 @@
+"""
+Budget di query per gli endpoint API.
+
+Per ogni endpoint GET dei router (apps/*/urls.py, lezioni/urls.py) e per il ruolo che lo usa,
+misura il numero di query con una classe piccola e poi con una classe più grande (più studenti,
+quiz, domande, risposte, ricompense, lezioni): il numero di query non deve crescere con i dati.
+In caso di violazione viene stampato l'SQL eseguito nei due casi.
+"""
+import importlib
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.routers import BaseRouter
+from rest_framework.test import APITestCase
+
+from apps.common.models import Job
+from apps.education.factories import (
+    QuizTemplateFactory, QuestionTemplateFactory, AnswerOptionTemplateFactory,
+    QuizFactory, QuestionFactory, AnswerOptionFactory, PathwayFactory,
+    QuizAttemptFactory, StudentAnswerFactory, PathwayProgressFactory,
+    QuizAssignmentFactory, PathwayAssignmentFactory,
+)
+from apps.education.jobs import ATTEMPT_REWARDS_JOB, attempt_rewards_key
+from apps.education.models import PathwayQuiz, PathwayTemplate, PathwayQuizTemplate, QuestionType
+from apps.rewards.factories import RewardTemplateFactory, RewardFactory, RewardPurchaseFactory
+from apps.rewards.models import Badge, EarnedBadge
+from apps.users.factories import UserFactory, StudentFactory
+from apps.users.models import RegistrationToken, UserRole
+from lezioni.models import Subject, Topic, Lesson, LessonContent, LessonAssignment
+
+ADMIN, TEACHER, STUDENT = 'admin', 'teacher', 'student'
+
+# Moduli URL i cui router devono essere coperti dai budget
+ROUTER_MODULES = ['apps.education.urls', 'apps.rewards.urls', 'apps.users.urls', 'lezioni.urls']
+
+# (nome URL, ruolo, funzione che restituisce i kwargs dell'URL a partire dal test)
+ENDPOINTS = [
+    # --- education: Admin ---
+    ('quiz-template-list', ADMIN, lambda t: {}),
+    ('quiz-template-detail', ADMIN, lambda t: {'pk': t.quiz_template.pk}),
+    ('quiz-template-questions-list', ADMIN, lambda t: {'quiz_template_pk': t.quiz_template.pk}),
+    ('question-template-options-list', ADMIN, lambda t: {
+        'quiz_template_pk': t.quiz_template.pk, 'question_template_pk': t.question_template.pk}),
+    # --- education: Docente ---
+    ('quiz-list', TEACHER, lambda t: {}),
+    ('quiz-detail', TEACHER, lambda t: {'pk': t.quiz.pk}),
+    ('quiz-questions-list', TEACHER, lambda t: {'quiz_pk': t.quiz.pk}),
+    ('question-options-list', TEACHER, lambda t: {'quiz_pk': t.quiz.pk, 'question_pk': t.question.pk}),
+    ('pathway-list', TEACHER, lambda t: {}),
+    ('pathway-detail', TEACHER, lambda t: {'pk': t.pathway.pk}),
+    ('teacher-grading-list-pending', TEACHER, lambda t: {}),
+    ('pathway-template-list', TEACHER, lambda t: {}),
+    ('pathway-template-quiz-templates-list', TEACHER, lambda t: {'pathway_template_pk': t.pathway_template.pk}),
+    ('teacher-quiz-template-list', TEACHER, lambda t: {}),
+    ('teacher-quiz-template-questions-list', TEACHER, lambda t: {'quiz_template_pk': t.teacher_quiz_template.pk}),
+    ('teacher-quiz-template-questions-question-ids', TEACHER, lambda t: {'quiz_template_pk': t.teacher_quiz_template.pk}),
+    ('teacher-question-template-options-list', TEACHER, lambda t: {
+        'quiz_template_pk': t.teacher_quiz_template.pk, 'question_template_pk': t.teacher_question_template.pk}),
+    # --- education: Studente ---
+    ('student-dashboard-quizzes', STUDENT, lambda t: {}),
+    ('student-dashboard-pathways', STUDENT, lambda t: {}),
+    ('student-pathway-attempt-detail', STUDENT, lambda t: {'pk': t.pathway.pk}),
+    ('attempt-details', STUDENT, lambda t: {'pk': t.attempt.pk}),
+    ('attempt-current-question', STUDENT, lambda t: {'pk': t.open_attempt.pk}),
+    ('attempt-quiz', STUDENT, lambda t: {'pk': t.open_attempt.pk}),
+    ('attempt-rewards', STUDENT, lambda t: {'pk': t.attempt.pk}),
+    # --- rewards ---
+    ('reward-template-list', TEACHER, lambda t: {}),
+    ('reward-list', TEACHER, lambda t: {}),
+    ('teacher-delivery-list-pending', TEACHER, lambda t: {}),
+    ('badge-list', TEACHER, lambda t: {}),
+    ('student-shop-list', STUDENT, lambda t: {}),
+    ('student-wallet-list', STUDENT, lambda t: {}),
+    ('student-wallet-transactions', STUDENT, lambda t: {'pk': t.student.wallet.pk}),
+    ('student-purchases-list', STUDENT, lambda t: {}),
+    ('student-earned-badge-list', STUDENT, lambda t: {}),
+    ('student-dashboard-wallet', STUDENT, lambda t: {}),
+    # --- users ---
+    ('admin-user-list', ADMIN, lambda t: {}),
+    ('admin-user-me', TEACHER, lambda t: {}),
+    ('student-list', TEACHER, lambda t: {}),
+    ('teacher-registration-token-list', TEACHER, lambda t: {}),
+    ('teacher-student-progress-summary', TEACHER, lambda t: {}),
+    # --- lezioni ---
+    ('lezioni:subject-list', TEACHER, lambda t: {}),
+    ('lezioni:topic-list', TEACHER, lambda t: {}),
+    ('lezioni:lesson-list', TEACHER, lambda t: {}),
+    ('lezioni:lesson-detail', TEACHER, lambda t: {'pk': t.lesson.pk}),
+    ('lezioni:lesson-content-list', TEACHER, lambda t: {'lesson_pk': t.lesson.pk}),
+    ('lezioni:lessonassignment-list', TEACHER, lambda t: {}),
+    ('lezioni:lessonassignment-list', STUDENT, lambda t: {}),
+]
+
+# Rotte GET dei router escluse dal budget, con il motivo
+EXCLUDED_ROUTES = {
+    'quiz-attempts-list': 'il ViewSet espone solo start-attempt (POST)',
+}
+
+
+def _router_route_names():
+    """ Nomi URL delle rotte GET di collezione (list e azioni extra) registrate nei router. """
+    names = set()
+    for module_name in ROUTER_MODULES:
+        module = importlib.import_module(module_name)
+        namespace = getattr(module, 'app_name', None)
+        for router in (obj for obj in vars(module).values() if isinstance(obj, BaseRouter)):
+            for _prefix, viewset, basename in router.registry:
+                route_names = []
+                if hasattr(viewset, 'list'):
+                    route_names.append(f'{basename}-list')
+                route_names += [
+                    f'{basename}-{action.url_name}' for action in viewset.get_extra_actions() if 'get' in action.mapping
+                ]
+                names.update(f'{namespace}:{name}' if namespace else name for name in route_names)
+    return names
+
+
+class QueryBudgetTests(APITestCase):
+    """ Il numero di query di ogni endpoint non deve crescere con la dimensione della classe. """
+
+    def setUp(self):
+        self.admin = UserFactory(admin=True)
+        self.teacher = UserFactory(role=UserRole.TEACHER)
+        self.student = StudentFactory(teacher=self.teacher)
+        self.subject = Subject.objects.create(name='Storia', creator=self.teacher)
+        self.topic = Topic.objects.create(name='Roma antica', subject=self.subject, creator=self.teacher)
+        self.badges = [
+            Badge.objects.create(name=f'Badge {i}', trigger_type=Badge.TriggerType.QUIZ_COMPLETED, trigger_condition={})
+            for i in range(3)
+        ]
+        self._round = 0
+        self._grow()
+
+        # Oggetti "di riferimento" usati dagli endpoint di dettaglio: crescono insieme alla classe
+        self.quiz = self.quizzes[0]
+        self.question = self.quiz.questions.first()
+        self.attempt = self.reference_attempt
+        self.open_attempt = QuizAttemptFactory(student=self.student, quiz=self.quiz)
+        Job.objects.create(
+            kind=ATTEMPT_REWARDS_JOB, idempotency_key=attempt_rewards_key(self.attempt.pk),
+            status=Job.JobStatus.DONE, result={'earned_badge_ids': [badge.pk for badge in self.badges]},
+        )
+
+        response = self.client.post(reverse('student-login'), {'student_code': self.student.student_code, 'pin': '1234'})
+        self.student_token = response.data['access']
+
+    # --- Costruzione dei dati ---
+
+    def _add_question(self, quiz):
+        question = QuestionFactory(quiz=quiz, question_type=QuestionType.MULTIPLE_CHOICE_SINGLE)
+        AnswerOptionFactory(question=question, is_correct=True)
+        AnswerOptionFactory(question=question, is_correct=False)
+        return question
+
+    def _grow(self):
+        """ Aggiunge alla classe studenti, quiz, risposte, percorsi, ricompense e lezioni. """
+        self._round += 1
+        classmates = [self.student] + StudentFactory.create_batch(2, teacher=self.teacher)
+        if self._round == 1:
+            self.quizzes, self.pathway = [], PathwayFactory(teacher=self.teacher)
+            self.quiz_template = QuizTemplateFactory(admin=self.admin)
+            self.teacher_quiz_template = QuizTemplateFactory(admin=None, teacher=self.teacher)
+            self.pathway_template = PathwayTemplate.objects.create(teacher=self.teacher, title='Template percorso')
+            self.lesson = Lesson.objects.create(title='Lezione', topic=self.topic, creator=self.teacher)
+        new_quizzes = QuizFactory.create_batch(2, teacher=self.teacher)
+        self.quizzes += new_quizzes
+
+        for quiz in self.quizzes:
+            # Ogni giro aggiunge domande anche ai quiz esistenti (e risposte ai tentativi)
+            self._add_question(quiz)
+            self._add_question(quiz)
+        for order, quiz in enumerate(new_quizzes, start=PathwayQuiz.objects.filter(pathway=self.pathway).count() + 1):
+            PathwayQuiz.objects.create(pathway=self.pathway, quiz=quiz, order=order)
+
+        for student in classmates:
+            PathwayAssignmentFactory(student=student, pathway=self.pathway)
+            PathwayProgressFactory(student=student, pathway=self.pathway)
+            for quiz in new_quizzes:
+                QuizAssignmentFactory(student=student, quiz=quiz, assigned_by=self.teacher)
+            for quiz in self.quizzes:
+                attempt = QuizAttemptFactory(student=student, quiz=quiz, completed=True)
+                if student == self.student and quiz == self.quizzes[0] and self._round == 1:
+                    self.reference_attempt = attempt
+                for question in quiz.questions.all():
+                    StudentAnswerFactory(quiz_attempt=attempt, question=question, is_correct=True, score=1)
+                QuizAttemptFactory(student=student, quiz=quiz, pending=True)
+            student.wallet.add_points(500, 'Budget di prova')
+            reward = RewardFactory(teacher=self.teacher, cost_points=10)
+            RewardPurchaseFactory(student=student, reward=reward)
+            EarnedBadge.objects.get_or_create(student=student, badge=self.badges[self._round - 1])
+            LessonAssignment.objects.get_or_create(lesson=self.lesson, student=student, defaults={'assigned_by': self.teacher})
+            RegistrationToken.objects.create(teacher=self.teacher)
+
+        # Il tentativo di riferimento (endpoint di dettaglio) riceve le risposte alle nuove domande
+        answered = set(self.reference_attempt.student_answers.values_list('question_id', flat=True))
+        for question in self.quizzes[0].questions.exclude(pk__in=answered):
+            StudentAnswerFactory(quiz_attempt=self.reference_attempt, question=question, is_correct=True, score=1)
+
+        # Template (Admin e Docente) con domande e opzioni
+        for template in (self.quiz_template, self.teacher_quiz_template):
+            for _ in range(2):
+                question_template = QuestionTemplateFactory(quiz_template=template, mc_single=True)
+                AnswerOptionTemplateFactory.create_batch(2, question_template=question_template)
+        self.question_template = self.quiz_template.question_templates.first()
+        self.teacher_question_template = self.teacher_quiz_template.question_templates.first()
+        PathwayQuizTemplate.objects.create(
+            pathway_template=self.pathway_template,
+            quiz_template=QuizTemplateFactory(admin=None, teacher=self.teacher),
+            order=self._round,
+        )
+        RewardTemplateFactory(creator=self.teacher)
+        LessonContent.objects.create(lesson=self.lesson, content_type='html', html_content='<p>Testo</p>', order=self._round)
+        extra_lesson = Lesson.objects.create(title=f'Lezione {self._round}', topic=self.topic, creator=self.teacher)
+        LessonContent.objects.create(lesson=extra_lesson, content_type='html', html_content='<p>Testo</p>', order=1)
+        for student in classmates:
+            LessonAssignment.objects.create(lesson=extra_lesson, student=student, assigned_by=self.teacher)
+
+    # --- Misura ---
+
+    def _authenticate(self, role):
+        self.client.force_authenticate(user=None)
+        self.client.credentials()
+        if role == STUDENT:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.student_token}')
+        else:
+            self.client.force_authenticate(user=self.admin if role == ADMIN else self.teacher)
+
+    def _measure(self, url_name, role, kwargs_func):
+        """ Esegue la richiesta (dopo una chiamata di riscaldamento delle cache) e cattura le query. """
+        self._authenticate(role)
+        url = reverse(url_name, kwargs=kwargs_func(self))
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        return response.status_code, [query['sql'] for query in captured.captured_queries]
+
+    def _measure_all(self):
+        return {(name, role): self._measure(name, role, kwargs_func) for name, role, kwargs_func in ENDPOINTS}
+
+    # --- Test ---
+
+    def test_every_router_endpoint_has_a_budget(self):
+        budgeted = {name for name, _role, _kwargs in ENDPOINTS}
+        missing = _router_route_names() - budgeted - set(EXCLUDED_ROUTES)
+        self.assertFalse(missing, f"Endpoint senza budget di query: {sorted(missing)}")
+
+    def test_query_count_does_not_grow_with_class_size(self):
+        small = self._measure_all()
+        self._grow()
+        self._grow()
+        large = self._measure_all()
+
+        report = []
+        for (name, role), (status_small, queries_small) in small.items():
+            status_large, queries_large = large[(name, role)]
+            if status_small >= 500 or status_large >= 500:
+                report.append(f"{name} [{role}]: errore del server ({status_small}/{status_large})")
+            elif len(queries_large) > len(queries_small):
+                report.append(
+                    f"{name} [{role}]: {len(queries_small)} -> {len(queries_large)} query\n"
+                    + "  classe piccola:\n    " + "\n    ".join(queries_small)
+                    + "\n  classe grande:\n    " + "\n    ".join(queries_large)
+                )
+        self.assertFalse(report, "Budget di query superato:\n\n" + "\n\n".join(report))
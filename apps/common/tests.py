@@ -0,0 +1,300 @@
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.common.cache import bump_version, get_or_set, get_version, make_key
+from apps.common.jobs import claim_jobs, enqueue, register_job, run_job, run_pending
+from apps.common.metrics import PerformanceMetricsMiddleware, registry, resolve_view_name
+from apps.common.models import Job
+from apps.common.pagination import keyset_ordering
+from apps.rewards.factories import RewardFactory
+from apps.rewards.models import Badge, PointTransaction
+from apps.users.factories import StudentFactory, UserFactory
+from apps.users.models import UserRole
+from lezioni.models import Subject
+
+
+class SharedCacheTests(TestCase):
+    """ Test per il livello di cache condiviso (namespace, versioni, stampede). """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unknown_namespace_is_rejected(self):
+        with self.assertRaises(ValueError):
+            make_key('sconosciuto', 'x')
+
+    def test_get_or_set_computes_once(self):
+        calls = []
+        compute = lambda: calls.append(1) or 'valore'
+        self.assertEqual(get_or_set('education', 'k', compute=compute), 'valore')
+        self.assertEqual(get_or_set('education', 'k', compute=compute), 'valore')
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_set_uses_backend_default_timeout(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            get_or_set('education', 'k', compute=lambda: 'valore')
+        key = make_key('education', 'k')
+        self.assertEqual(cache_set.call_args.args, (key, 'valore', DEFAULT_TIMEOUT))
+
+    def test_evicted_version_is_reseeded_from_timestamp(self):
+        get_version('education')
+        bump_version('education')
+        before = int(time.time())
+        cache.delete('cachever:education')
+        # Ripartire da 1 renderebbe di nuovo valide le chiavi scritte con le prime versioni
+        self.assertGreaterEqual(get_version('education'), before)
+
+    def test_bump_version_invalidates_namespace_and_scope(self):
+        key_ns = make_key('rewards', 'catalogue')
+        key_scoped = make_key('rewards', 'catalogue', scope='student:1')
+        bump_version('rewards', 'student:1')
+        self.assertEqual(make_key('rewards', 'catalogue'), key_ns)
+        self.assertNotEqual(make_key('rewards', 'catalogue', scope='student:1'), key_scoped)
+        bump_version('rewards')
+        self.assertNotEqual(make_key('rewards', 'catalogue'), key_ns)
+
+    def test_model_signals_bump_versions(self):
+        teacher = UserFactory(role=UserRole.TEACHER)
+        rewards_version = get_version('rewards')
+        scope_version = get_version('rewards', f'teacher:{teacher.pk}')
+        RewardFactory(teacher=teacher)
+        self.assertEqual(get_version('rewards'), rewards_version) # Solo il catalogo del docente
+        self.assertGreater(get_version('rewards', f'teacher:{teacher.pk}'), scope_version)
+        Badge.objects.create(name='Primo', description='Primo', trigger_type=Badge.TriggerType.QUIZ_COMPLETED)
+        self.assertGreater(get_version('rewards'), rewards_version)
+
+        lezioni_version = get_version('lezioni')
+        Subject.objects.create(name='Storia')
+        self.assertGreater(get_version('lezioni'), lezioni_version)
+
+    def test_student_changes_bump_only_student_scope(self):
+        student = StudentFactory()
+        users_version = get_version('users')
+        scope_version = get_version('users', f'student:{student.pk}')
+        student.first_name = 'Nuovo'
+        student.save()
+        self.assertEqual(get_version('users'), users_version)
+        self.assertGreater(get_version('users', f'student:{student.pk}'), scope_version)
+
+    @override_settings(CACHE_STAMPEDE_LOCK_TIMEOUT=2)
+    def test_concurrent_callers_wait_for_lock_holder(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_compute():
+            calls.append('lento')
+            started.set()
+            release.wait(2)
+            return 'calcolato'
+
+        results = []
+        holder = threading.Thread(target=lambda: results.append(get_or_set('lezioni', 'pesante', compute=slow_compute)))
+        holder.start()
+        started.wait(2)
+        waiter = threading.Thread(target=lambda: results.append(get_or_set('lezioni', 'pesante', compute=lambda: calls.append('secondo') or 'altro')))
+        waiter.start()
+        release.set()
+        holder.join()
+        waiter.join()
+
+        self.assertEqual(results, ['calcolato', 'calcolato'])
+        self.assertEqual(calls, ['lento'])
+
+
+_calls = []
+
+
+@register_job('test.record')
+def _record_job(payload):
+    _calls.append(payload['value'])
+    return {'recorded': payload['value']}
+
+
+@register_job('test.fail')
+def _failing_job(payload):
+    raise RuntimeError('errore simulato')
+
+
+class JobQueueTests(TestCase):
+    """ Test per la coda di job persistente. """
+
+    def setUp(self):
+        _calls.clear()
+
+    def test_enqueue_is_idempotent(self):
+        first = enqueue('test.record', {'value': 1}, idempotency_key='k-1')
+        second = enqueue('test.record', {'value': 2}, idempotency_key='k-1')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_unknown_kind_is_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue('test.sconosciuto', {}, idempotency_key='k-x')
+
+    def test_run_pending_executes_once(self):
+        job = enqueue('test.record', {'value': 7}, idempotency_key='k-7')
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(run_pending(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.JobStatus.DONE)
+        self.assertEqual(job.result, {'recorded': 7})
+        # Un job concluso non viene rieseguito
+        run_job(job.pk)
+        self.assertEqual(_calls, [7])
+
+    def test_failing_job_is_retried_then_failed(self):
+        job = enqueue('test.fail', {}, idempotency_key='k-fail')
+        Job.objects.filter(pk=job.pk).update(max_attempts=2)
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.JobStatus.PENDING)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('errore simulato', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.JobStatus.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_stale_running_job_is_reclaimed(self):
+        job = enqueue('test.record', {'value': 3}, idempotency_key='k-stale')
+        Job.objects.filter(pk=job.pk).update(status=Job.JobStatus.RUNNING, locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim_jobs(), [job.pk])
+        self.assertEqual(claim_jobs(), []) # Appena riservato: non ripreso da un altro worker
+
+    def test_run_jobs_command_once(self):
+        enqueue('test.record', {'value': 5}, idempotency_key='k-cmd')
+        out = StringIO()
+        call_command('run_jobs', '--once', stdout=out)
+        self.assertIn('Job eseguiti: 1', out.getvalue())
+        self.assertEqual(_calls, [5])
+
+
+class PerformanceMetricsTests(TestCase):
+    """ Test per il middleware di metriche e l'endpoint Prometheus. """
+
+    def setUp(self):
+        registry.reset()
+        cache.clear()
+        self.client = APIClient()
+        self.teacher = UserFactory(role=UserRole.TEACHER)
+        StudentFactory.create_batch(2, teacher=self.teacher)
+
+    @override_settings(PERF_METRICS_SAMPLE_RATE=1.0)
+    def test_sampled_request_records_queries_per_view(self):
+        self.client.force_authenticate(user=self.teacher)
+        self.client.get(reverse('student-list'))
+        metrics = registry.snapshot()['StudentViewSet.list']
+        self.assertEqual(metrics['requests'], 1)
+        self.assertEqual(metrics['sampled'], 1)
+        self.assertEqual(metrics['statuses'], {'2xx': 1})
+        self.assertGreater(metrics['queries'], 0)
+        self.assertGreater(metrics['serializer_time'], 0)
+
+    @override_settings(PERF_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_request_records_only_timing(self):
+        self.client.force_authenticate(user=self.teacher)
+        self.client.get(reverse('student-list'))
+        metrics = registry.snapshot()['StudentViewSet.list']
+        self.assertEqual((metrics['requests'], metrics['sampled'], metrics['queries']), (1, 0, 0))
+        self.assertGreater(metrics['duration_sum'], 0)
+
+    @override_settings(PERF_METRICS_SAMPLE_RATE=1.0, PERF_SLOW_REQUEST_MS=1)
+    def test_cache_counters_and_slow_request_log(self):
+        def view(request):
+            for _ in range(2):
+                get_or_set('education', 'metriche', compute=lambda: list(Subject.objects.all()))
+            time.sleep(0.005)
+            return HttpResponse('ok')
+
+        middleware = PerformanceMetricsMiddleware(view)
+        request = RequestFactory().get('/prova/')
+        with self.assertLogs('apps.common.metrics', 'WARNING') as logs:
+            middleware.process_view(request, view, (), {})
+            middleware(request)
+        self.assertIn('Richiesta lenta', logs.output[0])
+        self.assertIn('lezioni_subject', logs.output[0]) # Istruzione SQL più costosa riportata
+        metrics = registry.snapshot()[resolve_view_name(view, 'get')]
+        self.assertEqual((metrics['cache_hits'], metrics['cache_misses'], metrics['slow']), (1, 1, 1))
+
+    def test_metrics_endpoint_is_admin_only(self):
+        self.client.force_authenticate(user=self.teacher)
+        self.client.get(reverse('student-list'))
+        self.assertEqual(self.client.get(reverse('perf-metrics')).status_code, 403)
+
+        self.client.force_authenticate(user=UserFactory(admin=True))
+        response = self.client.get(reverse('perf-metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('eduapp_request_duration_seconds_bucket{view="StudentViewSet.list",le="+Inf"} 1', body)
+        self.assertIn('eduapp_requests_total{view="StudentViewSet.list",status="2xx"} 1', body)
+
+
+class ListPaginationTests(TestCase):
+    """ Test per la paginazione a cursore e i campi sparsi (?fields=) degli elenchi. """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.teacher = UserFactory(role=UserRole.TEACHER)
+        self.student = StudentFactory(teacher=self.teacher)
+        for points in range(1, 6):
+            self.student.wallet.add_points(points, f"Quiz {points}")
+
+    def _pages(self, url):
+        """ Segue i link `next` e restituisce le pagine. """
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data['results'])
+            url = response.data['next']
+        return pages
+
+    def test_keyset_ordering_uses_queryset_ordering(self):
+        self.assertEqual(keyset_ordering(PointTransaction.objects.all()), ('-timestamp',))
+        self.assertEqual(keyset_ordering(PointTransaction.objects.order_by('wallet')), ('-pk',)) # Relazione: non usabile
+
+    def test_transactions_are_paged_by_cursor_with_sparse_fields(self):
+        login = self.client.post(reverse('student-login'), {'student_code': self.student.student_code, 'pin': '1234'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {login.data['access']}")
+        url = reverse('student-wallet-transactions', kwargs={'pk': self.student.pk})
+        pages = self._pages(f"{url}?page_size=2&fields=id,points_change")
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        rows = [row for page in pages for row in page]
+        self.assertEqual([row['points_change'] for row in rows], [5, 4, 3, 2, 1]) # '-timestamp'
+        self.assertTrue(all(set(row) == {'id', 'points_change'} for row in rows))
+
+    def test_lists_are_plain_arrays_unless_pagination_is_requested(self):
+        StudentFactory.create_batch(2, teacher=self.teacher)
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.get(reverse('student-list'))
+        self.assertIsInstance(response.data, list) # Contratto dei frontend: array completo
+        self.assertEqual(len(response.data), 3)
+        pages = self._pages(f"{reverse('student-list')}?page_size=2")
+        self.assertEqual([len(page) for page in pages], [2, 1])
+
+    def test_sparse_fields_apply_only_to_reads_of_the_listed_objects(self):
+        StudentFactory(teacher=self.teacher)
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.get(reverse('student-list'), {'fields': 'id,first_name,sconosciuto', 'page_size': 1})
+        self.assertEqual(list(response.data['results'][0]), ['id', 'first_name'])
+        self.assertIsNotNone(response.data['next'])
+        detail_url = reverse('student-detail', kwargs={'pk': self.student.pk})
+        updated = self.client.patch(f"{detail_url}?fields=id", {'first_name': 'Ada'})
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(updated.data['first_name'], 'Ada') # Le scritture restituiscono tutti i campi
@@ -0,0 +1,14 @@
+from django.http import HttpResponse
+from rest_framework import permissions
+from rest_framework.views import APIView
+
+from apps.users.permissions import IsAdminUser
+from .metrics import render_prometheus
+
+
+class MetricsView(APIView):
+    """ Metriche di performance del processo in formato testo Prometheus (solo Admin). """
+    permission_classes = [permissions.IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class EducationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.education' # Use the full path
+
+    def ready(self):
+        """
+        Importa i segnali e registra i job asincroni quando l'app è pronta.
+        """
+        import apps.education.signals # Importa il modulo dei segnali
+        import apps.education.jobs # Registra gli handler della coda job
@@ -0,0 +1,278 @@
+"""
+Harness di carico per il flusso quiz dello studente.
+
+- `seed()` crea N docenti × M studenti con quiz a scelta singola assegnati (factory di test,
+  come `seed_test_data`), `cleanup()` li rimuove.
+- `run_benchmark()` simula studenti concorrenti (thread) che eseguono login, start-attempt,
+  current-question / submit-answer fino all'ultima domanda e complete. Le richieste passano
+  dal client di test di Django (in processo, con conteggio delle query) oppure via HTTP verso
+  un server avviato a parte (es. gunicorn locale, senza conteggio delle query).
+- `build_report()` calcola per endpoint i percentili di latenza, le query per richiesta e il
+  throughput; `compare_reports()` confronta un report con una baseline JSON salvata.
+
+Usato dal comando `python manage.py benchmark_quiz_flow`.
+"""
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.users.factories import UserFactory, StudentFactory
+from apps.users.models import Student, User, UserRole
+from .factories import QuizFactory, QuestionFactory, AnswerOptionFactory, QuizAssignmentFactory
+from .models import Quiz, QuestionType
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PIN = '1234'
+
+# Endpoint misurati, nell'ordine del flusso
+ENDPOINTS = ('login', 'start_attempt', 'current_question', 'submit_answer', 'complete_attempt')
+
+
+@dataclass
+class BenchmarkData:
+    """ Dati creati da `seed()`: codici degli studenti e quiz assegnati a ciascuno. """
+    run_id: str
+    teacher_ids: list = field(default_factory=list)
+    students: list = field(default_factory=list) # [(student_code, [quiz_id, ...]), ...]
+
+
+def seed(teachers: int, students_per_teacher: int, quizzes_per_teacher: int = 2,
+         questions_per_quiz: int = 5, pin: str = DEFAULT_PIN) -> BenchmarkData:
+    """ Crea docenti, studenti e quiz (domande a scelta singola con 4 opzioni) assegnati a tutti. """
+    data = BenchmarkData(run_id=uuid.uuid4().hex[:8])
+    for t in range(teachers):
+        teacher = UserFactory(role=UserRole.TEACHER, username=f'bench-{data.run_id}-t{t}')
+        data.teacher_ids.append(teacher.pk)
+        quizzes = QuizFactory.create_batch(quizzes_per_teacher, teacher=teacher)
+        for quiz in quizzes:
+            for order in range(questions_per_quiz):
+                question = QuestionFactory(quiz=quiz, mc_single=True, order=order)
+                for option_order in range(4):
+                    AnswerOptionFactory(question=question, is_correct=option_order == 0, order=option_order)
+        for s in range(students_per_teacher):
+            student = StudentFactory(teacher=teacher, student_code=f'bench-{data.run_id}-{t}-{s}', pin=pin)
+            for quiz in quizzes:
+                QuizAssignmentFactory(student=student, quiz=quiz, assigned_by=teacher)
+            data.students.append((student.student_code, [quiz.pk for quiz in quizzes]))
+    logger.info(f"Benchmark {data.run_id}: creati {teachers} docenti e {len(data.students)} studenti.")
+    return data
+
+
+def cleanup(data: BenchmarkData) -> None:
+    """ Elimina i dati creati da `seed()` (quiz, studenti con tentativi e wallet, docenti). """
+    Quiz.objects.filter(teacher_id__in=data.teacher_ids).delete()
+    Student.objects.filter(teacher_id__in=data.teacher_ids).delete()
+    User.objects.filter(pk__in=data.teacher_ids).delete()
+
+
+# --- Trasporti ---
+
+class DjangoClientTransport:
+    """ Richieste in processo con il client di test di Django; conta le query di ogni richiesta. """
+    counts_queries = True
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method: str, path: str, payload=None, token: str | None = None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        with CaptureQueriesContext(connection) as captured:
+            if method == 'GET':
+                response = self.client.get(path, **headers)
+            else:
+                response = self.client.post(path, payload or {}, content_type='application/json', **headers)
+        body = response.json() if response.content and response.get('Content-Type', '').startswith('application/json') else None
+        return response.status_code, body, len(captured.captured_queries)
+
+
+class HttpTransport:
+    """ Richieste HTTP verso un server già avviato (es. `gunicorn config.wsgi`); query non misurabili. """
+    counts_queries = False
+
+    def __init__(self, base_url: str, timeout: float = 30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, payload=None, token: str | None = None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        data = json.dumps(payload or {}).encode() if method != 'GET' else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status_code, raw = response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            status_code, raw = exc.code, exc.read()
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            body = None
+        return status_code, body, None
+
+
+# --- Simulazione ---
+
+class Recorder:
+    """ Raccoglie (thread-safe) latenza, query e stato di ogni richiesta, per endpoint. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {name: [] for name in ENDPOINTS}
+        self.flows_completed = 0
+
+    def add(self, endpoint: str, seconds: float, queries: int | None, status_code: int):
+        with self._lock:
+            self.samples[endpoint].append((seconds, queries, status_code))
+
+    def flow_done(self):
+        with self._lock:
+            self.flows_completed += 1
+
+
+def _call(transport, recorder, endpoint, method, path, payload=None, token=None, expected=(200, 201)):
+    started = time.perf_counter()
+    status_code, body, queries = transport.request(method, path, payload, token)
+    recorder.add(endpoint, time.perf_counter() - started, queries, status_code)
+    if status_code not in expected:
+        raise RuntimeError(f"{endpoint}: risposta {status_code} inattesa ({body})")
+    return status_code, body
+
+
+def run_student_flow(transport, recorder: Recorder, student_code: str, quiz_ids, pin: str = DEFAULT_PIN) -> None:
+    """ Login e svolgimento completo di tutti i quiz assegnati, rispondendo con la prima opzione. """
+    _status, body = _call(transport, recorder, 'login', 'POST', reverse('student-login'),
+                          {'student_code': student_code, 'pin': pin})
+    token = body['access']
+    for quiz_id in quiz_ids:
+        _status, attempt = _call(transport, recorder, 'start_attempt', 'POST',
+                                 reverse('quiz-attempts-start-attempt', kwargs={'quiz_pk': quiz_id}), token=token)
+        attempt_id = attempt['id']
+        while True:
+            status_code, question = _call(transport, recorder, 'current_question', 'GET',
+                                          reverse('attempt-current-question', kwargs={'pk': attempt_id}),
+                                          token=token, expected=(200, 204))
+            if status_code == 204: # Nessuna domanda rimasta
+                break
+            if question['question_type'] not in (QuestionType.MULTIPLE_CHOICE_SINGLE, QuestionType.TRUE_FALSE):
+                raise RuntimeError(f"Tipo di domanda non gestito dal benchmark: {question['question_type']}")
+            _call(transport, recorder, 'submit_answer', 'POST',
+                  reverse('attempt-submit-answer', kwargs={'pk': attempt_id}),
+                  {'question_id': question['id'], 'selected_answers': {'answer_option_id': question['answer_options'][0]['id']}},
+                  token=token)
+        _call(transport, recorder, 'complete_attempt', 'POST',
+              reverse('attempt-complete-attempt', kwargs={'pk': attempt_id}), token=token)
+    recorder.flow_done()
+
+
+def run_benchmark(data: BenchmarkData, concurrency: int = 4, transport_factory=DjangoClientTransport,
+                  pin: str = DEFAULT_PIN) -> tuple[Recorder, float, list]:
+    """
+    Esegue il flusso per tutti gli studenti con `concurrency` thread.
+    Restituisce (recorder, durata in secondi, errori). Con concurrency=1 il flusso gira nel
+    thread corrente (necessario nei test, dove i dati non sono visibili ad altre connessioni).
+    """
+    recorder = Recorder()
+    errors = []
+
+    def worker(student):
+        try:
+            run_student_flow(transport_factory(), recorder, *student, pin=pin)
+        except Exception as exc: # Un flusso fallito non interrompe gli altri
+            logger.warning(f"Benchmark: flusso dello studente {student[0]} fallito: {exc}")
+            errors.append(f"{student[0]}: {exc}")
+        finally:
+            if concurrency > 1:
+                connections.close_all() # Ogni thread ha le proprie connessioni al database
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for student in data.students:
+            worker(student)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, data.students))
+    return recorder, time.perf_counter() - started, errors
+
+
+# --- Report ---
+
+def percentile(values, pct: float) -> float:
+    """ Percentile con interpolazione lineare (pct tra 0 e 100). """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def build_report(recorder: Recorder, wall_time: float, config: dict | None = None) -> dict:
+    """ Report serializzabile in JSON: totali e statistiche per endpoint (latenze in ms). """
+    endpoints = {}
+    total_requests = total_errors = 0
+    for name, samples in recorder.samples.items():
+        latencies = [seconds * 1000 for seconds, _queries, _status in samples]
+        queries = [q for _seconds, q, _status in samples if q is not None]
+        errors = sum(1 for _seconds, _queries, status_code in samples if status_code >= 400)
+        total_requests += len(samples)
+        total_errors += errors
+        endpoints[name] = {
+            'count': len(samples),
+            'errors': errors,
+            'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p90_ms': round(percentile(latencies, 90), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'max_ms': round(max(latencies), 3) if latencies else 0.0,
+            'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+    return {
+        'config': config or {},
+        'totals': {
+            'requests': total_requests,
+            'errors': total_errors,
+            'flows': recorder.flows_completed,
+            'wall_time_s': round(wall_time, 3),
+            'requests_per_s': round(total_requests / wall_time, 2) if wall_time else 0.0,
+            'flows_per_s': round(recorder.flows_completed / wall_time, 2) if wall_time else 0.0,
+        },
+        'endpoints': endpoints,
+    }
+
+
+def compare_reports(baseline: dict, current: dict, tolerance: float = 0.2) -> list[str]:
+    """
+    Confronta un report con la baseline e restituisce le regressioni: p95 o throughput peggiorati
+    oltre la tolleranza relativa, oppure più query per richiesta (nessuna tolleranza).
+    """
+    regressions = []
+    old_rps = baseline.get('totals', {}).get('requests_per_s') or 0
+    new_rps = current['totals']['requests_per_s']
+    if old_rps and new_rps < old_rps * (1 - tolerance):
+        regressions.append(f"throughput: {old_rps} -> {new_rps} richieste/s")
+    for name, stats in current['endpoints'].items():
+        old = baseline.get('endpoints', {}).get(name)
+        if not old or not stats['count']:
+            continue
+        if old['p95_ms'] and stats['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old['p95_ms']} -> {stats['p95_ms']} ms")
+        if old.get('queries_mean') is not None and stats['queries_mean'] is not None \
+                and stats['queries_mean'] > old['queries_mean']:
+            regressions.append(f"{name}: query per richiesta {old['queries_mean']} -> {stats['queries_mean']}")
+    return regressions
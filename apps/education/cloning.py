@@ -0,0 +1,135 @@
+"""
+Creazione di Quiz e Pathway concreti a partire dai template.
+
+L'albero dei template (quiz del percorso, domande, opzioni) viene letto con un numero fisso di
+query e le nuove righe vengono scritte con `bulk_create`, un'istruzione per tabella:
+clonare un percorso di 10 quiz da 40 domande costa una decina di query, non centinaia.
+Gli ID dei template vengono associati ai nuovi oggetti in memoria.
+
+`bulk_create` non invia i segnali post_save: al termine viene invalidato esplicitamente il
+namespace 'education' della cache condivisa, come farebbero i segnali (apps.education.signals).
+Per ogni nuovo quiz viene creata anche la riga QuizAnswerKey (versione 0): la chiave di
+risposta viene compilata alla prima lettura.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+
+from apps.common.cache import bump_version
+from .models import (
+    QuizTemplate, QuestionTemplate, AnswerOptionTemplate, PathwayTemplate, PathwayQuizTemplate,
+    Quiz, QuizAnswerKey, Question, AnswerOption, Pathway, PathwayQuiz,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _copy(metadata) -> dict:
+    return metadata.copy() if metadata else {}
+
+
+def _invalidate_education_cache() -> None:
+    """ Stessa invalidazione dei segnali: subito e di nuovo al commit. """
+    bump_version('education')
+    transaction.on_commit(lambda: bump_version('education'))
+
+
+def _load_template_trees(template_ids) -> tuple[dict, dict]:
+    """
+    Domande e opzioni dei template indicati (due query):
+    ({quiz_template_id: [QuestionTemplate, ...]}, {question_template_id: [AnswerOptionTemplate, ...]}),
+    entrambe ordinate per 'order'.
+    """
+    questions_by_template = defaultdict(list)
+    for q_template in QuestionTemplate.objects.filter(quiz_template_id__in=template_ids).order_by('quiz_template_id', 'order', 'id'):
+        questions_by_template[q_template.quiz_template_id].append(q_template)
+    options_by_question = defaultdict(list)
+    options = AnswerOptionTemplate.objects.filter(
+        question_template__quiz_template_id__in=template_ids
+    ).order_by('question_template_id', 'order', 'id')
+    for opt_template in options:
+        options_by_question[opt_template.question_template_id].append(opt_template)
+    return questions_by_template, options_by_question
+
+
+def _clone_quizzes(items, teacher) -> list[Quiz]:
+    """
+    Crea un Quiz per ogni coppia (QuizTemplate, titolo) con domande e opzioni:
+    due letture e quattro bulk_create (quiz, chiavi di risposta, domande, opzioni) indipendentemente
+    dalle dimensioni.
+    """
+    if not items:
+        return []
+    questions_by_template, options_by_question = _load_template_trees({template.id for template, _title in items})
+
+    quizzes = Quiz.objects.bulk_create([
+        Quiz(
+            teacher=teacher,
+            source_template=template,
+            title=title or template.title,
+            description=template.description,
+            metadata=_copy(template.metadata),
+        )
+        for template, title in items
+    ])
+    QuizAnswerKey.objects.bulk_create([QuizAnswerKey(quiz=quiz) for quiz in quizzes])
+
+    questions, pending_options = [], []
+    for quiz, (template, _title) in zip(quizzes, items):
+        # Ordine sequenziale 0-based, come nella creazione manuale da template
+        for order, q_template in enumerate(questions_by_template.get(template.id, [])):
+            question = Question(
+                quiz=quiz,
+                text=q_template.text,
+                question_type=q_template.question_type,
+                order=order,
+                metadata=_copy(q_template.metadata),
+            )
+            questions.append(question)
+            pending_options.append((question, options_by_question.get(q_template.id, [])))
+    Question.objects.bulk_create(questions)
+
+    # Dopo bulk_create le domande hanno la chiave primaria: le opzioni vengono collegate in memoria
+    options = [
+        AnswerOption(question=question, text=opt_template.text, is_correct=opt_template.is_correct, order=opt_template.order)
+        for question, option_templates in pending_options
+        for opt_template in option_templates
+    ]
+    if options:
+        AnswerOption.objects.bulk_create(options)
+
+    _invalidate_education_cache()
+    logger.info(f"Creati {len(quizzes)} quiz ({len(questions)} domande, {len(options)} opzioni) da template per Docente {teacher.id}.")
+    return quizzes
+
+
+@transaction.atomic
+def clone_quiz_template(template: QuizTemplate, teacher, title_override: str = None) -> Quiz:
+    """ Crea una nuova istanza di Quiz (con domande e opzioni) a partire da un QuizTemplate. """
+    quiz = _clone_quizzes([(template, title_override)], teacher)[0]
+    logger.info(f"Creata istanza Quiz ID {quiz.id} da Template ID {template.id} per Docente {teacher.id}")
+    return quiz
+
+
+@transaction.atomic
+def clone_pathway_template(template: PathwayTemplate, teacher, title_override: str = None) -> Pathway:
+    """
+    Crea una nuova istanza di Pathway a partire da un PathwayTemplate: un Quiz per ogni
+    template di quiz del percorso (nello stesso ordine) e i relativi collegamenti PathwayQuiz.
+    """
+    pathway = Pathway.objects.create(
+        teacher=teacher,
+        source_template=template,
+        title=title_override or template.title,
+        description=template.description,
+        metadata=_copy(template.metadata),
+    )
+    links = list(PathwayQuizTemplate.objects.filter(pathway_template=template).select_related('quiz_template').order_by('order'))
+    quizzes = _clone_quizzes([(link.quiz_template, None) for link in links], teacher)
+    if links:
+        PathwayQuiz.objects.bulk_create([
+            PathwayQuiz(pathway=pathway, quiz=quiz, order=link.order) for link, quiz in zip(links, quizzes)
+        ])
+    logger.info(f"Creata istanza Pathway ID {pathway.id} da Template ID {template.id} per Docente {teacher.id}")
+    return pathway
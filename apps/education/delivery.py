@@ -0,0 +1,123 @@
+"""
+Consegna delle domande agli studenti durante un tentativo.
+
+Tutti gli studenti che svolgono lo stesso quiz ricevono le stesse domande: il "bundle" del quiz
+(domande e opzioni senza soluzioni, vedi StudentQuestionSerializer) viene serializzato una sola
+volta per versione del quiz (`Quiz.answer_key_version`, incrementata dai segnali su
+Question/AnswerOption) e salvato nella cache condivisa come JSON già pronto. I bundle stanno in
+un namespace dedicato ('quiz_bundles'), con chiave solo su quiz e versione: le modifiche ad altri
+quiz, template o percorsi (che invalidano il namespace 'education') non li scartano.
+
+Le viste rispondono con i byte salvati, senza ripassare dai serializer, e con un ETag:
+una richiesta con If-None-Match uguale riceve 304. Il quiz completo di un tentativo
+(`AttemptViewSet.quiz`) è diviso in pagine di al massimo QUIZ_PREFETCH_MAX_BYTES di domande.
+"""
+import hashlib
+import logging
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from apps.common.cache import get_or_set
+from .serializers import StudentQuestionSerializer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QuizBundle:
+    """ Domande di un quiz già serializzate (JSON), nell'ordine di svolgimento. """
+    quiz_id: int
+    version: int
+    digest: str  # Hash del contenuto, base degli ETag
+    question_ids: tuple = ()
+    questions: tuple = ()  # JSON (bytes) di ogni domanda, stesso ordine di question_ids
+
+    def next_unanswered(self, answered_ids) -> int | None:
+        """ Indice della prima domanda non ancora risposta (None se sono tutte risposte). """
+        for index, question_id in enumerate(self.question_ids):
+            if question_id not in answered_ids:
+                return index
+        return None
+
+    def question_etag(self, index: int) -> str:
+        return f'"{self.digest}-{self.question_ids[index]}"'
+
+    def page_bounds(self, max_bytes: int) -> list[tuple[int, int]]:
+        """
+        Suddivide le domande in pagine consecutive [inizio, fine) di al massimo `max_bytes` di JSON
+        (almeno una domanda per pagina, anche se da sola supera il limite).
+        """
+        bounds, start, size = [], 0, 0
+        for index, payload in enumerate(self.questions):
+            if index > start and size + len(payload) > max_bytes:
+                bounds.append((start, index))
+                start, size = index, 0
+            size += len(payload) + 1 # Virgola separatrice
+        bounds.append((start, len(self.questions)))
+        return bounds
+
+
+def build_quiz_bundle(quiz) -> QuizBundle:
+    """ Serializza domande e opzioni del quiz (due query). """
+    questions = quiz.questions.prefetch_related('answer_options').order_by('order')
+    renderer = JSONRenderer()
+    rendered = [(item['id'], renderer.render(item)) for item in StudentQuestionSerializer(questions, many=True).data]
+    digest = hashlib.sha256(b"\n".join(payload for _id, payload in rendered)).hexdigest()[:20]
+    logger.debug(f"Bundle domande compilato per Quiz {quiz.id} (versione {quiz.answer_key_version}, {len(rendered)} domande).")
+    return QuizBundle(
+        quiz_id=quiz.id,
+        version=quiz.answer_key_version,
+        digest=digest,
+        question_ids=tuple(question_id for question_id, _payload in rendered),
+        questions=tuple(payload for _question_id, payload in rendered),
+    )
+
+
+def get_quiz_bundle(quiz) -> QuizBundle:
+    """ Bundle del quiz dalla cache condivisa (chiave per quiz e versione del quiz). """
+    return get_or_set(
+        'quiz_bundles', quiz.id, quiz.answer_key_version,
+        compute=lambda: build_quiz_bundle(quiz),
+        timeout=settings.QUIZ_BUNDLE_CACHE_TIMEOUT,
+    )
+
+
+def render_attempt_quiz(attempt, bundle: QuizBundle, page: int, pages: list[tuple[int, int]], answers: dict) -> bytes:
+    """
+    JSON del quiz completo di un tentativo: dati del tentativo e del quiz, una pagina di domande
+    (byte del bundle, senza riserializzarli) e le risposte già date {question_id: selected_answers}.
+    """
+    renderer = JSONRenderer()
+    quiz = attempt.quiz
+    header = renderer.render({
+        'attempt': {'id': attempt.id, 'status': attempt.status, 'started_at': attempt.started_at},
+        'quiz': {'id': quiz.id, 'title': quiz.title, 'description': quiz.description, 'metadata': quiz.metadata},
+        'question_count': len(bundle.question_ids),
+        'page': page,
+        'pages': len(pages),
+        'answered': {str(question_id): selected for question_id, selected in answers.items()},
+    })
+    start, end = pages[page - 1]
+    # Chiude l'oggetto di intestazione e aggiunge la lista di domande già serializzate
+    return header[:-1] + b',"questions":[' + b",".join(bundle.questions[start:end]) + b"]}"
+
+
+def content_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def json_bytes_response(request, body: bytes, etag: str) -> HttpResponse:
+    """ Risposta JSON con byte già serializzati ed ETag; 304 se il client ha già questa versione. """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Dati del tentativo: solo cache del client, da rivalidare a ogni uso
+    response['Cache-Control'] = 'private, no-cache'
+    return response
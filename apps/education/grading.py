@@ -0,0 +1,291 @@
+"""
+Motore di valutazione unico per i tentativi di quiz.
+
+La chiave di risposta (AnswerKey) di un quiz viene costruita una sola volta
+(domande + opzioni corrette in due query) e poi usata per valutare in memoria
+tutte le risposte di un tentativo, sia in `AttemptViewSet.complete_attempt`
+sia in `QuizAttempt.calculate_final_score`.
+
+La chiave compilata è salvata in forma serializzata su QuizAnswerKey (tabella separata dal
+Quiz, scritta solo con update mirati), con la sua versione: i segnali su Question/AnswerOption
+incrementano la versione e svuotano la chiave, che viene ricompilata alla prima lettura.
+"""
+import logging
+from dataclasses import dataclass, field
+
+from django.db.models import F
+
+from .models import QuizAnswerKey, QuestionType, StudentAnswer
+
+logger = logging.getLogger(__name__)
+
+# Testi delle opzioni Vero/Falso interpretati come "vero" (risposte legacy con 'is_true')
+TRUE_OPTION_TEXTS = frozenset({'vero', 'true', 'v'})
+
+
+def _normalize_blank(value, case_sensitive: bool) -> str:
+    """ Normalizza una risposta FILL_BLANK per il confronto. """
+    normalized = str(value).strip()
+    return normalized if case_sensitive else normalized.lower()
+
+
+@dataclass(frozen=True)
+class QuestionKey:
+    """ Informazioni di correzione precompilate per una singola domanda. """
+    question_id: int
+    question_type: str
+    order: int
+    points: float  # Punti assegnati per una risposta corretta
+    max_score: float  # Contributo della domanda a Quiz.get_max_possible_score()
+    correct_option_ids: frozenset = frozenset()
+    tf_truth: bool | None = None  # Valore di verità atteso per TRUE_FALSE
+    correct_blanks: tuple = ()  # Risposte FILL_BLANK già normalizzate
+    case_sensitive: bool = False
+
+    @property
+    def is_manual(self) -> bool:
+        return self.question_type == QuestionType.OPEN_ANSWER_MANUAL
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.question_id,
+            'type': self.question_type,
+            'order': self.order,
+            'points': self.points,
+            'max_score': self.max_score,
+            'options': sorted(self.correct_option_ids),
+            'tf': self.tf_truth,
+            'blanks': list(self.correct_blanks),
+            'cs': self.case_sensitive,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'QuestionKey':
+        return cls(
+            question_id=data['id'],
+            question_type=data['type'],
+            order=data['order'],
+            points=data['points'],
+            max_score=data['max_score'],
+            correct_option_ids=frozenset(data['options']),
+            tf_truth=data['tf'],
+            correct_blanks=tuple(data['blanks']),
+            case_sensitive=data['cs'],
+        )
+
+
+@dataclass(frozen=True)
+class AnswerKey:
+    """ Chiave di risposta compilata di un Quiz. """
+    quiz_id: int
+    questions: dict = field(default_factory=dict)  # question_id -> QuestionKey
+    version: int = 0
+
+    def to_dict(self) -> dict:
+        """ Forma serializzata (JSON) salvata su QuizAnswerKey.data. """
+        return {
+            'version': self.version,
+            'questions': [qk.to_dict() for qk in self.questions.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, quiz_id: int, data: dict) -> 'AnswerKey':
+        questions = (QuestionKey.from_dict(item) for item in data['questions'])
+        return cls(quiz_id=quiz_id, questions={qk.question_id: qk for qk in questions}, version=data['version'])
+
+    @property
+    def manual_question_ids(self) -> frozenset:
+        return frozenset(qid for qid, qk in self.questions.items() if qk.is_manual)
+
+    @property
+    def autograded_count(self) -> int:
+        return sum(1 for qk in self.questions.values() if not qk.is_manual)
+
+    @property
+    def max_possible_score(self) -> float:
+        return sum(qk.max_score for qk in self.questions.values())
+
+
+@dataclass
+class GradingResult:
+    """ Esito della valutazione automatica di un tentativo. """
+    total_points: float = 0.0
+    max_points: float = 0.0
+    correct_count: int = 0
+    graded_count: int = 0
+    best_streak: int = 0  # Massima serie di risposte corrette consecutive (per ordine domanda)
+
+
+def build_question_key(question, options) -> QuestionKey:
+    """ Compila la QuestionKey a partire da una domanda e dalle sue opzioni. """
+    metadata = question.metadata or {}
+    q_type = question.question_type
+    points = float(metadata.get('points_per_correct_answer', 1.0))
+    correct_options = [opt for opt in options if opt.is_correct]
+    correct_option_ids = frozenset(opt.id for opt in correct_options)
+    tf_truth = None
+    correct_blanks = ()
+    case_sensitive = bool(metadata.get('case_sensitive', False))
+
+    if q_type == QuestionType.OPEN_ANSWER_MANUAL:
+        max_score = float(metadata.get('max_score', 1.0))
+    elif q_type == QuestionType.FILL_BLANK:
+        correct_blanks = tuple(
+            _normalize_blank(ans, case_sensitive) for ans in metadata.get('correct_answers', [])
+        )
+        num_blanks = len(metadata.get('correct_answers', [1]))
+        max_score = num_blanks * float(metadata.get('points_per_blank', 1.0))
+    else:
+        max_score = points
+        if q_type == QuestionType.TRUE_FALSE and correct_options:
+            tf_truth = correct_options[0].text.strip().lower() in TRUE_OPTION_TEXTS
+
+    return QuestionKey(
+        question_id=question.id,
+        question_type=q_type,
+        order=question.order,
+        points=points,
+        max_score=max_score,
+        correct_option_ids=correct_option_ids,
+        tf_truth=tf_truth,
+        correct_blanks=correct_blanks,
+        case_sensitive=case_sensitive,
+    )
+
+
+def build_answer_key(quiz) -> AnswerKey:
+    """ Costruisce la chiave di risposta del quiz (domande + opzioni, due query). """
+    questions = quiz.questions.prefetch_related('answer_options').all()
+    return AnswerKey(
+        quiz_id=quiz.id,
+        questions={q.id: build_question_key(q, q.answer_options.all()) for q in questions},
+        version=quiz.answer_key_version,
+    )
+
+
+def get_answer_key(quiz) -> AnswerKey:
+    """
+    Restituisce la chiave di risposta del quiz.
+    Se la chiave salvata (QuizAnswerKey, caricabile con select_related('answer_key_record'))
+    corrisponde alla versione corrente non esegue query, altrimenti la ricompila e la salva
+    (solo se nel frattempo la versione non è cambiata).
+    """
+    record = getattr(quiz, 'answer_key_record', None)
+    stored = record.data if record is not None else None
+    if stored and stored.get('version') == record.version:
+        try:
+            return AnswerKey.from_dict(quiz.id, stored)
+        except (KeyError, TypeError) as e:
+            logger.warning(f"Chiave di risposta non valida per Quiz {quiz.id}, ricompilo: {e}")
+
+    answer_key = build_answer_key(quiz)
+    serialized = answer_key.to_dict()
+    if record is None:
+        # Quiz creato senza segnali (es. bulk_create): la riga nasce con la chiave appena compilata
+        record, created = QuizAnswerKey.objects.get_or_create(quiz_id=quiz.pk, defaults={'data': serialized})
+        quiz.answer_key_record = record
+        if created:
+            return answer_key
+    if QuizAnswerKey.objects.filter(pk=quiz.pk, version=answer_key.version).update(data=serialized):
+        record.data = serialized
+    logger.debug(f"Chiave di risposta compilata per Quiz {quiz.id} (versione {answer_key.version}).")
+    return answer_key
+
+
+def invalidate_answer_key(quiz_id: int) -> None:
+    """ Incrementa la versione della chiave di risposta del quiz e svuota quella salvata. """
+    QuizAnswerKey.objects.filter(pk=quiz_id).update(version=F('version') + 1, data=None)
+
+
+def _selected_option_id(selected: dict):
+    # 'selected_option_id' è il formato precedente ancora presente in risposte salvate
+    return selected.get('answer_option_id', selected.get('selected_option_id'))
+
+
+def _selected_option_ids(selected: dict) -> set:
+    return set(selected.get('answer_option_ids', selected.get('selected_option_ids', [])) or [])
+
+
+def grade_answer(question_key: QuestionKey, selected_answers) -> tuple[bool | None, float | None]:
+    """
+    Valuta una singola risposta con la chiave della domanda.
+    Restituisce (is_correct, score); (None, None) per domande a correzione manuale.
+    """
+    if question_key.is_manual:
+        return None, None
+
+    selected = selected_answers if isinstance(selected_answers, dict) else {}
+    q_type = question_key.question_type
+    is_correct = False
+
+    if q_type == QuestionType.MULTIPLE_CHOICE_SINGLE:
+        is_correct = _selected_option_id(selected) in question_key.correct_option_ids
+    elif q_type == QuestionType.TRUE_FALSE:
+        if 'is_true' in selected:
+            # Formato legacy: confronta il booleano con il valore atteso
+            is_correct = question_key.tf_truth is not None and selected['is_true'] == question_key.tf_truth
+        else:
+            is_correct = _selected_option_id(selected) in question_key.correct_option_ids
+    elif q_type == QuestionType.MULTIPLE_CHOICE_MULTIPLE:
+        is_correct = _selected_option_ids(selected) == set(question_key.correct_option_ids)
+    elif q_type == QuestionType.FILL_BLANK:
+        submitted = selected.get('answers', [])
+        if isinstance(submitted, list) and len(submitted) == len(question_key.correct_blanks):
+            is_correct = all(
+                _normalize_blank(given, question_key.case_sensitive) == expected
+                for given, expected in zip(submitted, question_key.correct_blanks)
+            )
+
+    return is_correct, (question_key.points if is_correct else 0.0)
+
+
+def grade_answers(answer_key: AnswerKey, student_answers) -> tuple[GradingResult, list]:
+    """
+    Valuta in memoria le risposte date, aggiornando `is_correct`/`score` sulle istanze.
+    Restituisce il GradingResult e la lista delle risposte modificate (da salvare con bulk_update).
+    """
+    result = GradingResult()
+    changed = []
+    outcomes = {} # {question_id: esito} per il calcolo della serie di risposte corrette
+    for answer in student_answers:
+        question_key = answer_key.questions.get(answer.question_id)
+        if question_key is None or question_key.is_manual:
+            continue
+
+        is_correct, score = grade_answer(question_key, answer.selected_answers)
+        if answer.is_correct != is_correct or answer.score != score:
+            answer.is_correct = is_correct
+            answer.score = score
+            changed.append(answer)
+
+        result.graded_count += 1
+        result.max_points += question_key.points
+        outcomes[answer.question_id] = is_correct
+        if is_correct:
+            result.correct_count += 1
+            result.total_points += question_key.points
+
+    # Serie su tutte le domande del quiz in ordine: una domanda senza risposta, sbagliata
+    # o a correzione manuale interrompe la serie
+    streak = 0
+    for question_id, _question_key in sorted(answer_key.questions.items(), key=lambda item: (item[1].order, item[0])):
+        streak = streak + 1 if outcomes.get(question_id, False) else 0
+        result.best_streak = max(result.best_streak, streak)
+    return result, changed
+
+
+def grade_attempt(attempt, answer_key: AnswerKey | None = None, student_answers=None) -> GradingResult:
+    """
+    Valuta tutte le risposte automatiche di un tentativo
+    e salva gli esiti modificati con un unico bulk_update.
+    """
+    if answer_key is None:
+        answer_key = get_answer_key(attempt.quiz)
+    if student_answers is None:
+        student_answers = list(attempt.student_answers.all())
+
+    result, changed = grade_answers(answer_key, student_answers)
+    if changed:
+        StudentAnswer.objects.bulk_update(changed, ['is_correct', 'score'])
+    logger.debug(f"Tentativo {attempt.id}: valutate {result.graded_count} risposte, aggiornate {len(changed)}.")
+    return result
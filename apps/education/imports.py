@@ -0,0 +1,203 @@
+"""
+Importazione di quiz e template di quiz da file (PDF, DOCX, MD) in background.
+
+1. La vista salva l'upload su disco a blocchi (`spool_upload`, mai tutto in memoria) nella
+   directory QUIZ_IMPORT_SPOOL_DIR, condivisa con il worker, e accoda il job 'education.quiz_import'.
+2. Il job legge il file pagina per pagina (`iter_pages`) e passa ogni pagina al parser incrementale
+   (apps.education.quiz_parser), aggiornando la percentuale di avanzamento nella cache condivisa.
+   Lettura e analisi (`prepare_import`) avvengono prima della transazione del job e del lock sulla
+   sua riga; nella transazione (`run_import`) si creano solo quiz, domande e opzioni con
+   `bulk_create` (tre istruzioni in tutto).
+3. Il client interroga GET /api/education/quiz-imports/{import_id}/ per stato, avanzamento ed esito.
+
+Gli errori nel contenuto del file (PDF illeggibile, nessuna domanda trovata) concludono il job con
+un esito di errore, senza nuovi tentativi; il file caricato viene eliminato al termine.
+"""
+import logging
+import os
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from PyPDF2 import PdfReader
+from docx import Document as DocxDocument
+from rest_framework.exceptions import ValidationError
+
+from apps.common.cache import bump_version
+from .models import QuizTemplate, QuestionTemplate, AnswerOptionTemplate, Quiz, Question, AnswerOption
+from .quiz_parser import QuizTextParser, ParseResult
+
+logger = logging.getLogger(__name__)
+
+IMPORT_QUIZ = 'quiz'
+IMPORT_TEMPLATE = 'template'
+
+# Paragrafi DOCX letti per "pagina" (il formato non ha pagine)
+DOCX_PARAGRAPHS_PER_PAGE = 200
+# Quota dell'avanzamento dedicata a lettura e analisi delle pagine; il resto è il salvataggio
+EXTRACTION_PROGRESS_SHARE = 90
+
+
+def file_extension(filename: str) -> str:
+    return os.path.splitext(filename)[1].lower()
+
+
+def spool_upload(uploaded_file) -> str:
+    """ Copia l'upload su disco a blocchi e restituisce il percorso del file. """
+    spool_dir = Path(settings.QUIZ_IMPORT_SPOOL_DIR)
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    path = spool_dir / f"{uuid.uuid4().hex}{file_extension(uploaded_file.name)}"
+    with open(path, 'wb') as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+    return str(path)
+
+
+def iter_pages(path: str, ext: str):
+    """
+    Restituisce (numero di pagine, iteratore sul testo di ogni pagina).
+    Il PDF viene letto dal disco una pagina alla volta.
+    """
+    if ext == '.pdf':
+        reader = PdfReader(path)
+        return len(reader.pages), (page.extract_text() or '' for page in reader.pages)
+    if ext == '.docx':
+        paragraphs = [para.text for para in DocxDocument(path).paragraphs if para.text]
+        blocks = range(0, len(paragraphs), DOCX_PARAGRAPHS_PER_PAGE)
+        return len(blocks), ("\n".join(paragraphs[start:start + DOCX_PARAGRAPHS_PER_PAGE]) for start in blocks)
+    if ext == '.md':
+        # Testo Markdown così com'è: il parser riconosce titoli, elenchi ed enfasi
+        with open(path, encoding='utf-8') as source:
+            return 1, iter([source.read()])
+    raise ValidationError(f"Tipo di file non supportato: {ext}.")
+
+
+# --- Avanzamento (cache condivisa tra worker e web) ---
+
+def _progress_key(import_id: str) -> str:
+    return f"quiz-import-progress:{import_id}"
+
+
+def set_progress(import_id: str, percent: int) -> None:
+    cache.set(_progress_key(import_id), percent, settings.QUIZ_IMPORT_PROGRESS_TIMEOUT)
+
+
+def get_progress(import_id: str) -> int | None:
+    return cache.get(_progress_key(import_id))
+
+
+def parse_file(path: str, ext: str, import_id: str) -> ParseResult:
+    """ Legge e analizza il file una pagina alla volta, aggiornando l'avanzamento. """
+    parser = QuizTextParser(markdown=ext == '.md')
+    try:
+        total, pages = iter_pages(path, ext)
+        last_percent = None
+        for index, page_text in enumerate(pages, start=1):
+            parser.feed(page_text, page=index)
+            percent = EXTRACTION_PROGRESS_SHARE * index // max(total, 1)
+            if percent != last_percent:
+                set_progress(import_id, percent)
+                last_percent = percent
+    except ValidationError:
+        raise
+    except Exception as e:
+        logger.warning(f"Import {import_id}: impossibile leggere il file {ext}: {e}")
+        raise ValidationError(f"Impossibile leggere il file {ext}. Errore: {e}")
+    return parser.finish()
+
+
+# --- Creazione in blocco ---
+
+def _create_quiz(teacher_id: int, title: str, filename: str, parsed_questions: list[dict]) -> Quiz:
+    quiz = Quiz.objects.create(
+        teacher_id=teacher_id,
+        title=title,
+        description=f"Quiz generato automaticamente da {filename}",
+        metadata={'source_file': filename, 'generation_method': 'auto_upload'},
+    )
+    questions = Question.objects.bulk_create([
+        Question(quiz=quiz, text=q['text'], question_type=q['type'], order=q['order'], metadata={})
+        for q in parsed_questions
+    ])
+    AnswerOption.objects.bulk_create([
+        AnswerOption(question=question, text=opt['text'], is_correct=opt['is_correct'], order=opt['order'])
+        for question, q in zip(questions, parsed_questions)
+        for opt in q['options']
+    ])
+    # bulk_create non invia i segnali: stessa invalidazione di apps.education.signals
+    bump_version('education')
+    transaction.on_commit(lambda: bump_version('education'))
+    return quiz
+
+
+def _create_quiz_template(teacher_id: int, title: str, filename: str, parsed_questions: list[dict]) -> QuizTemplate:
+    quiz_template = QuizTemplate.objects.create(
+        teacher_id=teacher_id,
+        title=title,
+        description=f"Template generato automaticamente da {filename}",
+        metadata={'source_file': filename, 'generation_method': 'auto_upload'},
+    )
+    question_templates = QuestionTemplate.objects.bulk_create([
+        QuestionTemplate(quiz_template=quiz_template, text=q['text'], question_type=q['type'], order=q['order'], metadata={})
+        for q in parsed_questions
+    ])
+    AnswerOptionTemplate.objects.bulk_create([
+        AnswerOptionTemplate(question_template=question_template, text=opt['text'], is_correct=opt['is_correct'], order=opt['order'])
+        for question_template, q in zip(question_templates, parsed_questions)
+        for opt in q['options']
+    ])
+    return quiz_template
+
+
+def prepare_import(payload: dict) -> dict:
+    """
+    Legge e analizza il file di un import accodato, fuori dalla transazione del job.
+    Restituisce {'parsed': ParseResult} oppure {'errors': [...]} se il contenuto del file non è valido.
+    """
+    import_id, path, filename = payload['import_id'], payload['path'], payload['filename']
+    set_progress(import_id, 0)
+    try:
+        return {'parsed': parse_file(path, file_extension(filename), import_id)}
+    except ValidationError as e:
+        logger.warning(f"Import {import_id} da {filename} non riuscito: {e.detail}")
+        _discard(path)
+        set_progress(import_id, 100)
+        return {'errors': e.detail if isinstance(e.detail, list) else [e.detail]}
+
+
+def run_import(payload: dict, prepared: dict) -> dict:
+    """
+    Salva un import analizzato da `prepare_import`. Esito: {'quiz_id': ...} o {'quiz_template_id': ...}
+    con le anomalie trovate nel testo ('warnings'), oppure gli errori del file.
+    """
+    if 'errors' in prepared:
+        return prepared
+    import_id, path, filename = payload['import_id'], payload['path'], payload['filename']
+    is_template = payload['target'] == IMPORT_TEMPLATE
+    parsed = prepared['parsed']
+
+    if is_template:
+        created = _create_quiz_template(payload['teacher_id'], payload['title'], filename, parsed.questions)
+        result = {'quiz_template_id': created.id}
+    else:
+        created = _create_quiz(payload['teacher_id'], payload['title'], filename, parsed.questions)
+        result = {'quiz_id': created.id}
+    result['warnings'] = [issue.as_dict() for issue in parsed.issues]
+
+    # Il file serve ai nuovi tentativi del job finché la transazione non è confermata
+    transaction.on_commit(lambda: _discard(path))
+    set_progress(import_id, 100)
+    logger.info(
+        f"Import {import_id}: creato {'QuizTemplate' if is_template else 'Quiz'} {created.id} con {len(parsed.questions)} domande "
+        f"da {filename} ({parsed.lines} righe analizzate in {parsed.seconds * 1000:.1f} ms, {len(parsed.issues)} anomalie)."
+    )
+    return result
+
+
+def _discard(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
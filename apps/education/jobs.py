@@ -0,0 +1,72 @@
+"""
+Job asincroni dell'app education (vedi apps.common.jobs).
+"""
+import logging
+
+from apps.common.jobs import enqueue, register_job
+from .imports import prepare_import, run_import
+from .models import QuizAttempt
+
+logger = logging.getLogger(__name__)
+
+ATTEMPT_REWARDS_JOB = 'education.attempt_rewards'
+
+
+def attempt_rewards_key(attempt_id: int) -> str:
+    """ Chiave di idempotenza: le ricompense di un tentativo si assegnano una sola volta. """
+    return f"attempt-rewards:{attempt_id}"
+
+
+def enqueue_attempt_rewards(attempt: QuizAttempt, correct_streak: int | None = None):
+    """ Accoda l'assegnazione di punti, badge e avanzamento percorsi per un tentativo concluso. """
+    return enqueue(
+        ATTEMPT_REWARDS_JOB,
+        {'attempt_id': attempt.id, 'correct_streak': correct_streak},
+        idempotency_key=attempt_rewards_key(attempt.id),
+    )
+
+
+@register_job(ATTEMPT_REWARDS_JOB)
+def run_attempt_rewards(payload: dict) -> dict:
+    """ Assegna le ricompense di fine tentativo e restituisce gli id dei badge ottenuti. """
+    attempt = QuizAttempt.objects.select_related('quiz__answer_key_record', 'student').get(pk=payload['attempt_id'])
+    if attempt.status not in (QuizAttempt.AttemptStatus.COMPLETED, QuizAttempt.AttemptStatus.FAILED):
+        logger.warning(f"Job ricompense: tentativo {attempt.id} in stato {attempt.status}, nessuna ricompensa assegnata.")
+        return {'earned_badge_ids': []}
+    earned = attempt.award_completion_rewards(
+        correct_streak=payload.get('correct_streak'),
+        credit_quiz_points=not _quiz_points_credited(attempt),
+    )
+    return {'earned_badge_ids': [e.badge_id for e in earned]}
+
+
+def _quiz_points_credited(attempt: QuizAttempt) -> bool:
+    """
+    Punti del quiz già accreditati per questo tentativo da un'esecuzione precedente del job:
+    first_correct_completion viene salvato nella stessa transazione dell'accredito.
+    """
+    return attempt.first_correct_completion
+
+
+QUIZ_IMPORT_JOB = 'education.quiz_import'
+
+
+def quiz_import_key(import_id: str) -> str:
+    return f"quiz-import:{import_id}"
+
+
+def enqueue_quiz_import(import_id: str, path: str, filename: str, title: str, teacher_id: int, target: str,
+                        run_inline: bool | None = None):
+    """ Accoda l'import di un file già salvato su disco (vedi apps.education.imports). """
+    return enqueue(
+        QUIZ_IMPORT_JOB,
+        {'import_id': import_id, 'path': path, 'filename': filename, 'title': title, 'teacher_id': teacher_id, 'target': target},
+        idempotency_key=quiz_import_key(import_id),
+        run_inline=run_inline,
+    )
+
+
+@register_job(QUIZ_IMPORT_JOB, prepare=prepare_import)
+def run_quiz_import(payload: dict, prepared: dict) -> dict:
+    """ Crea quiz o template con domande e opzioni dal file già analizzato da `prepare_import`. """
+    return run_import(payload, prepared)
@@ -0,0 +1,85 @@
+import json
+from functools import partial
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from apps.education.benchmark import (
+    ENDPOINTS, DjangoClientTransport, HttpTransport,
+    build_report, cleanup, compare_reports, run_benchmark, seed,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = ('Benchmark del flusso quiz dello studente (login, start-attempt, current-question, submit-answer, complete) '
+            'con studenti concorrenti: latenze per endpoint, query per richiesta e throughput, con baseline JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teachers', type=int, default=2, help='Numero di docenti da creare.')
+        parser.add_argument('--students', type=int, default=10, help='Studenti per docente.')
+        parser.add_argument('--quizzes', type=int, default=2, help='Quiz per docente (assegnati a tutti i suoi studenti).')
+        parser.add_argument('--questions', type=int, default=5, help='Domande per quiz.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Studenti simulati in parallelo (thread).')
+        parser.add_argument('--base-url', help='Esegue le richieste via HTTP verso un server avviato (es. http://127.0.0.1:8000) invece del client di test.')
+        parser.add_argument('--output', help='Salva il report JSON in questo file (baseline).')
+        parser.add_argument('--compare', help='Baseline JSON con cui confrontare il risultato: errore in caso di regressioni.')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Peggioramento relativo tollerato per p95 e throughput (default 0.2 = 20%%).')
+        parser.add_argument('--keep-data', action='store_true', help='Non eliminare i dati creati al termine.')
+
+    def handle(self, *args, **options):
+        config = {key: options[key] for key in ('teachers', 'students', 'quizzes', 'questions', 'concurrency', 'base_url')}
+        if connection.vendor == 'sqlite' and options['concurrency'] > 1:
+            self.stderr.write(self.style.WARNING(
+                "SQLite serializza le scritture: con più thread i flussi possono fallire con 'database is locked'. "
+                "Usare PostgreSQL (DATABASE_URL) per misure con concorrenza."
+            ))
+        data = seed(options['teachers'], options['students'], options['quizzes'], options['questions'])
+        self.stdout.write(f"Creati {len(data.students)} studenti (run {data.run_id}).")
+        try:
+            if options['base_url']:
+                transport_factory = partial(HttpTransport, options['base_url'])
+                recorder, wall_time, errors = run_benchmark(data, options['concurrency'], transport_factory)
+            else:
+                # Il client di test usa l'host 'testserver'
+                with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                    recorder, wall_time, errors = run_benchmark(data, options['concurrency'], DjangoClientTransport)
+        finally:
+            if not options['keep_data']:
+                cleanup(data)
+
+        report = build_report(recorder, wall_time, config)
+        self._print_report(report)
+        for error in errors:
+            self.stderr.write(f"Flusso fallito: {error}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report salvato in {options['output']}.")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = compare_reports(baseline, report, options['tolerance'])
+            for regression in regressions:
+                self.stderr.write(f"Regressione: {regression}")
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressioni rispetto a {options['compare']}.")
+            self.stdout.write(self.style.SUCCESS('Nessuna regressione rispetto alla baseline.'))
+
+    def _print_report(self, report):
+        self.stdout.write(f"{'endpoint':<18}{'n':>6}{'err':>5}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}{'query':>7}")
+        for name in ENDPOINTS:
+            stats = report['endpoints'][name]
+            queries = '-' if stats['queries_mean'] is None else f"{stats['queries_mean']:g}"
+            self.stdout.write(
+                f"{name:<18}{stats['count']:>6}{stats['errors']:>5}{stats['p50_ms']:>9.1f}{stats['p90_ms']:>9.1f}"
+                f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}{queries:>7}"
+            )
+        totals = report['totals']
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['requests']} richieste ({totals['errors']} errori), {totals['flows']} flussi in {totals['wall_time_s']} s: "
+            f"{totals['requests_per_s']} richieste/s, {totals['flows_per_s']} flussi/s."
+        ))
@@ -0,0 +1,56 @@
+import time
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from apps.education.imports import file_extension, iter_pages
+from apps.education.quiz_parser import QuizTextParser
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Corpus predefinito: i quiz di esempio nella radice del progetto
+DEFAULT_CORPUS = ('QuizPHPeCookie.pdf', 'quiz_reti_internet_CAT.pdf')
+
+
+class Command(BaseCommand):
+    help = ("Misura il parser dei quiz caricati (apps.education.quiz_parser) su un corpus di file: righe al secondo, "
+            "domande trovate e anomalie con pagina e riga. L'estrazione del testo dal file è esclusa dalla misura.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', action='append', default=[],
+                            help='File PDF, DOCX o MD da analizzare (ripetibile). Predefinito: i quiz di esempio del progetto.')
+        parser.add_argument('--repeat', type=int, default=20, help='Analisi ripetute per ogni file.')
+
+    def handle(self, *args, **options):
+        paths = options['file'] or [str(Path(settings.BASE_DIR) / name) for name in DEFAULT_CORPUS]
+        repeat = max(options['repeat'], 1)
+        for path in paths:
+            if not Path(path).is_file():
+                raise CommandError(f"File non trovato: {path}")
+            ext = file_extension(path)
+            _total, pages = iter_pages(path, ext)
+            pages = list(pages)
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                try:
+                    result = self._parse(pages, ext)
+                except ValidationError as e:
+                    self.stderr.write(f"{Path(path).name}: {e.detail}")
+                    break
+            else:
+                elapsed = (time.perf_counter() - started) / repeat
+                self.stdout.write(
+                    f"{Path(path).name:<35}{result.lines:>6} righe{len(result.questions):>6} domande"
+                    f"{elapsed * 1000:>9.2f} ms{result.lines / elapsed:>12.0f} righe/s"
+                )
+                for issue in result.issues:
+                    self.stdout.write(f"    {issue}")
+
+    @staticmethod
+    def _parse(pages, ext):
+        parser = QuizTextParser(markdown=ext == '.md')
+        for index, page_text in enumerate(pages, start=1):
+            parser.feed(page_text, page=index)
+        return parser.finish()
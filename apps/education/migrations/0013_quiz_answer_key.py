@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0012_alter_pathwayassignment_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='answer_key',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Answer Key'),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='answer_key_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Answer Key Version'),
+        ),
+    ]
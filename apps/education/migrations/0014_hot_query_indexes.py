@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-17 21:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0013_quiz_answer_key'),
+        ('users', '0004_student_progress_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pathwayprogress',
+            index=models.Index(condition=models.Q(('status', 'COMPLETED')), fields=['student'], name='edu_pprog_stu_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['student', 'quiz', 'status'], name='edu_attempt_stu_quiz_st_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['quiz', 'status', 'completed_at'], name='edu_attempt_quiz_st_done_idx'),
+        ),
+    ]
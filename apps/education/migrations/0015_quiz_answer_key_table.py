@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_answer_keys(apps, schema_editor):
+    """ Crea la riga QuizAnswerKey di ogni quiz esistente con versione e chiave già salvate. """
+    Quiz = apps.get_model('education', 'Quiz')
+    QuizAnswerKey = apps.get_model('education', 'QuizAnswerKey')
+    rows = Quiz.objects.values_list('pk', 'answer_key_version', 'answer_key').iterator(chunk_size=1000)
+    QuizAnswerKey.objects.bulk_create(
+        (QuizAnswerKey(quiz_id=pk, version=version, data=data) for pk, version, data in rows),
+        batch_size=1000,
+    )
+
+
+def restore_answer_keys(apps, schema_editor):
+    """ Riporta versione e chiave sulle colonne del Quiz. """
+    Quiz = apps.get_model('education', 'Quiz')
+    QuizAnswerKey = apps.get_model('education', 'QuizAnswerKey')
+    for record in QuizAnswerKey.objects.iterator(chunk_size=1000):
+        Quiz.objects.filter(pk=record.quiz_id).update(answer_key_version=record.version, answer_key=record.data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0014_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizAnswerKey',
+            fields=[
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='answer_key_record', serialize=False, to='education.quiz', verbose_name='Quiz')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Version')),
+                ('data', models.JSONField(blank=True, null=True, verbose_name='Compiled Key')),
+            ],
+            options={
+                'verbose_name': 'Quiz Answer Key',
+                'verbose_name_plural': 'Quiz Answer Keys',
+            },
+        ),
+        migrations.RunPython(copy_answer_keys, restore_answer_keys),
+        migrations.RemoveField(
+            model_name='quiz',
+            name='answer_key',
+        ),
+        migrations.RemoveField(
+            model_name='quiz',
+            name='answer_key_version',
+        ),
+    ]
@@ -7,11 +7,14 @@ from django.db.models import Max as AggregateMax # Rinomina Max per evitare conf
 # Import Student model
 from apps.users.models import Student, UserRole, User # Ripristinato import UserRole e User
 from django.utils import timezone # Import timezone
-from django.db.models import F # Import F for atomic updates
 # Import Wallet and PointTransaction later to avoid circular dependency if needed,
 # or ensure they are defined before QuizAttempt if in the same file.
 # Let's import them here for clarity for now.
 from apps.rewards.models import Wallet, PointTransaction, Badge, EarnedBadge # Import Badge and EarnedBadge
+from apps.rewards.ledger import apply_entries
+from apps.rewards.badges import (
+    get_badge_index, award_badges, QuizCompleted, PathwayCompleted, PointsChanged, CorrectStreak
+)
 import logging # Import logging
 
 # Get an instance of a logger
@@ -251,6 +254,12 @@ class Quiz(models.Model):
     def __str__(self):
         return self.title
 
+    @property
+    def answer_key_version(self) -> int:
+        """ Versione della chiave di risposta compilata (QuizAnswerKey); 0 se non ancora creata. """
+        record = getattr(self, 'answer_key_record', None)
+        return record.version if record is not None else 0
+
     def get_max_possible_score(self) -> float:
         """
         Calcola il punteggio massimo possibile per questo quiz.
@@ -258,23 +267,34 @@ class Quiz(models.Model):
         - 1 punto per MC_SINGLE, MC_MULTI, TF, FILL_BLANK (a meno che specificato diversamente in metadata).
         - Punteggio definito in metadata['max_score'] per OPEN_MANUAL.
         Restituisce un float per gestire potenziali punteggi frazionari futuri.
+        Il valore è letto dalla chiave di risposta compilata: nessuna query se già disponibile.
         """
-        total_max_score = 0.0
-        for question in self.questions.all():
-            if question.question_type == QuestionType.OPEN_ANSWER_MANUAL:
-                # Per domande manuali, usa 'max_score' dai metadati, default a 1 se non presente
-                max_score = float(question.metadata.get('max_score', 1.0))
-                total_max_score += max_score
-            elif question.question_type == QuestionType.FILL_BLANK:
-                 # Per fill_blank, conta il numero di risposte corrette attese, default a 1
-                 num_blanks = len(question.metadata.get('correct_answers', [1])) # Default a 1 blank se non specificato
-                 points_per_blank = float(question.metadata.get('points_per_blank', 1.0)) # Default 1 punto per blank
-                 total_max_score += num_blanks * points_per_blank
-            else:
-                # Per MC e TF, usa 'points_per_correct_answer', default a 1.0
-                points = float(question.metadata.get('points_per_correct_answer', 1.0))
-                total_max_score += points
-        return total_max_score
+        from .grading import get_answer_key # Import locale per evitare import circolari
+        return get_answer_key(self).max_possible_score
+
+
+class QuizAnswerKey(models.Model):
+    """
+    Chiave di risposta compilata di un Quiz (vedi apps.education.grading), in una tabella separata:
+    i salvataggi del Quiz non possono sovrascriverla con valori non aggiornati. La versione viene
+    incrementata dai segnali su Question/AnswerOption e identifica anche il bundle delle domande.
+    """
+    quiz = models.OneToOneField(
+        Quiz,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='answer_key_record',
+        verbose_name=_('Quiz')
+    )
+    version = models.PositiveIntegerField(_('Version'), default=0)
+    data = models.JSONField(_('Compiled Key'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Quiz Answer Key')
+        verbose_name_plural = _('Quiz Answer Keys')
+
+    def __str__(self):
+        return f"Answer key of quiz {self.quiz_id} (version {self.version})"
 
 
 class Question(models.Model):
@@ -451,12 +471,18 @@ class QuizAttempt(models.Model):
         verbose_name = _('Quiz Attempt')
         verbose_name_plural = _('Quiz Attempts')
         ordering = ['student', '-started_at']
+        indexes = [
+            # Tentativi di uno studente su un quiz filtrati per stato (start_attempt, punti, dashboard)
+            models.Index(fields=['student', 'quiz', 'status'], name='edu_attempt_stu_quiz_st_idx'),
+            # Tentativi di un quiz per stato, in ordine di completamento (coda di correzione del docente)
+            models.Index(fields=['quiz', 'status', 'completed_at'], name='edu_attempt_quiz_st_done_idx'),
+        ]
 
     def __str__(self):
         return f"Attempt by {self.student.full_name} on {self.quiz.title} ({self.status})"
 
     # Methods moved from AttemptViewSet
-    def calculate_final_score(self):
+    def calculate_final_score(self, answer_key=None, student_answers=None, grading_result=None, commit: bool = True):
         """
         Calculates the final score for this attempt based on saved answers.
 
@@ -471,118 +497,42 @@ class QuizAttempt(models.Model):
               Manually assigned scores on OPEN_MANUAL questions are used primarily for teacher feedback
               unless *only* manual questions exist in the quiz.
 
+        `answer_key` (see apps.education.grading) and `student_answers` can be passed
+        by callers that already loaded them, avoiding further queries; `grading_result`
+        (from grade_attempt) skips grading the answers again. With `commit=False` score
+        and status are only set on the instance, for the caller to save once.
+
         Returns:
             float: The calculated final score (percentage, 0-100), rounded to 2 decimal places.
         """
-        score = 0
-        # Recupera le risposte dello studente per questo tentativo
-        student_answers = self.student_answers.select_related('question').all()
-        quiz = self.quiz
-
-        # Pre-fetch questions and their correct options for efficiency
-        questions = quiz.questions.prefetch_related('answer_options').all()
-        correct_options_map = {}
-        fill_blank_answers_map = {}
-        total_questions = 0 # Conteggio totale domande (per punteggio manuale)
-        total_autograded_questions = 0 # Conteggio domande auto-gradate
-
-        for q in questions:
-            total_questions += 1
-            # Considera solo le domande a correzione automatica per il calcolo del punteggio %
-            if q.question_type != QuestionType.OPEN_ANSWER_MANUAL:
-                total_autograded_questions += 1
-                if q.question_type in [QuestionType.MULTIPLE_CHOICE_SINGLE, QuestionType.TRUE_FALSE]:
-                     correct_option = q.answer_options.filter(is_correct=True).first()
-                     if correct_option:
-                         correct_options_map[q.id] = correct_option.id
-                elif q.question_type == QuestionType.MULTIPLE_CHOICE_MULTIPLE:
-                     correct_options_map[q.id] = set(q.answer_options.filter(is_correct=True).values_list('id', flat=True))
-                elif q.question_type == QuestionType.FILL_BLANK:
-                    correct_answers = [ans.strip().lower() for ans in q.metadata.get('correct_answers', [])]
-                    fill_blank_answers_map[q.id] = correct_answers
+        # Import locale per evitare import circolari (grading importa i modelli)
+        from .grading import get_answer_key, grade_answers
+
+        if answer_key is None:
+            answer_key = get_answer_key(self.quiz)
 
         # Se non ci sono domande auto-gradate, non possiamo calcolare un punteggio automatico
-        if total_autograded_questions == 0:
-            # Potremmo controllare se ci sono domande manuali e se sono state valutate,
-            # ma per ora restituiamo None se non ci sono domande auto-gradate.
-            # Oppure potremmo impostare lo stato su PENDING_GRADING se ci sono domande manuali.
+        if answer_key.autograded_count == 0:
             logger.info(f"Attempt {self.id}: No auto-gradable questions found. Score calculation skipped.")
             # Se ci sono domande totali ma nessuna auto-gradabile, probabilmente sono tutte manuali
-            if total_questions > 0:
+            update_fields = ['score']
+            if answer_key.questions:
                  self.status = self.AttemptStatus.PENDING_GRADING
-                 self.save(update_fields=['status'])
+                 update_fields.append('status')
                  logger.info(f"Attempt {self.id}: Status set to PENDING_GRADING as only manual questions exist.")
             self.score = None # Assicura che lo score sia None
-            self.save(update_fields=['score'])
-            return None # O 0.0? None indica che non è stato calcolato automaticamente.
-
-        correct_answers_count = 0
-        total_score_points = 0.0 # Punteggio basato sui punti per domanda
-        max_possible_points = 0.0 # Punteggio massimo possibile dalle domande auto-gradate
-
-        for answer in student_answers:
-            q = answer.question
-            # Considera solo le risposte a domande auto-gradate per il punteggio
-            if q.question_type != QuestionType.OPEN_ANSWER_MANUAL:
-                points_per_correct = float(q.metadata.get('points_per_correct_answer', 1.0)) # Default a 1 punto
-                max_possible_points += points_per_correct # Aggiungi al massimo possibile
-
-                is_correct = False # Resetta per ogni risposta
-                selected_data = answer.selected_answers
-
-                if q.question_type == QuestionType.MULTIPLE_CHOICE_SINGLE:
-                    correct_option_id = correct_options_map.get(q.id)
-                    selected_option_id = selected_data.get('answer_option_id') if isinstance(selected_data, dict) else None
-                    if correct_option_id is not None and selected_option_id == correct_option_id:
-                        is_correct = True
-
-                elif q.question_type == QuestionType.TRUE_FALSE:
-                    correct_option_id = correct_options_map.get(q.id)
-                    selected_bool = selected_data.get('is_true') if isinstance(selected_data, dict) else None
-                    # Trova l'opzione corretta per determinare se la risposta attesa è True o False
-                    correct_option_obj = q.answer_options.filter(id=correct_option_id).first() if correct_option_id else None
-                    if correct_option_obj:
-                         expected_bool = correct_option_obj.text.lower() == 'vero' # O un check più robusto
-                         if selected_bool == expected_bool:
-                             is_correct = True
-                    # Se correct_option_obj non esiste o selected_bool è None, is_correct rimane False
-
-                elif q.question_type == QuestionType.MULTIPLE_CHOICE_MULTIPLE:
-                    correct_option_ids = correct_options_map.get(q.id, set())
-                    selected_option_ids = set(selected_data.get('answer_option_ids', [])) if isinstance(selected_data, dict) else set()
-                    if correct_option_ids == selected_option_ids:
-                        is_correct = True
-
-                elif q.question_type == QuestionType.FILL_BLANK:
-                    correct_answers_list = fill_blank_answers_map.get(q.id, [])
-                    submitted_answers = selected_data.get('answers', []) if isinstance(selected_data, dict) else []
-                    case_sensitive = q.metadata.get('case_sensitive', False)
-
-                    if len(correct_answers_list) == len(submitted_answers):
-                        all_match = True
-                        for i, correct_ans in enumerate(correct_answers_list):
-                            submitted = submitted_answers[i]
-                            correct_str = str(correct_ans)
-                            submitted_str = str(submitted)
-                            if not case_sensitive:
-                                if correct_str.lower() != submitted_str.lower(): all_match = False; break
-                            else:
-                                if correct_str != submitted_str: all_match = False; break
-                        if all_match:
-                            is_correct = True
-
-                # Aggiorna il conteggio e il punteggio se la risposta è corretta
-                if is_correct:
-                    correct_answers_count += 1
-                    total_score_points += points_per_correct
-
-                # Salva is_correct e score sulla singola risposta (se non già fatto in submit_answer)
-                # Questo è ridondante se lo facciamo già in submit_answer, ma può servire come fallback
-                # o se vogliamo ricalcolare tutto qui. Per ora lo commentiamo assumendo che submit_answer lo faccia.
-                # answer.is_correct = is_correct
-                # answer.score = points_per_correct if is_correct else 0.0
-                # answer.save(update_fields=['is_correct', 'score'])
-
+            if commit:
+                self.save(update_fields=update_fields)
+            return None # None indica che non è stato calcolato automaticamente.
+
+        # Valutazione in memoria delle risposte alle domande auto-gradate (nessuna query aggiuntiva)
+        result = grading_result
+        if result is None:
+            if student_answers is None:
+                student_answers = self.student_answers.all()
+            result, _changed = grade_answers(answer_key, student_answers)
+        total_score_points = result.total_points # Punteggio basato sui punti per domanda
+        max_possible_points = result.max_points # Punteggio massimo possibile dalle domande risposte
 
         # Calcola il punteggio percentuale finale
         final_score_percent = 0.0
@@ -595,31 +545,43 @@ class QuizAttempt(models.Model):
 
         # Salva il punteggio finale sul tentativo
         self.score = final_score_percent
-        self.save(update_fields=['score'])
+        if commit:
+            self.save(update_fields=['score'])
         logger.info(f"Attempt {self.id}: Final score calculated: {final_score_percent}% ({total_score_points}/{max_possible_points} points)")
 
         return final_score_percent
 
 
     @transaction.atomic # Assicura atomicità per punti e badge
-    def assign_completion_points(self) -> list[EarnedBadge]: # Aggiunto tipo di ritorno
-        logger.info(f"Attempt {self.id}: Entering assign_completion_points. Current status: {self.status}, Score: {self.score}") # LOGGING
+    def assign_completion_points(self, correct_streak: int | None = None) -> list[EarnedBadge]: # Aggiunto tipo di ritorno
         """
-        Assigns points and potentially the 'first-quiz-completed' badge
-        if the quiz attempt is the first successful one for the student.
-        Also updates the attempt status based on score and threshold.
+        Updates the attempt status based on score and threshold, then awards points,
+        pathway progress and badges (see `award_completion_rewards`).
         Returns a list of newly earned Badge instances.
         """
-        newly_earned_badges = [] # Inizializza lista badge guadagnati
         logger.info(f"Attempt {self.id}: Entering assign_completion_points. Current status: {self.status}, Score: {self.score}") # LOGGING
+        passed = self.evaluate_outcome()
+        if passed is None:
+            return []
+        return self.award_completion_rewards(correct_streak=correct_streak, passed=passed)
+
+
+    def evaluate_outcome(self, commit: bool = True) -> bool | None:
+        """
+        Determina il superamento del quiz confrontando lo score con la soglia e aggiorna lo stato
+        del tentativo (COMPLETED/FAILED). Restituisce None se lo score non è disponibile.
+        È la parte sincrona del completamento: punti e badge possono essere assegnati dopo.
+        Con `commit=False` lo stato viene solo impostato sull'istanza.
+        """
         # Ensure score is calculated and available
         if self.score is None:
              logger.warning(f"Attempt {self.id}: Score is None, cannot assign points or determine status accurately.")
              # Decide how to handle this - maybe recalculate? For now, just return or set to FAILED.
              if self.status == self.AttemptStatus.IN_PROGRESS: # Avoid overwriting PENDING_GRADING
                  self.status = self.AttemptStatus.FAILED
-                 self.save(update_fields=['status'])
-             return
+                 if commit:
+                     self.save(update_fields=['status'])
+             return None
 
         # Determine pass/fail based on threshold
         # Recupera la soglia (come frazione, es: 0.5) dal campo metadata del Quiz usando la chiave corretta
@@ -642,7 +604,42 @@ class QuizAttempt(models.Model):
         # Update status based on pass/fail, only if currently IN_PROGRESS or PENDING (after grading)
         if self.status in [self.AttemptStatus.IN_PROGRESS, self.AttemptStatus.PENDING_GRADING]:
              self.status = self.AttemptStatus.COMPLETED if passed else self.AttemptStatus.FAILED
-             self.save(update_fields=['status']) # Save status update
+             if commit:
+                 self.save(update_fields=['status']) # Save status update
+        return passed
+
+
+    def _previous_completed_attempts(self):
+        """
+        Tentativi COMPLETED dello studente conclusi prima di questo. Il confronto su completed_at
+        mantiene corretto il "primo completamento" anche quando le ricompense vengono assegnate
+        in differita (coda job), dopo che altri tentativi sono già stati completati.
+        """
+        previous = QuizAttempt.objects.filter(
+            student=self.student,
+            status=self.AttemptStatus.COMPLETED
+        ).exclude(pk=self.pk) # Exclude the current attempt
+        if self.completed_at:
+            previous = previous.filter(Q(completed_at__lt=self.completed_at) | Q(completed_at__isnull=True))
+        return previous
+
+
+    @transaction.atomic # Assicura atomicità per punti e badge
+    def award_completion_rewards(self, correct_streak: int | None = None, passed: bool | None = None,
+                                 credit_quiz_points: bool = True, commit: bool = True) -> list[EarnedBadge]:
+        """
+        Assigns points if the quiz attempt is the first successful one for the student
+        and advances pathway progress. Badges are awarded through the rule engine
+        (apps.rewards.badges) from the collected events; `correct_streak` is the longest
+        run of correct answers in the attempt (CORRECT_STREAK badges).
+        `passed` defaults to the current status (COMPLETED). Returns the newly earned badges.
+        `credit_quiz_points=False` skips the quiz credit (already applied, e.g. job re-run).
+        `commit=False` leaves saving `first_correct_completion` to the caller.
+        """
+        badge_events = [] # Eventi per il motore badge
+        credits = [] # Punti quiz e percorsi, accreditati dal ledger in un'unica operazione
+        if passed is None:
+            passed = self.status == self.AttemptStatus.COMPLETED
 
         # Award points logic (only if passed)
         points_to_award = 0
@@ -650,11 +647,7 @@ class QuizAttempt(models.Model):
             points_to_award = self.quiz.metadata.get('points_on_completion', 0)
 
             # Check if this is the first *successful* completion for this specific quiz
-            is_first_successful_for_this_quiz = not QuizAttempt.objects.filter(
-                quiz=self.quiz,
-                student=self.student,
-                status=self.AttemptStatus.COMPLETED
-            ).exclude(pk=self.pk).exists() # Exclude the current attempt
+            is_first_successful_for_this_quiz = not self._previous_completed_attempts().filter(quiz=self.quiz).exists()
 
             if is_first_successful_for_this_quiz:
                 self.first_correct_completion = True # Mark this attempt
@@ -664,201 +657,111 @@ class QuizAttempt(models.Model):
                  logger.info(f"Attempt {self.id} is NOT the first successful completion for quiz {self.quiz.id} by student {self.student.id}.")
 
             # Save first_correct_completion status
-            self.save(update_fields=['first_correct_completion'])
+            if commit:
+                self.save(update_fields=['first_correct_completion'])
 
             # Award points only on the first successful completion and if points > 0
-            if is_first_successful_for_this_quiz and points_to_award > 0:
-                try:
-                    wallet = Wallet.objects.get(student=self.student)
-                    # Use atomic transaction for updating wallet and creating transaction
-                    with transaction.atomic():
-                        # Use F() expression for atomic update
-                        wallet.current_points = F('current_points') + points_to_award
-                        wallet.save(update_fields=['current_points'])
-                        PointTransaction.objects.create(
-                            wallet=wallet,
-                            points_change=points_to_award,
-                            reason=f"Completamento Quiz: {self.quiz.title}"
-                        )
-                        logger.info(f"Awarded {points_to_award} points to student {self.student.id} for completing quiz {self.quiz.id}.")
-                except Wallet.DoesNotExist:
-                    logger.error(f"Wallet not found for student {self.student.id} when trying to award points for quiz {self.quiz.id}.")
-                except Exception as e_points:
-                    logger.exception(f"Error awarding points for quiz attempt {self.id}: {e_points}")
-
-            # --- Logica Assegnazione Badge per Soglia Punti ---
-            # Questo controllo va fatto se il quiz è stato superato, dopo l'eventuale assegnazione punti.
-            try:
-                # Recupera il wallet (potrebbe non essere stato caricato se points_to_award era 0 o non era la prima volta)
-                # Usiamo select_for_update per bloccare la riga del wallet durante il controllo della soglia
-                # per evitare race conditions se più tentativi finiscono contemporaneamente.
-                # Nota: Questo richiede che il DB supporti SELECT FOR UPDATE (PostgreSQL lo fa).
-                wallet = Wallet.objects.select_for_update().get(student=self.student)
-                # Ricarica sempre dal DB per avere il saldo più aggiornato possibile dopo l'eventuale F() expression
-                wallet.refresh_from_db()
-                current_points = wallet.current_points
-                logger.info(f"Attempt {self.id}: Student {self.student.id} current points: {current_points}. Checking threshold badges.")
-
-                # Recupera tutti i badge di soglia attivi
-                threshold_badges = Badge.objects.filter(
-                    is_active=True,
-                    trigger_type='POINTS_THRESHOLD' # Usa la stringa diretta
-                )
-
-                for badge in threshold_badges:
-                    try:
-                        # Estrai la soglia dalla condizione JSON
-                        threshold = int(badge.trigger_condition.get("points", -1)) # CORRETTO: Usa la chiave "points" come da definizione modello
-                        if threshold < 0:
-                            logger.warning(f"Badge Soglia ID {badge.id} ('{badge.name}') ha una soglia non valida o mancante: {badge.trigger_condition}")
-                            continue # Salta questo badge
-
-                        # Controlla se la soglia è raggiunta
-                        if current_points >= threshold:
-                            logger.info(f"Attempt {self.id}: Student points ({current_points}) >= threshold ({threshold}) for badge '{badge.name}' (ID {badge.id}).")
-                            # Tenta di assegnare il badge se non già posseduto
-                            earned_badge, created = EarnedBadge.objects.get_or_create(
-                                student=self.student,
-                                badge=badge,
-                                defaults={'earned_at': timezone.now()}
-                            )
-                            if created:
-                                logger.info(f"Badge Soglia '{badge.name}' assegnato a {self.student.full_name}.")
-                                newly_earned_badges.append(earned_badge) # Aggiungi alla lista se creato
-                                logger.info(f"Attempt {self.id}: Threshold Badge ID {earned_badge.id} aggiunto alla lista newly_earned_badges.")
-                            # else: # Log non necessario se già posseduto
-                            #    logger.info(f"Studente {self.student.full_name} aveva già il badge '{badge.name}' (threshold).")
-
-                    except (ValueError, TypeError, KeyError) as e_cond:
-                        logger.error(f"Errore nel parsing trigger_condition per Badge Soglia {badge.id} ('{badge.name}'): {badge.trigger_condition}. Errore: {e_cond}", exc_info=True)
-                    except Exception as e_thresh_badge:
-                        logger.error(f"Errore durante l'assegnazione del Badge Soglia {badge.id} ('{badge.name}') a {self.student.id}: {e_thresh_badge}", exc_info=True)
-
-            except Wallet.DoesNotExist:
-                logger.error(f"Wallet not found for student {self.student.id} when checking threshold badges.")
-            except Exception as e_check_thresh:
-                logger.error(f"Errore imprevisto durante il controllo dei badge di soglia per lo studente {self.student.id}: {e_check_thresh}", exc_info=True)
-            # --- Fine Logica Badge Soglia Punti ---
-
-            # --- Logica Assegnazione Badge per Completamento Quiz Specifico ---
-            try:
-                logger.info(f"Attempt {self.id}: Checking specific quiz completion badges.")
-                quiz_completion_badges = Badge.objects.filter(
-                    is_active=True,
-                    trigger_type='QUIZ_COMPLETED' # Usa la stringa diretta
-                )
-
-                for badge in quiz_completion_badges:
-                    try:
-                        condition = badge.trigger_condition
-                        required_quiz_id = condition.get("quiz_id") # Può essere None
-                        min_score_percent = float(condition.get("min_score_percent", 0)) # Default 0 se non specificato
-
-                        # Controlla se è il quiz giusto (se specificato)
-                        quiz_match = (required_quiz_id is None or required_quiz_id == self.quiz.id)
-
-                        # Controlla se il punteggio è sufficiente (usa self.score che è già percentuale 0-100)
-                        score_match = (self.score is not None and self.score >= min_score_percent)
-
-                        logger.debug(f"Badge '{badge.name}': ReqQuizID={required_quiz_id}, MinScore={min_score_percent} | CurrentQuizID={self.quiz.id}, CurrentScore={self.score} | QuizMatch={quiz_match}, ScoreMatch={score_match}")
-
-                        if quiz_match and score_match:
-                            logger.info(f"Attempt {self.id}: Conditions met for QUIZ_COMPLETED badge '{badge.name}' (ID {badge.id}).")
-                            # Tenta di assegnare il badge se non già posseduto
-                            earned_badge, created = EarnedBadge.objects.get_or_create(
-                                student=self.student,
-                                badge=badge,
-                                defaults={'earned_at': timezone.now()}
-                            )
-                            if created:
-                                logger.info(f"Badge QUIZ_COMPLETED '{badge.name}' assegnato a {self.student.full_name}.")
-                                newly_earned_badges.append(earned_badge) # Aggiungi alla lista se creato
-                                logger.info(f"Attempt {self.id}: QUIZ_COMPLETED Badge ID {earned_badge.id} aggiunto alla lista newly_earned_badges.")
-                            # else:
-                            #    logger.info(f"Studente {self.student.full_name} aveva già il badge '{badge.name}' (QUIZ_COMPLETED).")
-
-                    except (ValueError, TypeError, KeyError) as e_cond:
-                         logger.error(f"Errore nel parsing trigger_condition per Badge QUIZ_COMPLETED {badge.id} ('{badge.name}'): {condition}. Errore: {e_cond}", exc_info=True)
-                    except Exception as e_quiz_badge:
-                        logger.error(f"Errore durante l'assegnazione del Badge QUIZ_COMPLETED {badge.id} ('{badge.name}') a {self.student.id}: {e_quiz_badge}", exc_info=True)
-
-            except Exception as e_check_quiz_comp:
-                 logger.error(f"Errore imprevisto durante il controllo dei badge QUIZ_COMPLETED per lo studente {self.student.id}: {e_check_quiz_comp}", exc_info=True)
-            # --- Fine Logica Badge Quiz Specifico ---
-
-            # --- Logica Assegnazione Badge "Primo Quiz Completato" (SPOSTATA FUORI DAL BLOCCO PUNTI) ---
-            # Controlla se è il primo quiz IN ASSOLUTO completato correttamente dallo studente
-            # Questo controllo ha senso farlo solo se il tentativo corrente è stato superato con successo
-            # E se è la prima volta che questo specifico quiz viene superato con successo
-            # La condizione corretta: controlla solo se il quiz è stato superato.
-            # Il controllo se è il primo in assoluto avviene all'interno.
-            if passed:
-                 logger.info(f"Attempt {self.id}: Quiz passed and first successful for this quiz. Checking for first completion badge.")
-                 is_first_ever_completion = not QuizAttempt.objects.filter(
-                     student=self.student,
-                     status=QuizAttempt.AttemptStatus.COMPLETED
-                 ).exclude(pk=self.pk).exists() # Escludi il tentativo corrente
-
-                 logger.info(f"Attempt {self.id}: Checking for first completion badge. is_first_ever_completion={is_first_ever_completion}")
-                 if is_first_ever_completion:
-                     logger.info(f"Questo è il primo quiz IN ASSOLUTO completato correttamente da {self.student.full_name}. Tentativo assegnazione badge 'Primo Quiz Completato!'.")
-                     try:
-                         first_quiz_badge = Badge.objects.get(name='Primo Quiz Completato!') # Usa nome corretto
-                         earned_badge, created = EarnedBadge.objects.get_or_create(
-                             student=self.student,
-                             badge=first_quiz_badge,
-                             defaults={'earned_at': timezone.now()}
-                         )
-                         if created:
-                             logger.info(f"Badge '{first_quiz_badge.name}' assegnato a {self.student.full_name}.")
-                             newly_earned_badges.append(earned_badge) # Aggiungi alla lista se creato
-                         else:
-                             logger.info(f"Studente {self.student.full_name} aveva già il badge '{first_quiz_badge.name}'.")
-                     except Badge.DoesNotExist:
-                         logger.warning("Badge con nome 'Primo Quiz Completato!' non trovato nel database. Impossibile assegnare.")
-                     except Exception as e_badge:
-                         logger.error(f"Errore durante l'assegnazione del badge 'Primo Quiz Completato!' a {self.student.id}: {e_badge}", exc_info=True)
-            # --- Fine Logica Badge ---
-
-        # --- Trigger Pathway Progress Update (TEMPORANEAMENTE COMMENTATO PER DEBUG) ---
-        # This should happen if the quiz was passed, regardless of points awarded
-        pathway_badges = []
-        if passed:
-             pathway_badges = self.update_pathway_progress() # Cattura i badge dal percorso
+            if is_first_successful_for_this_quiz and points_to_award > 0 and credit_quiz_points:
+                credits.append((points_to_award, f"Completamento Quiz: {self.quiz.title}"))
+
+            # Evento per i badge QUIZ_COMPLETED (e "Primo Quiz Completato!")
+            # La query sul primo quiz in assoluto serve solo se il badge dedicato esiste
+            is_first_ever_completion = False
+            if get_badge_index().first_quiz_badge_id is not None:
+                is_first_ever_completion = not self._previous_completed_attempts().exists()
+            badge_events.append(QuizCompleted(quiz_id=self.quiz_id, score=self.score, first_ever=is_first_ever_completion))
+
+            # Avanzamento dei percorsi che contengono questo quiz (eventi PathwayCompleted)
+            badge_events.extend(self._advance_pathways(credits))
+
+            # Saldo aggiornato dopo gli eventuali punti quiz/percorso, per i badge a soglia
+            balance = self._apply_credits(credits)
+            if balance is not None:
+                badge_events.append(PointsChanged(current_points=balance))
 
-        return newly_earned_badges + pathway_badges # Restituisci tutti i badge guadagnati
+        # Serie di risposte corrette consecutive (calcolata dal motore di valutazione)
+        if correct_streak:
+            badge_events.append(CorrectStreak(streak_length=correct_streak))
+
+        return self._award_badges(badge_events)
+
+
+    def _award_badges(self, badge_events) -> list[EarnedBadge]:
+        """ Assegna i badge per gli eventi raccolti senza bloccare il completamento in caso di errore. """
+        if not badge_events:
+            return []
+        try:
+            with transaction.atomic(): # Savepoint: un errore non invalida la transazione esterna
+                return award_badges(self.student, badge_events)
+        except Exception as e_badge:
+            logger.error(f"Errore durante l'assegnazione dei badge per il tentativo {self.id}: {e_badge}", exc_info=True)
+            return []
 
 
     def update_pathway_progress(self) -> list[EarnedBadge]: # Aggiunto tipo di ritorno
         """
         Updates the PathwayProgress if this quiz is part of a pathway and was successfully completed.
-        Uses the new `completed_orders` field.
         Checks if the pathway itself is now complete and assigns pathway points/badges if applicable.
         Returns a list of newly earned pathway-related Badge instances.
         """
-        newly_earned_pathway_badges = [] # Inizializza lista badge guadagnati
-        logger.debug(f"Attempt {self.id}: Checking pathway progress update for quiz {self.quiz.id}.")
-        # Check if the attempt was successful (status is COMPLETED)
         if self.status != self.AttemptStatus.COMPLETED:
             logger.debug(f"Attempt {self.id}: Quiz not passed (status={self.status}), skipping pathway update.")
-            return
+            return []
+        credits = []
+        events = self._advance_pathways(credits)
+        if credits:
+            self._apply_credits(credits)
+        return self._award_badges(events)
 
-        # Find pathways this quiz belongs to and the student is assigned to
-        pathway_assignments = PathwayAssignment.objects.filter(
-            student=self.student,
-            pathway__quizzes=self.quiz # Filtra per percorsi che contengono questo quiz
-        ).select_related('pathway')
-
-        logger.debug(f"Attempt {self.id}: Found {pathway_assignments.count()} pathway assignments for student {self.student.id} containing quiz {self.quiz.id}.")
-
-        for assignment in pathway_assignments:
-            pathway = assignment.pathway
-            # Get the order of the current quiz within this specific pathway
-            try:
-                pathway_quiz_entry = PathwayQuiz.objects.get(pathway=pathway, quiz=self.quiz)
-                current_quiz_order = pathway_quiz_entry.order
-            except PathwayQuiz.DoesNotExist:
-                logger.warning(f"Attempt {self.id}: Quiz {self.quiz.id} is linked to pathway {pathway.id} but PathwayQuiz entry is missing.")
+
+    def _apply_credits(self, credits) -> int | None:
+        """
+        Accredita i punti raccolti (apps.rewards.ledger: un solo UPDATE ... RETURNING con le transazioni)
+        e restituisce il saldo aggiornato; None se il wallet non esiste o l'accredito non riesce.
+        """
+        try:
+            with transaction.atomic(): # Savepoint: un errore non invalida la transazione esterna
+                balance = apply_entries(self.student_id, credits)
+        except Wallet.DoesNotExist:
+            logger.error(f"Wallet not found for student {self.student_id} when trying to award points for attempt {self.id}.")
+            return None
+        except Exception as e_points:
+            logger.exception(f"Error awarding points for quiz attempt {self.id}: {e_points}")
+            return None
+        if credits:
+            logger.info(f"Awarded {sum(points for points, _reason in credits)} points to student {self.student_id} for attempt {self.id}.")
+        return balance
+
+
+    def _advance_pathways(self, credits: list) -> list:
+        """
+        Aggiorna il PathwayProgress dei percorsi assegnati che contengono questo quiz (campo `completed_orders`)
+        e aggiunge a `credits` i punti del primo completamento di un percorso (accreditati dal chiamante).
+        Restituisce gli eventi PathwayCompleted per il motore badge.
+        """
+        events = []
+        logger.debug(f"Attempt {self.id}: Checking pathway progress update for quiz {self.quiz_id}.")
+
+        # Percorsi assegnati allo studente che contengono questo quiz
+        pathways = list(Pathway.objects.filter(
+            assignments__student=self.student,
+            quizzes=self.quiz
+        ).distinct())
+        if not pathways:
+            return events
+
+        # Ordini dei quiz di tutti i percorsi interessati, in una sola query
+        pathway_orders = {}
+        current_orders = {}
+        for pathway_id, quiz_id, order in PathwayQuiz.objects.filter(pathway__in=pathways).values_list('pathway_id', 'quiz_id', 'order'):
+            pathway_orders.setdefault(pathway_id, set()).add(order)
+            if quiz_id == self.quiz_id:
+                current_orders[pathway_id] = order
+
+        for pathway in pathways:
+            current_quiz_order = current_orders.get(pathway.id)
+            if current_quiz_order is None:
+                logger.warning(f"Attempt {self.id}: Quiz {self.quiz_id} is linked to pathway {pathway.id} but PathwayQuiz entry is missing.")
                 continue # Skip this pathway if the link is broken
 
             # Get or create the progress record for this student and pathway
@@ -877,12 +780,8 @@ class QuizAttempt(models.Model):
             else:
                  logger.debug(f"Attempt {self.id}: Quiz order {current_quiz_order} already marked as completed for pathway {pathway.id}, student {self.student.id}.")
 
-
             # Check if the pathway is now complete
-            all_pathway_quiz_orders = set(PathwayQuiz.objects.filter(pathway=pathway).values_list('order', flat=True))
-            completed_orders_set = set(progress.completed_orders)
-
-            if all_pathway_quiz_orders == completed_orders_set:
+            if pathway_orders[pathway.id] == set(progress.completed_orders):
                 logger.info(f"Pathway {pathway.id} completed by student {self.student.id} with attempt {self.id}.")
                 progress.status = PathwayProgress.ProgressStatus.COMPLETED
                 progress.completed_at = timezone.now()
@@ -892,61 +791,15 @@ class QuizAttempt(models.Model):
                     progress.first_correct_completion = True
                     points_for_pathway = pathway.metadata.get('points_on_completion', 0)
                     if points_for_pathway > 0:
-                        try:
-                            wallet = Wallet.objects.get(student=self.student)
-                            with transaction.atomic():
-                                wallet.current_points = F('current_points') + points_for_pathway
-                                wallet.save(update_fields=['current_points'])
-                                PointTransaction.objects.create(
-                                    wallet=wallet,
-                                    points_change=points_for_pathway,
-                                    reason=f"Completamento Percorso: {pathway.title}"
-                                )
-                                progress.points_earned = points_for_pathway
-                                logger.info(f"Awarded {points_for_pathway} points to student {self.student.id} for completing pathway {pathway.id}.")
-                        except Wallet.DoesNotExist:
-                             logger.error(f"Wallet not found for student {self.student.id} when trying to award points for pathway {pathway.id}.")
-                        except Exception as e_path_points:
-                             logger.exception(f"Error awarding points for pathway {pathway.id} completion: {e_path_points}")
-
-                    # --- Logica Badge per Completamento Percorso ---
-                    try:
-                        pathway_badges = Badge.objects.filter(
-                            trigger_type='PATHWAY_COMPLETED', # Usa la stringa diretta
-                            is_active=True
-                        )
-                        for badge in pathway_badges:
-                            try:
-                                condition = badge.trigger_condition
-                                required_pathway_id = condition.get("pathway_id") # Può essere None
-
-                                # Controlla se il badge è per questo percorso specifico (se richiesto)
-                                pathway_match = (required_pathway_id is None or required_pathway_id == pathway.id)
-
-                                logger.debug(f"Badge '{badge.name}': ReqPathwayID={required_pathway_id} | CurrentPathwayID={pathway.id} | Match={pathway_match}")
-
-                                if pathway_match:
-                                    # Controlla se lo studente ha già questo badge
-                                    already_earned = EarnedBadge.objects.filter(student=self.student, badge=badge).exists()
-                                    if not already_earned:
-                                        logger.info(f"Conditions met for PATHWAY_COMPLETED badge '{badge.name}' (ID {badge.id}).")
-                                        earned_badge = EarnedBadge.objects.create(student=self.student, badge=badge) # Cattura istanza creata
-                                        newly_earned_pathway_badges.append(earned_badge) # Aggiungi alla lista
-                                        logger.info(f"Awarded badge '{badge.name}' to student {self.student.id} for completing pathway {pathway.id}.")
-                                    # else:
-                                    #    logger.info(f"Studente {self.student.full_name} aveva già il badge '{badge.name}' (PATHWAY_COMPLETED).")
-
-                            except (ValueError, TypeError, KeyError) as e_cond:
-                                logger.error(f"Errore nel parsing trigger_condition per Badge PATHWAY_COMPLETED {badge.id} ('{badge.name}'): {condition}. Errore: {e_cond}", exc_info=True)
-                            except Exception as e_inner_path_badge:
-                                logger.error(f"Errore durante l'assegnazione del Badge PATHWAY_COMPLETED {badge.id} ('{badge.name}') a {self.student.id} per pathway {pathway.id}: {e_inner_path_badge}", exc_info=True)
-                    except Exception as e_path_badge:
-                        logger.exception(f"Error awarding badge for pathway {pathway.id} completion: {e_path_badge}")
+                        credits.append((points_for_pathway, f"Completamento Percorso: {pathway.title}"))
+                        progress.points_earned = points_for_pathway
+
+                    events.append(PathwayCompleted(pathway_id=pathway.id))
 
             # Salva le modifiche al progresso (stato, completed_at, points_earned, first_correct_completion, completed_orders, last_completed_quiz_order)
             progress.save()
 
-        return newly_earned_pathway_badges # Restituisci i badge guadagnati in questo aggiornamento
+        return events
 
 
 class StudentAnswer(models.Model):
@@ -1038,6 +891,14 @@ class PathwayProgress(models.Model):
         verbose_name_plural = _('Pathway Progresses')
         ordering = ['student', '-started_at']
         unique_together = ('student', 'pathway') # Un solo record di progresso per studente per percorso
+        # (student, pathway) è già coperto dall'indice del vincolo unique_together
+        indexes = [
+            models.Index(
+                fields=['student'],
+                condition=models.Q(status='COMPLETED'),
+                name='edu_pprog_stu_completed_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Progress of {self.student.full_name} in {self.pathway.title} ({self.status})"
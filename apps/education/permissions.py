@@ -89,7 +89,7 @@ class IsStudentOwnerForAttempt(permissions.BasePermission):
             return False
 
         if hasattr(obj, 'student'): # Per QuizAttempt, PathwayProgress
-            return obj.student == student
+            return obj.student_id == student.pk # Confronto per ID: nessuna query sullo studente
         elif hasattr(obj, 'quiz_attempt'): # Per StudentAnswer
             return obj.quiz_attempt.student == student
         return False
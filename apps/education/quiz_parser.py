@@ -0,0 +1,247 @@
+"""
+Analisi del testo dei quiz caricati dai docenti (PDF, DOCX, MD), condivisa da upload di quiz e template.
+
+`QuizTextParser` è una macchina a stati a passata singola: ogni riga viene classificata con una
+sola espressione regolare (domanda numerata, opzione con lettera o puntata, testo, riga vuota) e
+il testo può arrivare una pagina alla volta (`feed`), senza tenere in memoria l'intero documento.
+
+Formato riconosciuto:
+
+    1. Testo della domanda          (anche "1)"; il testo può continuare sulle righe successive)
+    A) Opzione                      (anche "A."; oppure "- Opzione", "• Opzione" o riga rientrata)
+    B) Opzione corretta *           ("*" o "(*)" in fondo all'opzione la segna come corretta)
+
+Il testo prima della prima domanda numerata (titolo, istruzioni) viene ignorato, anche quando si ripete
+come intestazione delle pagine successive; un documento senza
+domande numerate viene letto come in passato (la prima riga è la domanda). Le domande senza opzioni
+diventano a risposta aperta. Le anomalie vengono riportate con pagina e riga in `ParseResult.issues`.
+
+I PDF che PyPDF2 estrae con una parola per riga vengono ricomposti prima dell'analisi, andando a capo
+prima di ogni marcatore di domanda o di opzione.
+"""
+import re
+import time
+from dataclasses import dataclass, field
+
+from rest_framework.exceptions import ValidationError
+
+from .models import QuestionType
+
+NO_QUESTIONS_MESSAGE = "Nessuna domanda valida trovata nel file. Verifica la formattazione."
+
+# Un'unica regex per riga: rientro, poi numero di domanda, lettera di opzione o punto elenco
+_LINE_RE = re.compile(
+    r"(?P<indent>[ \t ]*)"
+    r"(?:(?P<number>\d{1,4})[ \t]*[.)](?![0-9])|(?P<letter>[A-Z])[ \t]*[.)]|(?P<bullet>[•●▪◦\uf0b7]|[-*](?=\s)))?"
+    r"[ \t ]*(?P<rest>.*)"
+)
+# Marcatore di risposta corretta in fondo all'opzione
+_CORRECT_RE = re.compile(r"\s*(?:\(\*\)|(?<=\s)\*)\s*$")
+# Token che iniziano una nuova riga quando si ricompone un PDF "una parola per riga"
+_REFLOW_MARKER_RE = re.compile(r"\d{1,4}[.)]|[A-Z][.)]")
+_MARKDOWN_EMPHASIS_RE = re.compile(r"\*\*|__")
+
+# Quante righe di una pagina devono contenere una sola parola perché venga ricomposta
+REFLOW_MIN_LINES = 20
+REFLOW_SINGLE_WORD_RATIO = 0.9
+
+
+@dataclass(frozen=True)
+class ParseIssue:
+    """ Anomalia trovata nel testo, con posizione (pagina 1-based se il testo è a pagine, riga 1-based). """
+    page: int | None
+    line: int
+    message: str
+
+    def as_dict(self) -> dict:
+        return {'page': self.page, 'line': self.line, 'message': self.message}
+
+    def __str__(self):
+        position = f"pagina {self.page}, riga {self.line}" if self.page else f"riga {self.line}"
+        return f"{position}: {self.message}"
+
+
+@dataclass
+class ParseResult:
+    questions: list = field(default_factory=list)  # [{'text', 'order', 'type', 'options': [{'text', 'order', 'is_correct'}]}]
+    issues: list = field(default_factory=list)  # [ParseIssue]
+    lines: int = 0
+    seconds: float = 0.0
+
+
+def reflow_word_lines(text: str) -> str:
+    """
+    Ricompone il testo se quasi tutte le righe contengono una sola parola (estrazione PDF degradata):
+    le parole vengono unite con spazi e si va a capo prima di ogni "12." / "12)" / "A)" / "A.".
+    """
+    words = text.split()
+    non_blank = [line for line in text.splitlines() if line.strip()]
+    if len(non_blank) < REFLOW_MIN_LINES:
+        return text
+    single_word = sum(1 for line in non_blank if len(line.split()) == 1)
+    if single_word < REFLOW_SINGLE_WORD_RATIO * len(non_blank):
+        return text
+    lines, current = [], []
+    for word in words:
+        if current and _REFLOW_MARKER_RE.fullmatch(word):
+            lines.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        lines.append(" ".join(current))
+    return "\n".join(lines)
+
+
+class QuizTextParser:
+    """ Parser incrementale: `feed()` per ogni pagina (o per tutto il testo), poi `finish()`. """
+
+    def __init__(self, markdown: bool = False):
+        self.markdown = markdown
+        self.questions = []
+        self.issues = []
+        self.lines = 0
+        self._current = None
+        self._numbered = False
+        self._preamble = [] # (page, line, testo) prima della prima domanda numerata
+        self._page_headers = set() # Righe del preambolo, ripetute come intestazione delle pagine successive
+        self._page = None
+        self._line = 0
+        self._seconds = 0.0
+        self._seen_numbers = set()
+
+    # --- Ingresso ---
+
+    def feed(self, text: str, page: int | None = None) -> None:
+        """ Analizza un blocco di testo (tipicamente una pagina); lo stato prosegue tra i blocchi. """
+        started = time.perf_counter()
+        if page is not None and page != self._page:
+            self._page, self._line = page, 0
+        for raw_line in reflow_word_lines(text).splitlines():
+            self._line += 1
+            self.lines += 1
+            self._feed_line(raw_line)
+        self._seconds += time.perf_counter() - started
+
+    def finish(self) -> ParseResult:
+        """ Chiude l'analisi: ordina e rinumera le domande (0-based). ValidationError se non ce ne sono. """
+        started = time.perf_counter()
+        if not self._numbered and self._preamble:
+            self._replay_unnumbered()
+        self._close_question()
+        questions = sorted((q for q in self.questions if q['text']), key=lambda q: q['order'])
+        for index, question in enumerate(questions):
+            question['order'] = index
+            if not question['options']:
+                question['type'] = QuestionType.OPEN_ANSWER_MANUAL
+        self._seconds += time.perf_counter() - started
+        if not questions:
+            detail = NO_QUESTIONS_MESSAGE
+            if self.issues:
+                detail += " " + "; ".join(str(issue) for issue in self.issues[:5])
+            raise ValidationError(detail)
+        return ParseResult(questions=questions, issues=self.issues, lines=self.lines, seconds=self._seconds)
+
+    # --- Macchina a stati ---
+
+    def _feed_line(self, raw_line: str) -> None:
+        if self.markdown:
+            raw_line = self._strip_markdown(raw_line)
+        match = _LINE_RE.match(raw_line)
+        rest = match['rest'].strip()
+        if match['number']:
+            self._start_numbered_question(int(match['number']), rest)
+        elif not self._numbered:
+            if rest or match['letter'] or match['bullet']:
+                self._preamble.append((self._page, self._line, raw_line))
+        elif match['letter'] or match['bullet']:
+            self._add_option(rest)
+        elif not rest:
+            return
+        elif rest in self._page_headers:
+            self._issue("Intestazione di pagina ignorata.")
+        elif match['indent'] and self._current and self._current['text']:
+            # Riga rientrata dopo la domanda: opzione senza lettera (es. elenco puntato perso nel PDF)
+            self._add_option(rest)
+        else:
+            self._add_text(rest)
+
+    def _start_numbered_question(self, number: int, text: str) -> None:
+        if not self._numbered and self._preamble:
+            page, line, _text = self._preamble[0]
+            self._issue(f"Ignorate {len(self._preamble)} righe prima della prima domanda numerata.", position=(page, line))
+            self._page_headers = {_LINE_RE.match(raw)['rest'].strip() for _page, _line, raw in self._preamble}
+            self._preamble = []
+        self._numbered = True
+        if number in self._seen_numbers:
+            self._issue(f"Numero di domanda {number} ripetuto.")
+        self._seen_numbers.add(number)
+        self._new_question(text, number)
+
+    def _new_question(self, text: str, order: int) -> None:
+        self._close_question()
+        self._current = {'text': text, 'order': order, 'options': [], 'type': QuestionType.MULTIPLE_CHOICE_SINGLE}
+
+    def _add_option(self, text: str) -> None:
+        if self._current is None or not self._current['text']:
+            self._issue("Opzione senza una domanda: riga trattata come testo della domanda.")
+            self._add_text(text)
+            return
+        is_correct = False
+        marker = _CORRECT_RE.search(text)
+        if marker:
+            text, is_correct = text[:marker.start()], True
+        if not text:
+            self._issue("Opzione vuota ignorata.")
+            return
+        options = self._current['options']
+        options.append({'text': text, 'order': len(options) + 1, 'is_correct': is_correct})
+
+    def _add_text(self, text: str) -> None:
+        current = self._current
+        if current is None:
+            self._new_question(text, len(self.questions) + 1)
+        elif current['options']:
+            # Testo dopo le opzioni: continuazione dell'ultima opzione
+            current['options'][-1]['text'] += " " + text
+        else:
+            current['text'] = f"{current['text']} {text}" if current['text'] else text
+
+    def _close_question(self) -> None:
+        if self._current is not None:
+            if self._current['text']:
+                self.questions.append(self._current)
+            else:
+                self._issue(f"Domanda {self._current['order']} senza testo ignorata.")
+            self._current = None
+
+    def _replay_unnumbered(self) -> None:
+        """ Documento senza domande numerate: le righe vengono lette come domanda e opzioni. """
+        self._numbered = True
+        preamble, self._preamble = self._preamble, []
+        for page, line, raw_line in preamble:
+            self._page, self._line = page, line
+            match = _LINE_RE.match(raw_line)
+            rest = match['rest'].strip()
+            if match['letter'] or match['bullet']:
+                self._add_option(rest)
+            elif rest:
+                self._add_text(rest)
+
+    def _strip_markdown(self, line: str) -> str:
+        stripped = line.lstrip()
+        if stripped.startswith('#'):
+            line = stripped.lstrip('#')
+        elif stripped.startswith('>'):
+            line = stripped.lstrip('>')
+        return _MARKDOWN_EMPHASIS_RE.sub('', line)
+
+    def _issue(self, message: str, position: tuple | None = None) -> None:
+        page, line = position or (self._page, self._line)
+        self.issues.append(ParseIssue(page, line, message))
+
+
+def parse_quiz_text(text: str, markdown: bool = False) -> ParseResult:
+    """ Analizza un testo completo (vedi QuizTextParser). """
+    parser = QuizTextParser(markdown=markdown)
+    parser.feed(text)
+    return parser.finish()
@@ -1,14 +1,9 @@
 import logging
-import io
-import re
-from PyPDF2 import PdfReader
-from docx import Document as DocxDocument
-import markdown as md_parser # Rinominato per evitare conflitti
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
-from django.db import transaction
 from django.utils import timezone
 from django.core.files.uploadedfile import UploadedFile
+from apps.common.serializers import SparseFieldsetMixin
 
 from .models import (
     QuizTemplate, QuestionTemplate, AnswerOptionTemplate,
@@ -49,7 +44,7 @@ class QuestionTemplateSerializer(serializers.ModelSerializer):
         read_only_fields = ['quiz_template']
 
 
-class QuizTemplateSerializer(serializers.ModelSerializer):
+class QuizTemplateSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     admin_username = serializers.CharField(source='admin.username', read_only=True, allow_null=True)
     teacher_username = serializers.CharField(source='teacher.username', read_only=True, allow_null=True)
 
@@ -71,7 +66,7 @@ class PathwayQuizTemplateSerializer(serializers.ModelSerializer):
         fields = ['id', 'quiz_template_id', 'quiz_template_title', 'order']
 
 
-class PathwayTemplateSerializer(serializers.ModelSerializer):
+class PathwayTemplateSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     teacher_username = serializers.CharField(source='teacher.username', read_only=True)
     quiz_template_details = PathwayQuizTemplateSerializer(source='pathwayquiztemplate_set', many=True, read_only=True)
 
@@ -109,6 +104,34 @@ class QuestionSerializer(serializers.ModelSerializer):
         read_only_fields = ['quiz']
 
 
+class StudentAnswerOptionSerializer(serializers.ModelSerializer):
+    """ Opzione di risposta mostrata allo studente: senza 'is_correct'. """
+    class Meta:
+        model = AnswerOption
+        fields = ['id', 'text', 'order']
+
+
+class StudentQuestionSerializer(serializers.ModelSerializer):
+    """ Domanda mostrata allo studente durante un tentativo: senza soluzioni (opzioni corrette, risposte attese). """
+    # Chiavi dei metadati che contengono le soluzioni
+    SOLUTION_METADATA_KEYS = frozenset({'correct_answers', 'fill_blank_correct_answers'})
+
+    answer_options = StudentAnswerOptionSerializer(many=True, read_only=True)
+    question_type_display = serializers.CharField(source='get_question_type_display', read_only=True)
+    metadata = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Question
+        fields = [
+            'id', 'quiz', 'text', 'question_type', 'question_type_display',
+            'order', 'metadata', 'answer_options'
+        ]
+        read_only_fields = fields
+
+    def get_metadata(self, obj: Question) -> dict:
+        return {key: value for key, value in (obj.metadata or {}).items() if key not in self.SOLUTION_METADATA_KEYS}
+
+
 class QuizSerializer(serializers.ModelSerializer):
     teacher_username = serializers.CharField(source='teacher.username', read_only=True)
 
@@ -154,7 +177,9 @@ ALLOWED_UPLOAD_EXTENSIONS = ['.pdf', '.docx', '.md']
 
 class QuizUploadSerializer(serializers.Serializer):
     """
-    Serializer per gestire l'upload di file (PDF, DOCX, MD) per creare quiz.
+    Serializer per validare l'upload di file (PDF, DOCX, MD) per creare quiz.
+    Lettura del file e creazione del quiz avvengono nel job di import (apps.education.imports),
+    l'analisi del testo in apps.education.quiz_parser.
     """
     file = serializers.FileField(required=True, help_text="File del quiz (.pdf, .docx, .md)")
     title = serializers.CharField(max_length=255, required=True, help_text="Titolo del nuovo quiz")
@@ -170,419 +195,17 @@ class QuizUploadSerializer(serializers.Serializer):
             raise ValidationError(f"Tipo di file non supportato: {ext}. Sono permessi: {', '.join(ALLOWED_UPLOAD_EXTENSIONS)}")
         return value
 
-    def _extract_text_from_pdf(self, file_obj: io.BytesIO) -> str:
-        try:
-            reader = PdfReader(file_obj)
-            text = ""
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            if not text:
-                 logger.warning("Nessun testo estratto dal PDF.")
-            return text
-        except Exception as e:
-            logger.error(f"Errore estrazione testo PDF: {e}", exc_info=True)
-            raise ValidationError(f"Impossibile leggere il file PDF. Errore: {e}")
-
-    def _extract_text_from_docx(self, file_obj: io.BytesIO) -> str:
-        try:
-            document = DocxDocument(file_obj)
-            text = "\n".join([para.text for para in document.paragraphs if para.text])
-            if not text:
-                 logger.warning("Nessun testo estratto dal DOCX.")
-            return text
-        except Exception as e:
-            logger.error(f"Errore estrazione testo DOCX: {e}", exc_info=True)
-            raise ValidationError(f"Impossibile leggere il file DOCX. Errore: {e}")
-
-    def _extract_text_from_md(self, file_obj: io.BytesIO) -> str:
-        try:
-            md_content = file_obj.read().decode('utf-8')
-            html = md_parser.markdown(md_content)
-            text = re.sub('<[^<]+?>', '', html).strip()
-            if not text:
-                 logger.warning("Nessun testo estratto dal Markdown.")
-            return text
-        except Exception as e:
-            logger.error(f"Errore estrazione testo Markdown: {e}", exc_info=True)
-            raise ValidationError(f"Impossibile leggere il file Markdown. Errore: {e}")
-
-    def _parse_quiz_text(self, text: str) -> list[dict]:
-        questions = []
-        current_question = None
-        question_start_re = re.compile(r"^\s*(?:(\d+)\s*[.)])?\s*(.*)", re.MULTILINE)
-        option_re = re.compile(r"^\s*([A-Z])\s*[.)]\s*(.*)", re.MULTILINE)
-        empty_line_re = re.compile(r"^\s*$")
-        lines = text.splitlines()
-        question_counter = 0
-
-        for line in lines:
-            if empty_line_re.match(line):
-                continue
-
-            line_stripped = line.strip()
-            question_match = question_start_re.match(line)
-            option_match = option_re.match(line_stripped)
-            is_likely_question_start = question_match and question_match.group(1)
-            is_likely_option = option_match
-
-            if is_likely_question_start:
-                if current_question:
-                    questions.append(current_question)
-                question_number = int(question_match.group(1))
-                question_text = question_match.group(2).strip()
-                question_counter = question_number
-                current_question = {
-                    "text": question_text, "order": question_number, "options": [],
-                    "type": QuestionType.MULTIPLE_CHOICE_SINGLE
-                }
-            elif is_likely_option and current_question:
-                option_letter = option_match.group(1)
-                option_text = option_match.group(2).strip()
-                current_question["options"].append({
-                    "text": option_text, "order": len(current_question["options"]) + 1, "is_correct": False
-                })
-            elif current_question:
-                 if current_question["options"] and not is_likely_question_start:
-                     current_question["options"][-1]["text"] += " " + line_stripped
-                 else:
-                     if current_question["options"] or not current_question["text"]:
-                         if current_question["text"]:
-                             questions.append(current_question)
-                         question_counter += 1
-                         current_question = {
-                             "text": line_stripped, "order": question_counter, "options": [],
-                             "type": QuestionType.MULTIPLE_CHOICE_SINGLE
-                         }
-                     else:
-                        current_question["text"] += " " + line_stripped
-            elif not current_question and line_stripped:
-                 question_counter += 1
-                 current_question = {
-                     "text": line_stripped, "order": question_counter, "options": [],
-                     "type": QuestionType.MULTIPLE_CHOICE_SINGLE
-                 }
-
-        if current_question:
-            questions.append(current_question)
-
-        questions = [q for q in questions if q.get("text")]
-        questions.sort(key=lambda q: q.get("order", float('inf')))
-        for i, q in enumerate(questions):
-            q["order"] = i # Ordine 0-based
-            if not q["options"]:
-                q["type"] = QuestionType.OPEN_ANSWER_MANUAL
-
-        if not questions:
-             raise ValidationError("Nessuna domanda valida trovata nel file.")
-
-        return questions
-
-
-    @transaction.atomic
-    def create(self, validated_data):
-        uploaded_file: UploadedFile = validated_data['file']
-        title = validated_data['title']
-        teacher: User = self.context['request'].user
-
-        file_content = io.BytesIO(uploaded_file.read())
-        file_ext = '.' + uploaded_file.name.split('.')[-1].lower()
-
-        text = ""
-        try:
-            if file_ext == '.pdf':
-                text = self._extract_text_from_pdf(file_content)
-            elif file_ext == '.docx':
-                text = self._extract_text_from_docx(file_content)
-            elif file_ext == '.md':
-                text = self._extract_text_from_md(file_content)
-            else:
-                raise ValidationError("Tipo di file non gestito internamente.")
-        except ValidationError as e:
-             raise e
-        except Exception as e:
-             logger.error(f"Errore estrazione testo da {uploaded_file.name}: {e}", exc_info=True)
-             raise ValidationError(f"Errore lettura file {file_ext}.")
-
-
-        if not text or text.isspace():
-             raise ValidationError(f"Contenuto testuale non valido da {uploaded_file.name}.")
-
-        try:
-            parsed_questions = self._parse_quiz_text(text)
-        except ValidationError as e:
-             raise e
-        except Exception as e:
-             logger.error(f"Errore parsing testo da {uploaded_file.name}: {e}", exc_info=True)
-             raise ValidationError("Errore analisi contenuto file.")
-
-
-        quiz = Quiz.objects.create(
-            teacher=teacher,
-            title=title,
-            description=f"Quiz generato automaticamente da {uploaded_file.name}",
-            metadata={
-                'source_file': uploaded_file.name,
-                'generation_method': 'auto_upload'
-            }
-        )
-
-        questions_to_create = []
-        options_to_create = []
-
-        for q_data in parsed_questions:
-            question = Question(
-                quiz=quiz,
-                text=q_data['text'],
-                question_type=q_data['type'],
-                order=q_data['order'],
-                metadata={}
-            )
-            questions_to_create.append(question)
-
-        created_questions = Question.objects.bulk_create(questions_to_create)
-        question_map = {(q.text, q.order): q for q in created_questions}
-
-        for q_data in parsed_questions:
-             question_obj = question_map.get((q_data['text'], q_data['order']))
-             if not question_obj:
-                 logger.warning(f"Domanda '{q_data['text'][:50]}...' (ordine {q_data['order']}) non trovata dopo bulk_create.")
-                 continue
-
-             for opt_data in q_data['options']:
-                 option = AnswerOption(
-                     question=question_obj,
-                     text=opt_data['text'],
-                     is_correct=opt_data['is_correct'],
-                     order=opt_data['order']
-                 )
-                 options_to_create.append(option)
-
-        if options_to_create:
-            AnswerOption.objects.bulk_create(options_to_create)
-
-        logger.info(f"Creato Quiz '{quiz.title}' (ID: {quiz.id}) con {len(created_questions)} domande da {uploaded_file.name}")
-        return QuizSerializer(quiz, context=self.context).data
 
 # --- Serializer per Upload Quiz Template ---
 
-class QuizTemplateUploadSerializer(serializers.Serializer):
+class QuizTemplateUploadSerializer(QuizUploadSerializer):
     """
-    Serializer per gestire l'upload di file (PDF, DOCX, MD) per creare QuizTemplate.
+    Serializer per validare l'upload di file (PDF, DOCX, MD) per creare QuizTemplate.
+    Stessa validazione dell'upload di quiz; l'analisi del testo è in apps.education.quiz_parser.
     """
     file = serializers.FileField(required=True, help_text="File del quiz template (.pdf, .docx, .md)")
     title = serializers.CharField(max_length=255, required=True, help_text="Titolo del nuovo quiz template")
 
-    def validate_file(self, value: UploadedFile):
-        if not hasattr(value, 'name') or not value.name:
-             raise ValidationError("Nome del file mancante o non valido.")
-        parts = value.name.split('.')
-        if len(parts) < 2:
-            raise ValidationError("Il file non ha un'estensione.")
-        ext = '.' + parts[-1].lower()
-        if ext not in ALLOWED_UPLOAD_EXTENSIONS:
-            raise ValidationError(f"Tipo di file non supportato: {ext}. Sono permessi: {', '.join(ALLOWED_UPLOAD_EXTENSIONS)}")
-        return value
-
-    def _extract_text_from_pdf(self, file_obj: io.BytesIO) -> str:
-        try:
-            reader = PdfReader(file_obj)
-            text = ""
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            if not text:
-                 logger.warning("Nessun testo estratto dal PDF (template).")
-            return text
-        except Exception as e:
-            logger.error(f"Errore estrazione testo PDF (template): {e}", exc_info=True)
-            raise ValidationError(f"Impossibile leggere il file PDF (template). Errore: {e}")
-
-    def _extract_text_from_docx(self, file_obj: io.BytesIO) -> str:
-        try:
-            document = DocxDocument(file_obj)
-            text = "\n".join([para.text for para in document.paragraphs if para.text])
-            if not text:
-                 logger.warning("Nessun testo estratto dal DOCX (template).")
-            return text
-        except Exception as e:
-            logger.error(f"Errore estrazione testo DOCX (template): {e}", exc_info=True)
-            raise ValidationError(f"Impossibile leggere il file DOCX (template). Errore: {e}")
-
-    def _extract_text_from_md(self, file_obj: io.BytesIO) -> str:
-        try:
-            md_content = file_obj.read().decode('utf-8')
-            html = md_parser.markdown(md_content)
-            text = re.sub('<[^<]+?>', '', html).strip()
-            if not text:
-                 logger.warning("Nessun testo estratto dal Markdown (template).")
-            return text
-        except Exception as e:
-            logger.error(f"Errore estrazione testo Markdown (template): {e}", exc_info=True)
-            raise ValidationError(f"Impossibile leggere il file Markdown (template). Errore: {e}")
-
-    def _parse_quiz_text(self, text: str) -> list[dict]:
-        questions = []
-        current_question = None
-        question_start_re = re.compile(r"^\s*(?:(\d+)\s*[.)])?\s*(.*)", re.MULTILINE)
-        option_re = re.compile(r"^\s*([A-Z])\s*[.)]\s*(.*)", re.MULTILINE)
-        empty_line_re = re.compile(r"^\s*$")
-        lines = text.splitlines()
-        question_counter = 0
-
-        for line in lines:
-            if empty_line_re.match(line):
-                continue
-
-            line_stripped = line.strip()
-            question_match = question_start_re.match(line)
-            option_match = option_re.match(line_stripped)
-            is_likely_question_start = question_match and question_match.group(1)
-            is_likely_option = option_match
-
-            if is_likely_question_start:
-                if current_question:
-                    questions.append(current_question)
-                question_number = int(question_match.group(1))
-                question_text = question_match.group(2).strip()
-                question_counter = question_number
-                current_question = {
-                    "text": question_text, "order": question_number, "options": [],
-                    "type": QuestionType.MULTIPLE_CHOICE_SINGLE
-                }
-            elif is_likely_option and current_question:
-                option_letter = option_match.group(1)
-                option_text = option_match.group(2).strip()
-                current_question["options"].append({
-                    "text": option_text, "order": len(current_question["options"]) + 1, "is_correct": False
-                })
-            elif current_question:
-                 if current_question["options"] and not is_likely_question_start:
-                     current_question["options"][-1]["text"] += " " + line_stripped
-                 else:
-                     if current_question["options"] or not current_question["text"]:
-                         if current_question["text"]:
-                             questions.append(current_question)
-                         question_counter += 1
-                         current_question = {
-                             "text": line_stripped, "order": question_counter, "options": [],
-                             "type": QuestionType.MULTIPLE_CHOICE_SINGLE
-                         }
-                     else:
-                        current_question["text"] += " " + line_stripped
-            elif not current_question and line_stripped:
-                 question_counter += 1
-                 current_question = {
-                     "text": line_stripped, "order": question_counter, "options": [],
-                     "type": QuestionType.MULTIPLE_CHOICE_SINGLE
-                 }
-
-        if current_question:
-            questions.append(current_question)
-
-        questions = [q for q in questions if q.get("text")]
-        questions.sort(key=lambda q: q.get("order", float('inf')))
-        for i, q in enumerate(questions):
-            q["order"] = i # Ordine 0-based
-            if not q["options"]:
-                q["type"] = QuestionType.OPEN_ANSWER_MANUAL
-
-        if not questions:
-             raise ValidationError("Nessuna domanda valida trovata nel file (template). Verifica la formattazione.")
-
-        return questions
-
-
-    @transaction.atomic
-    def create(self, validated_data):
-        uploaded_file: UploadedFile = validated_data['file']
-        title = validated_data['title']
-        teacher: User = self.context['request'].user
-
-        if not isinstance(teacher, User) or not teacher.is_teacher:
-             raise ValidationError("Solo i docenti possono caricare template di quiz.")
-
-        file_content = io.BytesIO(uploaded_file.read())
-        file_ext = '.' + uploaded_file.name.split('.')[-1].lower()
-
-        text = ""
-        try:
-            if file_ext == '.pdf':
-                text = self._extract_text_from_pdf(file_content)
-            elif file_ext == '.docx':
-                text = self._extract_text_from_docx(file_content)
-            elif file_ext == '.md':
-                text = self._extract_text_from_md(file_content)
-            else:
-                raise ValidationError("Tipo di file non gestito internamente (template).")
-        except ValidationError as e:
-             raise e
-        except Exception as e:
-             logger.error(f"Errore estrazione testo (template) da {uploaded_file.name}: {e}", exc_info=True)
-             raise ValidationError(f"Errore lettura file {file_ext} (template).")
-
-
-        if not text or text.isspace():
-             raise ValidationError(f"Contenuto testuale non valido da {uploaded_file.name} (template).")
-
-        try:
-            parsed_questions = self._parse_quiz_text(text)
-        except ValidationError as e:
-             raise e
-        except Exception as e:
-             logger.error(f"Errore parsing testo (template) da {uploaded_file.name}: {e}", exc_info=True)
-             raise ValidationError("Errore analisi contenuto file (template).")
-
-
-        quiz_template = QuizTemplate.objects.create(
-            teacher=teacher,
-            title=title,
-            description=f"Template generato automaticamente da {uploaded_file.name}",
-            metadata={
-                'source_file': uploaded_file.name,
-                'generation_method': 'auto_upload'
-            }
-        )
-
-        questions_to_create = []
-        options_to_create = []
-
-        for q_data in parsed_questions:
-            question_template = QuestionTemplate(
-                quiz_template=quiz_template,
-                text=q_data['text'],
-                question_type=q_data['type'],
-                order=q_data['order'],
-                metadata={}
-            )
-            questions_to_create.append(question_template)
-
-        created_question_templates = QuestionTemplate.objects.bulk_create(questions_to_create)
-        question_template_map = {(qt.text, qt.order): qt for qt in created_question_templates}
-
-        for q_data in parsed_questions:
-             question_template_obj = question_template_map.get((q_data['text'], q_data['order']))
-             if not question_template_obj:
-                 logger.warning(f"Domanda template '{q_data['text'][:50]}...' (ordine {q_data['order']}) non trovata dopo bulk_create.")
-                 continue
-
-             for opt_data in q_data['options']:
-                 option_template = AnswerOptionTemplate(
-                     question_template=question_template_obj,
-                     text=opt_data['text'],
-                     is_correct=opt_data['is_correct'],
-                     order=opt_data['order']
-                 )
-                 options_to_create.append(option_template)
-
-        if options_to_create:
-            AnswerOptionTemplate.objects.bulk_create(options_to_create)
-
-        logger.info(f"Creato QuizTemplate '{quiz_template.title}' (ID: {quiz_template.id}) con {len(created_question_templates)} domande da {uploaded_file.name} per docente {teacher.id}")
-        return QuizTemplateSerializer(quiz_template, context=self.context).data
-
 
 # --- Serializers per Assegnazione ---
 
@@ -695,6 +318,31 @@ class PathwayAssignActionSerializer(serializers.Serializer):
         return value
 
 
+# --- Serializer per Assegnazione in Blocco (Quiz/Percorso esistente) ---
+
+class BulkAssignSerializer(serializers.Serializer):
+    """
+    Dati dell'azione 'assign-students' di Quiz e Percorsi:
+    una lista di ID studenti oppure all_students=true (tutti gli studenti attivi del docente).
+    """
+    student_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        max_length=1000,
+        help_text="Lista degli ID degli studenti a cui assegnare il contenuto."
+    )
+    all_students = serializers.BooleanField(required=False, default=False,
+                                            help_text="Assegna a tutti gli studenti attivi del docente.")
+    due_date = serializers.DateTimeField(required=False, allow_null=True,
+                                         help_text="Scadenza opzionale delle nuove assegnazioni.")
+
+    def validate(self, data):
+        if bool(data.get('student_ids')) == data.get('all_students'):
+            raise ValidationError("Specificare 'student_ids' oppure 'all_students', non entrambi.")
+        return data
+
+
 class PathwayAssignmentSerializer(serializers.ModelSerializer):
     """ Serializer per assegnare Percorsi a Studenti. """
     # Dichiarazione esplicita del campo pathway per poterlo modificare in __init__
@@ -778,7 +426,7 @@ class StudentAnswerSerializer(serializers.ModelSerializer):
         return value
 
 
-class QuizAttemptSerializer(serializers.ModelSerializer):
+class QuizAttemptSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """ Serializer base per i tentativi di quiz. """
     student_info = StudentSerializer(source='student', read_only=True)
     quiz_title = serializers.CharField(source='quiz.title', read_only=True)
@@ -847,14 +495,15 @@ class QuizAttemptDetailSerializer(QuizAttemptSerializer):
 
     def get_total_questions(self, obj: QuizAttempt) -> int:
         """ Conta il numero totale di domande nel quiz associato. """
-        # Usiamo .count() che è efficiente
-        return obj.quiz.questions.count()
+        # Annotazione della view (total_questions_count) se presente, altrimenti .count()
+        total = getattr(obj, 'total_questions_count', None)
+        return total if total is not None else obj.quiz.questions.count()
 
     def get_correct_answers_count(self, obj: QuizAttempt) -> int:
         """ Conta il numero di risposte corrette date in questo tentativo. """
-        # Assicurati che le risposte siano state caricate (se usi prefetch_related nella view)
-        # Altrimenti, esegue una query qui.
-        # Usiamo la relazione inversa 'student_answers' definita nel modello QuizAttempt
+        # Se le risposte sono già state caricate (prefetch_related nella view) le conta in memoria
+        if 'student_answers' in getattr(obj, '_prefetched_objects_cache', {}):
+            return sum(1 for answer in obj.student_answers.all() if answer.is_correct)
         return obj.student_answers.filter(is_correct=True).count()
 
 
@@ -890,22 +539,25 @@ class StudentQuizDashboardSerializer(QuizSerializer):
     class Meta(QuizSerializer.Meta):
         fields = QuizSerializer.Meta.fields + ['latest_attempt', 'attempts_count']
 
-    def get_latest_attempt(self, obj):
+    def _student_attempts(self, obj):
+        """ Tentativi dello studente (più recenti prima), dal prefetch della view se disponibile. """
+        if hasattr(obj, 'student_attempts_for_quiz'):
+            return obj.student_attempts_for_quiz
         student = self.context.get('student')
-        if student:
-            # Seleziona solo i campi necessari per SimpleQuizAttemptSerializer
-            latest = obj.attempts.filter(student=student).order_by('-started_at').only(
-                'id', 'score', 'status', 'completed_at'
-            ).first()
-            if latest:
-                return SimpleQuizAttemptSerializer(latest).data
+        if not student:
+            return []
+        return list(obj.attempts.filter(student=student).order_by('-started_at').only(
+            'id', 'score', 'status', 'completed_at'
+        ))
+
+    def get_latest_attempt(self, obj):
+        attempts = self._student_attempts(obj)
+        if attempts:
+            return SimpleQuizAttemptSerializer(attempts[0]).data
         return None
 
     def get_attempts_count(self, obj):
-        student = self.context.get('student')
-        if student:
-            return obj.attempts.filter(student=student).count()
-        return 0
+        return len(self._student_attempts(obj))
 
 
 class SimplePathwayProgressSerializer(serializers.ModelSerializer):
@@ -918,19 +570,26 @@ class SimplePathwayProgressSerializer(serializers.ModelSerializer):
 class StudentPathwayDashboardSerializer(PathwaySerializer):
     """ Serializer per i percorsi nella dashboard studente, include stato ultimo progresso. """
     latest_progress = serializers.SerializerMethodField()
-    total_quizzes = serializers.IntegerField(source='quizzes.count', read_only=True) # Conteggio quiz nel percorso
+    total_quizzes = serializers.SerializerMethodField() # Conteggio quiz nel percorso
 
     class Meta(PathwaySerializer.Meta):
         fields = PathwaySerializer.Meta.fields + ['latest_progress', 'total_quizzes']
 
     def get_latest_progress(self, obj):
-        student = self.context.get('student')
-        if student:
-            latest = obj.progresses.filter(student=student).first()
-            if latest:
-                return SimplePathwayProgressSerializer(latest).data
+        if hasattr(obj, 'student_progresses_for_pathway'): # Prefetch della view
+            progresses = obj.student_progresses_for_pathway
+            latest = progresses[0] if progresses else None
+        else:
+            student = self.context.get('student')
+            latest = obj.progresses.filter(student=student).first() if student else None
+        if latest:
+            return SimplePathwayProgressSerializer(latest).data
         return None
 
+    def get_total_quizzes(self, obj) -> int:
+        # Usa i PathwayQuiz già caricati (prefetch 'pathwayquiz_set') invece di una COUNT per percorso
+        return len(obj.pathwayquiz_set.all())
+
 
 # --- Serializer per Svolgimento Percorso ---
 
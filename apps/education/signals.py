@@ -0,0 +1,55 @@
+import logging
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.common.cache import invalidate_on_change
+from .models import (
+    QuizTemplate, QuestionTemplate, AnswerOptionTemplate, PathwayTemplate, PathwayQuizTemplate,
+    Quiz, QuizAnswerKey, Question, AnswerOption, Pathway, PathwayQuiz, QuizAssignment, PathwayAssignment,
+)
+from .grading import invalidate_answer_key
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Quiz)
+def create_quiz_answer_key(sender, instance, created, raw=False, **kwargs):
+    """ Crea la riga della chiave di risposta (versione 0, da compilare) per un nuovo Quiz. """
+    if created and not raw:
+        QuizAnswerKey.objects.get_or_create(quiz=instance)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_answer_key_on_question_change(sender, instance, **kwargs):
+    """
+    Invalida la chiave di risposta compilata del quiz quando una domanda cambia o viene eliminata.
+    """
+    invalidate_answer_key(instance.quiz_id)
+    logger.debug(f"Chiave di risposta invalidata per Quiz {instance.quiz_id} (Question {instance.id}).")
+
+
+@receiver(post_save, sender=AnswerOption)
+@receiver(post_delete, sender=AnswerOption)
+def invalidate_answer_key_on_option_change(sender, instance, **kwargs):
+    """
+    Invalida la chiave di risposta compilata del quiz quando un'opzione di risposta cambia o viene eliminata.
+    """
+    # Una query per risalire al quiz evita di caricare l'intera domanda
+    quiz_id = Question.objects.filter(pk=instance.question_id).values_list('quiz_id', flat=True).first()
+    if quiz_id is not None:
+        invalidate_answer_key(quiz_id)
+        logger.debug(f"Chiave di risposta invalidata per Quiz {quiz_id} (AnswerOption {instance.id}).")
+
+
+# --- Invalidazione della cache applicativa (namespace 'education') ---
+# Catalogo (template, quiz, percorsi): invalida l'intero namespace.
+# Assegnazioni: invalida solo lo scope dello studente interessato.
+invalidate_on_change(
+    'education',
+    QuizTemplate, QuestionTemplate, AnswerOptionTemplate, PathwayTemplate, PathwayQuizTemplate,
+    Quiz, Question, AnswerOption, Pathway, PathwayQuiz,
+)
+invalidate_on_change(
+    'education', QuizAssignment, PathwayAssignment,
+    scope_func=lambda instance: f"student:{instance.student_id}",
+)
@@ -0,0 +1,116 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.common.assignments import bulk_assign
+from apps.education.factories import QuizFactory, PathwayFactory, QuizAssignmentFactory
+from apps.education.models import QuizAssignment, PathwayAssignment
+from apps.users.factories import UserFactory, StudentFactory
+from apps.users.models import Student, UserRole
+from lezioni.models import Subject, Topic, Lesson, LessonAssignment
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def teacher():
+    """Fixture per creare un Docente."""
+    return UserFactory(role=UserRole.TEACHER)
+
+
+@pytest.fixture
+def teacher_client(teacher):
+    client = APIClient()
+    client.force_authenticate(user=teacher)
+    return client
+
+
+def _make_students(teacher, count):
+    return Student.objects.bulk_create([
+        Student(teacher=teacher, student_code=f'BULK{teacher.id}-{i}', first_name='Nome', last_name=f'Cognome {i}', pin_hash='x')
+        for i in range(count)
+    ])
+
+
+class TestBulkAssignment:
+    """ Test per l'assegnazione in blocco di quiz, percorsi e lezioni. """
+
+    def test_reports_created_skipped_and_invalid(self, teacher, teacher_client):
+        quiz = QuizFactory(teacher=teacher)
+        new, existing = StudentFactory(teacher=teacher), StudentFactory(teacher=teacher)
+        QuizAssignmentFactory(quiz=quiz, student=existing)
+        other_teacher_student = StudentFactory()
+        inactive = StudentFactory(teacher=teacher, is_active=False)
+
+        response = teacher_client.post(
+            reverse('quiz-assign-students', kwargs={'pk': quiz.pk}),
+            {'student_ids': [new.id, existing.id, other_teacher_student.id, inactive.id, new.id], 'due_date': '2030-01-01T10:00:00Z'},
+            format='json',
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data == {'created': [new.id], 'skipped': [existing.id], 'invalid': [other_teacher_student.id, inactive.id]}
+        assignment = QuizAssignment.objects.get(quiz=quiz, student=new)
+        assert assignment.assigned_by == teacher and assignment.due_date.year == 2030
+
+        again = teacher_client.post(reverse('quiz-assign-students', kwargs={'pk': quiz.pk}), {'student_ids': [new.id]}, format='json')
+        assert again.status_code == status.HTTP_200_OK
+        assert again.data['skipped'] == [new.id]
+
+    def test_all_students_of_pathway_teacher(self, teacher, teacher_client):
+        pathway = PathwayFactory(teacher=teacher)
+        students = _make_students(teacher, 3)
+        StudentFactory() # Studente di un altro docente
+
+        response = teacher_client.post(reverse('pathway-assign-students', kwargs={'pk': pathway.pk}), {'all_students': True}, format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert sorted(response.data['created']) == sorted(s.id for s in students)
+        assert PathwayAssignment.objects.filter(pathway=pathway).count() == 3
+
+    def test_requires_student_ids_or_all_students(self, teacher, teacher_client):
+        quiz = QuizFactory(teacher=teacher)
+        url = reverse('quiz-assign-students', kwargs={'pk': quiz.pk})
+        assert teacher_client.post(url, {}, format='json').status_code == status.HTTP_400_BAD_REQUEST
+        both = {'student_ids': [StudentFactory(teacher=teacher).id], 'all_students': True}
+        assert teacher_client.post(url, both, format='json').status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_other_teacher_cannot_assign(self, teacher_client):
+        quiz = QuizFactory()
+        response = teacher_client.post(reverse('quiz-assign-students', kwargs={'pk': quiz.pk}), {'all_students': True}, format='json')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert not QuizAssignment.objects.filter(quiz=quiz).exists()
+
+    def test_query_count_is_constant(self):
+        counts = []
+        for size in (2, 200):
+            owner = UserFactory(role=UserRole.TEACHER)
+            quiz = QuizFactory(teacher=owner)
+            students = _make_students(owner, size)
+            with CaptureQueriesContext(connection) as captured:
+                result = bulk_assign(QuizAssignment, 'quiz', quiz, teacher=owner, assigned_by=owner,
+                                     student_ids=[s.id for s in students], cache_namespace='education')
+            assert len(result.created) == size
+            # Le INSERT possono essere divise in lotti dal backend (limite di parametri di SQLite)
+            counts.append(sum(1 for q in captured.captured_queries if not q['sql'].startswith('INSERT')))
+            assert len(captured.captured_queries) <= 10
+        assert counts[0] == counts[1]
+
+    def test_lesson_assign_keeps_response_and_rejects_unknown_ids(self, teacher, teacher_client):
+        topic = Topic.objects.create(name='Frazioni', subject=Subject.objects.create(name='Matematica'))
+        lesson = Lesson.objects.create(title='Lezione', topic=topic, creator=teacher)
+        student = StudentFactory(teacher=teacher)
+        url = reverse('lezioni:lesson-assign-students', kwargs={'pk': lesson.pk})
+
+        rejected = teacher_client.post(url, {'student_ids': [student.id, StudentFactory().id]}, format='json')
+        assert rejected.status_code == status.HTTP_400_BAD_REQUEST
+        assert not LessonAssignment.objects.filter(lesson=lesson).exists()
+
+        response = teacher_client.post(url, {'all_students': True}, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['created'] == [student.id]
+        assert [a['student'] for a in response.data['assignments']] == [student.id]
+        assert teacher_client.post(url, {'student_ids': [student.id]}, format='json').data['already_assigned'] == [student.id]
@@ -0,0 +1,67 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from apps.education.benchmark import (
+    DjangoClientTransport, build_report, compare_reports, percentile, run_benchmark, seed,
+)
+from apps.education.models import QuizAttempt
+
+pytestmark = pytest.mark.django_db
+
+
+def test_student_flow_is_measured_per_endpoint():
+    data = seed(teachers=1, students_per_teacher=2, quizzes_per_teacher=1, questions_per_quiz=3)
+    # concurrency=1: nei test i dati non sono visibili alle connessioni di altri thread
+    recorder, wall_time, errors = run_benchmark(data, concurrency=1, transport_factory=DjangoClientTransport)
+    report = build_report(recorder, wall_time)
+
+    assert errors == []
+    endpoints = report['endpoints']
+    assert endpoints['login']['count'] == 2
+    assert endpoints['start_attempt']['count'] == 2
+    assert endpoints['submit_answer']['count'] == 6
+    assert endpoints['current_question']['count'] == 8 # 3 domande + la risposta 204 finale, per studente
+    assert endpoints['complete_attempt']['count'] == 2
+    assert all(stats['errors'] == 0 and stats['queries_mean'] > 0 for stats in endpoints.values())
+    assert report['totals']['flows'] == 2 and report['totals']['requests'] == 20
+    # Prima opzione = risposta corretta: tutti i tentativi superati
+    assert QuizAttempt.objects.filter(status=QuizAttempt.AttemptStatus.COMPLETED).count() == 2
+
+
+def test_percentile_interpolates():
+    assert percentile([], 95) == 0.0
+    assert percentile([10, 20, 30, 40], 50) == 25
+    assert percentile([10, 20, 30, 40], 100) == 40
+
+
+def test_compare_reports_flags_regressions():
+    def report(p95, queries, rps):
+        return {
+            'totals': {'requests_per_s': rps},
+            'endpoints': {'login': {'count': 1, 'p95_ms': p95, 'queries_mean': queries}},
+        }
+
+    assert compare_reports(report(10, 3, 100), report(11, 3, 95)) == []
+    regressions = compare_reports(report(10, 3, 100), report(20, 4, 50))
+    assert len(regressions) == 3
+
+
+def test_command_writes_baseline_and_compares(tmp_path):
+    output = tmp_path / 'baseline.json'
+    call_command('benchmark_quiz_flow', teachers=1, students=1, quizzes=1, questions=2,
+                 concurrency=1, output=str(output), stdout=io.StringIO())
+    baseline = json.loads(output.read_text())
+    assert baseline['totals']['flows'] == 1
+    assert baseline['config']['concurrency'] == 1
+
+    # Una baseline con meno query per richiesta rende il confronto un errore
+    for stats in baseline['endpoints'].values():
+        stats['queries_mean'] = 0
+    output.write_text(json.dumps(baseline))
+    with pytest.raises(CommandError):
+        call_command('benchmark_quiz_flow', teachers=1, students=1, quizzes=1, questions=2,
+                     concurrency=1, compare=str(output), stdout=io.StringIO(), stderr=io.StringIO())
@@ -0,0 +1,89 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.education.cloning import clone_pathway_template, clone_quiz_template
+from apps.education.factories import QuizTemplateFactory, QuestionTemplateFactory, AnswerOptionTemplateFactory
+from apps.education.models import PathwayTemplate, PathwayQuizTemplate, QuestionType, QuizAnswerKey
+from apps.users.factories import UserFactory
+from apps.users.models import UserRole
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def teacher():
+    """Fixture per creare un Docente."""
+    return UserFactory(role=UserRole.TEACHER)
+
+
+def _make_quiz_template(teacher, num_questions, num_options=3):
+    template = QuizTemplateFactory(admin=None, teacher=teacher, metadata={'completion_threshold': 0.7})
+    for i in range(num_questions):
+        q_template = QuestionTemplateFactory(quiz_template=template, question_type=QuestionType.MULTIPLE_CHOICE_SINGLE,
+                                             order=i + 1, text=f'Domanda {i + 1}', metadata={'points_per_correct_answer': i})
+        for j in range(num_options):
+            AnswerOptionTemplateFactory(question_template=q_template, text=f'Opzione {i + 1}.{j + 1}', is_correct=j == 0, order=j + 1)
+    return template
+
+
+def _make_pathway_template(teacher, num_quizzes, num_questions):
+    template = PathwayTemplate.objects.create(teacher=teacher, title='Percorso', metadata={'points_on_completion': 5})
+    for order in range(1, num_quizzes + 1):
+        PathwayQuizTemplate.objects.create(pathway_template=template, quiz_template=_make_quiz_template(teacher, num_questions), order=order)
+    return template
+
+
+class TestTemplateCloning:
+    """ Test per la creazione in blocco di quiz e percorsi dai template. """
+
+    def test_quiz_clone_copies_questions_and_options(self, teacher):
+        template = _make_quiz_template(teacher, 3)
+
+        quiz = clone_quiz_template(template, teacher, title_override='Copia')
+
+        assert (quiz.title, quiz.source_template_id, quiz.metadata) == ('Copia', template.id, {'completion_threshold': 0.7})
+        questions = list(quiz.questions.order_by('order'))
+        assert [q.order for q in questions] == [0, 1, 2]
+        assert [q.text for q in questions] == ['Domanda 1', 'Domanda 2', 'Domanda 3']
+        for i, question in enumerate(questions):
+            options = list(question.answer_options.order_by('order'))
+            assert [o.text for o in options] == [f'Opzione {i + 1}.{j + 1}' for j in range(3)]
+            assert [o.is_correct for o in options] == [True, False, False]
+        assert QuizAnswerKey.objects.filter(quiz=quiz, version=0).exists() # Riga creata insieme al quiz
+        assert quiz.get_max_possible_score() == 0 + 1 + 2
+
+    def test_pathway_clone_keeps_quiz_order(self, teacher):
+        template = _make_pathway_template(teacher, 3, 2)
+
+        pathway = clone_pathway_template(template, teacher)
+
+        links = list(pathway.pathwayquiz_set.select_related('quiz').order_by('order'))
+        expected = list(template.pathwayquiztemplate_set.order_by('order').values_list('order', 'quiz_template_id'))
+        assert [(link.order, link.quiz.source_template_id) for link in links] == expected
+        assert all(link.quiz.questions.count() == 2 for link in links)
+
+    def test_pathway_clone_query_count_is_constant(self, teacher):
+        counts = []
+        for num_quizzes, num_questions in ((1, 2), (10, 40)):
+            template = _make_pathway_template(teacher, num_quizzes, num_questions)
+            with CaptureQueriesContext(connection) as captured:
+                pathway = clone_pathway_template(template, teacher)
+            # Le INSERT possono essere divise in lotti dal backend (limite di parametri di SQLite)
+            counts.append(sum(1 for q in captured.captured_queries if not q['sql'].startswith('INSERT')))
+            assert len(captured.captured_queries) <= 20
+            assert pathway.pathwayquiz_set.count() == num_quizzes
+        assert counts[0] == counts[1]
+
+    def test_create_from_template_endpoint(self, teacher):
+        template = _make_quiz_template(teacher, 2)
+        client = APIClient()
+        client.force_authenticate(user=teacher)
+
+        response = client.post(reverse('quiz-create-from-template'), {'template_id': template.id}, format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['source_template'] == template.id
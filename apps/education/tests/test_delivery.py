@@ -0,0 +1,160 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.education.delivery import build_quiz_bundle
+from apps.education.factories import (
+    QuizFactory, QuestionFactory, AnswerOptionFactory, QuizAttemptFactory, StudentAnswerFactory
+)
+from apps.education.models import QuestionType
+from apps.users.factories import StudentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def student():
+    """Fixture per creare uno Studente (con docente)."""
+    return StudentFactory()
+
+
+@pytest.fixture
+def api_client(student):
+    """Fixture per un client API autenticato come studente (token JWT reale)."""
+    client = APIClient()
+    response = client.post(reverse('student-login'), {'student_code': student.student_code, 'pin': '1234'})
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+    return client
+
+
+@pytest.fixture
+def quiz(student):
+    """ Quiz con una domanda a scelta singola e una a completamento (con soluzioni nei metadati). """
+    quiz = QuizFactory(teacher=student.teacher)
+    question = QuestionFactory(quiz=quiz, question_type=QuestionType.MULTIPLE_CHOICE_SINGLE, order=1)
+    AnswerOptionFactory(question=question, text='Giusta', is_correct=True, order=1)
+    AnswerOptionFactory(question=question, text='Sbagliata', is_correct=False, order=2)
+    QuestionFactory(quiz=quiz, question_type=QuestionType.FILL_BLANK, order=2,
+                    metadata={'correct_answers': ['Roma'], 'blanks_count': 1})
+    return quiz
+
+
+def _current_question_url(attempt):
+    return reverse('attempt-current-question', kwargs={'pk': attempt.pk})
+
+
+class TestQuizBundle:
+    """ Test per le domande pre-serializzate consegnate durante un tentativo. """
+
+    def test_bundle_hides_solutions(self, quiz):
+        bundle = build_quiz_bundle(quiz)
+        payload = b"".join(bundle.questions)
+        assert len(bundle.question_ids) == 2
+        assert b'is_correct' not in payload and b'Roma' not in payload
+        assert b'blanks_count' in payload
+
+    def test_current_question_follows_answers(self, api_client, student, quiz):
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        first, second = quiz.questions.order_by('order')
+
+        response = api_client.get(_current_question_url(attempt))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['id'] == first.id
+        assert 'is_correct' not in response.json()['answer_options'][0]
+
+        StudentAnswerFactory(quiz_attempt=attempt, question=first)
+        assert api_client.get(_current_question_url(attempt)).json()['id'] == second.id
+        StudentAnswerFactory(quiz_attempt=attempt, question=second)
+        assert api_client.get(_current_question_url(attempt)).status_code == status.HTTP_204_NO_CONTENT
+
+    def test_cached_bundle_skips_question_queries(self, api_client, student, quiz):
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        api_client.get(_current_question_url(attempt))
+        with CaptureQueriesContext(connection) as captured:
+            response = api_client.get(_current_question_url(attempt))
+        assert response.status_code == status.HTTP_200_OK
+        assert not [q['sql'] for q in captured.captured_queries if 'education_answeroption' in q['sql']]
+
+    def test_etag_returns_not_modified(self, api_client, student, quiz):
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        etag = api_client.get(_current_question_url(attempt))['ETag']
+        response = api_client.get(_current_question_url(attempt), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+
+    def test_question_change_rebuilds_bundle(self, api_client, student, quiz):
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        etag = api_client.get(_current_question_url(attempt))['ETag']
+        question = quiz.questions.get(order=1)
+        question.text = 'Testo aggiornato'
+        question.save()
+
+        response = api_client.get(_current_question_url(attempt), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['text'] == 'Testo aggiornato'
+        assert response['ETag'] != etag
+
+    def test_unrelated_quiz_changes_keep_cached_bundle(self, api_client, student, quiz):
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        api_client.get(_current_question_url(attempt))
+        other_quiz = QuizFactory()
+        QuestionFactory(quiz=other_quiz, question_type=QuestionType.TRUE_FALSE, order=1)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = api_client.get(_current_question_url(attempt))
+        assert response.status_code == status.HTTP_200_OK
+        assert not [q['sql'] for q in captured.captured_queries if 'education_answeroption' in q['sql']]
+
+
+class TestAttemptQuizPrefetch:
+    """ Test per il quiz completo di un tentativo (una GET per tutte le domande). """
+
+    def _url(self, attempt, **params):
+        url = reverse('attempt-quiz', kwargs={'pk': attempt.pk})
+        return f"{url}?page={params['page']}" if 'page' in params else url
+
+    def test_returns_questions_and_answered_state(self, api_client, student, quiz):
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        first = quiz.questions.get(order=1)
+        StudentAnswerFactory(quiz_attempt=attempt, question=first, selected_answers={'answer_option_id': 1})
+
+        response = api_client.get(self._url(attempt))
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data['attempt']['id'] == attempt.id and data['quiz']['id'] == quiz.id
+        assert [q['id'] for q in data['questions']] == list(quiz.questions.order_by('order').values_list('id', flat=True))
+        assert data['answered'] == {str(first.id): {'answer_option_id': 1}}
+        assert (data['page'], data['pages'], data['question_count']) == (1, 1, 2)
+        assert b'is_correct' not in response.content
+
+    def test_reload_is_not_modified_until_answers_change(self, api_client, student, quiz):
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        etag = api_client.get(self._url(attempt))['ETag']
+        assert api_client.get(self._url(attempt), HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+
+        StudentAnswerFactory(quiz_attempt=attempt, question=quiz.questions.get(order=1))
+        response = api_client.get(self._url(attempt), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()['answered']) == 1
+
+    def test_large_quiz_is_split_into_pages(self, api_client, student, settings):
+        quiz = QuizFactory(teacher=student.teacher)
+        for order in range(1, 31):
+            QuestionFactory(quiz=quiz, question_type=QuestionType.OPEN_ANSWER_MANUAL, order=order, text='x' * 200)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        settings.QUIZ_PREFETCH_MAX_BYTES = 2000
+
+        first_page = api_client.get(self._url(attempt)).json()
+        assert first_page['pages'] > 1
+
+        question_ids = []
+        for page in range(1, first_page['pages'] + 1):
+            response = api_client.get(self._url(attempt, page=page))
+            assert len(response.content) < 2000 + 1000 # Domande entro il budget, più l'intestazione
+            question_ids += [q['id'] for q in response.json()['questions']]
+        assert question_ids == list(quiz.questions.order_by('order').values_list('id', flat=True))
+        assert api_client.get(self._url(attempt, page=first_page['pages'] + 1)).status_code == status.HTTP_404_NOT_FOUND
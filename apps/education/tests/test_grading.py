@@ -0,0 +1,319 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.education.factories import (
+    QuizFactory, QuestionFactory, AnswerOptionFactory, QuizAttemptFactory, StudentAnswerFactory
+)
+from apps.education.jobs import attempt_rewards_key
+from apps.education.grading import build_answer_key, get_answer_key, grade_answer, grade_answers
+from apps.education.models import Quiz, QuizAnswerKey, QuestionType, QuizAttempt, StudentAnswer
+from apps.common.jobs import run_job, run_pending
+from apps.common.models import Job
+from apps.rewards.models import Badge
+from apps.users.factories import StudentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def student():
+    """Fixture per creare uno Studente (con docente)."""
+    return StudentFactory()
+
+
+@pytest.fixture
+def api_client(student):
+    """Fixture per un client API autenticato come studente (token JWT reale)."""
+    client = APIClient()
+    response = client.post(reverse('student-login'), {'student_code': student.student_code, 'pin': '1234'})
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+    return client
+
+
+def _make_quiz_with_questions(teacher, num_questions):
+    """ Crea un quiz con domande MC_SINGLE (opzione corretta per prima). """
+    quiz = QuizFactory(teacher=teacher, metadata={'completion_threshold': 0.5, 'points_on_completion': 10})
+    for i in range(num_questions):
+        question = QuestionFactory(quiz=quiz, question_type=QuestionType.MULTIPLE_CHOICE_SINGLE, order=i + 1)
+        AnswerOptionFactory(question=question, text='Giusta', is_correct=True, order=1)
+        AnswerOptionFactory(question=question, text='Sbagliata', is_correct=False, order=2)
+    return quiz
+
+
+def _answer_all_correctly(quiz, attempt):
+    for question in quiz.questions.all():
+        correct = question.answer_options.get(is_correct=True)
+        StudentAnswerFactory(quiz_attempt=attempt, question=question, selected_answers={'answer_option_id': correct.id})
+
+
+class TestAnswerKey:
+    """ Test per la costruzione della chiave di risposta e la valutazione in memoria. """
+
+    def test_grade_each_question_type(self, student):
+        quiz = QuizFactory(teacher=student.teacher)
+        mc = QuestionFactory(quiz=quiz, question_type=QuestionType.MULTIPLE_CHOICE_SINGLE, order=1,
+                             metadata={'points_per_correct_answer': 2})
+        mc_ok = AnswerOptionFactory(question=mc, is_correct=True, order=1)
+        mc_ko = AnswerOptionFactory(question=mc, is_correct=False, order=2)
+        tf = QuestionFactory(quiz=quiz, question_type=QuestionType.TRUE_FALSE, order=2)
+        tf_ok = AnswerOptionFactory(question=tf, text='Vero', is_correct=True, order=1)
+        AnswerOptionFactory(question=tf, text='Falso', is_correct=False, order=2)
+        multi = QuestionFactory(quiz=quiz, question_type=QuestionType.MULTIPLE_CHOICE_MULTIPLE, order=3)
+        m1 = AnswerOptionFactory(question=multi, is_correct=True, order=1)
+        m2 = AnswerOptionFactory(question=multi, is_correct=True, order=2)
+        AnswerOptionFactory(question=multi, is_correct=False, order=3)
+        fill = QuestionFactory(quiz=quiz, question_type=QuestionType.FILL_BLANK, order=4,
+                               metadata={'correct_answers': ['Roma', 'Tevere']})
+        manual = QuestionFactory(quiz=quiz, question_type=QuestionType.OPEN_ANSWER_MANUAL, order=5)
+
+        key = build_answer_key(quiz)
+
+        assert grade_answer(key.questions[mc.id], {'answer_option_id': mc_ok.id}) == (True, 2.0)
+        assert grade_answer(key.questions[mc.id], {'answer_option_id': mc_ko.id}) == (False, 0.0)
+        assert grade_answer(key.questions[tf.id], {'answer_option_id': tf_ok.id}) == (True, 1.0)
+        assert grade_answer(key.questions[tf.id], {'is_true': True}) == (True, 1.0)
+        assert grade_answer(key.questions[tf.id], {'is_true': False}) == (False, 0.0)
+        assert grade_answer(key.questions[multi.id], {'answer_option_ids': [m2.id, m1.id]}) == (True, 1.0)
+        assert grade_answer(key.questions[multi.id], {'answer_option_ids': [m1.id]}) == (False, 0.0)
+        assert grade_answer(key.questions[fill.id], {'answers': [' roma', 'TEVERE']}) == (True, 1.0)
+        assert grade_answer(key.questions[fill.id], {'answers': ['Roma']}) == (False, 0.0)
+        assert grade_answer(key.questions[manual.id], {'text': 'risposta'}) == (None, None)
+        assert key.manual_question_ids == {manual.id}
+        assert key.max_possible_score == quiz.get_max_possible_score()
+
+    def test_best_streak_is_broken_by_gaps(self, student):
+        quiz = _make_quiz_with_questions(student.teacher, 5)
+        q1, q2, q3, q4, q5 = quiz.questions.order_by('order')
+        q5.order = 6
+        q5.save(update_fields=['order'])
+        QuestionFactory(quiz=quiz, question_type=QuestionType.OPEN_ANSWER_MANUAL, order=5)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        # Ordine: q1 corretta, q2 senza risposta, q3 e q4 corrette, domanda manuale, q5 corretta
+        answers = [
+            StudentAnswerFactory(quiz_attempt=attempt, question=q,
+                                 selected_answers={'answer_option_id': q.answer_options.get(is_correct=True).id})
+            for q in (q1, q3, q4, q5)
+        ]
+
+        result, _changed = grade_answers(build_answer_key(quiz), answers)
+        assert result.correct_count == 4
+        assert result.best_streak == 2
+
+    def test_build_answer_key_query_count(self, student, django_assert_num_queries):
+        quiz = _make_quiz_with_questions(student.teacher, 5)
+        with django_assert_num_queries(2): # Domande + opzioni
+            build_answer_key(quiz)
+
+
+class TestStoredAnswerKey:
+    """ Test per la chiave di risposta salvata e versionata su QuizAnswerKey. """
+
+    def test_stored_key_is_read_without_queries(self, student, django_assert_num_queries):
+        quiz = _make_quiz_with_questions(student.teacher, 3)
+        get_answer_key(Quiz.objects.get(pk=quiz.pk)) # Compila e salva
+
+        fresh_quiz = Quiz.objects.select_related('answer_key_record').get(pk=quiz.pk)
+        with django_assert_num_queries(0):
+            key = get_answer_key(fresh_quiz)
+            max_score = fresh_quiz.get_max_possible_score()
+        assert len(key.questions) == 3
+        assert max_score == 3.0
+
+    def test_question_and_option_changes_bump_version(self, student):
+        quiz = _make_quiz_with_questions(student.teacher, 1)
+        get_answer_key(Quiz.objects.get(pk=quiz.pk))
+        version = Quiz.objects.get(pk=quiz.pk).answer_key_version
+
+        question = QuestionFactory(quiz=quiz, question_type=QuestionType.MULTIPLE_CHOICE_SINGLE, order=2,
+                                   metadata={'points_per_correct_answer': 4})
+        option = AnswerOptionFactory(question=question, is_correct=True, order=1)
+        refreshed = Quiz.objects.get(pk=quiz.pk)
+        assert refreshed.answer_key_version > version
+        assert refreshed.answer_key_record.data is None
+        assert refreshed.get_max_possible_score() == 5.0
+
+        option.is_correct = False
+        option.save()
+        key = get_answer_key(Quiz.objects.get(pk=quiz.pk))
+        assert key.questions[question.id].correct_option_ids == frozenset()
+
+        question.delete()
+        assert Quiz.objects.get(pk=quiz.pk).get_max_possible_score() == 1.0
+
+    def test_full_quiz_save_does_not_overwrite_newer_key(self, student):
+        quiz = _make_quiz_with_questions(student.teacher, 1)
+        stale_quiz = Quiz.objects.select_related('answer_key_record').get(pk=quiz.pk)
+        get_answer_key(stale_quiz)
+        QuestionFactory(quiz=quiz, question_type=QuestionType.OPEN_ANSWER_MANUAL, order=2)
+
+        stale_quiz.title = 'Titolo aggiornato'
+        stale_quiz.save()
+
+        refreshed = Quiz.objects.get(pk=quiz.pk)
+        assert refreshed.title == 'Titolo aggiornato'
+        assert len(get_answer_key(refreshed).questions) == 2
+
+    def test_quiz_without_key_row_compiles_on_first_read(self, student):
+        quiz = _make_quiz_with_questions(student.teacher, 2)
+        QuizAnswerKey.objects.filter(quiz=quiz).delete()
+        assert len(get_answer_key(Quiz.objects.get(pk=quiz.pk)).questions) == 2
+        assert QuizAnswerKey.objects.get(quiz=quiz).data is not None
+
+    def test_deleting_quiz_removes_key_row(self, student):
+        quiz = _make_quiz_with_questions(student.teacher, 2)
+        get_answer_key(quiz)
+        quiz.delete() # Le domande eliminate a cascata invalidano una riga già eliminata
+        assert not QuizAnswerKey.objects.exists()
+
+
+class TestCompleteAttemptGrading:
+    """ Test per la valutazione in `AttemptViewSet.complete_attempt`. """
+
+    def _complete(self, api_client, attempt):
+        url = reverse('attempt-complete-attempt', kwargs={'pk': attempt.pk})
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.post(url)
+        assert response.status_code == status.HTTP_200_OK, response.data
+        return response, len(ctx.captured_queries)
+
+    def test_answers_graded_and_saved(self, api_client, student):
+        quiz = _make_quiz_with_questions(student.teacher, 3)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        _answer_all_correctly(quiz, attempt)
+
+        self._complete(api_client, attempt)
+
+        attempt.refresh_from_db()
+        assert attempt.status == QuizAttempt.AttemptStatus.COMPLETED
+        assert attempt.score == 100.0
+        answers = StudentAnswer.objects.filter(quiz_attempt=attempt)
+        assert all(a.is_correct and a.score == 1.0 for a in answers)
+
+    def test_attempt_is_graded_and_written_once(self, api_client, student):
+        quiz = _make_quiz_with_questions(student.teacher, 3)
+        quiz.metadata['points_on_completion'] = 10
+        quiz.save(update_fields=['metadata'])
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        _answer_all_correctly(quiz, attempt)
+
+        url = reverse('attempt-complete-attempt', kwargs={'pk': attempt.pk})
+        with mock.patch('apps.education.grading.grade_answers', wraps=grade_answers) as grade, \
+                CaptureQueriesContext(connection) as ctx:
+            response = api_client.post(url)
+        assert response.status_code == status.HTTP_200_OK, response.data
+        assert grade.call_count == 1
+        attempt_updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "education_quizattempt"')]
+        assert len(attempt_updates) == 1
+        attempt.refresh_from_db()
+        assert (attempt.status, attempt.score, attempt.first_correct_completion) == (QuizAttempt.AttemptStatus.COMPLETED, 100.0, True)
+
+    def test_query_count_independent_of_question_count(self, api_client, student):
+        # Primo completamento a parte: la logica badge "primo quiz" aggiunge query solo la prima volta
+        warmup_quiz = _make_quiz_with_questions(student.teacher, 1)
+        warmup_attempt = QuizAttemptFactory(quiz=warmup_quiz, student=student)
+        _answer_all_correctly(warmup_quiz, warmup_attempt)
+        self._complete(api_client, warmup_attempt)
+
+        small_quiz = _make_quiz_with_questions(student.teacher, 2)
+        small_attempt = QuizAttemptFactory(quiz=small_quiz, student=student)
+        _answer_all_correctly(small_quiz, small_attempt)
+        _, small_queries = self._complete(api_client, small_attempt)
+
+        large_quiz = _make_quiz_with_questions(student.teacher, 12)
+        large_attempt = QuizAttemptFactory(quiz=large_quiz, student=student)
+        _answer_all_correctly(large_quiz, large_attempt)
+        _, large_queries = self._complete(api_client, large_attempt)
+
+        assert large_queries == small_queries
+
+    def test_manual_questions_go_to_pending_grading(self, api_client, student):
+        quiz = QuizFactory(teacher=student.teacher)
+        manual = QuestionFactory(quiz=quiz, question_type=QuestionType.OPEN_ANSWER_MANUAL, order=1)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        StudentAnswerFactory(quiz_attempt=attempt, question=manual, selected_answers={'text': 'Risposta'})
+
+        self._complete(api_client, attempt)
+
+        attempt.refresh_from_db()
+        assert attempt.status == QuizAttempt.AttemptStatus.PENDING_GRADING
+
+    def test_correct_streak_badge_awarded_on_completion(self, api_client, student):
+        badge = Badge.objects.create(
+            name='Serie perfetta', description='3 risposte corrette di fila',
+            trigger_type=Badge.TriggerType.CORRECT_STREAK, trigger_condition={'streak_length': 3}
+        )
+        quiz = _make_quiz_with_questions(student.teacher, 3)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        _answer_all_correctly(quiz, attempt)
+
+        response, _ = self._complete(api_client, attempt)
+
+        assert [b['id'] for b in response.data['newly_earned_badges']] == [badge.id]
+
+    def test_async_rewards_are_queued_and_pollable(self, api_client, student, settings):
+        settings.ASYNC_ATTEMPT_REWARDS = True
+        badge = Badge.objects.create(
+            name='Quiz completato', description='Completa un quiz',
+            trigger_type=Badge.TriggerType.QUIZ_COMPLETED, trigger_condition={}
+        )
+        quiz = _make_quiz_with_questions(student.teacher, 2)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        _answer_all_correctly(quiz, attempt)
+
+        response, _ = self._complete(api_client, attempt)
+
+        # Esito della valutazione subito, ricompense in coda
+        assert response.data['status'] == QuizAttempt.AttemptStatus.COMPLETED
+        assert response.data['rewards_status'] == Job.JobStatus.PENDING
+        assert response.data['newly_earned_badges'] == []
+        assert student.wallet.current_points == 0
+
+        poll = api_client.get(reverse('attempt-rewards', kwargs={'pk': attempt.pk}))
+        assert poll.data['status'] == Job.JobStatus.PENDING
+
+        assert run_pending() == 1
+        poll = api_client.get(reverse('attempt-rewards', kwargs={'pk': attempt.pk}))
+        assert poll.data['status'] == Job.JobStatus.DONE
+        assert [b['id'] for b in poll.data['newly_earned_badges']] == [badge.id]
+        student.wallet.refresh_from_db()
+        assert student.wallet.current_points == 10
+
+    def test_rerun_of_rewards_job_credits_quiz_points_once(self, api_client, student, settings):
+        settings.ASYNC_ATTEMPT_REWARDS = True
+        quiz = _make_quiz_with_questions(student.teacher, 2)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        _answer_all_correctly(quiz, attempt)
+        self._complete(api_client, attempt)
+        job = Job.objects.get(idempotency_key=attempt_rewards_key(attempt.pk))
+
+        assert run_job(job.pk).status == Job.JobStatus.DONE
+        assert run_job(job.pk).attempts == 1 # Job concluso: non rieseguito
+        # Worker terminato prima di confermare lo stato: il job viene riprelevato ed eseguito di nuovo
+        Job.objects.filter(pk=job.pk).update(status=Job.JobStatus.RUNNING, locked_at=timezone.now() - timedelta(hours=1))
+        assert run_pending() == 1
+
+        student.wallet.refresh_from_db()
+        assert student.wallet.current_points == 10
+        assert student.wallet.transactions.filter(reason=f"Completamento Quiz: {quiz.title}").count() == 1
+
+    def test_rewards_job_credits_quizzes_with_same_title(self, api_client, student, settings):
+        settings.ASYNC_ATTEMPT_REWARDS = True
+        for _ in range(2):
+            quiz = _make_quiz_with_questions(student.teacher, 2)
+            quiz.title = 'Verifica'
+            quiz.save(update_fields=['title'])
+            attempt = QuizAttemptFactory(quiz=quiz, student=student)
+            _answer_all_correctly(quiz, attempt)
+            self._complete(api_client, attempt)
+            run_job(Job.objects.get(idempotency_key=attempt_rewards_key(attempt.pk)).pk)
+
+        student.wallet.refresh_from_db()
+        assert student.wallet.current_points == 20
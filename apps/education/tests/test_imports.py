@@ -0,0 +1,137 @@
+import io
+from pathlib import Path
+
+import pytest
+from django.conf import settings as django_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.urls import reverse
+from docx import Document as DocxDocument
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.common.jobs import run_job, run_pending
+from apps.common.models import Job
+from apps.education import imports
+from apps.education.imports import parse_file, get_progress
+from apps.education.jobs import enqueue_quiz_import
+from apps.education.models import Quiz, QuizTemplate
+from apps.users.factories import UserFactory
+from apps.users.models import UserRole
+
+pytestmark = pytest.mark.django_db
+
+SAMPLE_PDF = Path(django_settings.BASE_DIR) / 'QuizPHPeCookie.pdf'
+
+QUIZ_LINES = [
+    "1. Quanto fa 2+2?", "A) 3", "B) 4",
+    "2. Capitale d'Italia?", "A) Roma", "B) Milano", "C) Torino",
+    "3. Spiega il teorema di Pitagora.",
+]
+
+
+def _docx(lines) -> bytes:
+    document = DocxDocument()
+    for line in lines:
+        document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(settings, tmp_path):
+    settings.QUIZ_IMPORT_SPOOL_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def teacher():
+    """Fixture per creare un Docente."""
+    return UserFactory(role=UserRole.TEACHER)
+
+
+@pytest.fixture
+def teacher_client(teacher):
+    client = APIClient()
+    client.force_authenticate(user=teacher)
+    return client
+
+
+def _upload(client, url_name, content, name='quiz.docx', title='Importato'):
+    return client.post(reverse(url_name), {'file': SimpleUploadedFile(name, content), 'title': title}, format='multipart')
+
+
+class TestQuizImport:
+    """ Test per l'import di quiz e template da file tramite job. """
+
+    def test_synchronous_upload_creates_quiz(self, teacher, teacher_client, spool_dir, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            response = _upload(teacher_client, 'quiz-upload-quiz', _docx(QUIZ_LINES))
+
+        assert response.status_code == status.HTTP_201_CREATED
+        quiz = Quiz.objects.get(pk=response.data['id'])
+        assert (quiz.title, quiz.teacher) == ('Importato', teacher)
+        questions = list(quiz.questions.order_by('order'))
+        assert [q.answer_options.count() for q in questions] == [2, 3, 0]
+        assert not list(spool_dir.iterdir()) # File caricato eliminato dopo l'import
+
+        import_status = teacher_client.get(reverse('quiz-import-detail', kwargs={'pk': response.data['import_id']}))
+        assert import_status.data['status'] == 'DONE' and import_status.data['progress'] == 100
+        assert import_status.data['quiz']['id'] == quiz.id
+
+    def test_async_upload_is_processed_by_worker(self, teacher_client, settings):
+        settings.ASYNC_QUIZ_IMPORT = True
+
+        response = _upload(teacher_client, 'teacher-quiz-template-upload-template', _docx(QUIZ_LINES))
+
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data['status'] == 'PENDING' and response.data['progress'] == 0
+        assert not QuizTemplate.objects.exists()
+
+        assert run_pending() == 1
+        import_status = teacher_client.get(response.data['status_url'])
+        assert import_status.data['status'] == 'DONE' and import_status.data['progress'] == 100
+        template = QuizTemplate.objects.get(pk=import_status.data['quiz_template']['id'])
+        assert template.question_templates.count() == 3
+
+    def test_invalid_content_reports_errors(self, teacher_client):
+        response = _upload(teacher_client, 'quiz-upload-quiz', b'   \n\n', name='vuoto.md')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['status'] == 'FAILED' and response.data['errors']
+        assert not Quiz.objects.exists()
+
+    def test_status_visible_only_to_uploader(self, teacher_client):
+        import_id = _upload(teacher_client, 'quiz-upload-quiz', _docx(QUIZ_LINES)).data['import_id']
+        other = APIClient()
+        other.force_authenticate(user=UserFactory(role=UserRole.TEACHER))
+        assert other.get(reverse('quiz-import-detail', kwargs={'pk': import_id})).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_pdf_is_read_page_by_page(self):
+        parsed = parse_file(str(SAMPLE_PDF), '.pdf', 'pdf-test')
+        assert len(parsed.questions) == 40
+        assert get_progress('pdf-test') == 90 # Pagine lette e analizzate, salvataggio ancora da fare
+
+    def test_file_is_parsed_before_job_transaction(self, teacher, spool_dir, monkeypatch):
+        path = spool_dir / 'quiz.docx'
+        path.write_bytes(_docx(QUIZ_LINES))
+        depth = {}
+        outer = len(connection.atomic_blocks) # Transazione del test
+        original_parse, original_create = imports.parse_file, imports._create_quiz
+
+        def parse_spy(*args):
+            depth['parse'] = len(connection.atomic_blocks)
+            return original_parse(*args)
+
+        def create_spy(*args):
+            depth['create'] = len(connection.atomic_blocks)
+            return original_create(*args)
+
+        monkeypatch.setattr(imports, 'parse_file', parse_spy)
+        monkeypatch.setattr(imports, '_create_quiz', create_spy)
+        job = enqueue_quiz_import('parse-test', str(path), 'quiz.docx', 'Importato', teacher.id, imports.IMPORT_QUIZ, run_inline=False)
+
+        assert run_job(job.pk).status == Job.JobStatus.DONE
+        assert depth == {'parse': outer, 'create': outer + 1} # Solo le scritture nella transazione del job
+        assert Quiz.objects.get(pk=Job.objects.get(pk=job.pk).result['quiz_id']).questions.count() == 3
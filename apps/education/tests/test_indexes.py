@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+from django.db import connection
+
+from apps.education.factories import QuizFactory, QuizAttemptFactory, PathwayProgressFactory
+from apps.education.models import QuizAttempt, PathwayProgress
+from apps.rewards.models import PointTransaction
+from apps.rewards.views import TeacherRewardDeliveryViewSet
+from apps.users.factories import StudentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def workload():
+    """ Piccolo carico rappresentativo: più studenti, quiz e tentativi in stati diversi. """
+    students = StudentFactory.create_batch(3)
+    teacher = students[0].teacher
+    quizzes = QuizFactory.create_batch(2, teacher=teacher)
+    for student in students:
+        for quiz in quizzes:
+            # Come in produzione, i tentativi conclusi sono molti più di quelli da correggere
+            QuizAttemptFactory.create_batch(4, student=student, quiz=quiz, status=QuizAttempt.AttemptStatus.COMPLETED)
+            QuizAttemptFactory(student=student, quiz=quiz, status=QuizAttempt.AttemptStatus.PENDING_GRADING)
+        PathwayProgressFactory(student=student, status=PathwayProgress.ProgressStatus.COMPLETED)
+        student.wallet.add_points(5, 'Carico di prova')
+    return {'student': students[0], 'teacher': teacher, 'quiz': quizzes[0]}
+
+
+def _explain(queryset) -> str:
+    """ Piano di esecuzione della query (EXPLAIN su PostgreSQL, EXPLAIN QUERY PLAN su SQLite). """
+    if connection.vendor == 'postgresql':
+        # Con tabelle minuscole il planner preferirebbe la scansione sequenziale
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    return queryset.explain()
+
+
+def _pending_deliveries(teacher):
+    """ Queryset reale della lista consegne pendenti del docente (TeacherRewardDeliveryViewSet). """
+    view = TeacherRewardDeliveryViewSet()
+    view.request = SimpleNamespace(user=teacher)
+    return view.get_queryset()
+
+
+# (descrizione, funzione che costruisce il queryset, indice atteso)
+HOT_QUERIES = [
+    (
+        'tentativi di uno studente su un quiz per stato',
+        lambda w: QuizAttempt.objects.filter(
+            student=w['student'], quiz=w['quiz'], status=QuizAttempt.AttemptStatus.COMPLETED
+        ),
+        'edu_attempt_stu_quiz_st_idx',
+    ),
+    (
+        'coda di correzione del docente',
+        lambda w: QuizAttempt.objects.filter(
+            quiz__teacher=w['teacher'], status=QuizAttempt.AttemptStatus.PENDING_GRADING
+        ).order_by('completed_at'),
+        'edu_attempt_quiz_st_done_idx',
+    ),
+    (
+        'percorsi completati dello studente',
+        lambda w: PathwayProgress.objects.filter(
+            student=w['student'], status=PathwayProgress.ProgressStatus.COMPLETED
+        ),
+        'edu_pprog_stu_completed_idx',
+    ),
+    (
+        'ultime transazioni del wallet',
+        lambda w: PointTransaction.objects.filter(wallet=w['student'].wallet).order_by('-timestamp')[:5],
+        'rew_ptx_wallet_ts_idx',
+    ),
+    (
+        # RewardPurchase non ha una colonna teacher: la query della vista passa da student__teacher,
+        # quindi il planner trova gli studenti del docente e poi i loro acquisti per (student, status)
+        'acquisti da consegnare del docente',
+        lambda w: _pending_deliveries(w['teacher']),
+        'rew_purchase_stu_st_idx',
+    ),
+]
+
+
+@pytest.mark.parametrize('description,build,index_name', HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_queries_use_indexes(workload, description, build, index_name):
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        pytest.skip(f"EXPLAIN non verificato per il backend {connection.vendor}.")
+    plan = _explain(build(workload))
+    assert index_name in plan, f"La query '{description}' non usa {index_name}:\n{plan}"
@@ -0,0 +1,82 @@
+import json
+from pathlib import Path
+
+import pytest
+from django.conf import settings as django_settings
+from rest_framework.exceptions import ValidationError
+
+from apps.education.imports import parse_file
+from apps.education.models import QuestionType
+from apps.education.quiz_parser import QuizTextParser, parse_quiz_text, reflow_word_lines
+
+GOLDEN_DIR = Path(__file__).parent / 'golden'
+
+
+@pytest.mark.parametrize('filename', ['QuizPHPeCookie.pdf', 'quiz_reti_internet_CAT.pdf'])
+def test_sample_pdfs_match_golden_output(filename):
+    parsed = parse_file(str(Path(django_settings.BASE_DIR) / filename), '.pdf', f'golden-{filename}')
+    golden = json.loads((GOLDEN_DIR / f"{Path(filename).stem}.json").read_text(encoding='utf-8'))
+    assert parsed.questions == golden['questions']
+    assert [issue.as_dict() for issue in parsed.issues] == golden['issues']
+
+
+class TestQuizTextParser:
+    """ Test per il parser del testo dei quiz caricati. """
+
+    def test_numbered_questions_with_options_and_correct_marker(self):
+        parsed = parse_quiz_text(
+            "Verifica di matematica\n"
+            "1) Quanto fa 2+2?\n"
+            "A. 3\n"
+            "B. 4 *\n"
+            "2. Quale numero è primo?\n"
+            "che non sia pari\n"
+            "A) 9\n"
+            "B) 7 (*)\n"
+            "3. Spiega il teorema di Pitagora."
+        )
+        assert [q['text'] for q in parsed.questions] == [
+            "Quanto fa 2+2?", "Quale numero è primo? che non sia pari", "Spiega il teorema di Pitagora.",
+        ]
+        assert [q['order'] for q in parsed.questions] == [0, 1, 2]
+        assert parsed.questions[0]['options'] == [
+            {'text': '3', 'order': 1, 'is_correct': False},
+            {'text': '4', 'order': 2, 'is_correct': True},
+        ]
+        assert parsed.questions[1]['options'][1]['is_correct']
+        assert parsed.questions[2]['type'] == QuestionType.OPEN_ANSWER_MANUAL
+        assert [(i.page, i.line) for i in parsed.issues] == [(None, 1)] # Titolo ignorato
+
+    def test_markdown_headings_emphasis_and_bullets(self):
+        parsed = parse_quiz_text("# Quiz\n\n**1. Capitale d'Italia?**\n- Roma *\n- Milano\n", markdown=True)
+        assert parsed.questions[0]['text'] == "Capitale d'Italia?"
+        assert [(o['text'], o['is_correct']) for o in parsed.questions[0]['options']] == [('Roma', True), ('Milano', False)]
+
+    def test_question_continues_across_pages_and_issues_have_positions(self):
+        parser = QuizTextParser()
+        parser.feed("1. Prima domanda\nA) Sì\n2. Seconda domanda", page=1)
+        parser.feed("che continua\nA) Vero\nB) Falso\n2. Duplicata\nA) X", page=2)
+        parsed = parser.finish()
+        assert parsed.questions[1]['text'] == "Seconda domanda che continua"
+        assert len(parsed.questions[1]['options']) == 2
+        assert [(i.page, i.line) for i in parsed.issues] == [(2, 4)]
+        assert "ripetuto" in parsed.issues[0].message
+
+    def test_unnumbered_document_keeps_legacy_format(self):
+        parsed = parse_quiz_text("Capitale d'Italia?\nA) Roma\nB) Milano")
+        assert parsed.questions == [{
+            'text': "Capitale d'Italia?", 'order': 0, 'type': QuestionType.MULTIPLE_CHOICE_SINGLE,
+            'options': [{'text': 'Roma', 'order': 1, 'is_correct': False}, {'text': 'Milano', 'order': 2, 'is_correct': False}],
+        }]
+
+    def test_word_per_line_text_is_reflowed(self):
+        words = "1. Quale protocollo usa il web? A) HTTP B) FTP C) SMTP 2. Quale porta usa HTTPS? A) 443 B) 21".split()
+        assert reflow_word_lines("\n".join(words)).splitlines() == [
+            "1. Quale protocollo usa il web?", "A) HTTP", "B) FTP", "C) SMTP", "2. Quale porta usa HTTPS?", "A) 443", "B) 21",
+        ]
+
+    def test_no_questions_raises_with_positions(self):
+        with pytest.raises(ValidationError) as excinfo:
+            parse_quiz_text("Titolo\n1.\n2)")
+        detail = str(excinfo.value.detail)
+        assert "Nessuna domanda" in detail and "riga 3: Domanda 2 senza testo ignorata." in detail
@@ -0,0 +1,128 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.education.factories import (
+    QuizFactory, QuestionFactory, AnswerOptionFactory, QuizAttemptFactory, StudentAnswerFactory
+)
+from apps.education.models import QuestionType, QuizAttempt, StudentAnswer
+from apps.users.factories import StudentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def student():
+    """Fixture per creare uno Studente (con docente)."""
+    return StudentFactory()
+
+
+@pytest.fixture
+def api_client(student):
+    """Fixture per un client API autenticato come studente (token JWT reale)."""
+    client = APIClient()
+    response = client.post(reverse('student-login'), {'student_code': student.student_code, 'pin': '1234'})
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+    return client
+
+
+def _make_quiz(teacher, num_questions):
+    """ Quiz con domande MC_SINGLE (opzione corretta per prima). """
+    quiz = QuizFactory(teacher=teacher, metadata={'completion_threshold': 0.5})
+    for i in range(num_questions):
+        question = QuestionFactory(quiz=quiz, question_type=QuestionType.MULTIPLE_CHOICE_SINGLE, order=i + 1)
+        AnswerOptionFactory(question=question, text='Giusta', is_correct=True, order=1)
+        AnswerOptionFactory(question=question, text='Sbagliata', is_correct=False, order=2)
+    return quiz
+
+
+def _correct_answers(quiz):
+    return [
+        {'question_id': question.id, 'selected_answers': {'answer_option_id': question.answer_options.get(is_correct=True).id}}
+        for question in quiz.questions.order_by('order')
+    ]
+
+
+def _url(attempt):
+    return reverse('attempt-submit-answers', kwargs={'pk': attempt.pk})
+
+
+class TestSubmitAnswers:
+    """ Test per l'invio di più risposte in una sola richiesta. """
+
+    def test_answers_are_created_and_updated(self, api_client, student):
+        quiz = _make_quiz(student.teacher, 3)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        first = quiz.questions.order_by('order').first()
+        wrong = first.answer_options.get(is_correct=False)
+        StudentAnswerFactory(quiz_attempt=attempt, question=first, selected_answers={'answer_option_id': wrong.id})
+
+        response = api_client.post(_url(attempt), {'answers': _correct_answers(quiz)}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['saved']) == 3 and response.data['errors'] == []
+        assert StudentAnswer.objects.filter(quiz_attempt=attempt).count() == 3
+        updated = StudentAnswer.objects.get(quiz_attempt=attempt, question=first)
+        assert updated.selected_answers == {'answer_option_id': first.answer_options.get(is_correct=True).id}
+
+    def test_invalid_items_are_reported_per_index(self, api_client, student):
+        quiz = _make_quiz(student.teacher, 2)
+        other_question = QuestionFactory(quiz=_make_quiz(student.teacher, 0), order=1)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        answers = _correct_answers(quiz)
+        answers[1]['selected_answers'] = {'answer_option_id': 999999}
+        answers.append({'question_id': other_question.id, 'selected_answers': {'text': 'x'}})
+        answers.append({'selected_answers': {}})
+
+        response = api_client.post(_url(attempt), {'answers': answers}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['question_id'] for item in response.data['saved']] == [answers[0]['question_id']]
+        assert [error['index'] for error in response.data['errors']] == [1, 2, 3]
+        assert StudentAnswer.objects.filter(quiz_attempt=attempt).count() == 1
+
+    def test_all_invalid_returns_400(self, api_client, student):
+        attempt = QuizAttemptFactory(quiz=_make_quiz(student.teacher, 1), student=student)
+        response = api_client.post(_url(attempt), {'answers': [{'question_id': 0, 'selected_answers': {}}]}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.post(_url(attempt), {'answers': []}, format='json').status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_query_count_independent_of_batch_size(self, api_client, student):
+        api_client.post(_url(QuizAttemptFactory(student=student)), {'answers': []}, format='json') # Studente in cache
+        counts = []
+        for num_questions in (2, 10):
+            quiz = _make_quiz(student.teacher, num_questions)
+            attempt = QuizAttemptFactory(quiz=quiz, student=student)
+            answers = _correct_answers(quiz)
+            with CaptureQueriesContext(connection) as captured:
+                response = api_client.post(_url(attempt), {'answers': answers}, format='json')
+            assert response.status_code == status.HTTP_200_OK
+            counts.append(len(captured.captured_queries))
+        assert counts[0] == counts[1]
+
+    def test_complete_flag_completes_attempt(self, api_client, student):
+        quiz = _make_quiz(student.teacher, 2)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+
+        response = api_client.post(_url(attempt), {'answers': _correct_answers(quiz), 'complete': True}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['completed'] is True
+        attempt.refresh_from_db()
+        assert attempt.status == QuizAttempt.AttemptStatus.COMPLETED
+        assert response.data['attempt']['status'] == QuizAttempt.AttemptStatus.COMPLETED
+
+    def test_complete_flag_ignored_when_items_fail(self, api_client, student):
+        quiz = _make_quiz(student.teacher, 2)
+        attempt = QuizAttemptFactory(quiz=quiz, student=student)
+        answers = _correct_answers(quiz)
+        answers[0]['selected_answers'] = {'answer_option_id': 'x'}
+
+        response = api_client.post(_url(attempt), {'answers': answers, 'complete': True}, format='json')
+
+        assert response.data['completed'] is False
+        attempt.refresh_from_db()
+        assert attempt.status == QuizAttempt.AttemptStatus.IN_PROGRESS
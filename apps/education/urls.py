@@ -9,7 +9,8 @@ from .views import (
     PathwayAttemptDetailView, # Importa la nuova view per i dettagli del tentativo percorso
     # Nuovi ViewSet per Template Percorsi
     PathwayTemplateViewSet, PathwayQuizTemplateViewSet, TeacherQuizTemplateViewSet,
-    TeacherQuestionTemplateViewSet, TeacherAnswerOptionTemplateViewSet # Aggiungo i nuovi ViewSet nidificati
+    TeacherQuestionTemplateViewSet, TeacherAnswerOptionTemplateViewSet, # Aggiungo i nuovi ViewSet nidificati
+    QuizImportViewSet,
 )
 
 # Router principale per le risorse top-level dell'app education
@@ -23,6 +24,7 @@ router.register(r'attempts', AttemptViewSet, basename='attempt') # Gestione Tent
 router.register(r'teacher/grading', TeacherGradingViewSet, basename='teacher-grading') # Gestione Correzioni (Docente)
 router.register(r'pathway-templates', PathwayTemplateViewSet, basename='pathway-template') # Gestione Template Percorsi (Docente)
 router.register(r'teacher/quiz-templates', TeacherQuizTemplateViewSet, basename='teacher-quiz-template') # Gestione Template Quiz (Docente)
+router.register(r'quiz-imports', QuizImportViewSet, basename='quiz-import') # Stato import di quiz da file (Docente)
 
 # --- Router Annidati ---
 
@@ -1,4 +1,5 @@
 import logging # Import logging
+import uuid
 from rest_framework import viewsets, permissions, status, serializers, generics, parsers # Import generics AND parsers
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -6,6 +7,8 @@ from rest_framework.exceptions import ValidationError, PermissionDenied as DRFPe
 from django.db import transaction, models, IntegrityError # Import IntegrityError
 from django.db.models import Max # Import Max
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.urls import reverse
 from django.utils import timezone
 from django.core.exceptions import PermissionDenied # Import PermissionDenied Django
 from django.db.models import F, OuterRef, Subquery, Count, Prefetch # Import per Subquery, Count e Prefetch
@@ -28,7 +31,7 @@ from .serializers import (
     NextPathwayQuizSerializer, # Aggiunto import mancante
     # Nuovi Serializer per Template Percorsi e Assegnazioni
     PathwayTemplateSerializer, PathwayQuizTemplateSerializer,
-    QuizAssignmentSerializer, PathwayAssignmentSerializer
+    QuizAssignmentSerializer, PathwayAssignmentSerializer, BulkAssignSerializer
 )
 from .permissions import (
     IsAdminOrReadOnly, IsQuizTemplateOwnerOrAdmin, IsQuizOwnerOrAdmin, IsPathwayOwnerOrAdmin, # Updated IsPathwayOwner -> IsPathwayOwnerOrAdmin
@@ -39,6 +42,18 @@ from apps.users.permissions import IsAdminUser, IsTeacherUser, IsStudent, IsStud
 from apps.users.models import UserRole, Student, User # Import modelli utente e User
 from apps.rewards.models import Wallet, PointTransaction # Import Wallet e PointTransaction
 from .models import QuizAssignment, PathwayAssignment, QuizAttempt, PathwayProgress # Assicurati che siano importati
+from .grading import get_answer_key, grade_attempt # Motore di valutazione unico
+from .jobs import enqueue_attempt_rewards, attempt_rewards_key # Ricompense asincrone
+from .cloning import clone_quiz_template, clone_pathway_template # Creazione in blocco da template
+from .delivery import get_quiz_bundle, render_attempt_quiz, content_etag, json_bytes_response # Domande pre-serializzate per i tentativi
+from apps.common.assignments import bulk_assign # Assegnazione in blocco
+from apps.common.jobs import run_job
+from apps.common.pagination import KeysetCursorPagination
+from .imports import IMPORT_QUIZ, IMPORT_TEMPLATE, spool_upload, get_progress # Import di quiz da file
+from .jobs import QUIZ_IMPORT_JOB, enqueue_quiz_import, quiz_import_key
+from apps.common.models import Job
+from apps.rewards.models import Badge
+from apps.rewards.serializers import SimpleBadgeSerializer
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -48,9 +63,10 @@ class QuizTemplateViewSet(viewsets.ModelViewSet):
     """ API endpoint per i Quiz Templates (Admin). """
     serializer_class = QuizTemplateSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminUser] # Solo Admin
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
-        return QuizTemplate.objects.all()
+        return QuizTemplate.objects.all().select_related('admin', 'teacher')
 
     def perform_create(self, serializer):
         serializer.save(admin=self.request.user)
@@ -62,7 +78,7 @@ class QuestionTemplateViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # Filtra per il quiz template specificato nell'URL
-        return QuestionTemplate.objects.filter(quiz_template_id=self.kwargs['quiz_template_pk'])
+        return QuestionTemplate.objects.filter(quiz_template_id=self.kwargs['quiz_template_pk']).prefetch_related('answer_option_templates')
 
     def perform_create(self, serializer):
         quiz_template = get_object_or_404(QuizTemplate, pk=self.kwargs['quiz_template_pk'])
@@ -86,6 +102,7 @@ class PathwayTemplateViewSet(viewsets.ModelViewSet):
     serializer_class = PathwayTemplateSerializer
     # Chi può creare/modificare template di percorso? Per ora solo Docenti.
     permission_classes = [permissions.IsAuthenticated, IsTeacherUser] # O aggiungere IsAdminUser?
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -93,9 +110,9 @@ class PathwayTemplateViewSet(viewsets.ModelViewSet):
             # Se decidiamo che Admin può vedere/gestire tutti i template
             # return PathwayTemplate.objects.all().select_related('teacher')
             # Per ora, Admin non gestisce template percorsi, solo Docenti
-             return PathwayTemplate.objects.filter(teacher=user).select_related('teacher') # Admin vede solo i propri? O nessuno?
+             return PathwayTemplate.objects.filter(teacher=user).select_related('teacher').prefetch_related('pathwayquiztemplate_set__quiz_template') # Admin vede solo i propri? O nessuno?
         elif isinstance(user, User) and user.is_teacher:
-            return PathwayTemplate.objects.filter(teacher=user).select_related('teacher')
+            return PathwayTemplate.objects.filter(teacher=user).select_related('teacher').prefetch_related('pathwayquiztemplate_set__quiz_template')
         return PathwayTemplate.objects.none()
 
     def perform_create(self, serializer):
@@ -163,13 +180,14 @@ class TeacherQuizTemplateViewSet(viewsets.ModelViewSet):
     """ API endpoint per i Quiz Templates gestiti dai Docenti. """
     serializer_class = QuizTemplateSerializer
     permission_classes = [permissions.IsAuthenticated, IsTeacherUser] # Solo Docenti
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         """ Filtra i template per mostrare solo quelli creati dal docente loggato. """
         user = self.request.user
         # Assicurati che l'utente sia un docente
         if isinstance(user, User) and user.is_teacher:
-            return QuizTemplate.objects.filter(teacher=user)
+            return QuizTemplate.objects.filter(teacher=user).select_related('admin', 'teacher')
         return QuizTemplate.objects.none() # Restituisce vuoto se non è un docente
 
     def perform_create(self, serializer):
@@ -187,29 +205,10 @@ class TeacherQuizTemplateViewSet(viewsets.ModelViewSet):
         """
         Permette a un docente di caricare un file (PDF, DOCX, MD) per creare un QuizTemplate.
         Richiede 'file' e 'title' nei dati della richiesta (form-data).
+        Il file viene importato da un job: vedi start_quiz_import.
         """
-        # Importa il nuovo serializer qui o all'inizio del file
         from .serializers import QuizTemplateUploadSerializer
-
-        serializer = QuizTemplateUploadSerializer(data=request.data, context={'request': request})
-        if serializer.is_valid():
-            try:
-                # Il metodo create del serializer gestisce l'estrazione, il parsing e la creazione del template
-                template_data = serializer.save() # .save() chiama .create()
-                # Restituisce i dati del template creato (formattati da QuizTemplateSerializer dentro QuizTemplateUploadSerializer)
-                return Response(template_data, status=status.HTTP_201_CREATED)
-            except ValidationError as e:
-                # Se il serializer.create solleva ValidationError (es. parsing fallito, testo vuoto)
-                logger.warning(f"Errore di validazione durante upload template da utente {request.user.id}: {e.detail}")
-                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
-            except Exception as e:
-                # Cattura altri errori imprevisti durante la creazione
-                logger.error(f"Errore imprevisto durante l'upload del template da utente {request.user.id}: {e}", exc_info=True)
-                return Response({"detail": "Errore interno durante la creazione del template dal file."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else:
-            # Errori di validazione del serializer (es. file mancante, titolo mancante, tipo file errato)
-            logger.warning(f"Errore di validazione dati upload template da utente {request.user.id}: {serializer.errors}")
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return start_quiz_import(request, QuizTemplateUploadSerializer, IMPORT_TEMPLATE)
     # Per ora, questo ViewSet gestisce solo il CRUD del QuizTemplate stesso.
 # --- ViewSets Nidificati per Docenti (Gestione Domande/Opzioni Template Quiz) ---
 
@@ -224,7 +223,7 @@ class TeacherQuestionTemplateViewSet(viewsets.ModelViewSet): # Aggiunta azione q
         # Verifica che il docente loggato sia il proprietario del template
         if quiz_template.teacher != self.request.user:
              raise DRFPermissionDenied("Non hai accesso a questo template di quiz.")
-        return QuestionTemplate.objects.filter(quiz_template=quiz_template).order_by('order')
+        return QuestionTemplate.objects.filter(quiz_template=quiz_template).prefetch_related('answer_option_templates').order_by('order')
 
     def perform_create(self, serializer):
         """ Associa la domanda al template corretto e calcola l'ordine. """
@@ -310,6 +309,95 @@ class TeacherAnswerOptionTemplateViewSet(viewsets.ModelViewSet):
 
 
 
+# --- Import di Quiz e Template da File ---
+
+def quiz_import_status(request, job: Job) -> dict:
+    """ Stato di un import: avanzamento, esito (quiz o template creato, anomalie del testo) o errori del contenuto. """
+    payload, result = job.payload, job.result or {}
+    data = {'import_id': payload['import_id'], 'status': job.status, 'progress': get_progress(payload['import_id']) or 0}
+    if job.status == Job.JobStatus.DONE:
+        data['progress'] = 100
+        if result.get('errors'):
+            data.update(status=Job.JobStatus.FAILED, errors=result['errors'])
+            return data
+        data['warnings'] = result.get('warnings', []) # Anomalie nel testo, con pagina e riga
+        if 'quiz_id' in result:
+            quiz = Quiz.objects.select_related('teacher').filter(pk=result['quiz_id']).first()
+            data['quiz'] = QuizSerializer(quiz, context={'request': request}).data if quiz else None
+        elif 'quiz_template_id' in result:
+            template = QuizTemplate.objects.select_related('admin', 'teacher').filter(pk=result['quiz_template_id']).first()
+            data['quiz_template'] = QuizTemplateSerializer(template, context={'request': request}).data if template else None
+    elif job.status == Job.JobStatus.FAILED:
+        data.update(progress=100, errors=["Errore interno durante l'importazione del file."])
+    return data
+
+
+def start_quiz_import(request, upload_serializer_class, target: str) -> Response:
+    """
+    Valida l'upload, lo salva su disco e accoda il job di import (apps.education.imports).
+    Con ASYNC_QUIZ_IMPORT risponde subito 202 con l'URL di stato da interrogare; altrimenti esegue
+    il job nella richiesta e risponde 201 con il quiz/template creato (o 400 con gli errori del file).
+    """
+    serializer = upload_serializer_class(data=request.data, context={'request': request})
+    if not serializer.is_valid():
+        # Errori di validazione del serializer (es. file mancante, titolo mancante, tipo file errato)
+        logger.warning(f"Errore di validazione dati upload ({target}) da utente {request.user.id}: {serializer.errors}")
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    uploaded_file = serializer.validated_data['file']
+    import_id = uuid.uuid4().hex
+    job = enqueue_quiz_import(
+        import_id, spool_upload(uploaded_file), uploaded_file.name, serializer.validated_data['title'],
+        request.user.id, target,
+        run_inline=None if settings.ASYNC_QUIZ_IMPORT else False, # Senza coda: eseguito qui sotto
+    )
+    status_url = request.build_absolute_uri(reverse('quiz-import-detail', kwargs={'pk': import_id}))
+    if settings.ASYNC_QUIZ_IMPORT:
+        logger.info(f"Import {import_id} ({target}) accodato per utente {request.user.id}.")
+        return Response({**quiz_import_status(request, job), 'status_url': status_url}, status=status.HTTP_202_ACCEPTED)
+
+    job = run_job(job.pk, worker_id='request')
+    data = quiz_import_status(request, job)
+    if job.status != Job.JobStatus.DONE:
+        # Errore imprevisto: il job resta in coda per un nuovo tentativo del worker
+        return Response({**data, 'status_url': status_url}, status=status.HTTP_202_ACCEPTED)
+    if data.get('errors'):
+        return Response({**data, 'detail': " ".join(str(error) for error in data['errors'])}, status=status.HTTP_400_BAD_REQUEST)
+    # Stessa risposta dell'upload sincrono: i dati dell'oggetto creato
+    created = data.get('quiz') or data.get('quiz_template')
+    return Response({**created, 'import_id': import_id, 'warnings': data['warnings']}, status=status.HTTP_201_CREATED)
+
+
+class QuizImportViewSet(viewsets.GenericViewSet):
+    """ Stato degli import di quiz/template da file avviati dal docente (GET /quiz-imports/{import_id}/). """
+    permission_classes = [permissions.IsAuthenticated, IsTeacherUser]
+
+    def retrieve(self, request, pk=None):
+        job = Job.objects.filter(kind=QUIZ_IMPORT_JOB, idempotency_key=quiz_import_key(pk)).first()
+        if job is None or job.payload.get('teacher_id') != request.user.id:
+            return Response({'detail': 'Import non trovato.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(quiz_import_status(request, job))
+
+
+def bulk_assign_response(request, model, target_field: str, target) -> Response:
+    """
+    Assegna `target` (Quiz o Pathway del docente) agli studenti indicati nel body (BulkAssignSerializer).
+    Risponde con gli ID creati/già assegnati/non validi: 201 se è stata creata almeno un'assegnazione.
+    """
+    action_serializer = BulkAssignSerializer(data=request.data)
+    action_serializer.is_valid(raise_exception=True)
+    data = action_serializer.validated_data
+    result = bulk_assign(
+        model, target_field, target,
+        teacher=target.teacher, # Anche per l'Admin: solo gli studenti del docente proprietario
+        assigned_by=request.user,
+        student_ids=None if data['all_students'] else data['student_ids'],
+        cache_namespace='education',
+        due_date=data.get('due_date'),
+    )
+    return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
+
+
 # --- ViewSets per Docenti (Contenuti Concreti) ---
 class QuizViewSet(viewsets.ModelViewSet):
     """ API endpoint per i Quiz concreti (Docente). """
@@ -347,73 +435,11 @@ class QuizViewSet(viewsets.ModelViewSet):
     # --- Funzioni Helper per Creazione da Template ---
     def _create_quiz_instance_from_template(self, template: QuizTemplate, teacher: User, title_override: str = None) -> Quiz:
         """
-        Crea una nuova istanza di Quiz (con domande e opzioni) a partire da un QuizTemplate.
+        Crea una nuova istanza di Quiz (con domande e opzioni) a partire da un QuizTemplate
+        (servizio di clonazione in blocco, apps.education.cloning).
         """
         try:
-            with transaction.atomic():
-                new_quiz = Quiz.objects.create(
-                    teacher=teacher,
-                    source_template=template,
-                    title=title_override or template.title, # Usa override se fornito
-                    description=template.description,
-                    # Copia i metadati, ma potremmo volerli modificare/filtrare
-                    metadata=template.metadata.copy() if template.metadata else {}
-                )
-                questions_to_create = []
-                options_to_create_map = {} # Mappa: q_template.id -> lista di opzioni da creare
-
-                question_order_counter = 0 # Inizializza contatore ordine a 0 PRIMA del ciclo
-                for q_template in template.question_templates.prefetch_related('answer_option_templates').order_by('order'):
-                    new_question = Question(
-                        quiz=new_quiz,
-                        text=q_template.text,
-                        question_type=q_template.question_type,
-                        order=question_order_counter, # Assegna ordine sequenziale 0-based
-                        metadata=q_template.metadata.copy() if q_template.metadata else {}
-                    )
-                    questions_to_create.append(new_question)
-                    question_order_counter += 1 # Incrementa contatore per la prossima domanda
-                    # Prepara le opzioni per il bulk create dopo aver creato le domande
-                    options_to_create_map[q_template.id] = []
-                    for opt_template in q_template.answer_option_templates.order_by('order'):
-                         options_to_create_map[q_template.id].append(
-                             AnswerOption(
-                                 # question sarà impostato dopo la creazione delle domande
-                                 text=opt_template.text,
-                                 is_correct=opt_template.is_correct,
-                                 order=opt_template.order
-                             )
-                         )
-
-                # Crea le domande in blocco
-                created_questions = Question.objects.bulk_create(questions_to_create)
-
-                # Mappa per recuperare le domande create e associare le opzioni
-                created_question_map = {q.order: q for q in created_questions}
-                options_final_list = []
-
-                # Associa le opzioni alle domande appena create
-                for q_template_id, options_list in options_to_create_map.items():
-                    # Trova la domanda corrispondente basandosi sull'ordine (assumendo che l'ordine sia preservato)
-                    # Questo è un punto debole se l'ordine non è garantito o unico durante la creazione.
-                    # Un approccio più robusto potrebbe usare un identificatore temporaneo.
-                    q_template_order = QuestionTemplate.objects.get(id=q_template_id).order # Recupera l'ordine originale
-                    newly_created_question = created_question_map.get(q_template_order)
-
-                    if newly_created_question:
-                        for option in options_list:
-                            option.question = newly_created_question
-                            options_final_list.append(option)
-                    else:
-                         logger.warning(f"Impossibile trovare la domanda creata corrispondente al template Q ID {q_template_id} per il quiz {new_quiz.id}")
-
-
-                # Crea le opzioni in blocco
-                if options_final_list:
-                    AnswerOption.objects.bulk_create(options_final_list)
-
-                logger.info(f"Creata istanza Quiz ID {new_quiz.id} da Template ID {template.id} per Docente {teacher.id}")
-                return new_quiz
+            return clone_quiz_template(template, teacher, title_override)
         except Exception as e:
             logger.error(f"Errore atomico durante creazione Quiz da template {template.id}: {e}", exc_info=True)
             # Rilancia l'eccezione per far fallire la richiesta API esterna
@@ -447,28 +473,10 @@ class QuizViewSet(viewsets.ModelViewSet):
         """
         Permette a un docente di caricare un file (PDF, DOCX, MD) per creare un quiz.
         Richiede 'file' e 'title' nei dati della richiesta (form-data).
+        Il file viene importato da un job: vedi start_quiz_import.
         """
-        serializer = QuizUploadSerializer(data=request.data, context={'request': request})
-        if serializer.is_valid():
-            try:
-                # Il metodo create del serializer gestisce l'estrazione, il parsing e la creazione
-                quiz_data = serializer.save() # .save() chiama .create()
-                # Restituisce i dati del quiz creato (formattati da QuizSerializer dentro QuizUploadSerializer)
-                return Response(quiz_data, status=status.HTTP_201_CREATED)
-            except ValidationError as e:
-                # Se il serializer.create solleva ValidationError (es. parsing fallito, testo vuoto)
-                logger.warning(f"Errore di validazione durante upload quiz da utente {request.user.id}: {e.detail}")
-                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
-            except Exception as e:
-                # Cattura altri errori imprevisti durante la creazione
-                logger.error(f"Errore imprevisto durante l'upload del quiz da utente {request.user.id}: {e}", exc_info=True)
-                return Response({"detail": "Errore interno durante la creazione del quiz dal file."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        else:
-            # Errori di validazione del serializer (es. file mancante, titolo mancante, tipo file errato)
-            logger.warning(f"Errore di validazione dati upload quiz da utente {request.user.id}: {serializer.errors}")
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return start_quiz_import(request, QuizUploadSerializer, IMPORT_QUIZ)
 
-    # Modificata per usare QuizAssignmentSerializer e gestire creazione da template
     @action(detail=False, methods=['post'], url_path='assign-student', permission_classes=[permissions.IsAuthenticated, IsTeacherUser])
     def assign_student(self, request):
         """Assegna un Quiz a uno studente, creandolo da un template."""
@@ -525,6 +533,14 @@ class QuizViewSet(viewsets.ModelViewSet):
             logger.error(f"Errore validazione QuizAssignActionSerializer: {action_serializer.errors}")
             return Response(action_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['post'], url_path='assign-students', permission_classes=[permissions.IsAuthenticated, IsQuizOwnerOrAdmin])
+    def assign_students(self, request, pk=None):
+        """
+        Assegna questo quiz a più studenti in una richiesta.
+        Body: { "student_ids": [1, 2, 3] } oppure { "all_students": true }, con "due_date" opzionale.
+        """
+        return bulk_assign_response(request, QuizAssignment, 'quiz', self.get_object())
+
 from django.db.models import F # Assicurati che F sia importato all'inizio del file
 
 class QuestionViewSet(viewsets.ModelViewSet):
@@ -538,7 +554,7 @@ class QuestionViewSet(viewsets.ModelViewSet):
         if not isinstance(self.request.user, User) or (not self.request.user.is_admin and quiz.teacher != self.request.user):
              raise DRFPermissionDenied("Non hai accesso a questo quiz.") # Usa DRFPermissionDenied
         # Ordina per 'order' per coerenza
-        return Question.objects.filter(quiz=quiz).order_by('order')
+        return Question.objects.filter(quiz=quiz).prefetch_related('answer_options').order_by('order')
 
     def perform_create(self, serializer):
         quiz = get_object_or_404(Quiz, pk=self.kwargs['quiz_pk'])
@@ -612,7 +628,7 @@ class PathwayViewSet(viewsets.ModelViewSet):
         user = self.request.user
 
         # Allow DRF to find the object for detail actions. Permissions handle access.
-        if self.action in ['retrieve', 'update', 'partial_update', 'destroy', 'add_quiz', 'assign_student_pathway']: # Added detail/custom actions
+        if self.action in ['retrieve', 'update', 'partial_update', 'destroy', 'add_quiz', 'assign_student_pathway', 'assign_students']: # Added detail/custom actions
             return Pathway.objects.all().select_related('teacher').prefetch_related('pathwayquiz_set__quiz')
 
         # Standard filtering for list action.
@@ -629,51 +645,13 @@ class PathwayViewSet(viewsets.ModelViewSet):
         serializer.save(teacher=self.request.user)
 
     # --- Funzione Helper per Creazione Pathway da Template ---
-    def _create_pathway_instance_from_template(self, template: PathwayTemplate, teacher: User, quiz_creator_func, title_override: str = None) -> Pathway:
+    def _create_pathway_instance_from_template(self, template: PathwayTemplate, teacher: User, title_override: str = None) -> Pathway:
         """
-        Crea una nuova istanza di Pathway (con Quiz interni) a partire da un PathwayTemplate.
-        Richiede una funzione (`quiz_creator_func`) per creare le istanze Quiz dai QuizTemplate.
+        Crea una nuova istanza di Pathway (con Quiz interni) a partire da un PathwayTemplate
+        (servizio di clonazione in blocco, apps.education.cloning).
         """
         try:
-            with transaction.atomic():
-                new_pathway = Pathway.objects.create(
-                    teacher=teacher,
-                    source_template=template,
-                    title=title_override or template.title,
-                    description=template.description,
-                    metadata=template.metadata.copy() if template.metadata else {}
-                )
-
-                pathway_quiz_links = []
-                # Itera sui template di quiz associati al template di percorso, ordinati
-                for pq_template in template.pathwayquiztemplate_set.select_related('quiz_template').order_by('order'):
-                    quiz_template = pq_template.quiz_template
-                    # Crea l'istanza Quiz usando la funzione helper passata
-                    # Passiamo il teacher corretto (quello che sta creando il percorso)
-                    try:
-                         new_quiz_instance = quiz_creator_func(quiz_template, teacher) # Non passiamo title_override qui
-                         if not new_quiz_instance:
-                              raise Exception(f"La funzione di creazione quiz non ha restituito un'istanza per il template {quiz_template.id}")
-                    except Exception as quiz_creation_error:
-                         logger.error(f"Errore durante la creazione dell'istanza Quiz (template ID {quiz_template.id}) per il Pathway (template ID {template.id}): {quiz_creation_error}", exc_info=True)
-                         # Rilancia l'errore per interrompere la transazione atomica
-                         raise Exception(f"Impossibile creare il quiz '{quiz_template.title}' dal template.") from quiz_creation_error
-
-                    # Crea l'oggetto per il modello through M2M
-                    pathway_quiz_links.append(
-                        PathwayQuiz(
-                            pathway=new_pathway,
-                            quiz=new_quiz_instance,
-                            order=pq_template.order
-                        )
-                    )
-
-                # Crea i collegamenti Pathway-Quiz in blocco
-                if pathway_quiz_links:
-                    PathwayQuiz.objects.bulk_create(pathway_quiz_links)
-
-                logger.info(f"Creata istanza Pathway ID {new_pathway.id} da Template ID {template.id} per Docente {teacher.id}")
-                return new_pathway
+            return clone_pathway_template(template, teacher, title_override)
         except Exception as e:
             logger.error(f"Errore atomico durante creazione Pathway da template {template.id}: {e}", exc_info=True)
             raise # Rilancia per fallimento API
@@ -739,7 +717,6 @@ class PathwayViewSet(viewsets.ModelViewSet):
             student = action_serializer.validated_data.get('student')
 
             pathway_to_assign = None
-            quiz_viewset = QuizViewSet() # Istanzia QuizViewSet per accedere al suo helper
 
             # Ora sappiamo che pathway_template_id è presente e valido grazie a PathwayAssignActionSerializer
             # Quindi procediamo direttamente con la creazione da template
@@ -748,12 +725,8 @@ class PathwayViewSet(viewsets.ModelViewSet):
             if template.teacher != request.user and not request.user.is_admin:
                 raise DRFPermissionDenied("Non puoi usare questo template di percorso.")
             try:
-                # Crea nuova istanza Pathway, passando l'helper di QuizViewSet per creare i quiz interni
-                pathway_to_assign = self._create_pathway_instance_from_template(
-                    template,
-                    request.user,
-                    quiz_viewset._create_quiz_instance_from_template # Passa la funzione helper
-                )
+                # Crea nuova istanza Pathway con i quiz interni
+                pathway_to_assign = self._create_pathway_instance_from_template(template, request.user)
             except Exception as e:
                 logger.error(f"Fallimento creazione Pathway da template {pathway_template_id} durante assegnazione a studente {student.id}: {e}", exc_info=True)
                 return Response({'detail': f'Errore durante la creazione del percorso dal template: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -785,6 +758,14 @@ class PathwayViewSet(viewsets.ModelViewSet):
             logger.error(f"Errore validazione PathwayAssignActionSerializer: {action_serializer.errors}")
             return Response(action_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['post'], url_path='assign-students', permission_classes=[permissions.IsAuthenticated, IsPathwayOwnerOrAdmin])
+    def assign_students(self, request, pk=None):
+        """
+        Assegna questo percorso a più studenti in una richiesta.
+        Body: { "student_ids": [1, 2, 3] } oppure { "all_students": true }, con "due_date" opzionale.
+        """
+        return bulk_assign_response(request, PathwayAssignment, 'pathway', self.get_object())
+
     @action(detail=True, methods=['delete'], url_path='remove-quiz/(?P<pathway_quiz_pk>[^/.]+)', permission_classes=[permissions.IsAuthenticated, IsPathwayOwnerOrAdmin])
     def remove_quiz(self, request, pk=None, pathway_quiz_pk=None):
         """
@@ -888,6 +869,95 @@ class StudentQuizAttemptViewSet(viewsets.GenericViewSet):
          return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+# Tipi di domanda la cui risposta va verificata contro le opzioni della domanda
+CHOICE_QUESTION_TYPES = (QuestionType.MULTIPLE_CHOICE_SINGLE, QuestionType.TRUE_FALSE, QuestionType.MULTIPLE_CHOICE_MULTIPLE)
+
+
+def validate_selected_answers(question: Question, option_ids: set, selected_answers_data) -> tuple[dict, str | None]:
+    """
+    Valida 'selected_answers' in base al tipo della domanda. `option_ids` sono gli ID delle
+    opzioni della domanda (usati solo per i tipi a scelta). Restituisce (dati da salvare, errore).
+    """
+    validation_error = None
+    valid_data_for_storage = {} # Dati validati da salvare
+
+    q_type = question.question_type
+    if q_type in [QuestionType.MULTIPLE_CHOICE_SINGLE, QuestionType.TRUE_FALSE]:
+        # Modificato per aspettarsi 'answer_option_id'
+        if not isinstance(selected_answers_data, dict) or 'answer_option_id' not in selected_answers_data:
+            validation_error = "Per questo tipo di domanda, 'selected_answers' deve essere un dizionario con chiave 'answer_option_id'."
+        else:
+            selected_id = selected_answers_data['answer_option_id'] # Modificato per usare la chiave corretta
+            # Permetti None per deselezionare? Se sì, aggiungere 'or selected_id is None'
+            # Modificato messaggio di errore
+            if not isinstance(selected_id, int):
+                validation_error = "'answer_option_id' deve essere un intero."
+            else:
+                # Verifica che l'opzione esista per questa domanda
+                # Modificato messaggio di errore
+                if selected_id not in option_ids:
+                    validation_error = f"L'opzione con ID {selected_id} ('answer_option_id') non è valida per questa domanda."
+                else:
+                    # Dati validi per il salvataggio
+                    valid_data_for_storage = {'answer_option_id': selected_id} # Modificato per salvare la chiave corretta
+
+    elif q_type == QuestionType.MULTIPLE_CHOICE_MULTIPLE:
+        # Modificato per aspettarsi 'answer_option_ids'
+        if not isinstance(selected_answers_data, dict) or 'answer_option_ids' not in selected_answers_data:
+            validation_error = "Per questo tipo di domanda, 'selected_answers' deve essere un dizionario con chiave 'answer_option_ids'."
+        else:
+            selected_ids = selected_answers_data['answer_option_ids'] # Modificato per usare la chiave corretta
+            # Modificato messaggio di errore
+            if not isinstance(selected_ids, list) or not all(isinstance(i, int) for i in selected_ids):
+                validation_error = "'answer_option_ids' deve essere una lista di interi."
+            else:
+                # Verifica che tutte le opzioni esistano per questa domanda
+                submitted_ids_set = set(selected_ids)
+                if not submitted_ids_set.issubset(option_ids):
+                    invalid_ids = submitted_ids_set - option_ids
+                    # Modificato messaggio di errore
+                    validation_error = f"Le seguenti opzioni ('answer_option_ids') non sono valide per questa domanda: {list(invalid_ids)}."
+                else:
+                    # Dati validi per il salvataggio
+                    valid_data_for_storage = {'answer_option_ids': sorted(list(submitted_ids_set))} # Salva come lista ordinata
+
+    elif q_type == QuestionType.FILL_BLANK:
+        # Modificato per aspettarsi 'answers' come lista di stringhe
+        if not isinstance(selected_answers_data, dict) or 'answers' not in selected_answers_data:
+             validation_error = "Per questo tipo di domanda, 'selected_answers' deve essere un dizionario con chiave 'answers'."
+        else:
+            answers = selected_answers_data['answers']
+            # Modificato messaggio di errore
+            if not isinstance(answers, list) or not all(isinstance(a, str) for a in answers):
+                validation_error = "'answers' deve essere una lista di stringhe."
+            else:
+                # Verifica che il numero di risposte corrisponda agli spazi vuoti attesi (se definito in metadata)
+                expected_blanks = question.metadata.get('blanks_count')
+                if expected_blanks is not None and len(answers) != expected_blanks:
+                    validation_error = f"Numero di risposte ('answers') non corretto. Attesi {expected_blanks}, ricevuti {len(answers)}."
+                else:
+                    # Dati validi per il salvataggio
+                    valid_data_for_storage = {'answers': answers} # Modificato per salvare la chiave corretta
+
+    elif q_type == QuestionType.OPEN_ANSWER_MANUAL:
+        # Modificato per aspettarsi 'text'
+        if not isinstance(selected_answers_data, dict) or 'text' not in selected_answers_data:
+             validation_error = "Per questo tipo di domanda, 'selected_answers' deve essere un dizionario con chiave 'text'."
+        else:
+            answer_text = selected_answers_data['text'] # Modificato per usare la chiave corretta
+            # Modificato messaggio di errore
+            if not isinstance(answer_text, str):
+                validation_error = "'text' deve essere una stringa."
+            else:
+                # Dati validi per il salvataggio
+                valid_data_for_storage = {'text': answer_text} # Modificato per salvare la chiave corretta
+
+    else:
+        validation_error = f"Tipo di domanda non supportato: {q_type}"
+
+    return valid_data_for_storage, validation_error
+
+
 # NUOVO ViewSet per gestire un tentativo specifico
 class AttemptViewSet(viewsets.GenericViewSet):
     """ Gestisce le azioni su un tentativo di quiz specifico (submit, complete). """
@@ -895,6 +965,21 @@ class AttemptViewSet(viewsets.GenericViewSet):
     # Usa IsStudentAuthenticated
     permission_classes = [IsStudentAuthenticated, IsStudentOwnerForAttempt] # Solo lo studente proprietario
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('current_question', 'quiz'):
+            queryset = queryset.select_related('quiz__answer_key_record') # Versione del quiz per il bundle delle domande
+        elif self.action in ('complete_attempt', 'submit_answers'):
+            queryset = queryset.select_related('quiz__answer_key_record') # Chiave di risposta compilata per la valutazione
+        elif self.action == 'details':
+            # Carica in anticipo quiz, studente e risposte (con domanda) usati da QuizAttemptDetailSerializer
+            queryset = queryset.select_related(
+                'quiz__teacher', 'student__teacher'
+            ).prefetch_related('student_answers__question').annotate(
+                total_questions_count=Count('quiz__questions', distinct=True)
+            )
+        return queryset
+
     # GET /api/education/attempts/{pk}/details/
     @action(detail=True, methods=['get'])
     def details(self, request, pk=None):
@@ -910,26 +995,44 @@ class AttemptViewSet(viewsets.GenericViewSet):
         if attempt.status != QuizAttempt.AttemptStatus.IN_PROGRESS:
             return Response({'detail': 'Questo tentativo non è più in corso.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Ottieni tutte le domande del quiz ordinate
-        all_questions = attempt.quiz.questions.prefetch_related('answer_options').order_by('order') # Aggiunto prefetch_related
-        # Ottieni gli ID delle domande già risposte in questo tentativo
+        # Domande del quiz già serializzate (cache per versione del quiz) e ID delle domande già risposte
+        bundle = get_quiz_bundle(attempt.quiz)
         answered_question_ids = set(attempt.student_answers.values_list('question_id', flat=True))
+        index = bundle.next_unanswered(answered_question_ids)
 
-        next_question = None
-        for question in all_questions:
-            if question.id not in answered_question_ids:
-                next_question = question
-                break # Trovata la prima domanda non risposta
-
-        if next_question:
-            # Serializza e restituisci la domanda corrente
-            serializer = QuestionSerializer(next_question, context={'request': request})
-            return Response(serializer.data)
-        else:
+        if index is None:
             # Se non ci sono più domande non risposte, ma il tentativo è ancora in corso
             # (l'utente potrebbe non aver ancora chiamato 'complete'),
             # restituisci 204 No Content per indicare che non c'è una *prossima* domanda.
             return Response(status=status.HTTP_204_NO_CONTENT)
+        # Restituisci la domanda corrente così come salvata nel bundle (con ETag)
+        return json_bytes_response(request, bundle.questions[index], bundle.question_etag(index))
+
+    # GET /api/education/attempts/{pk}/quiz/?page=1
+    @action(detail=True, methods=['get'])
+    def quiz(self, request, pk=None):
+        """
+        Quiz completo del tentativo in una richiesta: domande senza soluzioni (dal bundle in cache)
+        e risposte già date, per svolgere il quiz sul client inviando solo le risposte.
+        Le domande sono divise in pagine di al massimo QUIZ_PREFETCH_MAX_BYTES ('page', 'pages').
+        Supporta If-None-Match: ricaricare un tentativo invariato restituisce 304.
+        """
+        attempt = self.get_object()
+        if attempt.status != QuizAttempt.AttemptStatus.IN_PROGRESS:
+            return Response({'detail': 'Questo tentativo non è più in corso.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        bundle = get_quiz_bundle(attempt.quiz)
+        pages = bundle.page_bounds(settings.QUIZ_PREFETCH_MAX_BYTES)
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            page = 0
+        if not 1 <= page <= len(pages):
+            return Response({'detail': f"Pagina non valida: le pagine vanno da 1 a {len(pages)}."}, status=status.HTTP_404_NOT_FOUND)
+
+        answers = dict(attempt.student_answers.values_list('question_id', 'selected_answers'))
+        body = render_attempt_quiz(attempt, bundle, page, pages, answers)
+        return json_bytes_response(request, body, content_etag(body))
 
     # POST /api/education/attempts/{pk}/submit-answer/
     @action(detail=True, methods=['post'], url_path='submit-answer')
@@ -953,83 +1056,8 @@ class AttemptViewSet(viewsets.GenericViewSet):
         logger.info(f"Attempt {pk} - Submit Answer - Raw request.data: {request.data}") # LOGGING
         logger.info(f"Attempt {pk} - Submit Answer - Extracted selected_answers_data: {selected_answers_data}") # LOGGING
         logger.info(f"Attempt {pk} - Submit Answer - Type of selected_answers_data: {type(selected_answers_data)}") # LOGGING
-        validation_error = None
-        valid_data_for_storage = {} # Dati validati da salvare
-
-        q_type = question.question_type
-        if q_type in [QuestionType.MULTIPLE_CHOICE_SINGLE, QuestionType.TRUE_FALSE]:
-            # Modificato per aspettarsi 'answer_option_id'
-            if not isinstance(selected_answers_data, dict) or 'answer_option_id' not in selected_answers_data:
-                validation_error = "Per questo tipo di domanda, 'selected_answers' deve essere un dizionario con chiave 'answer_option_id'."
-            else:
-                selected_id = selected_answers_data['answer_option_id'] # Modificato per usare la chiave corretta
-                # Permetti None per deselezionare? Se sì, aggiungere 'or selected_id is None'
-                # Modificato messaggio di errore
-                if not isinstance(selected_id, int):
-                    validation_error = "'answer_option_id' deve essere un intero."
-                else:
-                    # Verifica che l'opzione esista per questa domanda
-                    # Modificato messaggio di errore
-                    if not question.answer_options.filter(pk=selected_id).exists():
-                        validation_error = f"L'opzione con ID {selected_id} ('answer_option_id') non è valida per questa domanda."
-                    else:
-                        # Dati validi per il salvataggio
-                        valid_data_for_storage = {'answer_option_id': selected_id} # Modificato per salvare la chiave corretta
-
-        elif q_type == QuestionType.MULTIPLE_CHOICE_MULTIPLE:
-            # Modificato per aspettarsi 'answer_option_ids'
-            if not isinstance(selected_answers_data, dict) or 'answer_option_ids' not in selected_answers_data:
-                validation_error = "Per questo tipo di domanda, 'selected_answers' deve essere un dizionario con chiave 'answer_option_ids'."
-            else:
-                selected_ids = selected_answers_data['answer_option_ids'] # Modificato per usare la chiave corretta
-                # Modificato messaggio di errore
-                if not isinstance(selected_ids, list) or not all(isinstance(i, int) for i in selected_ids):
-                    validation_error = "'answer_option_ids' deve essere una lista di interi."
-                else:
-                    # Verifica che tutte le opzioni esistano per questa domanda
-                    valid_option_ids = set(question.answer_options.values_list('id', flat=True))
-                    submitted_ids_set = set(selected_ids)
-                    if not submitted_ids_set.issubset(valid_option_ids):
-                        invalid_ids = submitted_ids_set - valid_option_ids
-                        # Modificato messaggio di errore
-                        validation_error = f"Le seguenti opzioni ('answer_option_ids') non sono valide per questa domanda: {list(invalid_ids)}."
-                    else:
-                        # Dati validi per il salvataggio
-                        valid_data_for_storage = {'answer_option_ids': sorted(list(submitted_ids_set))} # Salva come lista ordinata
-
-        elif q_type == QuestionType.FILL_BLANK:
-            # Modificato per aspettarsi 'answers' come lista di stringhe
-            if not isinstance(selected_answers_data, dict) or 'answers' not in selected_answers_data:
-                 validation_error = "Per questo tipo di domanda, 'selected_answers' deve essere un dizionario con chiave 'answers'."
-            else:
-                answers = selected_answers_data['answers']
-                # Modificato messaggio di errore
-                if not isinstance(answers, list) or not all(isinstance(a, str) for a in answers):
-                    validation_error = "'answers' deve essere una lista di stringhe."
-                else:
-                    # Verifica che il numero di risposte corrisponda agli spazi vuoti attesi (se definito in metadata)
-                    expected_blanks = question.metadata.get('blanks_count')
-                    if expected_blanks is not None and len(answers) != expected_blanks:
-                        validation_error = f"Numero di risposte ('answers') non corretto. Attesi {expected_blanks}, ricevuti {len(answers)}."
-                    else:
-                        # Dati validi per il salvataggio
-                        valid_data_for_storage = {'answers': answers} # Modificato per salvare la chiave corretta
-
-        elif q_type == QuestionType.OPEN_ANSWER_MANUAL:
-            # Modificato per aspettarsi 'text'
-            if not isinstance(selected_answers_data, dict) or 'text' not in selected_answers_data:
-                 validation_error = "Per questo tipo di domanda, 'selected_answers' deve essere un dizionario con chiave 'text'."
-            else:
-                answer_text = selected_answers_data['text'] # Modificato per usare la chiave corretta
-                # Modificato messaggio di errore
-                if not isinstance(answer_text, str):
-                    validation_error = "'text' deve essere una stringa."
-                else:
-                    # Dati validi per il salvataggio
-                    valid_data_for_storage = {'text': answer_text} # Modificato per salvare la chiave corretta
-
-        else:
-            validation_error = f"Tipo di domanda non supportato: {q_type}"
+        option_ids = set(question.answer_options.values_list('id', flat=True)) if question.question_type in CHOICE_QUESTION_TYPES else set()
+        valid_data_for_storage, validation_error = validate_selected_answers(question, option_ids, selected_answers_data)
 
         if validation_error:
             logger.warning(f"Attempt {pk} - Submit Answer - Validation Error: {validation_error}") # LOGGING
@@ -1053,6 +1081,85 @@ class AttemptViewSet(viewsets.GenericViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 
+    # POST /api/education/attempts/{pk}/submit-answers/
+    @action(detail=True, methods=['post'], url_path='submit-answers')
+    def submit_answers(self, request, pk=None):
+        """
+        Invia più risposte in una sola richiesta:
+        {"answers": [{"question_id": 1, "selected_answers": {...}}, ...], "complete": false}.
+        Domande e opzioni vengono caricate una volta per tutto il lotto, le risposte valide salvate
+        con un unico upsert e quelle non valide riportate in 'errors' con il loro indice.
+        Con "complete": true e nessun errore il tentativo viene anche completato (come 'complete').
+        """
+        attempt = self.get_object()
+        if attempt.status != QuizAttempt.AttemptStatus.IN_PROGRESS:
+            return Response({'detail': 'Questo tentativo non è più in corso.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = request.data.get('answers')
+        if not isinstance(items, list) or not items:
+            return Response({'answers': "'answers' deve essere una lista non vuota."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.SUBMIT_ANSWERS_MAX_BATCH:
+            return Response({'answers': f"Al massimo {settings.SUBMIT_ANSWERS_MAX_BATCH} risposte per richiesta."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Mappa delle domande del quiz citate nel lotto e delle rispettive opzioni (due query in tutto)
+        requested_ids = {item.get('question_id') for item in items if isinstance(item, dict) and isinstance(item.get('question_id'), int)}
+        questions = {
+            question.id: question
+            for question in Question.objects.filter(quiz_id=attempt.quiz_id, pk__in=requested_ids).only('id', 'question_type', 'metadata')
+        }
+        option_ids = {question_id: set() for question_id in questions}
+        choice_question_ids = [question.id for question in questions.values() if question.question_type in CHOICE_QUESTION_TYPES]
+        if choice_question_ids:
+            for question_id, option_id in AnswerOption.objects.filter(question_id__in=choice_question_ids).values_list('question_id', 'id'):
+                option_ids[question_id].add(option_id)
+
+        now = timezone.now()
+        answers_to_save = {} # question_id -> StudentAnswer: se una domanda compare più volte vale l'ultima risposta
+        errors = []
+        for index, item in enumerate(items):
+            question_id = item.get('question_id') if isinstance(item, dict) else None
+            selected_answers_data = item.get('selected_answers') if isinstance(item, dict) else None
+            if question_id is None or selected_answers_data is None:
+                errors.append({'index': index, 'question_id': question_id, 'detail': 'question_id e selected_answers sono richiesti.'})
+                continue
+            question = questions.get(question_id)
+            if question is None:
+                errors.append({'index': index, 'question_id': question_id, 'detail': 'Domanda non trovata in questo quiz.'})
+                continue
+            valid_data_for_storage, validation_error = validate_selected_answers(question, option_ids[question_id], selected_answers_data)
+            if validation_error:
+                errors.append({'index': index, 'question_id': question_id, 'detail': validation_error})
+                continue
+            answers_to_save[question_id] = StudentAnswer(
+                quiz_attempt=attempt, question_id=question_id,
+                selected_answers=valid_data_for_storage, answered_at=now,
+            )
+
+        if answers_to_save:
+            # Un solo INSERT ... ON CONFLICT: crea le nuove risposte e aggiorna quelle già date
+            StudentAnswer.objects.bulk_create(
+                list(answers_to_save.values()),
+                update_conflicts=True,
+                unique_fields=['quiz_attempt', 'question'],
+                update_fields=['selected_answers', 'answered_at'],
+            )
+        if errors:
+            logger.warning(f"Tentativo {attempt.id} - Invio risposte multiple: {len(errors)} risposte non valide su {len(items)}.")
+
+        data = {
+            'saved': [{'question_id': answer.question_id, 'selected_answers': answer.selected_answers} for answer in answers_to_save.values()],
+            'errors': errors,
+            'completed': False,
+        }
+        if request.data.get('complete') is True and not errors:
+            completion = self._complete(request, attempt)
+            if completion.status_code == status.HTTP_200_OK:
+                data['completed'] = True
+                data['attempt'] = completion.data
+            else:
+                data['completion_error'] = completion.data
+        return Response(data, status=status.HTTP_200_OK if answers_to_save or not errors else status.HTTP_400_BAD_REQUEST)
+
     # POST /api/education/attempts/{pk}/complete/
     @action(detail=True, methods=['post'], url_path='complete')
     def complete_attempt(self, request, pk=None):
@@ -1060,15 +1167,23 @@ class AttemptViewSet(viewsets.GenericViewSet):
         attempt = self.get_object()
         if attempt.status != QuizAttempt.AttemptStatus.IN_PROGRESS:
             return Response({'detail': 'Questo tentativo non è più in corso.'}, status=status.HTTP_400_BAD_REQUEST)
+        return self._complete(request, attempt)
+
+    def _complete(self, request, attempt: QuizAttempt) -> Response:
+        """ Valuta e chiude un tentativo in corso (usato da 'complete' e 'submit-answers'). """
+        # Chiave di risposta del quiz e risposte date: caricate una sola volta per tutta la valutazione
+        answer_key = get_answer_key(attempt.quiz)
+        student_answers = list(attempt.student_answers.all())
+        newly_earned_badges = []
+        rewards_job = None
 
         # Verifica se ci sono domande a risposta aperta non ancora valutate manualmente
-        has_manual_questions = attempt.quiz.questions.filter(question_type=QuestionType.OPEN_ANSWER_MANUAL).exists()
+        manual_question_ids = answer_key.manual_question_ids
         needs_manual_grading = False
-        if has_manual_questions:
+        if manual_question_ids:
             # Controlla se *tutte* le risposte alle domande manuali sono state date
-            manual_question_ids = attempt.quiz.questions.filter(question_type=QuestionType.OPEN_ANSWER_MANUAL).values_list('id', flat=True)
-            answered_manual_ids = attempt.student_answers.filter(question_id__in=manual_question_ids).values_list('question_id', flat=True)
-            if set(manual_question_ids) == set(answered_manual_ids):
+            answered_manual_ids = {a.question_id for a in student_answers if a.question_id in manual_question_ids}
+            if answered_manual_ids == manual_question_ids:
                  # Tutte le domande manuali hanno una risposta, ma potrebbero non essere state corrette
                  needs_manual_grading = True
             else:
@@ -1079,103 +1194,58 @@ class AttemptViewSet(viewsets.GenericViewSet):
         if needs_manual_grading:
             attempt.status = QuizAttempt.AttemptStatus.PENDING_GRADING
             attempt.completed_at = timezone.now() # Registra comunque il tempo di completamento
-            attempt.save()
+            attempt.save(update_fields=['status', 'completed_at'])
             logger.info(f"Tentativo Quiz {attempt.id} completato, in attesa di correzione manuale.")
         else:
-            # --- Inizio Valutazione Risposte Automatiche ---
-            # Itera su tutte le risposte date per questo tentativo e valuta quelle automatiche
-            logger.debug(f"Inizio valutazione risposte per tentativo {attempt.id}")
-            for student_answer in attempt.student_answers.prefetch_related('question', 'question__answer_options').all(): # Corretto: usa prefetch_related per entrambe
-                question = student_answer.question
-                valid_data_for_storage = student_answer.selected_answers # Recupera i dati salvati
-                is_correct = None
-                score = None
-                logger.debug(f"Valutazione Q{question.order} (Tipo: {question.question_type})")
-
-                # Esegui la logica di valutazione solo per domande a correzione automatica
-                # e solo se la risposta non è già stata valutata (is_correct è None)
-                if question.question_type != QuestionType.OPEN_ANSWER_MANUAL and student_answer.is_correct is None:
-                    try:
-                        if question.question_type == QuestionType.MULTIPLE_CHOICE_SINGLE:
-                            correct_option = question.answer_options.filter(is_correct=True).first()
-                            selected_option_id = valid_data_for_storage.get('answer_option_id')
-                            is_correct = bool(correct_option and selected_option_id == correct_option.id)
-                            score = float(question.metadata.get('points_per_correct_answer', 1.0)) if is_correct else 0.0
-                            logger.debug(f"  MC_SINGLE: Sel={selected_option_id}, Corr={correct_option.id if correct_option else None}, Result={is_correct}, Score={score}")
-
-                        elif question.question_type == QuestionType.TRUE_FALSE:
-                            correct_option = question.answer_options.filter(is_correct=True).first()
-                            selected_bool = valid_data_for_storage.get('is_true')
-                            if correct_option:
-                                is_correct_option_true = correct_option.text.lower() == 'vero'
-                                is_correct = (selected_bool == is_correct_option_true)
-                                score = float(question.metadata.get('points_per_correct_answer', 1.0)) if is_correct else 0.0
-                                logger.debug(f"  TF: Sel={selected_bool}, CorrVal={is_correct_option_true}, Result={is_correct}, Score={score}")
-                            else:
-                                is_correct = False; score = 0.0
-                                logger.warning(f"  TF: Nessuna opzione corretta definita per Q ID {question.id}")
-
-
-                        elif question.question_type == QuestionType.MULTIPLE_CHOICE_MULTIPLE:
-                            correct_option_ids = set(question.answer_options.filter(is_correct=True).values_list('id', flat=True))
-                            selected_option_ids = set(valid_data_for_storage.get('answer_option_ids', []))
-                            is_correct = (correct_option_ids == selected_option_ids)
-                            score = float(question.metadata.get('points_per_correct_answer', 1.0)) if is_correct else 0.0
-                            logger.debug(f"  MC_MULTI: Sel={selected_option_ids}, Corr={correct_option_ids}, Result={is_correct}, Score={score}")
-
-                        elif question.question_type == QuestionType.FILL_BLANK:
-                            correct_answers_list = question.metadata.get('correct_answers', [])
-                            case_sensitive = question.metadata.get('case_sensitive', False)
-                            submitted_answers = valid_data_for_storage.get('answers', [])
-                            if len(correct_answers_list) != len(submitted_answers):
-                                is_correct = False
-                                logger.debug(f"  FILL_BLANK: Numero risposte errato (atteso {len(correct_answers_list)}, dato {len(submitted_answers)})")
-                            else:
-                                all_match = True
-                                for i, correct_ans in enumerate(correct_answers_list):
-                                    submitted = submitted_answers[i]
-                                    correct_str = str(correct_ans)
-                                    submitted_str = str(submitted)
-                                    if not case_sensitive:
-                                        if correct_str.lower() != submitted_str.lower(): all_match = False; break
-                                    else:
-                                        if correct_str != submitted_str: all_match = False; break
-                                is_correct = all_match
-                            score = float(question.metadata.get('points_per_correct_answer', 1.0)) if is_correct else 0.0
-                            logger.debug(f"  FILL_BLANK: Result={is_correct}, Score={score}")
-
-                        # Salva i risultati della valutazione sulla singola risposta
-                        if is_correct is not None: # Salva solo se è stata valutata
-                            student_answer.is_correct = is_correct
-                            student_answer.score = score
-                            student_answer.save(update_fields=['is_correct', 'score'])
-                            logger.debug(f"  Risposta salvata: is_correct={is_correct}, score={score}")
-                        else:
-                             logger.debug(f"  Nessuna valutazione automatica applicabile o già valutata.")
-
-                    except Exception as eval_error:
-                         logger.error(f"Errore durante valutazione automatica risposta per Q ID {question.id} in tentativo {attempt.id}: {eval_error}", exc_info=True)
-                         # Non bloccare il completamento, ma logga l'errore
-                         student_answer.is_correct = None # Assicura che rimanga non valutato
-                         student_answer.score = None
-                         student_answer.save(update_fields=['is_correct', 'score'])
-
-            logger.debug(f"Fine valutazione risposte per tentativo {attempt.id}")
-            # --- Fine Valutazione Risposte Automatiche ---
-
-            # Ora calcola il punteggio finale e assegna punti/badge basandosi sulle risposte valutate
-            final_score = attempt.calculate_final_score() # Calcola e salva lo score sull'attempt
-            newly_earned_badges = attempt.assign_completion_points() # Assegna punti/badge e cattura i nuovi badge
-            # Lo stato viene aggiornato dentro assign_completion_points o rimane COMPLETED
+            # Valutazione in memoria di tutte le risposte automatiche, salvate con un unico bulk_update
+            grading_result = grade_attempt(attempt, answer_key=answer_key, student_answers=student_answers)
+
+            # Punteggio e stato (COMPLETED/FAILED) dall'esito già calcolato, senza rivalutare le risposte:
+            # il tentativo viene scritto una sola volta, alla fine
+            final_score = attempt.calculate_final_score(answer_key=answer_key, grading_result=grading_result, commit=False)
             attempt.completed_at = timezone.now()
-            attempt.save() # Salva eventuali modifiche da assign_completion_points
+            passed = attempt.evaluate_outcome(commit=False)
+            update_fields = ['score', 'status', 'completed_at']
+
+            # Punti, badge e avanzamento percorsi: in coda (worker run_jobs) o subito, secondo configurazione
+            with transaction.atomic():
+                if passed is not None and not settings.ASYNC_ATTEMPT_REWARDS:
+                    newly_earned_badges = attempt.award_completion_rewards(
+                        correct_streak=grading_result.best_streak, passed=passed, commit=False,
+                    )
+                    update_fields.append('first_correct_completion')
+                attempt.save(update_fields=update_fields)
+                if passed is not None and settings.ASYNC_ATTEMPT_REWARDS:
+                    rewards_job = enqueue_attempt_rewards(attempt, correct_streak=grading_result.best_streak)
             logger.info(f"Tentativo Quiz {attempt.id} completato automaticamente. Score: {final_score}, Status: {attempt.status}")
 
 
         # Passa i nuovi badge al contesto del serializer
         context = {'request': request, 'newly_earned_badges': newly_earned_badges}
         serializer = QuizAttemptSerializer(attempt, context=context)
-        return Response(serializer.data)
+        data = serializer.data
+        if rewards_job is not None:
+            # Le ricompense arrivano in differita: il client interroga l'endpoint 'rewards' del tentativo
+            data['rewards_status'] = rewards_job.status
+            data['rewards_url'] = request.build_absolute_uri(reverse('attempt-rewards', kwargs={'pk': attempt.pk}))
+        return Response(data)
+
+    # GET /api/education/attempts/{pk}/rewards/
+    @action(detail=True, methods=['get'])
+    def rewards(self, request, pk=None):
+        """ Stato dell'assegnazione asincrona delle ricompense e badge ottenuti dal tentativo. """
+        attempt = self.get_object()
+        job = Job.objects.filter(idempotency_key=attempt_rewards_key(attempt.pk)).first()
+        if job is None:
+            return Response({'detail': 'Nessuna assegnazione di ricompense in coda per questo tentativo.'}, status=status.HTTP_404_NOT_FOUND)
+
+        badges = []
+        if job.status == Job.JobStatus.DONE and job.result:
+            badges = Badge.objects.filter(id__in=job.result.get('earned_badge_ids', []))
+        return Response({
+            'status': job.status,
+            'newly_earned_badges': SimpleBadgeSerializer(badges, many=True, context={'request': request}).data,
+        })
 
 
 # --- ViewSet per Docenti (Correzione Manuale) ---
@@ -1196,18 +1266,22 @@ class TeacherGradingViewSet(viewsets.GenericViewSet):
         return QuizAttempt.objects.filter(
             quiz__teacher=user,
             status=QuizAttempt.AttemptStatus.PENDING_GRADING
-        ).select_related('student', 'quiz').order_by('completed_at')
+        ).select_related('student__teacher', 'quiz').order_by('completed_at')
 
 
     # GET /api/education/teacher/grading/pending/
-    @action(detail=False, methods=['get'], url_path='pending')
+    @action(detail=False, methods=['get'], url_path='pending', pagination_class=KeysetCursorPagination)
     def list_pending(self, request):
-        """ Lista dei tentativi in attesa di correzione per il docente loggato. """
+        """ Lista dei tentativi in attesa di correzione per il docente loggato (pagine a cursore su 'completed_at'). """
         # Workaround per permessi: controllo manuale perché i permessi standard sembrano fallire qui
         if not isinstance(request.user, User) or not request.user.is_teacher:
              raise DRFPermissionDenied("Accesso negato.")
 
         queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
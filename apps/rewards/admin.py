@@ -2,15 +2,16 @@ from django.contrib import admin
 from django.db import models # Import models
 from django_json_widget.widgets import JSONEditorWidget # Import the widget
 from .models import (
-    Wallet, PointTransaction, RewardTemplate, Reward,
+    Wallet, PointTransaction, WalletSnapshot, RewardTemplate, Reward,
     RewardStudentSpecificAvailability, RewardPurchase,
     Badge, EarnedBadge # Aggiunto Badge e EarnedBadge
 )
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
-    list_display = ('student', 'current_points')
+    list_display = ('student', 'current_points', 'transaction_count')
     search_fields = ('student__first_name', 'student__last_name')
+    readonly_fields = ('transaction_count',) # Gestito dal ledger (apps.rewards.ledger)
     # readonly_fields = ('student',) # 'current_points' reso modificabile
     # Nota: Modificare 'current_points' manualmente non crea una PointTransaction.
 
@@ -21,6 +22,12 @@ class PointTransactionAdmin(admin.ModelAdmin):
     search_fields = ('wallet__student__first_name', 'wallet__student__last_name', 'reason')
     readonly_fields = ('wallet', 'points_change', 'reason', 'timestamp') # Solo visualizzazione
 
+@admin.register(WalletSnapshot)
+class WalletSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('wallet', 'balance', 'transaction_count', 'last_transaction_id', 'created_at')
+    search_fields = ('wallet__student__first_name', 'wallet__student__last_name')
+    readonly_fields = ('wallet', 'balance', 'transaction_count', 'last_transaction_id', 'created_at') # Solo visualizzazione
+
 # Inline per mostrare la disponibilità specifica direttamente nella Reward
 class RewardStudentSpecificAvailabilityInline(admin.TabularInline):
     model = RewardStudentSpecificAvailability
@@ -9,6 +9,7 @@ class RewardsConfig(AppConfig):
 
     def ready(self):
         """
-        Importa i segnali quando l'app è pronta.
+        Importa i segnali e registra i job asincroni quando l'app è pronta.
         """
         import apps.rewards.signals # Importa il modulo dei segnali
+        import apps.rewards.jobs # Registra gli handler della coda job
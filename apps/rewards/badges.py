@@ -0,0 +1,175 @@
+"""
+Motore di regole per l'assegnazione dei badge.
+
+I Badge attivi vengono compilati in un indice in memoria (per trigger_type e, dove
+previsto, per quiz_id/pathway_id) salvato nella cache condivisa, namespace 'rewards':
+il salvataggio o l'eliminazione di un Badge incrementa la versione del namespace
+(vedi apps.rewards.signals) e l'indice viene ricompilato alla lettura successiva.
+
+Il chiamante produce eventi tipizzati (QuizCompleted, PathwayCompleted, PointsChanged,
+CorrectStreak) e `award_badges` assegna tutti i badge soddisfatti con un unico
+`bulk_create(ignore_conflicts=True)`, con un numero di query costante.
+"""
+import logging
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from apps.common.cache import get_or_set
+from .models import Badge, EarnedBadge
+
+logger = logging.getLogger(__name__)
+
+# Badge assegnato al primo quiz superato in assoluto (riconosciuto per nome)
+FIRST_QUIZ_BADGE_NAME = 'Primo Quiz Completato!'
+
+
+# --- Eventi ---
+
+@dataclass(frozen=True)
+class QuizCompleted:
+    """ Quiz superato. `first_ever` indica se è il primo quiz superato in assoluto dallo studente. """
+    quiz_id: int
+    score: float | None
+    first_ever: bool = False
+
+
+@dataclass(frozen=True)
+class PathwayCompleted:
+    """ Percorso completato per la prima volta. """
+    pathway_id: int
+
+
+@dataclass(frozen=True)
+class PointsChanged:
+    """ Saldo punti dello studente aggiornato. """
+    current_points: int
+
+
+@dataclass(frozen=True)
+class CorrectStreak:
+    """ Sequenza di risposte corrette consecutive ottenuta in un tentativo. """
+    streak_length: int
+
+
+# --- Indice delle regole ---
+
+@dataclass(frozen=True)
+class BadgeRule:
+    """ Condizione compilata di un singolo Badge attivo. """
+    badge_id: int
+    target_id: int | None = None  # quiz_id / pathway_id (None = qualsiasi)
+    threshold: float = 0  # min_score_percent / points / streak_length
+
+
+@dataclass
+class BadgeIndex:
+    """ Regole dei badge attivi raggruppate per tipo di evento. """
+    quiz_rules_any: list = field(default_factory=list)
+    quiz_rules_by_id: dict = field(default_factory=dict)  # quiz_id -> [BadgeRule]
+    pathway_rules_any: list = field(default_factory=list)
+    pathway_rules_by_id: dict = field(default_factory=dict)  # pathway_id -> [BadgeRule]
+    points_rules: list = field(default_factory=list)  # Ordinate per soglia crescente
+    streak_rules: list = field(default_factory=list)  # Ordinate per lunghezza crescente
+    first_quiz_badge_id: int | None = None
+
+    def match(self, event) -> list[int]:
+        """ Restituisce gli id dei badge soddisfatti dall'evento. """
+        if isinstance(event, QuizCompleted):
+            rules = self.quiz_rules_any + self.quiz_rules_by_id.get(event.quiz_id, [])
+            matched = [r.badge_id for r in rules if event.score is not None and event.score >= r.threshold]
+            if event.first_ever and self.first_quiz_badge_id is not None:
+                matched.append(self.first_quiz_badge_id)
+            return matched
+        if isinstance(event, PathwayCompleted):
+            rules = self.pathway_rules_any + self.pathway_rules_by_id.get(event.pathway_id, [])
+            return [r.badge_id for r in rules]
+        if isinstance(event, PointsChanged):
+            return [r.badge_id for r in self.points_rules if event.current_points >= r.threshold]
+        if isinstance(event, CorrectStreak):
+            return [r.badge_id for r in self.streak_rules if event.streak_length >= r.threshold]
+        logger.warning(f"Evento badge non gestito: {event!r}")
+        return []
+
+
+def _optional_int(value):
+    return int(value) if value is not None else None
+
+
+def compile_badge_index() -> BadgeIndex:
+    """ Compila i Badge attivi nell'indice delle regole (una query). """
+    index = BadgeIndex()
+    for badge in Badge.objects.filter(is_active=True).only('id', 'name', 'trigger_type', 'trigger_condition'):
+        if badge.name == FIRST_QUIZ_BADGE_NAME:
+            index.first_quiz_badge_id = badge.id
+        condition = badge.trigger_condition or {}
+        try:
+            if badge.trigger_type == Badge.TriggerType.QUIZ_COMPLETED:
+                rule = BadgeRule(badge.id, _optional_int(condition.get('quiz_id')), float(condition.get('min_score_percent', 0)))
+                if rule.target_id is None:
+                    index.quiz_rules_any.append(rule)
+                else:
+                    index.quiz_rules_by_id.setdefault(rule.target_id, []).append(rule)
+            elif badge.trigger_type == Badge.TriggerType.PATHWAY_COMPLETED:
+                rule = BadgeRule(badge.id, _optional_int(condition.get('pathway_id')))
+                if rule.target_id is None:
+                    index.pathway_rules_any.append(rule)
+                else:
+                    index.pathway_rules_by_id.setdefault(rule.target_id, []).append(rule)
+            elif badge.trigger_type == Badge.TriggerType.POINTS_THRESHOLD:
+                threshold = int(condition.get('points', -1))
+                if threshold < 0:
+                    logger.warning(f"Badge Soglia ID {badge.id} ('{badge.name}') ha una soglia non valida o mancante: {condition}")
+                    continue
+                index.points_rules.append(BadgeRule(badge.id, threshold=threshold))
+            elif badge.trigger_type == Badge.TriggerType.CORRECT_STREAK:
+                streak_length = int(condition.get('streak_length', 0))
+                if streak_length <= 0:
+                    logger.warning(f"Badge Streak ID {badge.id} ('{badge.name}') ha una lunghezza non valida o mancante: {condition}")
+                    continue
+                index.streak_rules.append(BadgeRule(badge.id, threshold=streak_length))
+        except (ValueError, TypeError) as e:
+            logger.error(f"Errore nel parsing trigger_condition per Badge {badge.id} ('{badge.name}'): {condition}. Errore: {e}")
+
+    index.points_rules.sort(key=lambda r: r.threshold)
+    index.streak_rules.sort(key=lambda r: r.threshold)
+    return index
+
+
+def get_badge_index() -> BadgeIndex:
+    """ Restituisce l'indice dei badge dalla cache condivisa, compilandolo se necessario. """
+    return get_or_set(
+        'rewards', 'badge_index',
+        compute=compile_badge_index,
+        timeout=settings.BADGE_INDEX_CACHE_TIMEOUT,
+    )
+
+
+def award_badges(student, events) -> list[EarnedBadge]:
+    """
+    Valuta gli eventi e assegna allo studente i badge soddisfatti non ancora posseduti.
+    Restituisce gli EarnedBadge appena creati (con il Badge già caricato).
+    """
+    index = get_badge_index()
+    candidate_ids = set()
+    for event in events:
+        candidate_ids.update(index.match(event))
+    if not candidate_ids:
+        return []
+
+    already_earned = set(
+        EarnedBadge.objects.filter(student=student, badge_id__in=candidate_ids).values_list('badge_id', flat=True)
+    )
+    new_ids = candidate_ids - already_earned
+    if not new_ids:
+        return []
+
+    EarnedBadge.objects.bulk_create(
+        [EarnedBadge(student=student, badge_id=badge_id) for badge_id in new_ids],
+        ignore_conflicts=True, # Un'assegnazione concorrente dello stesso badge non è un errore
+    )
+    earned = list(
+        EarnedBadge.objects.filter(student=student, badge_id__in=new_ids).select_related('badge')
+    )
+    logger.info(f"Badge assegnati allo studente {student.id}: {[e.badge.name for e in earned]}")
+    return earned
@@ -0,0 +1,87 @@
+"""
+Catalogo delle ricompense per lo shop degli studenti.
+
+Il catalogo di un docente (`RewardCatalogue`) contiene le sue ricompense attive già serializzate
+(RewardSerializer), gli id di quelle disponibili a tutti i suoi studenti e, per ogni studente,
+gli id di quelle disponibili solo a lui. È calcolato una volta (tre query) e salvato nella cache
+condivisa (namespace 'rewards', scope 'teacher:<id>'); gli id delle ricompense già acquistate da
+uno studente sono in cache a parte (scope 'student:<id>').
+
+Elenco dello shop e controllo di disponibilità all'acquisto sono quindi letture dalla cache.
+I segnali (apps.rewards.signals) invalidano i cataloghi quando cambiano ricompense o disponibilità
+specifiche (solo lo scope del docente proprietario, anche per add()/remove() e per la cancellazione
+di un template) o i dati mostrati (docente, studenti), e gli acquisti dello studente a ogni acquisto.
+"""
+import logging
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from apps.common.cache import get_or_set
+from .models import Reward, RewardPurchase
+from .serializers import RewardSerializer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RewardCatalogue:
+    """ Ricompense attive di un docente, con le regole di disponibilità per studente. """
+    teacher_id: int
+    order: tuple = ()  # id delle ricompense nell'ordine dello shop (per nome)
+    rewards: dict = field(default_factory=dict)  # {reward_id: Reward} con docente e studenti già caricati
+    entries: dict = field(default_factory=dict)  # {reward_id: dati serializzati}
+    open_ids: frozenset = frozenset()  # Disponibili a tutti gli studenti del docente
+    specific_ids: dict = field(default_factory=dict)  # {student_id: frozenset di reward_id}
+
+    def is_available(self, reward_id: int, student_id: int, purchased_ids=frozenset()) -> bool:
+        if reward_id in purchased_ids:
+            return False
+        return reward_id in self.open_ids or reward_id in self.specific_ids.get(student_id, ())
+
+    def available_ids(self, student_id: int, purchased_ids=frozenset()) -> list[int]:
+        return [reward_id for reward_id in self.order if self.is_available(reward_id, student_id, purchased_ids)]
+
+
+def build_reward_catalogue(teacher_id: int) -> RewardCatalogue:
+    """ Compila il catalogo delle ricompense attive del docente. """
+    rewards = list(
+        Reward.objects.filter(teacher_id=teacher_id, is_active=True)
+        .select_related('teacher').prefetch_related('available_to_specific_students__teacher')
+        .order_by('name', 'id')
+    )
+    open_ids, specific_ids = set(), {}
+    for reward in rewards:
+        if reward.availability_type == Reward.AvailabilityType.ALL_STUDENTS:
+            open_ids.add(reward.id)
+        else:
+            for student in reward.available_to_specific_students.all():
+                specific_ids.setdefault(student.id, set()).add(reward.id)
+    entries = {item['id']: item for item in RewardSerializer(rewards, many=True).data}
+    logger.debug(f"Catalogo ricompense compilato per il docente {teacher_id} ({len(rewards)} ricompense attive).")
+    return RewardCatalogue(
+        teacher_id=teacher_id,
+        order=tuple(reward.id for reward in rewards),
+        rewards={reward.id: reward for reward in rewards},
+        entries=entries,
+        open_ids=frozenset(open_ids),
+        specific_ids={student_id: frozenset(ids) for student_id, ids in specific_ids.items()},
+    )
+
+
+def get_reward_catalogue(teacher_id: int) -> RewardCatalogue:
+    """ Catalogo del docente dalla cache condivisa (scope 'teacher:<id>'). """
+    return get_or_set(
+        'rewards', 'catalogue', scope=f"teacher:{teacher_id}",
+        compute=lambda: build_reward_catalogue(teacher_id),
+        timeout=settings.REWARD_CATALOGUE_CACHE_TIMEOUT,
+    )
+
+
+def get_purchased_reward_ids(student_id: int) -> frozenset:
+    """ Id delle ricompense già acquistate dallo studente, dalla cache condivisa (scope 'student:<id>'). """
+    return get_or_set(
+        'rewards', 'purchased', scope=f"student:{student_id}",
+        compute=lambda: frozenset(RewardPurchase.objects.filter(student_id=student_id).values_list('reward_id', flat=True)),
+        timeout=settings.REWARD_CATALOGUE_CACHE_TIMEOUT,
+    )
@@ -0,0 +1,31 @@
+"""
+Job asincroni dell'app rewards (vedi apps.common.jobs).
+"""
+import logging
+
+from apps.common.jobs import enqueue, register_job
+from .reconciliation import reconcile_range
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_WALLETS_JOB = 'rewards.reconcile_wallets'
+
+
+def reconcile_key(run_id: str, after: int) -> str:
+    """ Chiave di idempotenza: un intervallo di wallet per esecuzione della riconciliazione. """
+    return f"wallet-reconcile:{run_id}:{after}"
+
+
+def enqueue_wallet_reconciliation(run_id: str, after: int, upto: int, repair: bool = False, full: bool = False):
+    """ Accoda la riconciliazione dei wallet con chiave in (after, upto]. """
+    return enqueue(
+        RECONCILE_WALLETS_JOB,
+        {'run_id': run_id, 'after': after, 'upto': upto, 'repair': repair, 'full': full},
+        idempotency_key=reconcile_key(run_id, after),
+    )
+
+
+@register_job(RECONCILE_WALLETS_JOB)
+def run_wallet_reconciliation(payload: dict) -> dict:
+    """ Riconcilia un intervallo di wallet e restituisce conteggi e discrepanze. """
+    return reconcile_range(payload['after'], payload['upto'], repair=payload['repair'], full=payload['full']).as_dict()
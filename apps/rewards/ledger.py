@@ -0,0 +1,182 @@
+"""
+Ledger dei punti: ogni variazione del saldo di un Wallet viene applicata insieme alle sue
+PointTransaction, con una sola andata e ritorno verso il database.
+
+- `apply_entries(student_id, entries)` applica una o più voci (es. punti del quiz e punti del
+  percorso nella stessa chiamata) con un UPDATE condizionato che restituisce il nuovo saldo
+  (RETURNING) e inserisce una transazione per voce. Su PostgreSQL UPDATE e INSERT sono un'unica
+  istruzione (CTE); su SQLite (>= 3.35) UPDATE ... RETURNING seguito da un INSERT in blocco.
+- Il controllo del saldo fa parte dell'UPDATE: niente lettura preventiva né select_for_update,
+  un saldo insufficiente solleva InsufficientPoints e non modifica nulla.
+- Ogni WALLET_SNAPSHOT_INTERVAL transazioni di un wallet viene salvata una WalletSnapshot con il
+  saldo del ledger: `balance_at` (e la riconciliazione) partono dall'ultima fotografia invece che
+  da tutto lo storico.
+- L'UPDATE non invia post_save: i riepiloghi dipendenti dal saldo ascoltano `balance_changed`.
+"""
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Wallet, PointTransaction, WalletSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Inviato dopo ogni variazione applicata dal ledger (argomenti: student_id, balance)
+balance_changed = Signal()
+
+
+class InsufficientPoints(ValueError):
+    """ Il saldo non copre le variazioni richieste. """
+
+
+def apply_entries(student_id: int, entries) -> int:
+    """
+    Applica le voci `entries` ([(punti, motivo)], punti negativi per le spese) al wallet dello studente
+    in modo atomico e restituisce il nuovo saldo. Le voci a zero vengono ignorate.
+    Solleva InsufficientPoints se il saldo diventerebbe negativo, Wallet.DoesNotExist se il wallet manca.
+    """
+    entries = [(int(points), reason) for points, reason in entries if points]
+    if not entries:
+        return Wallet.objects.values_list('current_points', flat=True).get(pk=student_id)
+    total = sum(points for points, _reason in entries)
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            row = _apply_single_statement(student_id, entries, total)
+        else:
+            row = _apply_update_returning(student_id, entries, total)
+        if row is None:
+            if not Wallet.objects.filter(pk=student_id).exists():
+                raise Wallet.DoesNotExist(f"Wallet non trovato per lo studente {student_id}.")
+            raise InsufficientPoints("Insufficient points.")
+        balance, transaction_count, last_transaction_id = row
+        _maybe_snapshot(student_id, balance, transaction_count, len(entries), last_transaction_id)
+        balance_changed.send(sender=Wallet, student_id=student_id, balance=balance)
+
+    logger.debug(f"Ledger: wallet {student_id} variato di {total} punti ({len(entries)} voci), saldo {balance}.")
+    return balance
+
+
+def balance_at(student_id: int, at: datetime | None = None) -> int:
+    """
+    Saldo risultante dal ledger (all'istante `at`, o attuale): ultima WalletSnapshot più le transazioni
+    successive. Non legge Wallet.current_points, così da poterli confrontare (riconciliazione).
+    """
+    snapshots = WalletSnapshot.objects.filter(wallet_id=student_id)
+    transactions = PointTransaction.objects.filter(wallet_id=student_id)
+    if at is not None:
+        snapshots = snapshots.filter(created_at__lte=at)
+        transactions = transactions.filter(timestamp__lte=at)
+    snapshot = snapshots.order_by('-last_transaction_id').first()
+    balance = 0
+    if snapshot is not None:
+        balance = snapshot.balance
+        transactions = transactions.filter(pk__gt=snapshot.last_transaction_id)
+    return balance + (transactions.aggregate(total=Sum('points_change'))['total'] or 0)
+
+
+# --- Implementazioni per backend ---
+
+def _columns():
+    quote = connection.ops.quote_name
+    wallet_field = Wallet._meta.get_field
+    tx_field = PointTransaction._meta.get_field
+    return {
+        'wallet': quote(Wallet._meta.db_table),
+        'pk': quote(Wallet._meta.pk.column),
+        'points': quote(wallet_field('current_points').column),
+        'count': quote(wallet_field('transaction_count').column),
+        'tx': quote(PointTransaction._meta.db_table),
+        'tx_id': quote(PointTransaction._meta.pk.column),
+        'tx_wallet': quote(tx_field('wallet').column),
+        'tx_change': quote(tx_field('points_change').column),
+        'tx_reason': quote(tx_field('reason').column),
+        'tx_timestamp': quote(tx_field('timestamp').column),
+    }
+
+
+def _update_sql(c) -> str:
+    # Il saldo non può diventare negativo: in tal caso nessuna riga viene aggiornata
+    return (
+        f"UPDATE {c['wallet']} SET {c['points']} = {c['points']} + %s, {c['count']} = {c['count']} + %s "
+        f"WHERE {c['pk']} = %s AND {c['points']} + %s >= 0"
+    )
+
+
+def _apply_single_statement(student_id, entries, total):
+    """ PostgreSQL: UPDATE e INSERT delle transazioni in un'unica istruzione. Restituisce (saldo, conteggio, ultimo id). """
+    c = _columns()
+    values = ", ".join(["(%s::integer, %s::varchar)"] * len(entries))
+    sql = (
+        f"WITH updated AS ({_update_sql(c)} RETURNING {c['pk']}, {c['points']}, {c['count']}), "
+        f"inserted AS ("
+        f"INSERT INTO {c['tx']} ({c['tx_wallet']}, {c['tx_change']}, {c['tx_reason']}, {c['tx_timestamp']}) "
+        f"SELECT updated.{c['pk']}, entry.points_change, entry.reason, %s "
+        f"FROM updated CROSS JOIN (VALUES {values}) AS entry(points_change, reason) "
+        f"RETURNING {c['tx_id']}) "
+        f"SELECT updated.{c['points']}, updated.{c['count']}, (SELECT MAX({c['tx_id']}) FROM inserted) FROM updated"
+    )
+    params = [total, len(entries), student_id, total, timezone.now()]
+    for points, reason in entries:
+        params.extend((points, reason))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def _apply_update_returning(student_id, entries, total):
+    """ Altri backend: UPDATE ... RETURNING e INSERT in blocco delle transazioni. """
+    c = _columns()
+    with connection.cursor() as cursor:
+        cursor.execute(f"{_update_sql(c)} RETURNING {c['points']}, {c['count']}", [total, len(entries), student_id, total])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    created = PointTransaction.objects.bulk_create([
+        PointTransaction(wallet_id=student_id, points_change=points, reason=reason)
+        for points, reason in entries
+    ])
+    return row[0], row[1], max(tx.pk for tx in created)
+
+
+def _maybe_snapshot(student_id, balance, transaction_count, added, last_transaction_id) -> None:
+    """
+    Salva una WalletSnapshot quando il conteggio delle transazioni supera un multiplo dell'intervallo.
+    Il saldo salvato è quello del ledger (fotografia precedente più le transazioni successive), non
+    `current_points`: una discrepanza presente in quel momento non diventa la nuova base della riconciliazione.
+    """
+    interval = settings.WALLET_SNAPSHOT_INTERVAL
+    if interval <= 0 or transaction_count // interval == (transaction_count - added) // interval:
+        return
+    ledger_balance = _ledger_balance(student_id, last_transaction_id)
+    if ledger_balance != balance:
+        logger.warning(f"Ledger: wallet {student_id} con saldo {balance} diverso dal ledger ({ledger_balance}), "
+                       f"fotografia salvata con il saldo del ledger.")
+    if ledger_balance < 0:
+        logger.error(f"Ledger: wallet {student_id} con saldo del ledger negativo ({ledger_balance}), fotografia non salvata.")
+        return
+    WalletSnapshot.objects.create(
+        wallet_id=student_id,
+        balance=ledger_balance,
+        transaction_count=transaction_count,
+        last_transaction_id=last_transaction_id,
+    )
+
+
+def _ledger_balance(student_id: int, last_transaction_id: int) -> int:
+    """ Saldo del ledger dopo la transazione `last_transaction_id`: fotografia precedente più le transazioni successive. """
+    transactions = PointTransaction.objects.filter(wallet_id=student_id, pk__lte=last_transaction_id)
+    snapshot = (
+        WalletSnapshot.objects.filter(wallet_id=student_id, last_transaction_id__lte=last_transaction_id)
+        .order_by('-last_transaction_id').values_list('balance', 'last_transaction_id').first()
+    )
+    balance = 0
+    if snapshot is not None:
+        balance = snapshot[0]
+        transactions = transactions.filter(pk__gt=snapshot[1])
+    return balance + (transactions.aggregate(total=Sum('points_change'))['total'] or 0)
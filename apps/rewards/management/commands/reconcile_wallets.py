@@ -0,0 +1,99 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from apps.common.models import Job
+from apps.rewards.jobs import RECONCILE_WALLETS_JOB, enqueue_wallet_reconciliation, reconcile_key
+from apps.rewards.reconciliation import RangeResult, reconcile_range, wallet_ranges
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = ('Verifica che il saldo dei wallet corrisponda al ledger (fotografie + PointTransaction), a blocchi di wallet. '
+            'Senza --repair riporta soltanto le discrepanze. Con --enqueue i blocchi diventano job eseguiti in parallelo '
+            'dai worker `run_jobs`; --summary RUN_ID riassume poi esito e throughput (es. da cron, ogni notte).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Wallet per blocco (e per job).')
+        parser.add_argument('--repair', action='store_true', help='Riallinea i saldi al ledger invece di limitarsi a segnalarli.')
+        parser.add_argument('--full', action='store_true', help='Ignora le WalletSnapshot e somma tutte le transazioni.')
+        parser.add_argument('--enqueue', action='store_true', help='Accoda un job per blocco invece di eseguire la verifica qui.')
+        parser.add_argument('--summary', metavar='RUN_ID', help='Riassume i job di una riconciliazione accodata.')
+
+    def handle(self, *args, **options):
+        if options['summary']:
+            return self._summary(options['summary'])
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size deve essere positivo.')
+
+        if options['enqueue']:
+            run_id = uuid.uuid4().hex[:12]
+            jobs = 0
+            for after, upto in wallet_ranges(options['chunk_size']):
+                enqueue_wallet_reconciliation(run_id, after, upto, repair=options['repair'], full=options['full'])
+                jobs += 1
+            self.stdout.write(self.style.SUCCESS(
+                f"Riconciliazione {run_id}: {jobs} job accodati ({RECONCILE_WALLETS_JOB}). "
+                f"Esito con: manage.py reconcile_wallets --summary {run_id}"
+            ))
+            return
+
+        started = time.perf_counter()
+        total = RangeResult()
+        for after, upto in wallet_ranges(options['chunk_size']):
+            result = reconcile_range(after, upto, repair=options['repair'], full=options['full'])
+            self._accumulate(total, result.as_dict())
+        self._report(total, time.perf_counter() - started, options['repair'])
+
+    def _summary(self, run_id):
+        jobs = Job.objects.filter(kind=RECONCILE_WALLETS_JOB, idempotency_key__startswith=reconcile_key(run_id, ''))
+        if not jobs.exists():
+            raise CommandError(f"Nessun job trovato per la riconciliazione {run_id}.")
+        by_status = {}
+        total = RangeResult()
+        for status, result in jobs.values_list('status', 'result').iterator():
+            by_status[status] = by_status.get(status, 0) + 1
+            if result:
+                self._accumulate(total, result)
+        self.stdout.write("Job: " + ", ".join(f"{status} {count}" for status, count in sorted(by_status.items())))
+        bounds = jobs.aggregate(first=Min('created_at'), last=Max('finished_at'))
+        elapsed = (bounds['last'] - bounds['first']).total_seconds() if bounds['last'] else 0.0
+        if set(by_status) - {Job.JobStatus.DONE}:
+            self.stdout.write(self.style.WARNING('Riconciliazione non ancora conclusa o con job falliti.'))
+        self._report(total, elapsed, repair=jobs.first().payload.get('repair', False))
+
+    @staticmethod
+    def _accumulate(total: RangeResult, result: dict):
+        """ Somma l'esito di un blocco (RangeResult.as_dict(), anche dal risultato di un job). """
+        total.wallets += result['wallets']
+        total.transactions += result['transactions']
+        total.drift_count += result['drift_count']
+        total.repaired += result['repaired']
+        total.invalid_snapshots += result.get('invalid_snapshots', 0)
+        total.snapshots_removed += result.get('snapshots_removed', 0)
+        total.seconds += result['seconds']
+        total.drifts.extend(result['drifts'])
+
+    def _report(self, total: RangeResult, elapsed: float, repair: bool):
+        for drift in total.drifts:
+            outcome = ' (riparato)' if drift['repaired'] else ''
+            self.stdout.write(f"Wallet {drift['student_id']}: saldo {drift['stored']}, ledger {drift['expected']}{outcome}")
+        rate = total.transactions / elapsed if elapsed else 0.0
+        self.stdout.write(
+            f"{total.wallets} wallet e {total.transactions} transazioni verificati in {elapsed:.2f} s "
+            f"({rate:.0f} transazioni/s, {total.seconds:.2f} s nelle query di verifica)."
+        )
+        if total.invalid_snapshots:
+            self.stdout.write(f"{total.invalid_snapshots} fotografie non coerenti con il ledger, {total.snapshots_removed} eliminate.")
+        unresolved = total.drift_count - total.repaired
+        if unresolved:
+            hint = '' if repair else ' Eseguire con --repair per riallinearli al ledger.'
+            raise CommandError(f"{unresolved} wallet non coerenti con il ledger.{hint}")
+        if total.invalid_snapshots > total.snapshots_removed:
+            hint = '' if repair else ' Eseguire con --full --repair per eliminarle.'
+            raise CommandError(f"{total.invalid_snapshots - total.snapshots_removed} fotografie non coerenti con il ledger.{hint}")
+        if total.drift_count:
+            self.stdout.write(self.style.SUCCESS(f"{total.repaired} wallet riallineati al ledger."))
+        else:
+            self.stdout.write(self.style.SUCCESS('Wallet coerenti con il ledger.'))
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-17 21:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0005_alter_badge_trigger_condition'),
+        ('users', '0004_student_progress_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pointtransaction',
+            index=models.Index(fields=['wallet', '-timestamp'], name='rew_ptx_wallet_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rewardpurchase',
+            index=models.Index(fields=['student', 'status'], name='rew_purchase_stu_st_idx'),
+        ),
+    ]
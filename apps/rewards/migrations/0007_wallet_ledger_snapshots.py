@@ -0,0 +1,47 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_transaction_count(apps, schema_editor):
+    """ Allinea il conteggio delle transazioni dei wallet esistenti. """
+    Wallet = apps.get_model('rewards', 'Wallet')
+    PointTransaction = apps.get_model('rewards', 'PointTransaction')
+    counts = PointTransaction.objects.filter(wallet=OuterRef('pk')).order_by().values('wallet').annotate(c=Count('id')).values('c')
+    Wallet.objects.update(transaction_count=Coalesce(Subquery(counts[:1], output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='transaction_count',
+            field=models.PositiveIntegerField(default=0, help_text='Numero di transazioni registrate dal ledger; determina quando salvare una WalletSnapshot.', verbose_name='Transaction Count'),
+        ),
+        migrations.CreateModel(
+            name='WalletSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.PositiveIntegerField(verbose_name='Balance')),
+                ('transaction_count', models.PositiveIntegerField(verbose_name='Transaction Count')),
+                ('last_transaction_id', models.BigIntegerField(verbose_name='Last Transaction ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='rewards.wallet', verbose_name='Wallet')),
+            ],
+            options={
+                'verbose_name': 'Wallet Snapshot',
+                'verbose_name_plural': 'Wallet Snapshots',
+                'ordering': ['-last_transaction_id'],
+                'indexes': [models.Index(fields=['wallet', '-last_transaction_id'], name='rew_wsnap_wallet_tx_idx')],
+            },
+        ),
+        migrations.RunPython(populate_transaction_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewards', '0007_wallet_ledger_snapshots'),
+        ('users', '0005_student_auth_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rewardpurchase',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Idempotency Key'),
+        ),
+        migrations.AddConstraint(
+            model_name='rewardpurchase',
+            constraint=models.UniqueConstraint(fields=('student', 'idempotency_key'), name='rew_purchase_idem_key_uniq'),
+        ),
+    ]
@@ -25,6 +25,11 @@ class Wallet(models.Model):
         default=0,
         help_text=_('Punti attualmente disponibili per lo studente.')
     )
+    transaction_count = models.PositiveIntegerField(
+        _('Transaction Count'),
+        default=0,
+        help_text=_('Numero di transazioni registrate dal ledger; determina quando salvare una WalletSnapshot.')
+    )
 
     class Meta:
         verbose_name = _('Wallet')
@@ -35,7 +40,7 @@ class Wallet(models.Model):
 
     def add_points(self, points_to_add, reason):
         """
-        Adds points to the wallet and creates a transaction record.
+        Adds points to the wallet and creates a transaction record (apps.rewards.ledger).
 
         Args:
             points_to_add (int): The number of points to add (must be positive).
@@ -44,21 +49,13 @@ class Wallet(models.Model):
         if points_to_add <= 0:
             # Consider raising ValueError for consistency? For now, just return.
             return
-        # Use F() expression for atomic update
-        self.current_points = models.F('current_points') + points_to_add
-        self.save(update_fields=['current_points'])
-        self.refresh_from_db() # Reload the value after atomic update
-
-        # Create transaction *after* successful update
-        PointTransaction.objects.create(
-            wallet=self,
-            points_change=points_to_add,
-            reason=reason
-        )
+        from .ledger import apply_entries
+        self.current_points = apply_entries(self.student_id, [(points_to_add, reason)])
 
     def subtract_points(self, points_to_subtract, reason):
         """
-        Subtracts points from the wallet and creates a transaction record.
+        Subtracts points from the wallet and creates a transaction record (apps.rewards.ledger).
+        The balance check is part of the UPDATE, so concurrent purchases cannot overdraw the wallet.
 
         Args:
             points_to_subtract (int): The number of points to subtract (must be positive).
@@ -69,19 +66,8 @@ class Wallet(models.Model):
         """
         if points_to_subtract <= 0:
             raise ValueError("Points to subtract must be positive.")
-        if self.current_points < points_to_subtract:
-            raise ValueError("Insufficient points.")
-        # Use F() expression for atomic update
-        self.current_points = models.F('current_points') - points_to_subtract
-        self.save(update_fields=['current_points'])
-        self.refresh_from_db() # Reload the value after atomic update
-
-        # Create transaction *after* successful update
-        PointTransaction.objects.create(
-            wallet=self,
-            points_change=-points_to_subtract, # Negativo per sottrazione
-            reason=reason
-        )
+        from .ledger import apply_entries
+        self.current_points = apply_entries(self.student_id, [(-points_to_subtract, reason)])
 
 
 class PointTransaction(models.Model):
@@ -109,12 +95,46 @@ class PointTransaction(models.Model):
         verbose_name = _('Point Transaction')
         verbose_name_plural = _('Point Transactions')
         ordering = ['-timestamp'] # Mostra le più recenti prima
+        indexes = [
+            # Storico del wallet, dalle transazioni più recenti
+            models.Index(fields=['wallet', '-timestamp'], name='rew_ptx_wallet_ts_idx'),
+        ]
 
     def __str__(self):
         change_type = "Added" if self.points_change > 0 else "Subtracted"
         return f"{change_type} {abs(self.points_change)} points for {self.wallet.student.full_name} at {self.timestamp}"
 
 
+class WalletSnapshot(models.Model):
+    """
+    Fotografia periodica del saldo di un Wallet (apps.rewards.ledger), dopo la transazione `last_transaction_id`:
+    il saldo in un qualunque momento è quello della fotografia più le transazioni successive.
+    """
+    wallet = models.ForeignKey(
+        Wallet,
+        on_delete=models.CASCADE,
+        related_name='snapshots',
+        verbose_name=_('Wallet')
+    )
+    balance = models.PositiveIntegerField(_('Balance'))
+    transaction_count = models.PositiveIntegerField(_('Transaction Count'))
+    # Id (non FK) dell'ultima transazione inclusa nel saldo: le transazioni non vengono mai modificate
+    last_transaction_id = models.BigIntegerField(_('Last Transaction ID'))
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Wallet Snapshot')
+        verbose_name_plural = _('Wallet Snapshots')
+        ordering = ['-last_transaction_id']
+        indexes = [
+            # Ultima fotografia del wallet (prima o dopo una transazione)
+            models.Index(fields=['wallet', '-last_transaction_id'], name='rew_wsnap_wallet_tx_idx'),
+        ]
+
+    def __str__(self):
+        return f"Snapshot of wallet {self.wallet_id}: {self.balance} points after transaction {self.last_transaction_id}"
+
+
 class RewardTemplate(models.Model):
     """
     Template per le ricompense, creato da Admin (global) o Docente (local).
@@ -289,11 +309,30 @@ class RewardPurchase(models.Model):
     )
     delivered_at = models.DateTimeField(_('Delivered At'), null=True, blank=True)
     delivery_notes = models.TextField(_('Delivery Notes'), blank=True)
+    # Chiave inviata dal client (header Idempotency-Key): un nuovo invio della stessa richiesta
+    # restituisce l'acquisto già registrato invece di addebitare di nuovo (apps.rewards.purchases)
+    idempotency_key = models.CharField(
+        _('Idempotency Key'),
+        max_length=64,
+        null=True,
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = _('Reward Purchase')
         verbose_name_plural = _('Reward Purchases')
         ordering = ['-purchased_at']
+        indexes = [
+            # Acquisti di uno studente per stato (consegne pendenti del docente, storico studente).
+            # Non esiste una colonna teacher: le consegne del docente filtrano su student__teacher,
+            # quindi l'indice è usato dopo il join con gli studenti del docente
+            models.Index(fields=['student', 'status'], name='rew_purchase_stu_st_idx'),
+        ]
+        constraints = [
+            # Una chiave di idempotenza identifica un solo acquisto per studente (NULL = richiesta senza chiave)
+            models.UniqueConstraint(fields=['student', 'idempotency_key'], name='rew_purchase_idem_key_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.student.full_name} purchased {self.reward.name} at {self.purchased_at}"
@@ -0,0 +1,113 @@
+"""
+Acquisto di una ricompensa dallo shop, sicuro rispetto a invii ripetuti e richieste concorrenti.
+
+- Il client può inviare una chiave di idempotenza (header Idempotency-Key, salvata su
+  RewardPurchase): un nuovo invio con la stessa chiave restituisce l'acquisto già registrato
+  (`PurchaseOutcome.replayed`) senza addebitare di nuovo; la stessa chiave per un'altra
+  ricompensa solleva IdempotencyKeyConflict.
+- Addebito, controllo di disponibilità e inserimento dell'acquisto avvengono in un'unica
+  transazione: l'UPDATE del ledger (apps.rewards.ledger) blocca la riga del wallet, quindi gli
+  acquisti dello stesso studente sono serializzati e il controllo "non ancora acquistata" fatto
+  dopo il blocco è definitivo (niente doppi acquisti né aggiornamenti persi).
+- L'attesa del blocco è limitata (REWARD_PURCHASE_LOCK_TIMEOUT_MS, lock_timeout su PostgreSQL;
+  su SQLite vale il timeout della connessione): oltre il limite il database solleva
+  OperationalError e la richiesta può essere ripetuta con la stessa chiave.
+"""
+import logging
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from .catalogue import get_reward_catalogue, get_purchased_reward_ids
+from .ledger import InsufficientPoints, apply_entries
+from .models import Wallet, RewardPurchase
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_MAX_LENGTH = RewardPurchase._meta.get_field('idempotency_key').max_length
+
+
+class RewardUnavailable(Exception):
+    """ Ricompensa non nel catalogo dello studente o già acquistata. """
+
+
+class IdempotencyKeyConflict(Exception):
+    """ La chiave di idempotenza è già stata usata per l'acquisto di un'altra ricompensa. """
+
+
+@dataclass(frozen=True)
+class PurchaseOutcome:
+    purchase: RewardPurchase
+    replayed: bool = False  # True se l'acquisto era già stato registrato con la stessa chiave
+
+
+def purchase_reward(student, reward_id: int, idempotency_key: str | None = None) -> PurchaseOutcome:
+    """
+    Acquista la ricompensa `reward_id` per lo studente (serve solo `pk` e `teacher_id`).
+    Solleva RewardUnavailable, IdempotencyKeyConflict, InsufficientPoints (ValueError),
+    Wallet.DoesNotExist oppure OperationalError se il wallet resta bloccato oltre il limite.
+    """
+    if idempotency_key:
+        previous = _purchase_for_key(student, idempotency_key, reward_id)
+        if previous is not None:
+            return PurchaseOutcome(previous, replayed=True)
+
+    try:
+        catalogue = get_reward_catalogue(student.teacher_id)
+        if not catalogue.is_available(reward_id, student.pk, get_purchased_reward_ids(student.pk)):
+            raise RewardUnavailable(f"Ricompensa {reward_id} non disponibile per lo studente {student.pk}.")
+        reward = catalogue.rewards[reward_id]
+
+        with transaction.atomic():
+            _limit_lock_wait()
+            _lock_wallet(student.pk, reward)
+            # Dopo il blocco del wallet nessun altro acquisto dello studente è in corso
+            if RewardPurchase.objects.filter(student_id=student.pk, reward_id=reward_id).exists():
+                raise RewardUnavailable(f"Ricompensa {reward_id} già acquistata dallo studente {student.pk}.")
+            purchase = RewardPurchase.objects.create(
+                student=student,
+                reward=reward,
+                points_spent=reward.cost_points,
+                idempotency_key=idempotency_key or None,
+            )
+    except (RewardUnavailable, InsufficientPoints, IntegrityError):
+        # Richiesta ripetuta mentre la prima era in corso: ora l'acquisto con la stessa chiave è visibile
+        # (e ha reso la ricompensa non disponibile, o speso i punti)
+        previous = _purchase_for_key(student, idempotency_key, reward_id) if idempotency_key else None
+        if previous is None:
+            raise
+        return PurchaseOutcome(previous, replayed=True)
+
+    logger.info(f"Studente {student.pk}: acquistata la ricompensa {reward_id} per {reward.cost_points} punti.")
+    return PurchaseOutcome(purchase)
+
+
+def _purchase_for_key(student, idempotency_key: str, reward_id: int) -> RewardPurchase | None:
+    """ Acquisto già registrato con la chiave; IdempotencyKeyConflict se riguarda un'altra ricompensa. """
+    purchase = (
+        RewardPurchase.objects.select_related('reward__teacher')
+        .filter(student_id=student.pk, idempotency_key=idempotency_key).first()
+    )
+    if purchase is None:
+        return None
+    if purchase.reward_id != reward_id:
+        raise IdempotencyKeyConflict("Idempotency key already used for another reward.")
+    purchase.student = student
+    logger.info(f"Studente {student.pk}: acquisto {purchase.pk} ripetuto con la stessa chiave di idempotenza.")
+    return purchase
+
+
+def _lock_wallet(student_id: int, reward) -> None:
+    """ Addebita il costo (l'UPDATE del ledger blocca il wallet); le ricompense gratuite bloccano la riga esplicitamente. """
+    if reward.cost_points:
+        apply_entries(student_id, [(-reward.cost_points, f"Acquisto ricompensa: {reward.name}")])
+    elif not Wallet.objects.select_for_update().filter(pk=student_id).exists():
+        raise Wallet.DoesNotExist(f"Wallet non trovato per lo studente {student_id}.")
+
+
+def _limit_lock_wait() -> None:
+    """ Limita l'attesa dei blocchi per la transazione corrente (solo PostgreSQL). """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('lock_timeout', %s, true)", [f"{settings.REWARD_PURCHASE_LOCK_TIMEOUT_MS}ms"])
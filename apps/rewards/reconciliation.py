@@ -0,0 +1,146 @@
+"""
+Riconciliazione dei wallet: verifica che `Wallet.current_points` corrisponda al ledger
+(ultima WalletSnapshot più le PointTransaction successive, vedi apps.rewards.ledger).
+
+- I wallet vengono letti a intervalli di chiave primaria (`wallet_ranges`, paginazione per chiave):
+  per ogni intervallo una sola query calcola nel database saldo atteso e transazioni esaminate,
+  quindi la memoria usata dipende dalla dimensione del blocco, non dal numero di transazioni.
+- `reconcile_range` riporta le discrepanze; con `repair=True` riallinea il saldo al ledger,
+  solo se nel frattempo non è cambiato (UPDATE condizionato sul valore letto).
+- Con `full=True` le fotografie vengono ignorate e si sommano tutte le transazioni; vengono
+  verificate anche le WalletSnapshot stesse e, con `repair=True`, eliminate dalla prima non coerente
+  in poi, così che le verifiche incrementali successive non ripartano da una base errata.
+- Gli intervalli possono essere accodati come job ('rewards.reconcile_wallets') ed eseguiti in
+  parallelo da più processi `run_jobs` (vedi il comando `reconcile_wallets`).
+"""
+import logging
+import time
+from dataclasses import dataclass, field, asdict
+
+from django.db.models import Count, F, IntegerField, BigIntegerField, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .ledger import balance_changed
+from .models import Wallet, PointTransaction, WalletSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Discrepanze riportate per intervallo (i conteggi restano esatti)
+MAX_REPORTED_DRIFTS = 100
+
+
+@dataclass
+class Drift:
+    student_id: int
+    stored: int
+    expected: int
+    repaired: bool = False
+
+
+@dataclass
+class RangeResult:
+    wallets: int = 0
+    transactions: int = 0
+    drift_count: int = 0
+    repaired: int = 0
+    invalid_snapshots: int = 0  # Solo con full=True
+    snapshots_removed: int = 0
+    seconds: float = 0.0
+    drifts: list = field(default_factory=list)  # [Drift], al massimo MAX_REPORTED_DRIFTS
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def wallet_ranges(chunk_size: int):
+    """ Genera gli intervalli (after, upto] di chiavi dei wallet, `chunk_size` wallet ciascuno, senza caricarli tutti. """
+    after = 0
+    while True:
+        pks = list(Wallet.objects.filter(pk__gt=after).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield after, pks[-1]
+        after = pks[-1]
+
+
+def _ledger_queryset(after: int, upto: int, full: bool):
+    """ Wallet dell'intervallo con saldo atteso dal ledger e numero di transazioni esaminate. """
+    wallets = Wallet.objects.filter(pk__gt=after, pk__lte=upto).order_by('pk')
+    if full:
+        wallets = wallets.annotate(snapshot_balance=Value(0), snapshot_last_id=Value(0, output_field=BigIntegerField()))
+    else:
+        latest = WalletSnapshot.objects.filter(wallet=OuterRef('pk')).order_by('-last_transaction_id')
+        wallets = wallets.annotate(
+            snapshot_balance=Coalesce(Subquery(latest.values('balance')[:1], output_field=IntegerField()), Value(0)),
+            snapshot_last_id=Coalesce(Subquery(latest.values('last_transaction_id')[:1], output_field=BigIntegerField()), Value(0)),
+        )
+    later = (
+        PointTransaction.objects.filter(wallet=OuterRef('pk'), pk__gt=OuterRef('snapshot_last_id'))
+        .order_by().values('wallet')
+    )
+    return wallets.annotate(
+        ledger_sum=Coalesce(Subquery(later.annotate(s=Sum('points_change')).values('s'), output_field=IntegerField()), Value(0)),
+        ledger_count=Coalesce(Subquery(later.annotate(c=Count('id')).values('c'), output_field=IntegerField()), Value(0)),
+    ).values_list('pk', 'current_points', 'snapshot_balance', 'ledger_sum', 'ledger_count')
+
+
+def reconcile_range(after: int, upto: int, repair: bool = False, full: bool = False) -> RangeResult:
+    """ Confronta (ed eventualmente ripara) i wallet con chiave in (after, upto]. """
+    started = time.perf_counter()
+    result = RangeResult()
+    if full:
+        _check_snapshots(after, upto, repair, result)
+    for student_id, stored, snapshot_balance, ledger_sum, ledger_count in _ledger_queryset(after, upto, full):
+        result.wallets += 1
+        result.transactions += ledger_count
+        expected = snapshot_balance + ledger_sum
+        if stored == expected:
+            continue
+        drift = Drift(student_id=student_id, stored=stored, expected=expected)
+        result.drift_count += 1
+        if repair:
+            drift.repaired = _repair(drift)
+            result.repaired += drift.repaired
+        if len(result.drifts) < MAX_REPORTED_DRIFTS:
+            result.drifts.append(drift)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def _check_snapshots(after: int, upto: int, repair: bool, result: RangeResult) -> None:
+    """
+    Conta le WalletSnapshot dell'intervallo il cui saldo non corrisponde alla somma delle transazioni
+    fino a `last_transaction_id`; con `repair=True` elimina, per ogni wallet, tutte le fotografie
+    dalla prima non coerente in poi (le successive ne derivano).
+    """
+    ledger = (
+        PointTransaction.objects.filter(wallet=OuterRef('wallet'), pk__lte=OuterRef('last_transaction_id'))
+        .order_by().values('wallet').annotate(s=Sum('points_change')).values('s')
+    )
+    invalid = (
+        WalletSnapshot.objects.filter(wallet_id__gt=after, wallet_id__lte=upto)
+        .annotate(ledger_balance=Coalesce(Subquery(ledger, output_field=IntegerField()), Value(0)))
+        .exclude(balance=F('ledger_balance'))
+    )
+    first_invalid = invalid.order_by().values('wallet_id').annotate(first_id=Min('last_transaction_id'))
+    for row in first_invalid:
+        count = WalletSnapshot.objects.filter(wallet_id=row['wallet_id'], last_transaction_id__gte=row['first_id']).count()
+        result.invalid_snapshots += count
+        if repair:
+            WalletSnapshot.objects.filter(wallet_id=row['wallet_id'], last_transaction_id__gte=row['first_id']).delete()
+            result.snapshots_removed += count
+            logger.warning(f"Wallet {row['wallet_id']}: {count} fotografie non coerenti con il ledger eliminate.")
+
+
+def _repair(drift: Drift) -> bool:
+    """ Riallinea il saldo al ledger se non è cambiato dopo la lettura; un saldo atteso negativo non è riparabile. """
+    if drift.expected < 0:
+        logger.error(f"Wallet {drift.student_id}: saldo atteso negativo ({drift.expected}), riparazione manuale necessaria.")
+        return False
+    updated = Wallet.objects.filter(pk=drift.student_id, current_points=drift.stored).update(current_points=drift.expected)
+    if not updated:
+        logger.info(f"Wallet {drift.student_id} modificato durante la riconciliazione, riparazione rimandata.")
+        return False
+    balance_changed.send(sender=Wallet, student_id=drift.student_id, balance=drift.expected)
+    logger.warning(f"Wallet {drift.student_id}: saldo riallineato da {drift.stored} a {drift.expected} punti.")
+    return True
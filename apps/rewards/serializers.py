@@ -1,5 +1,6 @@
 import logging # Aggiunto import per logging
 from rest_framework import serializers
+from apps.common.serializers import SparseFieldsetMixin
 from .models import (
     Wallet, PointTransaction, RewardTemplate, Reward,
     RewardStudentSpecificAvailability, RewardPurchase
@@ -23,7 +24,7 @@ class WalletSerializer(serializers.ModelSerializer):
         read_only_fields = ['student', 'student_info', 'current_points'] # Il saldo è gestito internamente
 
 
-class PointTransactionSerializer(serializers.ModelSerializer):
+class PointTransactionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """ Serializer per visualizzare le transazioni di punti. """
     class Meta:
         model = PointTransaction
@@ -31,7 +32,7 @@ class PointTransactionSerializer(serializers.ModelSerializer):
         read_only_fields = fields # Le transazioni sono create internamente
 
 
-class RewardTemplateSerializer(serializers.ModelSerializer):
+class RewardTemplateSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """ Serializer per i RewardTemplate (globali e locali). """
     creator_username = serializers.CharField(source='creator.username', read_only=True)
     scope_display = serializers.CharField(source='get_scope_display', read_only=True)
@@ -1,9 +1,12 @@
 import logging
 import os
 from django.db import models # Import models for pre_save check
-from django.db.models.signals import post_delete, pre_save # Import pre_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, pre_delete, pre_save # Import pre_save
 from django.dispatch import receiver
-from .models import Badge
+from apps.common.cache import bump_version, invalidate_on_change
+from apps.users.models import Student, User
+from .models import Badge, Reward, RewardTemplate, RewardStudentSpecificAvailability, RewardPurchase
 
 logger = logging.getLogger(__name__)
 
@@ -51,4 +54,51 @@ def delete_old_badge_image_on_change(sender, instance, **kwargs):
             except Exception as e:
                 logger.error(f"Errore durante l'eliminazione della vecchia immagine {old_image_path} per Badge ID {instance.id}: {e}", exc_info=True)
         else:
-             logger.warning(f"Vecchio file immagine non trovato ({old_image_path}) per Badge ID {instance.id} durante il tentativo di eliminazione pre_save.")
\ No newline at end of file
+             logger.warning(f"Vecchio file immagine non trovato ({old_image_path}) per Badge ID {instance.id} durante il tentativo di eliminazione pre_save.")
+
+
+# --- Invalidazione della cache applicativa (namespace 'rewards') ---
+# L'indice dei badge (apps.rewards.badges) non ha scope: i badge invalidano tutto il namespace
+invalidate_on_change('rewards', Badge)
+
+# Ricompense e disponibilità specifiche invalidano solo il catalogo del docente proprietario (apps.rewards.catalogue)
+invalidate_on_change('rewards', Reward, scope_func=lambda instance: f"teacher:{instance.teacher_id}")
+invalidate_on_change('rewards', RewardStudentSpecificAvailability, scope_func=lambda instance: [
+    # Query sul solo teacher_id: nelle cancellazioni a cascata la ricompensa potrebbe non essere in memoria
+    f"teacher:{teacher_id}" for teacher_id in Reward.objects.filter(pk=instance.reward_id).values_list('teacher_id', flat=True)
+])
+
+# Catalogo dello shop: acquisti dello studente e scope del docente
+invalidate_on_change('rewards', RewardPurchase, scope_func=lambda instance: f"student:{instance.student_id}")
+# Dati di docente e studenti inclusi nelle ricompense serializzate del catalogo
+invalidate_on_change('rewards', Student, scope_func=lambda instance: f"teacher:{instance.teacher_id}")
+invalidate_on_change('rewards', User, scope_func=lambda instance: f"teacher:{instance.pk}", ignore_fields=('last_login',))
+
+
+@receiver(m2m_changed, sender=Reward.available_to_specific_students.through)
+def invalidate_catalogue_on_availability_change(sender, instance, action, **kwargs):
+    """ add()/remove()/set() sulla disponibilità specifica non inviano post_save sul modello intermedio. """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    scope = f"teacher:{instance.teacher_id}" # Reward (lato diretto) o Student (lato inverso)
+    bump_version('rewards', scope)
+    transaction.on_commit(lambda: bump_version('rewards', scope))
+
+
+@receiver(pre_delete, sender=RewardTemplate)
+def invalidate_catalogues_on_template_delete(sender, instance, **kwargs):
+    """
+    Il catalogo serializza solo l'id del template: basta invalidare alla cancellazione, che azzera
+    Reward.template (SET_NULL) con un update senza post_save. Gli altri salvataggi non toccano la cache.
+    """
+    scopes = [
+        f"teacher:{teacher_id}"
+        for teacher_id in Reward.objects.filter(template=instance).values_list('teacher_id', flat=True).distinct()
+    ]
+
+    def _bump():
+        for scope in scopes:
+            bump_version('rewards', scope)
+
+    _bump()
+    transaction.on_commit(_bump)
@@ -2,6 +2,7 @@ from django.test import TestCase
 from django.db.utils import IntegrityError
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.core.cache import cache
 from decimal import Decimal # Se usassimo DecimalField
 
 # Importa modelli e factory da altre app
@@ -11,7 +12,10 @@ from apps.users.models import UserRole, User # Importa User
 # Importa modelli e factory locali usando percorsi assoluti
 from apps.rewards.models import (
     Wallet, PointTransaction, RewardTemplate, Reward,
-    RewardStudentSpecificAvailability, RewardPurchase
+    RewardStudentSpecificAvailability, RewardPurchase, Badge, EarnedBadge
+)
+from apps.rewards.badges import (
+    FIRST_QUIZ_BADGE_NAME, award_badges, get_badge_index, QuizCompleted, PointsChanged, CorrectStreak
 )
 from apps.rewards.factories import (
     WalletFactory, PointTransactionFactory, RewardTemplateFactory,
@@ -136,6 +140,158 @@ class PointTransactionModelTests(TestCase):
         self.assertTrue("Added 25 points" in str(transaction))
 
 
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from apps.rewards.ledger import apply_entries, balance_at, InsufficientPoints
+from apps.rewards.models import WalletSnapshot
+from apps.users.models import StudentProgressSummary
+
+
+class WalletLedgerTests(TestCase):
+    """ Test per il ledger dei punti (apps.rewards.ledger). """
+
+    def setUp(self):
+        self.student = StudentFactory()
+
+    def test_batch_is_one_wallet_update_and_one_insert(self):
+        with CaptureQueriesContext(connection) as captured:
+            balance = apply_entries(self.student.pk, [(10, "Quiz"), (0, "Ignorata"), (25, "Percorso")])
+        self.assertEqual(balance, 35)
+        # Istruzioni sulla tabella del wallet (escluse le subquery del riepilogo progressi)
+        wallet_sql = [q['sql'] for q in captured.captured_queries
+                      if q['sql'].startswith(('UPDATE "rewards_wallet"', 'SELECT')) and '"rewards_wallet"' in q['sql']]
+        self.assertEqual(len(wallet_sql), 1) # Solo l'UPDATE ... RETURNING, nessuna lettura del wallet
+        self.assertTrue(wallet_sql[0].startswith('UPDATE'))
+        self.assertEqual(sum(1 for q in captured.captured_queries if q['sql'].startswith('INSERT INTO "rewards_pointtransaction"')), 1)
+
+        wallet = Wallet.objects.get(pk=self.student.pk)
+        self.assertEqual((wallet.current_points, wallet.transaction_count), (35, 2))
+        self.assertEqual(sorted(wallet.transactions.values_list('points_change', flat=True)), [10, 25])
+        self.assertEqual(StudentProgressSummary.objects.get(student=self.student).total_points, 35) # Segnale balance_changed
+
+    def test_insufficient_points_change_nothing(self):
+        apply_entries(self.student.pk, [(20, "Carico")])
+        with self.assertRaises(InsufficientPoints):
+            apply_entries(self.student.pk, [(5, "Bonus"), (-30, "Acquisto")])
+        wallet = Wallet.objects.get(pk=self.student.pk)
+        self.assertEqual((wallet.current_points, wallet.transactions.count()), (20, 1))
+        self.assertTrue(issubclass(InsufficientPoints, ValueError)) # Compatibile con subtract_points
+
+    @override_settings(WALLET_SNAPSHOT_INTERVAL=3)
+    def test_snapshots_and_balance_history(self):
+        for points in (10, 20, -5):
+            apply_entries(self.student.pk, [(points, "Movimento")])
+        snapshot = WalletSnapshot.objects.get(wallet_id=self.student.pk)
+        self.assertEqual((snapshot.balance, snapshot.transaction_count), (25, 3))
+        self.assertEqual(snapshot.last_transaction_id, PointTransaction.objects.order_by('-id').values_list('id', flat=True)[0])
+
+        before = timezone.now()
+        apply_entries(self.student.pk, [(7, "Dopo la fotografia"), (1, "Altro")])
+        self.assertEqual(WalletSnapshot.objects.filter(wallet_id=self.student.pk).count(), 1) # Prossima al 6° movimento
+        self.assertEqual(balance_at(self.student.pk), 33)
+        self.assertEqual(balance_at(self.student.pk, at=before), 25)
+
+    @override_settings(WALLET_SNAPSHOT_INTERVAL=2)
+    def test_snapshot_uses_ledger_balance_when_wallet_drifted(self):
+        apply_entries(self.student.pk, [(10, "Carico")])
+        Wallet.objects.filter(pk=self.student.pk).update(current_points=999) # Modifica fuori dal ledger
+        self.assertEqual(apply_entries(self.student.pk, [(5, "Bonus")]), 1004)
+        snapshot = WalletSnapshot.objects.get(wallet_id=self.student.pk)
+        self.assertEqual(snapshot.balance, 15)
+        self.assertEqual(balance_at(self.student.pk), 15)
+
+
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from apps.common.jobs import run_pending
+from django.db.models import F
+from apps.rewards.reconciliation import reconcile_range, wallet_ranges
+
+
+class WalletReconciliationTests(TestCase):
+    """ Test per la riconciliazione dei wallet con il ledger (comando reconcile_wallets). """
+
+    def setUp(self):
+        self.students = [StudentFactory() for _ in range(3)]
+        for student in self.students:
+            apply_entries(student.pk, [(50, "Carico"), (-10, "Acquisto")])
+        self.drifted = self.students[1]
+        Wallet.objects.filter(pk=self.drifted.pk).update(current_points=99) # Modifica fuori dal ledger
+
+    def test_dry_run_reports_drift_without_changes(self):
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconcile_wallets', '--chunk-size', '2', stdout=out)
+        self.assertIn(f"Wallet {self.drifted.pk}: saldo 99, ledger 40", out.getvalue())
+        self.assertIn("3 wallet e 6 transazioni verificati", out.getvalue())
+        self.assertEqual(Wallet.objects.get(pk=self.drifted.pk).current_points, 99)
+
+    def test_repair_realigns_balance_and_summary(self):
+        call_command('reconcile_wallets', '--repair', stdout=StringIO())
+        self.assertEqual(Wallet.objects.get(pk=self.drifted.pk).current_points, 40)
+        self.assertEqual(StudentProgressSummary.objects.get(student=self.drifted).total_points, 40)
+        call_command('reconcile_wallets', stdout=StringIO()) # Nessuna discrepanza residua
+
+    def test_ranges_are_keyset_chunks(self):
+        ranges = list(wallet_ranges(2))
+        self.assertEqual(len(ranges), 2)
+        self.assertEqual(sum(reconcile_range(after, upto).wallets for after, upto in ranges), 3)
+
+    @override_settings(WALLET_SNAPSHOT_INTERVAL=2)
+    def test_full_mode_ignores_snapshots(self):
+        student = StudentFactory()
+        apply_entries(student.pk, [(30, "Carico"), (5, "Bonus")]) # Fotografia con saldo 35
+        WalletSnapshot.objects.filter(wallet_id=student.pk).update(balance=1000)
+        Wallet.objects.filter(pk=student.pk).update(current_points=1000)
+        after = student.pk - 1
+        self.assertEqual(reconcile_range(after, student.pk).drift_count, 0) # Coerente con la fotografia
+        self.assertEqual(reconcile_range(after, student.pk, full=True).drifts[0].expected, 35)
+
+    @override_settings(WALLET_SNAPSHOT_INTERVAL=2)
+    def test_snapshot_taken_while_drifted_does_not_hide_drift(self):
+        student = StudentFactory()
+        apply_entries(student.pk, [(10, "Carico")])
+        Wallet.objects.filter(pk=student.pk).update(current_points=999) # Modifica fuori dal ledger
+        apply_entries(student.pk, [(5, "Bonus")]) # Fotografia presa con il wallet non coerente
+        after = student.pk - 1
+        self.assertEqual(reconcile_range(after, student.pk).drifts[0].expected, 15)
+
+        reconcile_range(after, student.pk, repair=True)
+        self.assertEqual(Wallet.objects.get(pk=student.pk).current_points, 15)
+        self.assertEqual(reconcile_range(after, student.pk).drift_count, 0)
+
+    @override_settings(WALLET_SNAPSHOT_INTERVAL=2)
+    def test_full_repair_removes_inconsistent_snapshots(self):
+        student = StudentFactory()
+        apply_entries(student.pk, [(10, "Carico")])
+        apply_entries(student.pk, [(5, "Bonus")]) # Fotografia con saldo 15
+        apply_entries(student.pk, [(1, "Extra"), (1, "Extra")]) # Fotografia con saldo 17
+        # Fotografie salvate con un saldo non coerente (es. prima della correzione del ledger)
+        WalletSnapshot.objects.filter(wallet_id=student.pk).update(balance=F('balance') + 989)
+        Wallet.objects.filter(pk=student.pk).update(current_points=1006)
+        after = student.pk - 1
+
+        result = reconcile_range(after, student.pk, repair=True, full=True)
+        self.assertEqual((result.repaired, result.snapshots_removed), (1, 2))
+        self.assertFalse(WalletSnapshot.objects.filter(wallet_id=student.pk).exists())
+        # La verifica incrementale successiva non riporta il saldo alla fotografia errata
+        reconcile_range(after, student.pk, repair=True)
+        self.assertEqual(Wallet.objects.get(pk=student.pk).current_points, 17)
+
+    def test_enqueued_chunks_run_as_jobs(self):
+        out = StringIO()
+        call_command('reconcile_wallets', '--enqueue', '--repair', '--chunk-size', '1', stdout=out)
+        run_id = out.getvalue().split()[1].rstrip(':')
+        self.assertEqual(run_pending(), 3)
+        summary = StringIO()
+        call_command('reconcile_wallets', '--summary', run_id, stdout=summary)
+        self.assertIn("Job: DONE 3", summary.getvalue())
+        self.assertIn("1 wallet riallineati", summary.getvalue())
+        self.assertEqual(Wallet.objects.get(pk=self.drifted.pk).current_points, 40)
+
+
 class RewardTemplateModelTests(TestCase):
 
     def test_create_local_template(self):
@@ -804,6 +960,177 @@ class StudentShopAPITests(APITestCase):
         self.client.credentials() # Pulisci token
 
 
+class RewardCatalogueTests(APITestCase):
+    """ Test per il catalogo in cache dello shop (apps.rewards.catalogue). """
+    def setUp(self):
+        self.teacher = UserFactory(role=UserRole.TEACHER)
+        self.student = StudentFactory(teacher=self.teacher)
+        self.other_student = StudentFactory(teacher=self.teacher)
+        self.student.wallet.add_points(500, "Initial setup points")
+        self.reward_all = RewardFactory(teacher=self.teacher, name="A Tutti", cost_points=100)
+        self.reward_spec = RewardFactory(
+            teacher=self.teacher, name="B Specifica", cost_points=50,
+            availability_type=Reward.AvailabilityType.SPECIFIC_STUDENTS,
+        )
+        self.shop_list_url = reverse('student-shop-list')
+        login = self.client.post(reverse('student-login'), {'student_code': self.student.student_code, 'pin': '1234'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {login.data['access']}")
+
+    def _shop_names(self):
+        return [r['name'] for r in self.client.get(self.shop_list_url).data]
+
+    def test_warm_listing_needs_no_queries(self):
+        self.assertEqual(self._shop_names(), ["A Tutti"])
+        with self.assertNumQueries(0):
+            response = self.client.get(self.shop_list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_signals_invalidate_catalogue(self):
+        self.assertEqual(self._shop_names(), ["A Tutti"])
+        self.reward_spec.available_to_specific_students.add(self.student) # m2m_changed
+        self.assertEqual(self._shop_names(), ["A Tutti", "B Specifica"])
+        self.reward_all.is_active = False
+        self.reward_all.save()
+        self.assertEqual(self._shop_names(), ["B Specifica"])
+        self.reward_spec.available_to_specific_students.remove(self.student)
+        self.assertEqual(self._shop_names(), [])
+
+    def test_other_teacher_changes_keep_catalogue_and_badge_index(self):
+        other_teacher = UserFactory(role=UserRole.TEACHER)
+        other_student = StudentFactory(teacher=other_teacher)
+        other_reward = RewardFactory(teacher=other_teacher, template=RewardTemplateFactory(creator=other_teacher))
+        self.assertEqual(self._shop_names(), ["A Tutti"])
+        get_badge_index()
+        other_reward.cost_points = 10
+        other_reward.save()
+        RewardStudentSpecificAvailability.objects.create(reward=other_reward, student=other_student)
+        other_reward.template.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._shop_names(), ["A Tutti"])
+            get_badge_index()
+        RewardTemplateFactory(creator=self.teacher).delete() # Senza ricompense: nessuno scope da invalidare
+        self.reward_all.name = "A Tutti (modificata)"
+        self.reward_all.save()
+        self.assertEqual(self._shop_names(), ["A Tutti (modificata)"])
+
+    def test_purchase_checks_catalogue_without_reading_rewards(self):
+        self.assertEqual(self._shop_names(), ["A Tutti"])
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse('student-shop-purchase', kwargs={'pk': self.reward_all.pk}))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['reward_info']['name'], "A Tutti")
+        self.assertFalse([q['sql'] for q in captured.captured_queries if q['sql'].startswith('SELECT') and '"rewards_reward"' in q['sql']])
+        self.assertEqual(self._shop_names(), []) # Già acquistata: segnale su RewardPurchase
+        again = self.client.post(reverse('student-shop-purchase', kwargs={'pk': self.reward_all.pk}))
+        self.assertEqual(again.status_code, status.HTTP_404_NOT_FOUND)
+
+
+import threading
+import time
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.test import TransactionTestCase
+from apps.rewards.purchases import purchase_reward
+
+class RewardPurchaseIdempotencyTests(APITestCase):
+    """ Test per gli acquisti ripetuti con header Idempotency-Key (apps.rewards.purchases). """
+    def setUp(self):
+        self.teacher = UserFactory(role=UserRole.TEACHER)
+        self.student = StudentFactory(teacher=self.teacher)
+        self.student.wallet.add_points(300, "Initial setup points")
+        self.reward = RewardFactory(teacher=self.teacher, name="Penna", cost_points=100)
+        self.other_reward = RewardFactory(teacher=self.teacher, name="Quaderno", cost_points=50)
+        login = self.client.post(reverse('student-login'), {'student_code': self.student.student_code, 'pin': '1234'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {login.data['access']}")
+
+    def _purchase(self, reward, key):
+        return self.client.post(reverse('student-shop-purchase', kwargs={'pk': reward.pk}), HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_with_same_key_replays_purchase(self):
+        first = self._purchase(self.reward, 'acquisto-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', first)
+        retry = self._purchase(self.reward, 'acquisto-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(RewardPurchase.objects.filter(student=self.student).count(), 1)
+        self.assertEqual(Wallet.objects.get(pk=self.student.pk).current_points, 200) # Un solo addebito
+        # Senza chiave (o con una nuova) la ricompensa già acquistata non è più disponibile
+        self.assertEqual(self._purchase(self.reward, 'acquisto-2').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_same_key_for_other_reward_conflicts(self):
+        self.assertEqual(self._purchase(self.reward, 'acquisto-1').status_code, status.HTTP_201_CREATED)
+        response = self._purchase(self.other_reward, 'acquisto-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(RewardPurchase.objects.filter(reward=self.other_reward).exists())
+        self.assertEqual(Wallet.objects.get(pk=self.student.pk).current_points, 200)
+
+
+class RewardPurchaseConcurrencyTests(TransactionTestCase):
+    """ Acquisti concorrenti sullo stesso wallet da più thread (una connessione ciascuno). """
+    THREADS = 8
+    MAX_ATTEMPTS = 50
+
+    def test_concurrent_purchases_keep_wallet_consistent(self):
+        teacher = UserFactory(role=UserRole.TEACHER)
+        student = StudentFactory(teacher=teacher)
+        student.wallet.add_points(250, "Initial setup points")
+        rewards = [RewardFactory(teacher=teacher, cost_points=10) for _ in range(40)] # 400 punti: non bastano per tutte
+        # Ogni ricompensa viene inviata da due thread con la stessa chiave (doppio invio del client)
+        submissions = [(reward.pk, f"acquisto-{reward.pk}") for reward in rewards] * 2
+        outcomes, failures, latencies = [], [], []
+        start = threading.Barrier(self.THREADS)
+
+        def worker(batch):
+            try:
+                start.wait()
+                for reward_id, key in batch:
+                    # Come un client dopo un 503: stessa richiesta, stessa chiave
+                    for _attempt in range(self.MAX_ATTEMPTS):
+                        began = time.perf_counter()
+                        try:
+                            outcomes.append((key, purchase_reward(student, reward_id, idempotency_key=key)))
+                        except OperationalError:
+                            time.sleep(0.005)
+                            continue
+                        except ValueError: # Punti insufficienti
+                            failures.append(key)
+                        finally:
+                            latencies.append(time.perf_counter() - began)
+                        break
+                    else:
+                        failures.append(f"{key}: wallet sempre bloccato")
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(submissions[i::self.THREADS],)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertFalse([failure for failure in failures if 'bloccato' in failure])
+        purchases = RewardPurchase.objects.filter(student=student)
+        self.assertEqual(purchases.count(), 25) # 250 punti / 10
+        self.assertEqual(len(set(purchases.values_list('reward_id', flat=True))), 25)
+        # Nessun aggiornamento perso: saldo e ledger coincidono con gli acquisti registrati
+        wallet = Wallet.objects.get(pk=student.pk)
+        self.assertEqual(wallet.current_points, 0)
+        self.assertEqual(wallet.transactions.count(), 1 + 25)
+        self.assertEqual(balance_at(student.pk), 0)
+        # Gli invii con la stessa chiave restituiscono lo stesso acquisto
+        by_key = {}
+        for key, outcome in outcomes:
+            by_key.setdefault(key, set()).add(outcome.purchase.pk)
+        self.assertTrue(all(len(ids) == 1 for ids in by_key.values()))
+        self.assertEqual(len(by_key), 25)
+        # Attesa dei blocchi limitata da lock_timeout, impostato solo su PostgreSQL (su SQLite vale
+        # il busy timeout della connessione e i tempi dipendono dal carico della macchina)
+        if connection.vendor == 'postgresql':
+            self.assertLess(max(latencies), settings.REWARD_PURCHASE_LOCK_TIMEOUT_MS / 1000 + 1)
+
+
 # Importa i serializer necessari
 from .serializers import WalletSerializer, PointTransactionSerializer
 
@@ -1059,3 +1386,56 @@ class TeacherRewardDeliveryAPITests(APITestCase):
         # Ci aspettiamo 403 perché IsTeacherUser blocca l'accesso
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.client.credentials() # Pulisci token
+
+
+from unittest import mock
+
+class BadgeRuleEngineTests(TestCase):
+    """ Test per il motore di regole dei badge (apps.rewards.badges). """
+
+    def setUp(self):
+        cache.clear()
+        self.student = StudentFactory()
+
+    def _badge(self, name, trigger_type, condition):
+        return Badge.objects.create(name=name, description=name, trigger_type=trigger_type, trigger_condition=condition)
+
+    def test_index_groups_rules_and_awards_in_bulk(self):
+        any_quiz = self._badge('Quiz qualsiasi', Badge.TriggerType.QUIZ_COMPLETED, {})
+        quiz_7 = self._badge('Quiz 7 eccellente', Badge.TriggerType.QUIZ_COMPLETED, {'quiz_id': 7, 'min_score_percent': 90})
+        self._badge('Quiz 8', Badge.TriggerType.QUIZ_COMPLETED, {'quiz_id': 8})
+        points = self._badge('100 punti', Badge.TriggerType.POINTS_THRESHOLD, {'points': 100})
+        self._badge('1000 punti', Badge.TriggerType.POINTS_THRESHOLD, {'points': 1000})
+        streak = self._badge('Serie da 3', Badge.TriggerType.CORRECT_STREAK, {'streak_length': 3})
+
+        events = [QuizCompleted(quiz_id=7, score=95.0), PointsChanged(current_points=150), CorrectStreak(streak_length=4)]
+        with self.assertNumQueries(4): # Indice + badge posseduti + bulk_create + rilettura
+            earned = award_badges(self.student, events)
+
+        self.assertCountEqual([e.badge for e in earned], [any_quiz, quiz_7, points, streak])
+        # Una seconda valutazione non riassegna nulla
+        self.assertEqual(award_badges(self.student, events), [])
+        self.assertEqual(EarnedBadge.objects.filter(student=self.student).count(), 4)
+
+    def test_index_is_cached_and_invalidated_on_badge_save(self):
+        get_badge_index()
+        with self.assertNumQueries(0):
+            get_badge_index()
+        badge = self._badge('Percorso 3', Badge.TriggerType.PATHWAY_COMPLETED, {'pathway_id': 3})
+        self.assertEqual([r.badge_id for r in get_badge_index().pathway_rules_by_id[3]], [badge.id])
+
+        badge.is_active = False
+        badge.save()
+        self.assertNotIn(3, get_badge_index().pathway_rules_by_id)
+
+    @override_settings(BADGE_INDEX_CACHE_TIMEOUT=60)
+    def test_index_is_cached_with_configured_timeout(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            get_badge_index()
+        self.assertEqual(cache_set.call_args.args[2], 60)
+
+    def test_first_quiz_badge_only_on_first_completion(self):
+        first = self._badge(FIRST_QUIZ_BADGE_NAME, Badge.TriggerType.QUIZ_COMPLETED, {'quiz_id': 999})
+        self.assertEqual(award_badges(self.student, [QuizCompleted(quiz_id=1, score=100.0, first_ever=False)]), [])
+        earned = award_badges(self.student, [QuizCompleted(quiz_id=1, score=100.0, first_ever=True)])
+        self.assertEqual([e.badge for e in earned], [first])
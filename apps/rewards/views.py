@@ -1,6 +1,6 @@
 import logging
 from django.shortcuts import get_object_or_404
-from django.db import transaction, models
+from django.db import OperationalError, transaction, models
 from django.db.models import ProtectedError
 from django.http import Http404
 from django.utils import timezone
@@ -9,6 +9,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied, ValidationError, NotFound
 
+from apps.common.pagination import KeysetCursorPagination
 from apps.users.permissions import IsAdminUser, IsTeacherUser, IsStudent, IsStudentAuthenticated
 from apps.users.models import User, Student, UserRole # Import User
 from .models import (
@@ -20,6 +21,8 @@ from .serializers import (
     RewardSerializer, RewardPurchaseSerializer, StudentWalletDashboardSerializer,
     BadgeSerializer, EarnedBadgeSerializer # Importa serializer Badge
 )
+from .catalogue import get_reward_catalogue, get_purchased_reward_ids
+from .purchases import IDEMPOTENCY_KEY_MAX_LENGTH, IdempotencyKeyConflict, RewardUnavailable, purchase_reward
 from .permissions import (
     IsAdminOrReadOnly, IsRewardTemplateOwnerOrAdmin, IsRewardOwnerOrAdmin,
     IsStudentOwnerForPurchase, IsTeacherOfStudentForPurchase
@@ -36,6 +39,7 @@ class RewardTemplateViewSet(viewsets.ModelViewSet):
     """
     serializer_class = RewardTemplateSerializer
     permission_classes = [permissions.IsAuthenticated, IsRewardTemplateOwnerOrAdmin]
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         """
@@ -45,11 +49,11 @@ class RewardTemplateViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if isinstance(user, User) and user.is_admin:
-            return RewardTemplate.objects.all()
+            return RewardTemplate.objects.all().select_related('creator')
         elif isinstance(user, User) and user.is_teacher:
             return RewardTemplate.objects.filter(
                 models.Q(scope=RewardTemplate.RewardScope.GLOBAL) | models.Q(creator=user, scope=RewardTemplate.RewardScope.LOCAL)
-            )
+            ).select_related('creator')
         return RewardTemplate.objects.none()
 
     def perform_create(self, serializer):
@@ -86,9 +90,9 @@ class RewardViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if user.is_admin:
-            return Reward.objects.all().select_related('teacher')
+            return Reward.objects.all().select_related('teacher').prefetch_related('available_to_specific_students__teacher')
         elif user.is_teacher:
-            return Reward.objects.filter(teacher=user).select_related('teacher')
+            return Reward.objects.filter(teacher=user).select_related('teacher').prefetch_related('available_to_specific_students__teacher')
         return Reward.objects.none()
 
     def get_permissions(self):
@@ -168,69 +172,93 @@ class RewardViewSet(viewsets.ModelViewSet):
 class StudentShopViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Endpoint ReadOnly per lo Studente per visualizzare le ricompense disponibili.
+    Elenco e disponibilità vengono dal catalogo in cache del docente (apps.rewards.catalogue).
     """
     serializer_class = RewardSerializer
     permission_classes = [IsStudentAuthenticated]
+    token_student_principal = True # Servono solo id e docente dello studente (vedi StudentJWTAuthentication)
 
     def get_queryset(self):
         """
         Returns the queryset of rewards available to the authenticated student.
+        Le viste dello shop usano il catalogo in cache; il queryset resta per schema e introspezione.
         """
         student = self.request.student
         if not student:
              return Reward.objects.none()
-        teacher = student.teacher
+        available_ids = self._catalogue().available_ids(student.pk, get_purchased_reward_ids(student.pk))
+        return Reward.objects.filter(pk__in=available_ids)
 
-        purchased_reward_ids = RewardPurchase.objects.filter(student=student).values_list('reward_id', flat=True)
+    def _catalogue(self):
+        return get_reward_catalogue(self.request.student.teacher_id)
 
-        return Reward.objects.filter(
-            teacher=teacher,
-            is_active=True
-        ).filter(
-            models.Q(availability_type=Reward.AvailabilityType.ALL_STUDENTS) |
-            models.Q(availability_type=Reward.AvailabilityType.SPECIFIC_STUDENTS, available_to_specific_students=student)
-        ).exclude(
-            id__in=purchased_reward_ids
-        ).distinct()
+    def _available_reward(self, pk):
+        """ Ricompensa del catalogo disponibile per lo studente (non ancora acquistata), altrimenti 404. """
+        student = self.request.student
+        catalogue = self._catalogue()
+        try:
+            reward_id = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound()
+        if not catalogue.is_available(reward_id, student.pk, get_purchased_reward_ids(student.pk)):
+            raise NotFound()
+        return catalogue, reward_id
+
+    def list(self, request, *args, **kwargs):
+        catalogue = self._catalogue()
+        available_ids = catalogue.available_ids(request.student.pk, get_purchased_reward_ids(request.student.pk))
+        return Response([catalogue.entries[reward_id] for reward_id in available_ids])
+
+    def retrieve(self, request, *args, **kwargs):
+        catalogue, reward_id = self._available_reward(kwargs.get('pk'))
+        return Response(catalogue.entries[reward_id])
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsStudent])
     def purchase(self, request, pk=None):
         """
         Allows the authenticated student to purchase a specific reward.
+        Disponibilità, addebito e acquisto sono un'unica transazione sul wallet bloccato
+        (apps.rewards.purchases). Con l'header Idempotency-Key un nuovo invio della stessa richiesta
+        restituisce l'acquisto già registrato (header Idempotent-Replayed) senza addebitare di nuovo.
         """
-        reward = self.get_object()
         student = request.student
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip() or None
+        if idempotency_key and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {'detail': f"Idempotency-Key troppo lunga (massimo {IDEMPOTENCY_KEY_MAX_LENGTH} caratteri)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            reward_id = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound()
 
         try:
-            wallet = student.wallet
+            outcome = purchase_reward(student, reward_id, idempotency_key=idempotency_key)
+        except RewardUnavailable:
+            raise NotFound()
+        except IdempotencyKeyConflict as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
         except Wallet.DoesNotExist:
              return Response({'detail': 'Portafoglio studente non trovato.'}, status=status.HTTP_404_NOT_FOUND)
-
-        if not self.get_queryset().filter(pk=reward.pk).exists():
-             return Response({'detail': 'Ricompensa non disponibile per questo studente.'}, status=status.HTTP_403_FORBIDDEN)
-
-        if not reward.is_active:
-             return Response({'detail': 'Ricompensa non più attiva.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        try: # Blocco try per la transazione atomica
-            with transaction.atomic():
-                wallet = Wallet.objects.select_for_update().get(student=student)
-                wallet.subtract_points(reward.cost_points, f"Acquisto ricompensa: {reward.name}")
-
-                purchase = RewardPurchase.objects.create(
-                    student=student,
-                    reward=reward,
-                    points_spent=reward.cost_points,
-                )
-            serializer = RewardPurchaseSerializer(purchase)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        except ValueError as e: # Errore da subtract_points (es. punti insufficienti)
-            logger.info(f"Errore di validazione durante l'acquisto della ricompensa {reward.id} da parte dello studente {student.id}: {e}")
+        except OperationalError:
+            # Wallet bloccato oltre REWARD_PURCHASE_LOCK_TIMEOUT_MS: nulla è stato addebitato
+            logger.warning(f"Acquisto della ricompensa {reward_id} da parte dello studente {student.id}: wallet occupato.")
+            return Response(
+                {'detail': 'Portafoglio occupato, riprovare.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'},
+            )
+        except ValueError as e: # Errore dal ledger (es. punti insufficienti)
+            logger.info(f"Errore di validazione durante l'acquisto della ricompensa {reward_id} da parte dello studente {student.id}: {e}")
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            logger.exception(f"Errore imprevisto durante l'acquisto della ricompensa {reward.id} da parte dello studente {student.id}")
+            logger.exception(f"Errore imprevisto durante l'acquisto della ricompensa {reward_id} da parte dello studente {student.id}")
             return Response({'detail': 'Errore durante l\'acquisto.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        serializer = RewardPurchaseSerializer(outcome.purchase)
+        headers = {'Idempotent-Replayed': 'true'} if outcome.replayed else None
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
 
 # --- ViewSets per Gamification (Badge) ---
 
@@ -255,6 +283,7 @@ class StudentEarnedBadgeViewSet(mixins.ListModelMixin,
     """
     serializer_class = EarnedBadgeSerializer
     permission_classes = [IsStudentAuthenticated]
+    token_student_principal = True # Serve solo l'id dello studente
 
     def get_queryset(self):
         """ Filtra i badge guadagnati per lo studente corrente. """
@@ -280,25 +309,27 @@ class StudentWalletViewSet(viewsets.ReadOnlyModelViewSet):
     """ Endpoint ReadOnly per lo Studente per vedere il proprio wallet e transazioni. """
     serializer_class = WalletSerializer
     permission_classes = [IsStudentAuthenticated]
+    token_student_principal = True # Serve solo l'id dello studente
 
     def get_queryset(self):
         """ Returns the Wallet belonging to the authenticated student. """
         student = self.request.student
         if not student:
              return Wallet.objects.none()
-        return Wallet.objects.filter(student=student)
+        # student_info (StudentSerializer) legge studente e docente: nella stessa query
+        return Wallet.objects.filter(student=student).select_related('student__teacher')
 
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get'], pagination_class=KeysetCursorPagination)
     def transactions(self, request, pk=None):
-        """ Lists the point transactions for the student's wallet. """
+        """ Lists the point transactions for the student's wallet (pagine a cursore su '-timestamp'). """
         wallet = self.get_object()
         transactions = wallet.transactions.all()
         page = self.paginate_queryset(transactions)
         if page is not None:
-            serializer = PointTransactionSerializer(page, many=True)
+            serializer = PointTransactionSerializer(page, many=True, context=self.get_serializer_context())
             return self.get_paginated_response(serializer.data)
 
-        serializer = PointTransactionSerializer(transactions, many=True)
+        serializer = PointTransactionSerializer(transactions, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
 
 
@@ -311,7 +342,9 @@ class StudentPurchasesViewSet(viewsets.ReadOnlyModelViewSet):
         student = self.request.student
         if not student:
              return RewardPurchase.objects.none()
-        return RewardPurchase.objects.filter(student=student).select_related('reward')
+        return RewardPurchase.objects.filter(student=student).select_related(
+            'student__teacher', 'reward__teacher', 'delivered_by'
+        ).prefetch_related('reward__available_to_specific_students__teacher')
 
 
 # --- ViewSet specifici per Docenti ---
@@ -327,7 +360,9 @@ class TeacherRewardDeliveryViewSet(viewsets.GenericViewSet):
         return RewardPurchase.objects.filter(
             student__teacher=user,
             status=RewardPurchase.PurchaseStatus.PURCHASED
-        ).select_related('student', 'reward')
+        ).select_related('student__teacher', 'reward__teacher', 'delivered_by').prefetch_related(
+            'reward__available_to_specific_students__teacher'
+        )
 
     @action(detail=False, methods=['get'], url_path='pending-delivery', permission_classes=[permissions.IsAuthenticated, IsTeacherUser])
     def list_pending(self, request):
@@ -1,8 +1,102 @@
+import logging
+
+from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+from apps.common.cache import get_or_set
 from .models import Student
 
-class StudentJWTAuthentication(JWTAuthentication):
+logger = logging.getLogger(__name__)
+
+
+def get_student_principal(student_id: int) -> Student | None:
+    """
+    Studente attivo associato al token, letto dalla cache condivisa (namespace 'users',
+    scope 'student:<id>'). Il salvataggio o l'eliminazione dello studente incrementano la
+    versione dello scope (apps.users.signals), quindi una disattivazione ha effetto subito;
+    STUDENT_PRINCIPAL_CACHE_TIMEOUT limita la durata per le modifiche fatte senza segnali
+    (es. queryset.update()). Restituisce None se lo studente non esiste o non è attivo.
+    """
+    return get_or_set(
+        'users', 'principal', scope=f"student:{student_id}",
+        compute=lambda: Student.objects.filter(pk=student_id, is_active=True).first(),
+        timeout=settings.STUDENT_PRINCIPAL_CACHE_TIMEOUT,
+    )
+
+
+def get_auth_state(student_id: int) -> tuple[int, int] | None:
+    """
+    Versione di autenticazione e docente correnti dello studente (dalla cache condivisa, stesso
+    scope del principal); None se lo studente non esiste o non è attivo.
+    """
+    return get_or_set(
+        'users', 'auth-state', scope=f"student:{student_id}",
+        compute=lambda: Student.objects.filter(pk=student_id, is_active=True).values_list('auth_version', 'teacher_id').first(),
+        timeout=settings.STUDENT_PRINCIPAL_CACHE_TIMEOUT,
+    )
+
+
+def add_student_claims(token, student: Student) -> None:
+    """ Claim dei token studente: identità, docente e versione di autenticazione (per la revoca). """
+    token['student_id'] = student.pk
+    token['student_code'] = student.student_code
+    token['is_student'] = True # Claim custom per identificarlo facilmente
+    token['teacher_id'] = student.teacher_id
+    token['auth_version'] = student.auth_version
+
+
+def build_token_principal(validated_token) -> Student | None:
+    """
+    Principal "leggero": uno Student con i soli campi id, teacher_id, is_active e auth_version,
+    senza leggere la riga. Versione di autenticazione e docente vengono dalla cache (non dal
+    token, che resterebbe con il docente precedente dopo un trasferimento dello studente); gli
+    altri campi vengono caricati al primo accesso (vedi Student.refresh_from_db).
+    Restituisce None se lo studente è stato disattivato o i suoi token revocati.
+    """
+    student_id = validated_token['student_id']
+    state = get_auth_state(student_id)
+    if state is None or state[0] != validated_token['auth_version']:
+        return None
+    auth_version, teacher_id = state
+    student = Student.from_db(
+        Student.objects.db, ['id', 'teacher_id', 'is_active', 'auth_version'],
+        [student_id, teacher_id, True, auth_version],
+    )
+    student._deferred_loader = lambda: get_student_principal(student_id)
+    return student
+
+
+class SharedTokenMixin:
+    """
+    Decodifica e valida il token una sola volta per richiesta: il risultato (o l'errore)
+    viene salvato sulla richiesta e riusato dalle altre classi di autenticazione.
+    """
+
+    def get_request_token(self, request):
+        """ Restituisce (raw_token, validated_token) oppure None se manca l'header; solleva InvalidToken. """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        cached = getattr(request, '_validated_jwt', None)
+        if cached is not None and cached[0] == raw_token:
+            result = cached[1]
+        else:
+            try:
+                result = self.get_validated_token(raw_token)
+            except InvalidToken as exc:
+                result = exc
+            request._validated_jwt = (raw_token, result)
+        if isinstance(result, InvalidToken):
+            raise result
+        return raw_token, result
+
+
+class StudentJWTAuthentication(SharedTokenMixin, JWTAuthentication):
     """
     Classe di autenticazione JWT personalizzata per gli studenti.
     Verifica la presenza del claim 'is_student' e 'student_id' nel token
@@ -10,59 +104,46 @@ class StudentJWTAuthentication(JWTAuthentication):
     """
 
     def authenticate(self, request):
-       # print(f"[StudentAuth DEBUG] authenticate() called. Request path: {request.path}")
-       header = self.get_header(request)
-       if header is None:
-           # print("[StudentAuth DEBUG] No Authorization header found.")
-           return None # Nessun header, passa al prossimo backend
-
-       raw_token = self.get_raw_token(header)
-       if raw_token is None:
-           # print("[StudentAuth DEBUG] Could not extract raw token from header.")
-           return None # Formato header non valido, passa al prossimo backend
-
-       # print(f"[StudentAuth DEBUG] Raw token extracted: {raw_token[:10]}...") # Mostra solo inizio
-
-       try:
-           validated_token = self.get_validated_token(raw_token)
-           # print(f"[StudentAuth DEBUG] Token validated successfully. Claims: {validated_token}")
-       except InvalidToken as e:
-           # print(f"[StudentAuth DEBUG] Token validation failed: {e}")
-           # Non sollevare eccezione qui, lascia che il backend standard lo gestisca se necessario
-           return None # Token non valido, passa al prossimo backend
-       except Exception as e:
-           # print(f"[StudentAuth DEBUG] Unexpected error during token validation: {e}")
-           return None # Errore generico, passa al prossimo backend
-
-
-       # Ora controlliamo i claim specifici dello studente NEL token validato
-       is_student = validated_token.get('is_student', False)
-       student_id = validated_token.get('student_id')
-
-       if is_student and student_id:
-           # È un token studente, proviamo a recuperare lo studente
-           print(f"[StudentAuth] Student token identified. student_id: {student_id}")
-           try:
-               student = Student.objects.get(pk=student_id, is_active=True)
-           except Student.DoesNotExist:
-               print(f"[StudentAuth] Studente non trovato o non attivo (ID: {student_id}).")
-               # Se il token è valido ma lo studente non esiste più, consideralo un fallimento
-               raise AuthenticationFailed('Studente associato al token non trovato o non attivo.')
-           except Exception as e:
-                print(f"[StudentAuth] ERRORE durante recupero studente: {e}")
-                raise AuthenticationFailed('Errore interno durante recupero studente.')
-
-           # Autenticazione studente riuscita!
-           # Impostiamo request.student E restituiamo (student, validated_token)
-           # DRF imposterà request.user = student e request.auth = validated_token
-           request.student = student # Manteniamo per compatibilità se usato altrove
-           print(f"[StudentAuth] Autenticazione studente {student.pk} riuscita. Restituisce (student, token).")
-           return (student, validated_token)
-       else:
-           # Il token è valido ma NON è un token studente (mancano i claim specifici).
-           # Restituiamo None per permettere al prossimo backend di autenticazione
-           # (JWTAuthentication standard) di provare a gestirlo come token Admin/Docente.
-           print("[StudentAuth] Token valido ma non è un token studente (claim mancanti). Passa al prossimo backend.")
-           return None
-
-   # get_user non è necessario qui perché authenticate restituisce già l'oggetto utente corretto (Student)
\ No newline at end of file
+        try:
+            token = self.get_request_token(request)
+        except InvalidToken:
+            # Non sollevare eccezione qui, lascia che il backend standard lo gestisca
+            return None
+        if token is None:
+            return None # Nessun header (o formato non valido), passa al prossimo backend
+        _raw_token, validated_token = token
+
+        # Ora controlliamo i claim specifici dello studente NEL token validato
+        student_id = validated_token.get('student_id')
+        if not (validated_token.get('is_student', False) and student_id):
+            # Token valido ma non da studente: lo gestisce il backend per Admin/Docenti
+            return None
+
+        view = (request.parser_context or {}).get('view')
+        if getattr(view, 'token_student_principal', False) and 'auth_version' in validated_token:
+            # Vista che usa solo id e docente dello studente: nessuna lettura della riga Student
+            student = build_token_principal(validated_token)
+        else:
+            student = get_student_principal(student_id)
+            if student is not None and validated_token.get('auth_version', student.auth_version) != student.auth_version:
+                student = None # Token revocato (es. cambio PIN)
+        if student is None:
+            logger.warning("Autenticazione studente fallita: studente non attivo o token revocato.",
+                           extra={'student_id': student_id, 'path': request.path})
+            raise AuthenticationFailed('Studente associato al token non trovato, non attivo o token revocato.')
+
+        # DRF imposterà request.user = student e request.auth = validated_token
+        request.student = student # Manteniamo per compatibilità se usato altrove
+        logger.debug("Autenticazione studente riuscita.", extra={'student_id': student.pk, 'path': request.path})
+        return (student, validated_token)
+
+
+class UserJWTAuthentication(SharedTokenMixin, JWTAuthentication):
+    """ Autenticazione JWT standard per Admin/Docenti che riusa il token già validato. """
+
+    def authenticate(self, request):
+        token = self.get_request_token(request)
+        if token is None:
+            return None
+        _raw_token, validated_token = token
+        return self.get_user(validated_token), validated_token
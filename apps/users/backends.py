@@ -1,6 +1,7 @@
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth import get_user_model # Per recuperare il modello User standard (Admin/Docente)
 from .models import Student
+from .hashers import run_dummy_verification
 
 UserModel = get_user_model()
 
@@ -9,13 +10,14 @@ class StudentCodeBackend(BaseBackend):
     Backend di autenticazione che permette il login usando student_code e PIN.
     """
 
-    def authenticate(self, request, username=None, password=None, **kwargs):
+    def authenticate(self, request, student_code=None, pin=None, username=None, password=None, **kwargs):
         """
-        Tenta l'autenticazione usando student_code (passato come 'username') e PIN (passato come 'password').
+        Tenta l'autenticazione usando student_code e PIN (accettati anche come 'username'/'password').
         Restituisce un oggetto Student se l'autenticazione ha successo, None altrimenti.
+        Passare student_code/pin evita che ModelBackend calcoli un hash di password inutile.
         """
-        student_code = username # Usiamo il campo 'username' per passare lo student_code
-        pin = password
+        student_code = student_code or username
+        pin = pin or password
 
         if not student_code or not pin:
             return None
@@ -24,12 +26,11 @@ class StudentCodeBackend(BaseBackend):
             # Cerca lo studente attivo tramite il codice fornito
             student = Student.objects.get(student_code=student_code, is_active=True)
         except Student.DoesNotExist:
-            # Esegui un controllo a tempo costante per prevenire timing attacks
-            # se si usasse il modello User standard. Qui è meno critico ma buona pratica.
-            # UserModel().set_password(pin) # Non necessario qui
+            # Stesso costo di una verifica reale: i tempi non rivelano quali codici esistono
+            run_dummy_verification(pin)
             return None
 
-        # Verifica il PIN fornito con l'hash memorizzato
+        # Verifica il PIN fornito con l'hash memorizzato (con eventuale aggiornamento dell'hash)
         if student.check_pin(pin):
             # Autenticazione riuscita! Restituiamo l'oggetto Student.
             # Nota: NON restituiamo un oggetto User standard.
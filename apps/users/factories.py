@@ -1,6 +1,7 @@
 import factory
 from factory.django import DjangoModelFactory
 from django.contrib.auth.hashers import make_password # Per hashare password di default
+from .hashers import hash_pin
 from .models import User, Student, UserRole
 # NON importare WalletFactory qui
 
@@ -52,7 +53,7 @@ class StudentFactory(DjangoModelFactory):
         pin = None
 
     # LazyAttribute per hashare il PIN fornito o usare il default
-    pin_hash = factory.LazyAttribute(lambda o: make_password(o.pin if o.pin else '1234'))
+    pin_hash = factory.LazyAttribute(lambda o: hash_pin(o.pin if o.pin else '1234'))
 
     # RIMOSSO: Crea automaticamente un Wallet per lo studente
     # Questo causava errori IntegrityError se un wallet veniva creato altrove.
@@ -0,0 +1,48 @@
+"""
+Hash dei PIN degli studenti.
+
+Un PIN di 4 cifre ha solo 10.000 combinazioni: un hash lento non lo protegge da un attacco
+offline, mentre ogni login di una classe intera paga il costo pieno dell'hasher di Django.
+La protezione reale è il limite di tentativi online (apps.users.throttling); l'hasher dei PIN
+usa quindi PBKDF2 con un numero di iterazioni configurabile (STUDENT_PIN_HASH_ITERATIONS).
+
+Gli hash esistenti (hasher predefinito di Django) restano validi e vengono convertiti al primo
+login riuscito (`verify_pin` segnala quando serve un nuovo hash).
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password
+
+
+class StudentPinHasher(PBKDF2PasswordHasher):
+    """ PBKDF2-SHA256 con costo letto da STUDENT_PIN_HASH_ITERATIONS. """
+    algorithm = 'pin_pbkdf2_sha256'
+
+    @property
+    def iterations(self):
+        return settings.STUDENT_PIN_HASH_ITERATIONS
+
+
+PIN_HASHER = StudentPinHasher()
+
+
+def hash_pin(raw_pin: str) -> str:
+    return PIN_HASHER.encode(raw_pin, PIN_HASHER.salt())
+
+
+def verify_pin(raw_pin: str, encoded: str) -> tuple[bool, bool]:
+    """
+    Verifica il PIN. Restituisce (valido, da_aggiornare): da_aggiornare è True se l'hash usa un
+    altro algoritmo (es. quello predefinito di Django) o un costo diverso da quello configurato.
+    """
+    if not encoded:
+        return False, False
+    if encoded.startswith(f"{PIN_HASHER.algorithm}$"):
+        valid = PIN_HASHER.verify(raw_pin, encoded)
+        return valid, valid and PIN_HASHER.must_update(encoded)
+    valid = check_password(raw_pin, encoded)
+    return valid, valid
+
+
+def run_dummy_verification(raw_pin: str) -> None:
+    """ Stesso costo di una verifica reale, per non distinguere dai tempi i codici inesistenti. """
+    PIN_HASHER.encode(raw_pin or '0', PIN_HASHER.salt())
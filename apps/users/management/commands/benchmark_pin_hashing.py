@@ -0,0 +1,43 @@
+import time
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, make_password
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from apps.users.hashers import hash_pin, verify_pin
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = ('Misura le verifiche di PIN al secondo su un singolo core: hasher predefinito di Django '
+            '(prima) e hasher dei PIN con STUDENT_PIN_HASH_ITERATIONS (dopo).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50, help='Verifiche da eseguire per ogni hasher.')
+        parser.add_argument('--iterations', type=int, action='append', default=[],
+                            help="Misura anche l'hasher dei PIN con questo numero di iterazioni (ripetibile).")
+
+    def handle(self, *args, **options):
+        logins = options['logins']
+        django_hasher = get_hasher()
+        results = [(
+            f"{django_hasher.algorithm} ({getattr(django_hasher, 'iterations', '-')} iter.)",
+            self._measure(logins, make_password('1234'), check_password),
+        )]
+        for iterations in [settings.STUDENT_PIN_HASH_ITERATIONS, *options['iterations']]:
+            with override_settings(STUDENT_PIN_HASH_ITERATIONS=iterations):
+                per_second = self._measure(logins, hash_pin('1234'), lambda raw, encoded: verify_pin(raw, encoded)[0])
+            results.append((f"pin_pbkdf2_sha256 ({iterations} iter.)", per_second))
+
+        baseline = results[0][1]
+        for label, per_second in results:
+            self.stdout.write(f"{label:<45}{per_second:>10.1f} login/s per core  (x{per_second / baseline:.1f})")
+
+    @staticmethod
+    def _measure(logins, encoded, verify):
+        """ Verifiche al secondo (thread singolo) di un PIN corretto contro `encoded`. """
+        started = time.perf_counter()
+        for _ in range(logins):
+            if not verify('1234', encoded):
+                raise RuntimeError('Verifica del PIN fallita durante il benchmark.')
+        return logins / (time.perf_counter() - started)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apps.users.progress import find_inconsistencies, rebuild_summaries
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Ricalcola la tabella di riepilogo dei progressi degli studenti, oppure ne verifica la coerenza (--check).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--student', type=int, action='append', dest='student_ids', help='Limita agli studenti indicati (ripetibile).')
+        parser.add_argument('--check', action='store_true', help='Verifica soltanto: segnala le differenze ed esce con errore se presenti.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Dimensione dei lotti di scrittura.')
+
+    def handle(self, *args, **options):
+        student_ids = options['student_ids']
+        if options['check']:
+            problems = find_inconsistencies(student_ids)
+            for student_id, field, saved, actual in problems:
+                self.stdout.write(f"Studente {student_id}: {field} salvato={saved} reale={actual}")
+            if problems:
+                raise CommandError(f"{len(problems)} valori non coerenti. Eseguire il comando senza --check per ricalcolarli.")
+            self.stdout.write(self.style.SUCCESS('Riepiloghi progressi coerenti.'))
+            return
+
+        with transaction.atomic():
+            count = rebuild_summaries(student_ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Riepiloghi progressi ricalcolati per {count} studenti."))
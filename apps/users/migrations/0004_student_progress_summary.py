@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-17 20:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_summaries(apps, schema_editor):
+    """ Popola il riepilogo per gli studenti esistenti. """
+    Student = apps.get_model('users', 'Student')
+    StudentProgressSummary = apps.get_model('users', 'StudentProgressSummary')
+    QuizAttempt = apps.get_model('education', 'QuizAttempt')
+    PathwayProgress = apps.get_model('education', 'PathwayProgress')
+    Wallet = apps.get_model('rewards', 'Wallet')
+
+    quizzes = dict(QuizAttempt.objects.filter(status='COMPLETED').values('student_id').annotate(c=Count('id')).values_list('student_id', 'c'))
+    pathways = dict(PathwayProgress.objects.filter(status='COMPLETED').values('student_id').annotate(c=Count('id')).values_list('student_id', 'c'))
+    points = dict(Wallet.objects.values_list('student_id', 'current_points'))
+    StudentProgressSummary.objects.bulk_create([
+        StudentProgressSummary(
+            student_id=pk,
+            completed_quizzes_count=quizzes.get(pk, 0),
+            completed_pathways_count=pathways.get(pk, 0),
+            total_points=points.get(pk, 0),
+        )
+        for pk in Student.objects.values_list('pk', flat=True)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_registrationtoken'),
+        ('education', '0013_quiz_answer_key'),
+        ('rewards', '0005_alter_badge_trigger_condition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentProgressSummary',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='progress_summary', serialize=False, to='users.student', verbose_name='Student')),
+                ('completed_quizzes_count', models.PositiveIntegerField(default=0, verbose_name='Completed Quizzes')),
+                ('completed_pathways_count', models.PositiveIntegerField(default=0, verbose_name='Completed Pathways')),
+                ('total_points', models.IntegerField(default=0, verbose_name='Total Points')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Student Progress Summary',
+                'verbose_name_plural': 'Student Progress Summaries',
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
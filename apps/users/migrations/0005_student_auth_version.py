@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_student_progress_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='auth_version',
+            field=models.PositiveIntegerField(default=0, help_text='Incrementato per revocare i token già emessi (es. cambio PIN).', verbose_name='Auth Version'),
+        ),
+    ]
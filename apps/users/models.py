@@ -1,7 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.translation import gettext_lazy as _
-from django.contrib.auth.hashers import make_password, check_password # Add imports
+from .hashers import hash_pin, verify_pin # Hasher dedicato ai PIN (costo configurabile)
 import uuid
 from django.utils import timezone
 from datetime import timedelta
@@ -95,6 +95,11 @@ class Student(models.Model):
         help_text=_('Designates whether this student should be treated as active. Unselect this instead of deleting accounts.')
     )
     created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+    auth_version = models.PositiveIntegerField(
+        _('Auth Version'),
+        default=0,
+        help_text=_('Incrementato per revocare i token già emessi (es. cambio PIN).')
+    )
 
     class Meta:
         verbose_name = _('Student')
@@ -133,7 +138,9 @@ class Student(models.Model):
         # Esempio: lunghezza minima 4 cifre
         if len(raw_pin) < 4:
              raise ValueError("Il PIN deve essere di almeno 4 cifre.")
-        self.pin_hash = make_password(raw_pin)
+        self.pin_hash = hash_pin(raw_pin)
+        # I token emessi con il PIN precedente non sono più validi
+        self.auth_version += 1
 
     def check_pin(self, raw_pin):
         """
@@ -145,7 +152,28 @@ class Student(models.Model):
         Returns:
             bool: True if the PIN matches, False otherwise.
         """
-        return check_password(raw_pin, self.pin_hash)
+        valid, needs_rehash = verify_pin(raw_pin, self.pin_hash)
+        if needs_rehash and self.pk:
+            # Migrazione trasparente all'hasher dei PIN (o al nuovo costo) al primo login riuscito.
+            # update() invece di save(): nessun segnale, i token emessi restano validi.
+            self.pin_hash = hash_pin(raw_pin)
+            Student.objects.filter(pk=self.pk).update(pin_hash=self.pin_hash)
+        return valid
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        """
+        Per il principal "leggero" creato dai soli claim del token (apps.users.authentication),
+        il primo accesso a un campo non caricato legge l'intera riga, dalla cache se possibile,
+        invece di una query per ogni campo.
+        """
+        loader = self.__dict__.pop('_deferred_loader', None)
+        if loader is not None and fields:
+            full = loader()
+            if full is not None:
+                for attname in self.get_deferred_fields():
+                    self.__dict__[attname] = full.__dict__[attname]
+                return
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
 
 
 class RegistrationToken(models.Model):
@@ -235,3 +263,29 @@ class RegistrationToken(models.Model):
         # Unisci la base URL e il path relativo
         return urljoin(base_url, registration_path)
 
+
+
+class StudentProgressSummary(models.Model):
+    """
+    Riepilogo denormalizzato dei progressi di uno Studente (quiz e percorsi completati, punti).
+    Mantenuto aggiornato dai segnali (vedi apps.users.progress) e letto dalla dashboard docente
+    al posto delle aggregazioni sull'intero storico dei tentativi.
+    """
+    student = models.OneToOneField(
+        Student,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='progress_summary',
+        verbose_name=_('Student')
+    )
+    completed_quizzes_count = models.PositiveIntegerField(_('Completed Quizzes'), default=0)
+    completed_pathways_count = models.PositiveIntegerField(_('Completed Pathways'), default=0)
+    total_points = models.IntegerField(_('Total Points'), default=0)
+    updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('Student Progress Summary')
+        verbose_name_plural = _('Student Progress Summaries')
+
+    def __str__(self):
+        return f"Progress summary for {self.student}"
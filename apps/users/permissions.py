@@ -59,9 +59,7 @@ class IsStudent(permissions.BasePermission):
     """
     def has_permission(self, request, view):
         # Verifica la presenza di request.student impostato da StudentJWTAuthentication
-        is_student = hasattr(request, 'student') and request.student is not None
-        print(f"[IsStudent] Checking request.student. Result: {is_student}. request.user: {request.user}") # DEBUG
-        return is_student
+        return hasattr(request, 'student') and request.student is not None
 
 class IsStudentAuthenticated(permissions.BasePermission):
     """
@@ -69,23 +67,8 @@ class IsStudentAuthenticated(permissions.BasePermission):
     Combina la verifica di IsStudent e la presenza della property is_authenticated.
     """
     def has_permission(self, request, view):
-        # request.user sarà l'oggetto Student grazie a StudentJWTAuthentication
-        print(f"[IsStudentAuthenticated] Checking permission...") # DEBUG
-        print(f"[IsStudentAuthenticated] request.user: {request.user} (Type: {type(request.user)})") # DEBUG
-        print(f"[IsStudentAuthenticated] request.auth: {getattr(request, 'auth', 'N/A')}") # DEBUG
-        is_student_instance = isinstance(request.user, Student)
-        has_auth_prop = hasattr(request.user, 'is_authenticated')
-        is_auth_val = getattr(request.user, 'is_authenticated', False) if has_auth_prop else False
-        print(f"[IsStudentAuthenticated] is_student_instance: {is_student_instance}") # DEBUG
-        print(f"[IsStudentAuthenticated] has_auth_prop: {has_auth_prop}") # DEBUG
-        print(f"[IsStudentAuthenticated] is_auth_val: {is_auth_val}") # DEBUG
-
-        result = (
-            is_student_instance and
-            has_auth_prop and
-            is_auth_val
-        )
-        print(f"[IsStudentAuthenticated] Result: {result}") # DEBUG
-        return result
+        # request.user sarà l'oggetto Student grazie a StudentJWTAuthentication.
+        # Non serve accedere ad altri campi: con il principal "leggero" la riga non viene letta.
+        return isinstance(request.user, Student) and getattr(request.user, 'is_authenticated', False)
 
 # Potremmo aggiungere altri permessi qui, come IsReadOnly, etc.
\ No newline at end of file
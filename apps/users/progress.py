@@ -0,0 +1,115 @@
+"""
+Mantenimento della tabella di riepilogo StudentProgressSummary.
+
+- I segnali (apps.users.signals) aggiornano il riepilogo di un solo studente quando un
+  tentativo viene completato, un percorso completato o il saldo del wallet cambia: ogni
+  aggiornamento è un singolo UPDATE con subquery sugli indici per studente, quindi senza
+  letture/scritture concorrenti da riconciliare.
+- `rebuild_summaries` ricalcola i riepiloghi (tutti o per gli studenti indicati) con tre
+  query aggregate e un upsert in blocco.
+- `find_inconsistencies` confronta i riepiloghi salvati con i valori reali.
+"""
+import logging
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from apps.education.models import QuizAttempt, PathwayProgress
+from apps.rewards.models import Wallet
+from .models import Student, StudentProgressSummary
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = ('completed_quizzes_count', 'completed_pathways_count', 'total_points')
+
+
+def _count_subquery(queryset):
+    counts = queryset.filter(student=OuterRef('student_id')).order_by().values('student').annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(counts[:1], output_field=IntegerField()), Value(0))
+
+
+def _field_expressions():
+    """ Espressioni (per riga di StudentProgressSummary) che calcolano i valori reali. """
+    points = Wallet.objects.filter(student=OuterRef('student_id')).values('current_points')
+    return {
+        'completed_quizzes_count': _count_subquery(
+            QuizAttempt.objects.filter(status=QuizAttempt.AttemptStatus.COMPLETED)
+        ),
+        'completed_pathways_count': _count_subquery(
+            PathwayProgress.objects.filter(status=PathwayProgress.ProgressStatus.COMPLETED)
+        ),
+        'total_points': Coalesce(Subquery(points[:1], output_field=IntegerField()), Value(0)),
+    }
+
+
+def refresh_summary(student_id: int, fields=SUMMARY_FIELDS, create_missing: bool = True) -> None:
+    """
+    Aggiorna i campi indicati del riepilogo di uno studente.
+    Se il riepilogo manca viene creato, salvo `create_missing=False` (eliminazioni a cascata).
+    """
+    expressions = _field_expressions()
+    updated = StudentProgressSummary.objects.filter(student_id=student_id).update(
+        **{name: expressions[name] for name in fields}
+    )
+    if not updated and create_missing and Student.objects.filter(pk=student_id).exists():
+        rebuild_summaries([student_id])
+
+
+def _actual_values(student_ids=None) -> dict:
+    """ Restituisce {student_id: {campo: valore}} calcolati dalle tabelle sorgente (3 query). """
+    students = Student.objects.all()
+    if student_ids is not None:
+        students = students.filter(pk__in=student_ids)
+    values = {pk: dict.fromkeys(SUMMARY_FIELDS, 0) for pk in students.values_list('pk', flat=True)}
+    if not values:
+        return values
+
+    def _fill(field, rows):
+        for student_id, value in rows:
+            if student_id in values:
+                values[student_id][field] = value or 0
+
+    ids = list(values)
+    _fill('completed_quizzes_count', QuizAttempt.objects.filter(
+        student_id__in=ids, status=QuizAttempt.AttemptStatus.COMPLETED
+    ).order_by().values('student_id').annotate(c=Count('id')).values_list('student_id', 'c'))
+    _fill('completed_pathways_count', PathwayProgress.objects.filter(
+        student_id__in=ids, status=PathwayProgress.ProgressStatus.COMPLETED
+    ).order_by().values('student_id').annotate(c=Count('id')).values_list('student_id', 'c'))
+    _fill('total_points', Wallet.objects.filter(student_id__in=ids).values_list('student_id', 'current_points'))
+    return values
+
+
+def rebuild_summaries(student_ids=None, batch_size: int = 500) -> int:
+    """ Ricalcola e salva i riepiloghi (tutti o per gli studenti indicati). Restituisce il numero di righe. """
+    values = _actual_values(student_ids)
+    StudentProgressSummary.objects.bulk_create(
+        [StudentProgressSummary(student_id=pk, **fields) for pk, fields in values.items()],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['student'],
+        update_fields=[*SUMMARY_FIELDS, 'updated_at'],
+    )
+    logger.info(f"Riepiloghi progressi ricalcolati per {len(values)} studenti.")
+    return len(values)
+
+
+def find_inconsistencies(student_ids=None) -> list[tuple]:
+    """
+    Confronta i riepiloghi salvati con i valori reali.
+    Restituisce una lista di (student_id, campo, valore_salvato, valore_reale); un riepilogo
+    mancante viene riportato con valore_salvato None.
+    """
+    actual = _actual_values(student_ids)
+    stored = {
+        row['student_id']: row
+        for row in StudentProgressSummary.objects.filter(student_id__in=list(actual)).values('student_id', *SUMMARY_FIELDS)
+    }
+    problems = []
+    for student_id, fields in actual.items():
+        row = stored.get(student_id)
+        for field, value in fields.items():
+            saved = row[field] if row else None
+            if saved != value:
+                problems.append((student_id, field, saved, value))
+    return problems
@@ -4,6 +4,7 @@ from django.utils import timezone # Aggiungi timezone
 from apps.rewards.models import Wallet # Importa Wallet
 from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from rest_framework_simplejwt.exceptions import InvalidToken
+from apps.common.serializers import SparseFieldsetMixin
 
 class UserSerializer(serializers.ModelSerializer):
     """
@@ -63,7 +64,7 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return user
 
 
-class StudentSerializer(serializers.ModelSerializer):
+class StudentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer per il modello Student.
     Usato principalmente dai Docenti per gestire i propri studenti.
@@ -113,15 +114,14 @@ class StudentProgressSummarySerializer(serializers.Serializer):
     student_id = serializers.IntegerField(read_only=True, source='id') # ID dello studente
     full_name = serializers.CharField(read_only=True)
     student_code = serializers.CharField(read_only=True) # Sostituito username con student_code
-    # Campi aggregati (verranno calcolati nella view con annotazioni)
-    completed_quizzes_count = serializers.IntegerField(read_only=True, default=0)
-    completed_pathways_count = serializers.IntegerField(read_only=True, default=0)
-    total_points_earned = serializers.IntegerField(read_only=True, default=0) # Punti totali dal wallet
+    # Campi aggregati letti dalla tabella di riepilogo (StudentProgressSummary)
+    completed_quizzes_count = serializers.IntegerField(read_only=True, default=0, source='progress_summary.completed_quizzes_count')
+    completed_pathways_count = serializers.IntegerField(read_only=True, default=0, source='progress_summary.completed_pathways_count')
+    total_points_earned = serializers.IntegerField(read_only=True, default=0, source='progress_summary.total_points') # Punti totali dal wallet
     # Potremmo aggiungere altri campi aggregati se necessario
     # last_activity_at = serializers.DateTimeField(read_only=True, allow_null=True)
 
-    # Nota: La view che usa questo serializer dovrà fornire un queryset
-    # annotato con i campi aggregati (completed_quizzes_count, etc.).
+    # Nota: La view che usa questo serializer dovrebbe usare select_related('progress_summary').
 
 
 # --- Serializer per Token di Registrazione ---
@@ -261,6 +261,10 @@ class StudentTokenRefreshSerializer(TokenRefreshSerializer):
         except Student.DoesNotExist:
             raise InvalidToken('Studente associato al token non trovato o non attivo.')
 
+        # Refresh token emesso prima di una revoca (es. cambio PIN): non più valido
+        if self.token.get('auth_version', student.auth_version) != student.auth_version:
+            raise InvalidToken('Token revocato.')
+
         # Se tutto ok, restituisci i dati validati (che includono il nuovo access token generato da super().validate)
         # Non è necessario aggiungere lo studente qui, serve solo per la validazione.
         return data
\ No newline at end of file
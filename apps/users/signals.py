@@ -1,9 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Student
+from .models import Student, User
+from .progress import refresh_summary, rebuild_summaries
+from apps.common.cache import invalidate_on_change
+from apps.education.models import QuizAttempt, PathwayProgress
 # Importa Wallet qui per evitare import circolari a livello di modulo
 # se rewards importasse qualcosa da users.models
 from apps.rewards.models import Wallet
+from apps.rewards.ledger import balance_changed
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,4 +23,58 @@ def create_student_wallet(sender, instance, created, **kwargs):
             logger.info(f"Wallet creato automaticamente per lo studente {instance.id} ({instance.student_code})")
         except Exception as e:
             # Logga eventuali errori durante la creazione del wallet
-            logger.error(f"Errore nella creazione automatica del wallet per lo studente {instance.id}: {e}", exc_info=True)
\ No newline at end of file
+            logger.error(f"Errore nella creazione automatica del wallet per lo studente {instance.id}: {e}", exc_info=True)
+
+
+# --- Riepilogo progressi (StudentProgressSummary) ---
+
+@receiver(post_save, sender=Student)
+def create_student_progress_summary(sender, instance, created, **kwargs):
+    """ Crea il riepilogo progressi per un nuovo Studente. """
+    if created:
+        rebuild_summaries([instance.pk])
+
+
+def _status_saved(kwargs) -> bool:
+    """ True se il salvataggio ha scritto lo stato: anche uscire da COMPLETED cambia i conteggi. """
+    update_fields = kwargs.get('update_fields')
+    return update_fields is None or 'status' in update_fields
+
+
+@receiver(post_save, sender=QuizAttempt)
+def update_summary_on_attempt_save(sender, instance, **kwargs):
+    if _status_saved(kwargs):
+        refresh_summary(instance.student_id, fields=('completed_quizzes_count',))
+
+
+@receiver(post_save, sender=PathwayProgress)
+def update_summary_on_pathway_save(sender, instance, **kwargs):
+    if _status_saved(kwargs):
+        refresh_summary(instance.student_id, fields=('completed_pathways_count',))
+
+
+@receiver(post_delete, sender=QuizAttempt)
+def update_summary_on_attempt_delete(sender, instance, **kwargs):
+    refresh_summary(instance.student_id, fields=('completed_quizzes_count',), create_missing=False)
+
+
+@receiver(post_delete, sender=PathwayProgress)
+def update_summary_on_pathway_delete(sender, instance, **kwargs):
+    refresh_summary(instance.student_id, fields=('completed_pathways_count',), create_missing=False)
+
+
+@receiver(post_save, sender=Wallet)
+def update_summary_on_wallet_save(sender, instance, **kwargs):
+    # Salvataggi diretti del wallet (admin, seed): il valore viene riletto dalla subquery
+    refresh_summary(instance.student_id, fields=('total_points',), create_missing=False)
+
+
+@receiver(balance_changed)
+def update_summary_on_ledger_change(sender, student_id, **kwargs):
+    # Variazioni del ledger (apps.rewards.ledger): UPDATE diretto, senza post_save
+    refresh_summary(student_id, fields=('total_points',), create_missing=False)
+
+
+# --- Invalidazione della cache applicativa (namespace 'users') ---
+invalidate_on_change('users', User, ignore_fields=('last_login',))
+invalidate_on_change('users', Student, scope_func=lambda instance: f"student:{instance.pk}")
@@ -3,6 +3,15 @@ from django.db.utils import IntegrityError # Per testare vincoli
 # Usiamo import assoluti basati sulla struttura del progetto
 from apps.users.models import User, Student, UserRole
 from apps.users.factories import UserFactory, StudentFactory
+from unittest.mock import patch
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from apps.users.authentication import build_token_principal
+from django.contrib.auth.hashers import make_password
+from django.test import override_settings
 
 class UserModelTests(TestCase):
 
@@ -400,3 +409,219 @@ class StudentAuthenticationAPITests(APITestCase):
         response = self.client.get(self.protected_url)
         # Il permesso IsStudent dovrebbe negare l'accesso
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def _student_token(self):
+        response = self.client.post(self.login_url, {'student_code': 'STUDENT001', 'pin': '1234'})
+        return response.data['access']
+
+    def test_student_principal_is_cached(self):
+        """ Dopo la prima richiesta lo studente viene letto dalla cache: nessuna query di autenticazione. """
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self._student_token()}')
+        self.client.get(self.protected_url)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.protected_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(captured.captured_queries), 0)
+
+    def test_deactivated_student_is_rejected_immediately(self):
+        """ La disattivazione invalida la cache: il token non è più accettato. """
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self._student_token()}')
+        self.assertEqual(self.client.get(self.protected_url).status_code, status.HTTP_200_OK)
+        self.student.is_active = False
+        self.student.save()
+        self.assertEqual(self.client.get(self.protected_url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_teacher_token_is_decoded_once(self):
+        """ Il token di un Docente viene validato una sola volta per richiesta. """
+        access = RefreshToken.for_user(self.teacher).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with patch.object(JWTAuthentication, 'get_validated_token', autospec=True,
+                          side_effect=JWTAuthentication.get_validated_token) as validate:
+            response = self.client.get(reverse('student-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(validate.call_count, 1)
+
+    def test_token_principal_view_does_not_read_student_row(self):
+        """ Le viste con token_student_principal usano id e docente dal token, senza leggere lo studente. """
+        url = reverse('student-earned-badge-list')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self._student_token()}')
+        self.client.get(url) # Versione di autenticazione in cache
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q['sql'] for q in captured.captured_queries if 'FROM "users_student"' in q['sql']])
+
+    def test_token_principal_loads_full_row_on_demand(self):
+        """ I campi non presenti nel token vengono caricati tutti insieme al primo accesso. """
+        access = AccessToken(self._student_token())
+        principal = build_token_principal(access)
+        self.assertEqual((principal.pk, principal.teacher_id), (self.student.pk, self.teacher.pk))
+        self.assertIn('first_name', principal.get_deferred_fields())
+        self.assertEqual(principal.full_name, self.student.full_name)
+        self.assertEqual(principal.get_deferred_fields(), set())
+
+    def test_token_principal_follows_teacher_change(self):
+        """ Uno studente trasferito a un altro docente non mantiene il docente scritto nel token. """
+        access = AccessToken(self._student_token())
+        build_token_principal(access) # Stato di autenticazione in cache
+        new_teacher = UserFactory(role=UserRole.TEACHER)
+        self.student.teacher = new_teacher
+        self.student.save()
+        self.assertEqual(build_token_principal(access).teacher_id, new_teacher.pk)
+
+    def test_pin_change_revokes_issued_tokens(self):
+        """ Dopo il cambio PIN i token emessi in precedenza non sono più accettati. """
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self._student_token()}')
+        lazy_url = reverse('student-wallet-list')
+        self.assertEqual(self.client.get(lazy_url).status_code, status.HTTP_200_OK)
+        self.student.set_pin('5678')
+        self.student.save()
+        self.assertEqual(self.client.get(lazy_url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get(self.protected_url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_cuts_off_token_principal(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self._student_token()}')
+        lazy_url = reverse('student-shop-list')
+        self.assertEqual(self.client.get(lazy_url).status_code, status.HTTP_200_OK)
+        self.student.is_active = False
+        self.student.save(update_fields=['is_active'])
+        self.assertEqual(self.client.get(lazy_url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class StudentLoginHardeningTests(APITestCase):
+    """ Hash dei PIN (costo configurabile, aggiornamento al login) e limite dei tentativi di login. """
+    def setUp(self):
+        cache.clear()
+        self.student = StudentFactory(student_code="STUDENT002", pin="1234")
+        self.login_url = reverse('student-login')
+
+    def _login(self, pin, code='STUDENT002', **extra):
+        return self.client.post(self.login_url, {'student_code': code, 'pin': pin}, **extra)
+
+    def test_legacy_hash_is_upgraded_on_login(self):
+        """ Un hash dell'hasher predefinito resta valido e viene convertito al primo login. """
+        Student.objects.filter(pk=self.student.pk).update(pin_hash=make_password('1234'))
+        self.assertEqual(self._login('1234').status_code, status.HTTP_200_OK)
+        self.student.refresh_from_db()
+        self.assertTrue(self.student.pin_hash.startswith('pin_pbkdf2_sha256$'))
+        self.assertTrue(self.student.check_pin('1234'))
+
+    def test_pin_hash_follows_configured_iterations(self):
+        with self.settings(STUDENT_PIN_HASH_ITERATIONS=1000):
+            self.student.set_pin('4321')
+            self.assertEqual(self.student.pin_hash.split('$')[1], '1000')
+        with self.settings(STUDENT_PIN_HASH_ITERATIONS=2000):
+            self.assertTrue(self.student.check_pin('4321')) # Costo cambiato: hash aggiornato
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.pin_hash.split('$')[1], '2000')
+
+    @override_settings(STUDENT_LOGIN_MAX_FAILURES=3)
+    def test_code_is_locked_after_repeated_failures(self):
+        for _ in range(3):
+            self.assertEqual(self._login('0000').status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self._login('1234') # Anche il PIN corretto viene rifiutato durante il blocco
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    @override_settings(STUDENT_LOGIN_MAX_FAILURES=3)
+    def test_successful_login_resets_code_failures(self):
+        for _ in range(2):
+            self._login('0000')
+        self.assertEqual(self._login('1234').status_code, status.HTTP_200_OK)
+        for _ in range(2):
+            self.assertEqual(self._login('0000').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._login('1234').status_code, status.HTTP_200_OK)
+
+    @override_settings(STUDENT_LOGIN_IP_MAX_FAILURES=3, CLIENT_IP_META_KEY='HTTP_X_REAL_IP')
+    def test_ip_is_locked_across_codes(self):
+        """ Il limite per IP conta gli errori su codici diversi; altri IP non sono coinvolti. """
+        for code in ('UNKNOWN1', 'UNKNOWN2', 'UNKNOWN3'):
+            self._login('0000', code=code, HTTP_X_REAL_IP='10.0.0.1')
+        self.assertEqual(self._login('1234', HTTP_X_REAL_IP='10.0.0.1').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self._login('1234', HTTP_X_REAL_IP='10.0.0.2').status_code, status.HTTP_200_OK)
+
+    def test_pin_hashing_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_pin_hashing', logins=2, iterations=[1000], stdout=out)
+        self.assertEqual(out.getvalue().count('login/s per core'), 3)
+
+
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+from apps.education.factories import QuizAttemptFactory, PathwayProgressFactory
+from apps.education.models import QuizAttempt, PathwayProgress
+from apps.users.models import StudentProgressSummary
+
+
+class StudentProgressSummaryTests(APITestCase):
+    """ Test per la tabella di riepilogo dei progressi e la dashboard docente. """
+
+    def setUp(self):
+        self.teacher = UserFactory(role=UserRole.TEACHER)
+        self.student = StudentFactory(teacher=self.teacher)
+        self.url = reverse('teacher-student-progress-summary')
+
+    def _summary(self):
+        return StudentProgressSummary.objects.get(student=self.student)
+
+    def test_summary_follows_attempts_pathways_and_wallet(self):
+        self.assertEqual(self._summary().completed_quizzes_count, 0)
+
+        attempt = QuizAttemptFactory(student=self.student)
+        self.assertEqual(self._summary().completed_quizzes_count, 0)
+        attempt.status = QuizAttempt.AttemptStatus.COMPLETED
+        attempt.completed_at = timezone.now()
+        attempt.save()
+        PathwayProgressFactory(student=self.student, status=PathwayProgress.ProgressStatus.COMPLETED)
+        self.student.wallet.add_points(15, 'Test')
+
+        summary = self._summary()
+        self.assertEqual(summary.completed_quizzes_count, 1)
+        self.assertEqual(summary.completed_pathways_count, 1)
+        self.assertEqual(summary.total_points, 15)
+
+        attempt.delete()
+        self.assertEqual(self._summary().completed_quizzes_count, 0)
+        self.assertEqual(StudentProgressSummary.objects.count(), 1)
+
+    def test_summary_follows_status_leaving_completed(self):
+        attempt = QuizAttemptFactory(student=self.student, status=QuizAttempt.AttemptStatus.COMPLETED, completed_at=timezone.now())
+        progress = PathwayProgressFactory(student=self.student, status=PathwayProgress.ProgressStatus.COMPLETED)
+        self.assertEqual(self._summary().completed_quizzes_count, 1)
+        self.assertEqual(self._summary().completed_pathways_count, 1)
+
+        # Tentativo riaperto per la revisione manuale, percorso riportato in corso
+        attempt.status = QuizAttempt.AttemptStatus.PENDING_GRADING
+        attempt.save(update_fields=['status'])
+        progress.status = PathwayProgress.ProgressStatus.IN_PROGRESS
+        progress.save()
+
+        summary = self._summary()
+        self.assertEqual(summary.completed_quizzes_count, 0)
+        self.assertEqual(summary.completed_pathways_count, 0)
+
+    def test_teacher_dashboard_reads_summary_in_constant_queries(self):
+        StudentFactory.create_batch(3, teacher=self.teacher)
+        self.student.wallet.add_points(20, 'Test')
+        self.client.force_authenticate(user=self.teacher)
+        with self.assertNumQueries(1): # Studenti con riepilogo in join, nessuna subquery per studente
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 4)
+        row = next(r for r in response.data if r['student_id'] == self.student.pk)
+        self.assertEqual(row['total_points_earned'], 20)
+        self.assertEqual(row['completed_quizzes_count'], 0)
+
+    def test_check_and_rebuild_command(self):
+        StudentProgressSummary.objects.filter(student=self.student).update(total_points=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_progress_summaries', '--check', stdout=StringIO())
+
+        call_command('rebuild_progress_summaries', stdout=StringIO())
+        self.assertEqual(self._summary().total_points, 0)
+        out = StringIO()
+        call_command('rebuild_progress_summaries', '--check', stdout=out)
+        self.assertIn('coerenti', out.getvalue())
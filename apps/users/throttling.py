@@ -0,0 +1,65 @@
+"""
+Limite dei tentativi di login degli studenti, sulla cache condivisa.
+
+- Per codice studente: dopo STUDENT_LOGIN_MAX_FAILURES errori nella finestra
+  STUDENT_LOGIN_FAILURE_WINDOW il codice viene bloccato per STUDENT_LOGIN_LOCKOUT_SECONDS.
+- Per IP: stesso meccanismo con STUDENT_LOGIN_IP_MAX_FAILURES, più alto perché una classe
+  esce spesso da un unico IP (NAT della scuola).
+
+Un tentativo bloccato viene rifiutato prima di calcolare l'hash del PIN.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def client_ip(request) -> str:
+    """ IP del client: header impostato dal proxy (CLIENT_IP_META_KEY, es. X-Real-IP di nginx) o REMOTE_ADDR. """
+    return request.META.get(settings.CLIENT_IP_META_KEY) or request.META.get('REMOTE_ADDR', '')
+
+
+class LoginThrottle:
+    """ Contatori di errori e blocchi per un tentativo di login (codice studente + IP). """
+
+    def __init__(self, student_code: str, ip: str):
+        code_digest = hashlib.sha256(student_code.encode()).hexdigest()[:32] # Chiavi sicure per qualunque input
+        self.scopes = [
+            (f"code:{code_digest}", settings.STUDENT_LOGIN_MAX_FAILURES),
+            (f"ip:{ip}", settings.STUDENT_LOGIN_IP_MAX_FAILURES),
+        ]
+        self.student_code = student_code
+        self.ip = ip
+
+    def locked_for(self) -> int:
+        """ Secondi mancanti alla fine del blocco più lungo (0 se il tentativo è consentito). """
+        locks = cache.get_many([f"login-lock:{scope}" for scope, _limit in self.scopes])
+        if not locks:
+            return 0
+        return max(0, int(max(locks.values()) - time.time()) + 1)
+
+    def register_failure(self) -> None:
+        window = settings.STUDENT_LOGIN_FAILURE_WINDOW
+        lockout = settings.STUDENT_LOGIN_LOCKOUT_SECONDS
+        for scope, limit in self.scopes:
+            key = f"login-fail:{scope}"
+            cache.add(key, 0, window)
+            try:
+                failures = cache.incr(key)
+            except ValueError: # Chiave scaduta tra add e incr
+                cache.set(key, 1, window)
+                failures = 1
+            if failures >= limit:
+                cache.set(f"login-lock:{scope}", time.time() + lockout, lockout)
+                cache.delete(key)
+                logger.warning("Login studente bloccato per troppi tentativi falliti.",
+                               extra={'scope': scope.split(':', 1)[0], 'student_code': self.student_code,
+                                      'ip': self.ip, 'lockout_seconds': lockout})
+
+    def register_success(self) -> None:
+        """ Un login riuscito azzera gli errori del codice (non quelli dell'IP, condiviso dalla classe). """
+        cache.delete(f"login-fail:{self.scopes[0][0]}")
@@ -15,6 +15,7 @@ from .serializers import (
 from apps.education.models import QuizAttempt, PathwayProgress
 from apps.rewards.models import Wallet
 from rest_framework import mixins # Importa mixins
+from apps.common.pagination import KeysetCursorPagination
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -60,6 +61,7 @@ class StudentViewSet(viewsets.ModelViewSet):
     # IsTeacherUser | IsAdminUser: Deve essere Docente O Admin.
     # IsStudentOwnerOrAdmin: Applicato a livello di oggetto per retrieve/update/delete.
     permission_classes = [permissions.IsAuthenticated, (IsTeacherUser | IsAdminUser), IsStudentOwnerOrAdmin]
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         """
@@ -68,9 +70,9 @@ class StudentViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if user.is_admin:
-            return Student.objects.all().order_by('last_name', 'first_name')
+            return Student.objects.all().select_related('teacher').order_by('last_name', 'first_name')
         elif user.is_teacher:
-            return Student.objects.filter(teacher=user).order_by('last_name', 'first_name')
+            return Student.objects.filter(teacher=user).select_related('teacher').order_by('last_name', 'first_name')
         else:
             # Teoricamente non dovrebbe accadere a causa dei permessi a livello di vista,
             # ma per sicurezza restituiamo un queryset vuoto.
@@ -111,6 +113,8 @@ from rest_framework import status, permissions, serializers # Import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenRefreshView
 from .serializers import StudentTokenRefreshSerializer # Importa il nuovo serializer
+from .authentication import add_student_claims
+from .throttling import LoginThrottle, client_ip
 
 class StudentLoginView(APIView):
     """
@@ -129,26 +133,33 @@ class StudentLoginView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Usa authenticate di Django, che proverà tutti i backend in AUTHENTICATION_BACKENDS
-        # Passiamo student_code come 'username' e pin come 'password' come atteso dal nostro backend
-        student = authenticate(request, username=student_code, password=pin)
+        # Tentativi limitati per codice e IP: un login bloccato non calcola nemmeno l'hash del PIN
+        throttle = LoginThrottle(student_code, client_ip(request))
+        retry_after = throttle.locked_for()
+        if retry_after:
+            return Response(
+                {'detail': 'Troppi tentativi di accesso falliti. Riprova più tardi.'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(retry_after)},
+            )
+
+        # Usa authenticate di Django, che proverà tutti i backend in AUTHENTICATION_BACKENDS.
+        # Con student_code/pin (invece di username/password) ModelBackend esce subito senza hash.
+        student = authenticate(request, student_code=student_code, pin=pin)
 
         if student is not None:
+            throttle.register_success()
             # Autenticazione riuscita con StudentCodeBackend
             # 'student' è un'istanza del modello Student
 
             # Genera token JWT per lo studente
             # Aggiungiamo claim custom per identificare che è uno studente e il suo ID
             refresh = RefreshToken()
-            refresh['student_id'] = student.pk
-            refresh['student_code'] = student.student_code
-            refresh['is_student'] = True # Claim custom per identificarlo facilmente
+            add_student_claims(refresh, student)
 
             # Genera l'access token dal refresh token e aggiungi i claim custom anche qui
             access = refresh.access_token
-            access['student_id'] = student.pk
-            access['student_code'] = student.student_code
-            access['is_student'] = True
+            add_student_claims(access, student)
 
             # Non usiamo login() di Django qui, ci basiamo solo sui token
             # login(request, student, backend='apps.users.backends.StudentCodeBackend')
@@ -161,6 +172,7 @@ class StudentLoginView(APIView):
             })
         else:
             # Autenticazione fallita (o l'utente autenticato è un Admin/Docente, non uno Studente)
+            throttle.register_failure()
             return Response(
                 {'detail': 'Codice studente o PIN non validi.'},
                 status=status.HTTP_401_UNAUTHORIZED
@@ -191,48 +203,11 @@ class TeacherStudentProgressSummaryView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated, IsTeacherUser] # Solo Docenti
 
     def get_queryset(self):
-        teacher = self.request.user
-
-        # Queryset base: studenti del docente
-        queryset = Student.objects.filter(teacher=teacher)
-
-        # Annotazioni per i dati aggregati
-        # Conteggio Quiz Completati (con successo, basato sulla soglia del quiz)
-        # Nota: Questo richiede un modo per definire/ottenere la soglia per ogni quiz.
-        # Per semplicità ora contiamo solo gli status COMPLETED.
-        # Una soluzione più precisa richiederebbe subquery più complesse o denormalizzazione.
-        completed_quizzes = QuizAttempt.objects.filter(
-            student=OuterRef('pk'),
-            status=QuizAttempt.AttemptStatus.COMPLETED
-            # Aggiungere filtro su score >= soglia se necessario e fattibile
-        ).values('student').annotate(count=Count('id')).values('count')
-
-        # Conteggio Percorsi Completati
-        completed_pathways = PathwayProgress.objects.filter(
-            student=OuterRef('pk'),
-            status=PathwayProgress.ProgressStatus.COMPLETED
-        ).values('student').annotate(count=Count('id')).values('count')
-
-        # Punti totali guadagnati (dal Wallet)
-        total_points = Wallet.objects.filter(
-            student=OuterRef('pk')
-        ).values('current_points') # Assumiamo che current_points rifletta il totale guadagnato - speso
-
-        queryset = queryset.annotate(
-            completed_quizzes_count=Subquery(completed_quizzes[:1], output_field=models.IntegerField()),
-            completed_pathways_count=Subquery(completed_pathways[:1], output_field=models.IntegerField()),
-            total_points_earned=Subquery(total_points[:1], output_field=models.IntegerField())
-        ).order_by('last_name', 'first_name')
-
-        # Imposta valori predefiniti a 0 se le subquery restituiscono None
-        # Questo si può fare anche nel serializer con default=0
-        # queryset = queryset.annotate(
-        #     completed_quizzes_count=Coalesce(F('completed_quizzes_count'), 0),
-        #     completed_pathways_count=Coalesce(F('completed_pathways_count'), 0),
-        #     total_points_earned=Coalesce(F('total_points_earned'), 0)
-        # )
-
-        return queryset
+        # I valori aggregati sono letti dalla tabella di riepilogo StudentProgressSummary
+        # (mantenuta dai segnali, vedi apps.users.progress): una sola query con join sulla chiave primaria
+        return Student.objects.filter(
+            teacher=self.request.user
+        ).select_related('progress_summary').order_by('last_name', 'first_name')
 
 # TODO: Aggiungere azione a StudentViewSet per i dettagli del progresso
 # @action(detail=True, methods=['get'], url_path='progress-details')
@@ -255,7 +230,7 @@ class RegistrationTokenViewSet(mixins.CreateModelMixin,
     def get_queryset(self):
         """ Restituisce solo i token creati dal docente autenticato. """
         # Ordina per data di scadenza decrescente, mostrando prima i più recenti/validi
-        return RegistrationToken.objects.filter(teacher=self.request.user).order_by('-expires_at')
+        return RegistrationToken.objects.filter(teacher=self.request.user).select_related('teacher', 'student').order_by('-expires_at')
 
     def perform_create(self, serializer):
         """ Associa automaticamente il token al Docente autenticato durante la creazione. """
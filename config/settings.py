@@ -71,10 +71,13 @@ INSTALLED_APPS = [
     'apps.education.apps.EducationConfig',
     'apps.rewards.apps.RewardsConfig',
     'lezioni.apps.LezioniConfig', # Aggiunta nuova app lezioni
+    'apps.common.apps.CommonConfig', # Cache condivisa e coda job
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Metriche di performance per vista (tempo, query SQL, cache, serializer): vedi apps.common.metrics
+    'apps.common.metrics.PerformanceMetricsMiddleware',
     # Whitenoise Middleware (subito dopo SecurityMiddleware)
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -220,8 +223,8 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         # Prova prima l'autenticazione studente custom
         'apps.users.authentication.StudentJWTAuthentication',
-        # Poi prova l'autenticazione JWT standard per Admin/Docenti
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Poi prova l'autenticazione JWT standard per Admin/Docenti (riusa il token già validato)
+        'apps.users.authentication.UserJWTAuthentication',
         # Rimuoviamo temporaneamente SessionAuthentication per debug test 401
         # 'rest_framework.authentication.SessionAuthentication',
     ),
@@ -230,11 +233,15 @@ REST_FRAMEWORK = {
         # I permessi verranno specificati esplicitamente in ciascuna View/ViewSet.
         # 'rest_framework.permissions.IsAuthenticated', # Rimosso
     ),
-    # Optional: Add pagination, filtering, etc. defaults here
-    # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    # 'PAGE_SIZE': 10
+    # Paginazione: nessuna predefinita globale. Gli elenchi che crescono nel tempo usano
+    # apps.common.pagination.KeysetCursorPagination (pagination_class sulla vista), attiva solo
+    # se il client invia ?cursor= o ?page_size= (senza parametri: elenco completo come prima).
 }
 
+# Dimensione predefinita e massima (?page_size=) delle pagine a cursore (apps.common.pagination)
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', '50'))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '200'))
+
 # Simple JWT Configuration
 # https://django-rest-framework-simplejwt.readthedocs.io/en/latest/settings.html
 from datetime import timedelta
@@ -326,19 +333,58 @@ CORS_ALLOW_HEADERS = [
 # Ottimizzazioni per server con risorse limitate
 # Queste impostazioni aiutano a ridurre l'utilizzo di memoria e migliorare le prestazioni
 
-# Configurazione del caching in memoria
+# Configurazione del caching
 # https://docs.djangoproject.com/en/5.1/topics/cache/
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 300,  # 5 minuti
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000,  # Limita il numero di voci in cache
-            'CULL_FREQUENCY': 3,  # Rimuovi 1/3 delle voci quando la cache è piena
+# Con REDIS_URL impostata la cache è condivisa tra tutti i worker (necessario per sessioni
+# e invalidazione coerenti con più worker gunicorn); senza, si usa la cache in memoria locale
+# (sviluppo e test). Le chiavi applicative passano da apps.common.cache (namespace + versioni).
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'TIMEOUT': 300,  # 5 minuti
+            'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'edu_app'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'TIMEOUT': 300,  # 5 minuti
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000,  # Limita il numero di voci in cache
+                'CULL_FREQUENCY': 3,  # Rimuovi 1/3 delle voci quando la cache è piena
+            }
         }
     }
-}
+
+# Namespace della cache applicativa (vedi apps.common.cache). 'quiz_bundles' non viene mai invalidato
+# per intero: le chiavi dei bundle includono la versione del quiz (apps.education.delivery)
+CACHE_NAMESPACES = ('education', 'rewards', 'users', 'lezioni', 'quiz_bundles')
+# Durata massima del lock anti-stampede durante il ricalcolo di una chiave (secondi)
+CACHE_STAMPEDE_LOCK_TIMEOUT = int(os.getenv('CACHE_STAMPEDE_LOCK_TIMEOUT', '10'))
+
+# Durata in cache delle domande pre-serializzate di un quiz (apps.education.delivery); la chiave
+# include la versione del quiz, quindi le modifiche alle domande sono visibili subito
+QUIZ_BUNDLE_CACHE_TIMEOUT = int(os.getenv('QUIZ_BUNDLE_CACHE_TIMEOUT', '3600'))
+
+# Dimensione massima (byte di JSON delle domande) di una pagina del quiz completo di un tentativo
+QUIZ_PREFETCH_MAX_BYTES = int(os.getenv('QUIZ_PREFETCH_MAX_BYTES', str(256 * 1024)))
+
+# Durata in cache del catalogo ricompense di un docente e degli acquisti di uno studente
+# (apps.rewards.catalogue); i segnali invalidano le chiavi a ogni modifica
+REWARD_CATALOGUE_CACHE_TIMEOUT = int(os.getenv('REWARD_CATALOGUE_CACHE_TIMEOUT', '3600'))
+
+# Durata in cache dell'indice compilato dei badge (apps.rewards.badges); i segnali su Badge
+# invalidano il namespace 'rewards' a ogni modifica
+BADGE_INDEX_CACHE_TIMEOUT = int(os.getenv('BADGE_INDEX_CACHE_TIMEOUT', '3600'))
+
+# Attesa massima (ms) del blocco sul wallet durante un acquisto (apps.rewards.purchases, lock_timeout
+# su PostgreSQL): oltre il limite la richiesta fallisce con 503 e può essere ripetuta con la stessa chiave
+REWARD_PURCHASE_LOCK_TIMEOUT_MS = int(os.getenv('REWARD_PURCHASE_LOCK_TIMEOUT_MS', '2000'))
 
 # Ottimizzazione delle sessioni
 SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'  # Usa cache + DB per le sessioni
@@ -407,3 +453,58 @@ FRONTEND_STUDENT_BASE_URL = os.getenv('FRONTEND_STUDENT_BASE_URL', 'http://local
 # Ensure the base URL ends with a slash
 if not FRONTEND_STUDENT_BASE_URL.endswith('/'):
     FRONTEND_STUDENT_BASE_URL += '/'
+
+# Numero massimo di risposte accettate in una richiesta di AttemptViewSet.submit_answers
+SUBMIT_ANSWERS_MAX_BATCH = int(os.getenv('SUBMIT_ANSWERS_MAX_BATCH', '200'))
+
+# --- Coda job (apps.common.jobs) ---
+# Se True, le ricompense di fine tentativo (punti, badge, avanzamento percorsi) vengono accodate
+# ed eseguite dal worker `python manage.py run_jobs`, fuori dalla richiesta HTTP.
+ASYNC_ATTEMPT_REWARDS = os.getenv('ASYNC_ATTEMPT_REWARDS', 'False').lower() in ('true', '1', 't')
+# Se True, i job accodati vengono eseguiti subito (al commit) nel processo corrente, senza worker.
+JOBS_RUN_INLINE = os.getenv('JOBS_RUN_INLINE', 'False').lower() in ('true', '1', 't')
+# Dopo quanti secondi un job RUNNING con lock non rilasciato (worker terminato) può essere ripreso
+JOBS_LOCK_TIMEOUT = int(os.getenv('JOBS_LOCK_TIMEOUT', '300'))
+
+# --- Import di quiz da file (apps.education.imports) ---
+# Se True, gli upload di quiz/template rispondono 202 e vengono importati dal worker `run_jobs`;
+# il client interroga /api/education/quiz-imports/{import_id}/ per avanzamento ed esito.
+ASYNC_QUIZ_IMPORT = os.getenv('ASYNC_QUIZ_IMPORT', 'False').lower() in ('true', '1', 't')
+# Directory in cui vengono salvati gli upload in attesa di import: condivisa tra web e worker,
+# ma fuori da MEDIA_ROOT (servita pubblicamente da nginx)
+QUIZ_IMPORT_SPOOL_DIR = os.getenv('QUIZ_IMPORT_SPOOL_DIR', str(BASE_DIR / 'quiz_imports'))
+# Durata (secondi) della percentuale di avanzamento in cache
+QUIZ_IMPORT_PROGRESS_TIMEOUT = int(os.getenv('QUIZ_IMPORT_PROGRESS_TIMEOUT', '3600'))
+
+# --- Metriche di performance (apps.common.metrics) ---
+# Esposte in formato Prometheus su /api/metrics/ (solo Admin).
+PERF_METRICS_ENABLED = os.getenv('PERF_METRICS_ENABLED', 'True').lower() in ('true', '1', 't')
+# Frazione di richieste (0-1) per cui vengono misurate query SQL, cache e serializer.
+# Tempo e conteggio delle richieste sono misurati sempre.
+PERF_METRICS_SAMPLE_RATE = float(os.getenv('PERF_METRICS_SAMPLE_RATE', '0.1'))
+# Soglia (ms) oltre la quale una richiesta campionata viene loggata con le query più costose (0 = disattivato)
+PERF_SLOW_REQUEST_MS = int(os.getenv('PERF_SLOW_REQUEST_MS', '0'))
+# Numero di istruzioni SQL riportate nel log delle richieste lente
+PERF_SLOW_REQUEST_TOP_SQL = int(os.getenv('PERF_SLOW_REQUEST_TOP_SQL', '5'))
+
+# --- Autenticazione studenti (apps.users.authentication) ---
+# Durata massima (secondi) in cache dello studente autenticato; la cache viene comunque
+# invalidata quando lo studente viene salvato o eliminato.
+STUDENT_PRINCIPAL_CACHE_TIMEOUT = int(os.getenv('STUDENT_PRINCIPAL_CACHE_TIMEOUT', '300'))
+
+# --- Login studenti: costo dell'hash del PIN e limite dei tentativi ---
+# Iterazioni PBKDF2 dell'hasher dei PIN (apps.users.hashers); gli hash esistenti vengono
+# aggiornati al primo login riuscito quando il valore cambia.
+STUDENT_PIN_HASH_ITERATIONS = int(os.getenv('STUDENT_PIN_HASH_ITERATIONS', '20000'))
+# Errori consentiti per codice studente / per IP nella finestra, e durata del blocco (secondi)
+STUDENT_LOGIN_MAX_FAILURES = int(os.getenv('STUDENT_LOGIN_MAX_FAILURES', '5'))
+STUDENT_LOGIN_IP_MAX_FAILURES = int(os.getenv('STUDENT_LOGIN_IP_MAX_FAILURES', '100'))
+STUDENT_LOGIN_FAILURE_WINDOW = int(os.getenv('STUDENT_LOGIN_FAILURE_WINDOW', '900'))
+STUDENT_LOGIN_LOCKOUT_SECONDS = int(os.getenv('STUDENT_LOGIN_LOCKOUT_SECONDS', '900'))
+# Chiave di request.META con l'IP reale del client dietro al proxy (nginx imposta X-Real-IP)
+CLIENT_IP_META_KEY = os.getenv('CLIENT_IP_META_KEY', 'HTTP_X_REAL_IP')
+
+# --- Ledger dei punti (apps.rewards.ledger) ---
+# Ogni quante transazioni di un wallet viene salvata una fotografia del saldo (WalletSnapshot):
+# storico e riconciliazione partono dall'ultima fotografia invece che da tutte le transazioni.
+WALLET_SNAPSHOT_INTERVAL = int(os.getenv('WALLET_SNAPSHOT_INTERVAL', '100'))
@@ -50,6 +50,7 @@ urlpatterns = [
     path('api/rewards/', include('apps.rewards.urls')), # Gestione ricompense
     path('api/education/', include('apps.education.urls')), # Gestione contenuti educativi
     path('api/lezioni/', include('lezioni.urls')), # Gestione Lezioni (nuova app)
+    path('api/', include('apps.common.urls')), # Metriche di performance (Admin)
 ]
 
 # Serve media files during development
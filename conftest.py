@@ -0,0 +1,12 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    La cache condivisa (apps.common.cache) sopravvive al rollback del database tra un test e
+    l'altro: senza svuotarla un test potrebbe leggere valori (e versioni dei namespace) calcolati
+    da un test precedente su oggetti non più presenti.
+    """
+    cache.clear()
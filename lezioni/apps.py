@@ -4,3 +4,9 @@ class LezioniConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lezioni'
     verbose_name = "Gestione Lezioni" # Nome leggibile per l'admin
+
+    def ready(self):
+        """
+        Importa i segnali quando l'app è pronta.
+        """
+        import lezioni.signals # Importa il modulo dei segnali
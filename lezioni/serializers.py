@@ -1,6 +1,7 @@
 from django.utils.text import get_valid_filename
 from rest_framework import serializers
 from .models import Subject, Topic, Lesson, LessonContent, LessonAssignment
+from apps.common.serializers import SparseFieldsetMixin
 # Potrebbe essere necessario importare il serializer dello Studente se vogliamo dati annidati
 # from apps.users.serializers import StudentSerializer # Esempio, verificare path corretto
 
@@ -71,7 +72,7 @@ class LessonWriteSerializer(serializers.ModelSerializer):
         read_only_fields = ['id'] # Rende l'ID non scrivibile dal client
         # 'creator' verrà impostato nella view
 
-class LessonAssignmentSerializer(serializers.ModelSerializer):
+class LessonAssignmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     # Mostra informazioni rilevanti sulla lezione e sullo studente
     lesson_title = serializers.CharField(source='lesson.title', read_only=True)
     # Assumendo che Student abbia 'unique_identifier' o 'username'
@@ -91,7 +92,16 @@ class LessonAssignmentSerializer(serializers.ModelSerializer):
 class BulkLessonAssignSerializer(serializers.Serializer):
     student_ids = serializers.ListField(
         child=serializers.IntegerField(),
+        required=False,
         allow_empty=False,
+        max_length=1000,
         help_text="Lista degli ID degli studenti a cui assegnare la lezione."
     )
-    # lesson_id verrà preso dall'URL
\ No newline at end of file
+    all_students = serializers.BooleanField(required=False, default=False,
+                                            help_text="Assegna la lezione a tutti gli studenti attivi del docente.")
+    # lesson_id verrà preso dall'URL
+
+    def validate(self, data):
+        if bool(data.get('student_ids')) == data.get('all_students'):
+            raise serializers.ValidationError("Specificare 'student_ids' oppure 'all_students', non entrambi.")
+        return data
\ No newline at end of file
@@ -0,0 +1,11 @@
+from apps.common.cache import invalidate_on_change
+from .models import Subject, Topic, Lesson, LessonContent, LessonAssignment
+
+# --- Invalidazione della cache applicativa (namespace 'lezioni') ---
+# Contenuti delle lezioni: invalida l'intero namespace.
+# Assegnazioni: invalida solo lo scope dello studente interessato.
+invalidate_on_change('lezioni', Subject, Topic, Lesson, LessonContent)
+invalidate_on_change(
+    'lezioni', LessonAssignment,
+    scope_func=lambda instance: f"student:{instance.student_id}",
+)
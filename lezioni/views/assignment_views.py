@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from django.utils import timezone
 from django.contrib.auth import get_user_model # Utile per Admin/Docente
 
+from apps.common.pagination import KeysetCursorPagination
 from ..models import LessonAssignment, Lesson
 # Importa Student per controllo tipo
 # e che il modello Student sia importabile o gestito tramite request.user
@@ -26,6 +27,7 @@ class LessonAssignmentViewSet(mixins.ListModelMixin,
     """
     serializer_class = LessonAssignmentSerializer
     permission_classes = [permissions.IsAuthenticated] # Permesso base, poi affinato nel queryset
+    pagination_class = KeysetCursorPagination # Pagine a cursore su '-assigned_at'
 
     def get_queryset(self):
         """
@@ -18,10 +18,7 @@ from ..permissions import (
 )
 # Import necessario per l'assegnazione
 from ..models import LessonAssignment
-try:
-    from apps.users.models import Student
-except ImportError:
-    Student = None # Gestiremo il caso in cui Student non sia importabile
+from apps.common.assignments import bulk_assign
 
 class LessonViewSet(viewsets.ModelViewSet):
     """
@@ -126,45 +123,37 @@ class LessonViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsTeacherOwner], url_path='assign')
     def assign_students(self, request, pk=None):
         """
-        Assegna questa lezione a una lista di ID studenti forniti nel body.
-        Body atteso: { "student_ids": [1, 2, 3] }
+        Assegna questa lezione a una lista di ID studenti forniti nel body, oppure a tutti
+        gli studenti attivi del docente.
+        Body atteso: { "student_ids": [1, 2, 3] } oppure { "all_students": true }
         """
         lesson = self.get_object() # Ottiene la lezione, verifica permessi oggetto
         serializer = BulkLessonAssignSerializer(data=request.data)
 
         if serializer.is_valid():
-            student_ids = serializer.validated_data['student_ids']
-            if not Student:
-                 return Response({"detail": "Modello Studente non configurato correttamente."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            students = Student.objects.filter(id__in=student_ids)
-            found_ids = students.values_list('id', flat=True)
-            not_found_ids = list(set(student_ids) - set(found_ids))
-
-            if not_found_ids:
-                return Response({"detail": f"Studenti non trovati con ID: {not_found_ids}"}, status=status.HTTP_400_BAD_REQUEST)
-
-            assignments = []
-            skipped_students = []
-            for student in students:
-                # Crea l'assegnazione solo se non esiste già
-                assignment, created = LessonAssignment.objects.get_or_create(
-                    lesson=lesson,
-                    student=student,
-                    defaults={'assigned_by': request.user}
-                )
-                if created:
-                    assignments.append(assignment)
-                else:
-                    skipped_students.append(student.id) # Studente già assegnato
-
+            data = serializer.validated_data
+            result = bulk_assign(
+                LessonAssignment, 'lesson', lesson,
+                teacher=lesson.creator,
+                assigned_by=request.user,
+                student_ids=None if data['all_students'] else data['student_ids'],
+                cache_namespace='lezioni',
+                all_or_nothing=True, # Nessuna assegnazione se qualche ID non è valido
+            )
+            if result.invalid:
+                return Response({"detail": f"Studenti non trovati con ID: {result.invalid}"}, status=status.HTTP_400_BAD_REQUEST)
+
+            assignments = LessonAssignment.objects.filter(
+                lesson=lesson, student_id__in=result.created
+            ).select_related('lesson', 'student', 'assigned_by')
             assignment_serializer = LessonAssignmentSerializer(assignments, many=True)
             response_data = {
-                "success": f"{len(assignments)} studenti assegnati con successo.",
-                "already_assigned": skipped_students,
-                "assignments": assignment_serializer.data
+                "success": f"{len(result.created)} studenti assegnati con successo.",
+                "already_assigned": result.skipped,
+                "assignments": assignment_serializer.data,
+                **result.as_dict(),
             }
-            return Response(response_data, status=status.HTTP_201_CREATED if assignments else status.HTTP_200_OK)
+            return Response(response_data, status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 